@@ -0,0 +1,9 @@
+#!/bin/bash
+
+pip3 install --upgrade pip
+pip3 install requests kubernetes==24.2.0
+
+export PYTHONPATH=src/:test/:test/bur_cli/src/
+python3 test/bench_hooks.py --json bench_hooks.json "$@"
+python3 test/bench_wait_loops.py --json bench_wait_loops.json \
+    ${WAIT_LOOPS_BASELINE:+--baseline "$WAIT_LOOPS_BASELINE"}
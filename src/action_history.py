@@ -0,0 +1,262 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Remember how long BRO actions took, in a configmap, so waits can pick a
+poll interval and warn about an action that is taking far longer than
+usual. Set HOOK_FAIL_STUCK_ACTIONS=true to time such actions out instead.
+
+The configmap is created on the first recorded duration, so the hook's
+service account needs configmap create as well as get and patch.
+"""
+import json
+import math
+import os
+import re
+from typing import Dict, List, Optional
+
+from kubernetes.client import V1ConfigMap, V1ObjectMeta
+from kubernetes.client.exceptions import ApiException
+
+from common import BaseClass, KubeApi, shortest_timeout
+
+HISTORY_CONFIGMAP = 'eric-enm-hook-action-history'
+# Durations kept per key, oldest dropped first
+MAX_SAMPLES = 20
+# Durations needed before predicting anything
+MIN_SAMPLES = 3
+# An action running this many times its p95 duration is treated as stuck
+STUCK_FACTOR = 3.0
+# Time stuck actions out instead of only warning about them
+FAIL_STUCK_ENV = 'HOOK_FAIL_STUCK_ACTIONS'
+MAX_POLL_INTERVAL = 60.0
+
+
+def size_bucket(size: Optional[int]) -> str:
+    """
+    Group sizes by powers of two so similar backups share a history.
+
+    :param size: The backup size, None if it isn't known
+    :return: The bucket name
+    """
+    if size is None or size <= 0:
+        return 'any'
+    return f's{2 ** math.ceil(math.log2(size))}'
+
+
+def history_key(action: str, scope: str, size: Optional[int]) -> str:
+    """
+    :param action: The action name, e.g. RESTORE
+    :param scope: The backup scope
+    :param size: The backup size, None if it isn't known
+    :return: The configmap key for the durations
+    """
+    return re.sub(r'[^-._a-zA-Z0-9]', '_',
+                  f'{action}.{scope}.{size_bucket(size)}')
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Nearest rank percentile.
+
+    :param values: The values, not empty
+    :param fraction: The percentile, 0 to 1
+    :return: The value at that percentile
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Overrun(BaseClass):
+    """
+    Warn, once, when an action runs past the time it should have taken.
+    """
+
+    def __init__(self, description: str, limit: Optional[float]):
+        """
+        :param description: What is running, for the warning
+        :param limit: Seconds the action should have taken, None for no
+            limit
+        """
+        super().__init__()
+        self.description = description
+        self.limit = limit
+        self.warned = False
+
+    def check(self, elapsed: float) -> bool:
+        """
+        :param elapsed: Seconds the action has been running
+        :return: True if the action has run past its limit
+        """
+        if self.limit is None or elapsed <= self.limit:
+            return False
+        if not self.warned:
+            self.warning(f'{self.description} has been running for '
+                         f'{elapsed:.0f}s, longer than the {self.limit:.0f}s '
+                         f'it should take, still waiting for it. Set '
+                         f'{FAIL_STUCK_ENV}=true to time it out instead.')
+            self.warned = True
+        return True
+
+
+class ActionHistory(BaseClass):
+    """
+    Durations of past BRO actions, keyed by action, scope and backup size.
+
+    The history is best effort, failing to read or write it is logged and
+    otherwise ignored.
+    """
+
+    def __init__(self, kube: KubeApi, configmap: Optional[str] = None):
+        super().__init__()
+        self.__kube = kube
+        self.configmap = configmap or os.environ.get(
+            'HOOK_HISTORY_CONFIGMAP', HISTORY_CONFIGMAP)
+        self.fail_stuck = os.environ.get(FAIL_STUCK_ENV, '').lower() in (
+            'true', 'yes', '1')
+        self.__data = None
+
+    def __load(self) -> Dict[str, str]:
+        if self.__data is None:
+            try:
+                self.__data = dict(
+                    self.__kube.get_configmap(self.configmap).data or {})
+            except ApiException as exception:
+                if exception.status != 404:
+                    self.warning(f'Could not read {self.configmap}: '
+                                 f'{exception.status} {exception.reason}')
+                self.__data = {}
+        return self.__data
+
+    def durations(self, action: str, scope: str,
+                  size: Optional[int] = None) -> List[float]:
+        """
+        :param action: The action name
+        :param scope: The backup scope
+        :param size: The backup size, None if it isn't known
+        :return: Recorded durations in seconds, oldest first
+        """
+        try:
+            durations = json.loads(
+                self.__load().get(history_key(action, scope, size)) or '[]')
+            return [float(duration) for duration in durations]
+        except (TypeError, ValueError):
+            return []
+
+    def predicted(self, action: str, scope: str,
+                  size: Optional[int] = None) -> Optional[float]:
+        """
+        :param action: The action name
+        :param scope: The backup scope
+        :param size: The backup size, None if it isn't known
+        :return: The median duration, None without enough history
+        """
+        durations = self.durations(action, scope, size)
+        if len(durations) < MIN_SAMPLES:
+            return None
+        return percentile(durations, 0.5)
+
+    def p95(self, action: str, scope: str,
+            size: Optional[int] = None) -> Optional[float]:
+        """
+        :param action: The action name
+        :param scope: The backup scope
+        :param size: The backup size, None if it isn't known
+        :return: The 95th percentile duration, None without enough history
+        """
+        durations = self.durations(action, scope, size)
+        if len(durations) < MIN_SAMPLES:
+            return None
+        return percentile(durations, 0.95)
+
+    def limit(self, action: str, scope: str,
+              size: Optional[int] = None) -> Optional[float]:
+        """
+        :param action: The action name
+        :param scope: The backup scope
+        :param size: The backup size, None if it isn't known
+        :return: Seconds after which the action should be considered
+            stuck, None without enough history
+        """
+        p95 = self.p95(action, scope, size)
+        return None if p95 is None else STUCK_FACTOR * p95
+
+    def timeout(self, timeout: Optional[float],
+                limit: Optional[float]) -> Optional[float]:
+        """
+        :param timeout: Seconds to wait, None to wait forever
+        :param limit: Seconds after which the action is stuck, see limit
+        :return: Seconds to wait, cut to the limit if stuck actions fail
+        """
+        return shortest_timeout(timeout, limit) if self.fail_stuck \
+            else timeout
+
+    def overrun(self, description: str,
+                limit: Optional[float]) -> Overrun:
+        """
+        :param description: What is running, for the warning
+        :param limit: Seconds after which the action is stuck, see limit
+        :return: A check that warns once the action runs past the limit,
+            unless it is timed out at the limit instead
+        """
+        return Overrun(description, None if self.fail_stuck else limit)
+
+    def poll_interval(self, action: str, scope: str,
+                      size: Optional[int] = None,
+                      default: float = 10.0) -> float:
+        """
+        Poll long actions less often, about a hundred times over their
+        usual duration.
+
+        :param action: The action name
+        :param scope: The backup scope
+        :param size: The backup size, None if it isn't known
+        :param default: The shortest interval
+        :return: Seconds between polls
+        """
+        predicted = self.predicted(action, scope, size)
+        if predicted is None:
+            return default
+        return min(MAX_POLL_INTERVAL, max(default, predicted / 100))
+
+    def record(self, action: str, scope: str, duration: float,
+               size: Optional[int] = None):
+        """
+        Add a duration to the history.
+
+        :param action: The action name
+        :param scope: The backup scope
+        :param duration: Seconds the action took
+        :param size: The backup size, None if it isn't known
+        """
+        key = history_key(action, scope, size)
+        durations = self.durations(action, scope, size) + \
+            [round(duration, 1)]
+        values = {key: json.dumps(durations[-MAX_SAMPLES:])}
+        try:
+            self.__kube.patch_configmap_data(self.configmap, values)
+        except ApiException as exception:
+            if exception.status != 404:
+                self.warning(f'Could not update {self.configmap}: '
+                             f'{exception.status} {exception.reason}')
+                return
+            try:
+                self.__kube.create_configmap(V1ConfigMap(
+                    metadata=V1ObjectMeta(name=self.configmap),
+                    data=values))
+            except ApiException as create_exception:
+                self.warning(f'Could not create {self.configmap}: '
+                             f'{create_exception.status} '
+                             f'{create_exception.reason}')
+                return
+        self.__load().update(values)
+        self.debug(f'Recorded {action} {scope} took {duration:.0f}s')
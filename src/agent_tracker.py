@@ -0,0 +1,250 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Wait for BRO agents to register, watching the agent pods so BRO is only
+asked often while an agent is about to register.
+
+Agent pods carry their agent ID in the adpbrlabelkey label and go Ready
+shortly before the agent registers. While any agent being waited for has
+a Ready pod BRO is polled every few seconds, otherwise the polls back off
+to half a minute apart, as often as BRO was polled before the pods were
+watched, and a pod going Ready brings the next poll forward.
+
+Without permission to list and watch the pods BRO is polled every
+BLIND_POLL_SECONDS instead.
+"""
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from kubernetes import watch
+from kubernetes.client import V1Pod
+from kubernetes.client.exceptions import ApiException
+
+from common import WATCH_SECONDS, BaseClass, BroCliBaseClass, \
+    DeadlineClock, HookException, KubeApi, watch_timeout
+
+AGENT_LABEL = 'adpbrlabelkey'
+# Seconds between BRO polls, doubling after each poll that finds nothing
+# new, up to READY_POLL_SECONDS while an agent's pod is Ready and
+# IDLE_POLL_SECONDS otherwise.
+FAST_POLL_SECONDS = 2
+READY_POLL_SECONDS = 10
+IDLE_POLL_SECONDS = 30
+# Seconds between BRO polls when the agent pods can't be read
+BLIND_POLL_SECONDS = 10
+
+
+class AgentPod(NamedTuple):
+    """
+    What an agent pod says about its agent.
+    """
+    agent: str
+    ready: bool
+    backup_type: Optional[str] = None
+
+
+def agent_pod(pod: V1Pod) -> Optional[AgentPod]:
+    """
+    :param pod: A pod
+    :return: The pod's agent ID, readiness and backupType annotation, None
+        if it isn't an agent pod
+    """
+    agent = (pod.metadata.labels or {}).get(AGENT_LABEL)
+    if not agent:
+        return None
+    conditions = (pod.status.conditions if pod.status else None) or []
+    ready = any(condition.type == 'Ready' and condition.status == 'True'
+                for condition in conditions)
+    return AgentPod(agent, ready,
+                    (pod.metadata.annotations or {}).get('backupType'))
+
+
+class AgentTracker(BaseClass):
+    """
+    Track the agent pods and the agents registered with BRO.
+    """
+
+    def __init__(self, kube: KubeApi, bro: BroCliBaseClass):
+        """
+        :param kube: Kubernetes API for the agent pods
+        :param bro: BRO API for the registered agents
+        """
+        super().__init__()
+        self.__kube = kube
+        self.__bro = bro
+        self.pods: Dict[str, AgentPod] = {}
+        self.__resource_version = None
+        self.watching = True
+
+    def agents(self, backup_type: Optional[str] = None) -> List[str]:
+        """
+        :param backup_type: Only agents whose pods have this backupType
+            annotation, None for all agents
+        :return: IDs of the agents with pods, each only once
+        """
+        return list(dict.fromkeys(
+            pod.agent for pod in self.pods.values()
+            if backup_type is None or pod.backup_type == backup_type))
+
+    def ready_agents(self) -> Set[str]:
+        """
+        :return: IDs of the agents with a Ready pod
+        """
+        return {pod.agent for pod in self.pods.values() if pod.ready}
+
+    def __forbidden(self, error: ApiException):
+        """
+        Stop watching the pods after the API refused to show them.
+
+        :param error: The failed list or watch
+        :raises ApiException: If it failed for any other reason
+        """
+        if error.status != 403:
+            raise error
+        self.warning(f'Cannot read the agent pods ({error.status} '
+                     f'{error.reason}), polling BRO every '
+                     f'{BLIND_POLL_SECONDS}s instead. Grant the '
+                     f'serviceaccount get, list and watch on pods to '
+                     f'follow the agent pods.')
+        self.watching = False
+        self.pods = {}
+
+    def list_pods(self):
+        """
+        Read all the agent pods. If that isn't allowed the pods are no
+        longer watched, see watching.
+        """
+        try:
+            listing = self.__kube.api_core().list_namespaced_pod(
+                self.__kube.namespace(), label_selector=AGENT_LABEL)
+        except ApiException as error:
+            self.__forbidden(error)
+            return
+        self.pods = {}
+        for pod in listing.items:
+            self.__update(pod, 'ADDED')
+        self.__resource_version = listing.metadata.resource_version
+
+    def watch_pods(self, seconds: float) -> Set[str]:
+        """
+        Watch the agent pods for a while, or until an agent's pod goes
+        Ready.
+
+        :param seconds: Longest to watch for
+        :return: IDs of the agents whose pods went Ready, empty if the
+            watch isn't allowed
+        """
+        seconds = max(1, int(seconds))
+        watcher = watch.Watch()
+        try:
+            for event in watcher.stream(
+                    self.__kube.api_core().list_namespaced_pod,
+                    self.__kube.namespace(), label_selector=AGENT_LABEL,
+                    resource_version=self.__resource_version,
+                    timeout_seconds=seconds, _request_timeout=seconds + 10):
+                was_ready = self.ready_agents()
+                self.__update(event['object'], event['type'])
+                self.__resource_version = watcher.resource_version
+                went_ready = self.ready_agents() - was_ready
+                if went_ready:
+                    watcher.stop()
+                    return went_ready
+        except ApiException as error:
+            if error.status != 410:
+                self.__forbidden(error)
+                return set()
+            self.debug('Agent pod watch expired, listing the pods again')
+            was_ready = self.ready_agents()
+            self.list_pods()
+            return self.ready_agents() - was_ready
+        return set()
+
+    def __update(self, pod: V1Pod, event_type: str):
+        name = pod.metadata.name
+        agent = agent_pod(pod)
+        if event_type == 'DELETED' or agent is None:
+            self.pods.pop(name, None)
+        else:
+            self.pods[name] = agent
+
+    def wait_for_agents(self, agents: Optional[List[str]],
+                        clock: DeadlineClock,
+                        backup_type: Optional[str] = None) -> List[str]:
+        """
+        Wait for agents to register with BRO, logging when each one does.
+
+        :param agents: The agent IDs, None for the agents with pods
+        :param clock: The deadline for the agents to register
+        :param backup_type: With agents None, only wait for the agents
+            whose pods have this backupType annotation
+        :return: The agents waited for
+        :raises HookTimeoutException: If they don't register in time
+        :raises HookException: If agents is None and the agent pods can't
+            be read
+        """
+        started = clock.now()
+        self.list_pods()
+        if agents is None and not self.watching:
+            raise HookException('Cannot read the agent pods to find the '
+                                'agents to wait for')
+        interval, woken = FAST_POLL_SECONDS, True
+        waiting = []
+        while True:
+            registered = self.__bro.bro_api().status.agents
+            required = list(agents) if agents is not None else \
+                self.agents(backup_type)
+            now_registered = [agent for agent in waiting
+                              if agent in registered]
+            for agent in now_registered:
+                self.info(f'Agent {agent} registered after '
+                          f'{clock.now() - started:.0f}s')
+            waiting = [agent for agent in required
+                       if agent not in registered]
+            if not waiting:
+                break
+            expected = self.ready_agents().intersection(waiting)
+            if not self.watching:
+                interval = BLIND_POLL_SECONDS
+            else:
+                interval = FAST_POLL_SECONDS if woken else min(
+                    interval * 2,
+                    READY_POLL_SECONDS if expected else IDLE_POLL_SECONDS)
+            self.info(f'Waiting for {len(waiting)} of {len(required)} '
+                      f'agents to register: {", ".join(waiting)}'
+                      + (f', {len(expected)} with Ready pods'
+                         if expected else ''))
+            woken = self.__wait(clock, interval, set(waiting))
+        self.info(f'All {len(required)} agents registered after '
+                  f'{clock.now() - started:.0f}s')
+        return required
+
+    def __wait(self, clock: DeadlineClock, interval: float,
+               waiting: Set[str]) -> bool:
+        """
+        Watch the pods until the next BRO poll is due, or shortly after a
+        pod of an agent being waited for goes Ready.
+
+        :return: True if a pod went Ready
+        """
+        poll_at = clock.now() + interval
+        while clock.now() < poll_at:
+            if not self.watching:
+                clock.sleep(poll_at - clock.now())
+                return False
+            went_ready = self.watch_pods(watch_timeout(
+                clock, min(WATCH_SECONDS, poll_at - clock.now()))) & waiting
+            if went_ready:
+                self.info(f'Pods Ready for {", ".join(sorted(went_ready))}')
+                clock.sleep(min(FAST_POLL_SECONDS,
+                                max(0.0, poll_at - clock.now())))
+                return True
+        return False
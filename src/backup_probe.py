@@ -0,0 +1,334 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Read the product version and size of an exported backup from its SFTP
+location, without importing it into BRO.
+"""
+import json
+import os
+import posixpath
+import re
+import tarfile
+from typing import List, NamedTuple, Optional
+from urllib.parse import unquote, urlparse
+
+from common import BaseClass
+
+try:
+    import paramiko
+except ImportError:  # pragma: no cover
+    paramiko = None
+
+APPLICATION_INFO = 'APPLICATION_INFO'
+# Give up if the metadata isn't found in the first part of the tarball, the
+# full import will still check the version afterwards. The metadata is
+# written near the front, so a few MiB is plenty.
+MAX_SCAN_BYTES = 4 * 1024 * 1024
+MAX_METADATA_BYTES = 1024 * 1024
+SFTP_TIMEOUT = 30
+
+PROBE_ERRORS = (OSError, EOFError, ValueError, tarfile.TarError) + \
+    ((paramiko.SSHException,) if paramiko else ())
+
+
+class BackupLocation:
+    """
+    Read access to the directory backups are exported to.
+    """
+
+    def listdir(self, path: str) -> List[str]:
+        """
+        :param path: Directory path
+        :return: Names of the entries in the directory
+        """
+        raise NotImplementedError
+
+    def open(self, path: str):
+        """
+        :param path: File path
+        :return: A binary file object
+        """
+        raise NotImplementedError
+
+    def size(self, path: str) -> int:
+        """
+        :param path: File path
+        :return: The file size in bytes
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """ Release the connection """
+
+
+class LocalLocation(BackupLocation):
+    """
+    A file:// location, a local stand-in for an SFTP server.
+    """
+
+    def listdir(self, path: str) -> List[str]:
+        return os.listdir(path)
+
+    def open(self, path: str):
+        return open(path, 'rb')  # pylint: disable=consider-using-with
+
+    def size(self, path: str) -> int:
+        return os.path.getsize(path)
+
+
+class SftpLocation(BackupLocation):
+    """
+    An sftp:// location. The server's host key must be in the system
+    known_hosts or the known_hosts file given, unless unknown keys are
+    explicitly accepted.
+    """
+
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 host: str, port: int, username: str, password: str,
+                 known_hosts: Optional[str] = None,
+                 accept_unknown_host_key: bool = False):
+        self.__client = paramiko.SSHClient()
+        self.__client.load_system_host_keys()
+        if known_hosts and os.path.isfile(known_hosts):
+            self.__client.load_host_keys(known_hosts)
+        self.__client.set_missing_host_key_policy(
+            paramiko.AutoAddPolicy() if accept_unknown_host_key
+            else paramiko.RejectPolicy())
+        self.__client.connect(host, port=port, username=username,
+                              password=password, timeout=SFTP_TIMEOUT,
+                              banner_timeout=SFTP_TIMEOUT,
+                              auth_timeout=SFTP_TIMEOUT,
+                              allow_agent=False, look_for_keys=False)
+        self.__sftp = self.__client.open_sftp()
+        self.__sftp.get_channel().settimeout(SFTP_TIMEOUT)
+
+    def listdir(self, path: str) -> List[str]:
+        return self.__sftp.listdir(path)
+
+    def open(self, path: str):
+        remote = self.__sftp.open(path, 'rb')
+        remote.prefetch()
+        return remote
+
+    def size(self, path: str) -> int:
+        return self.__sftp.stat(path).st_size
+
+    def close(self):
+        self.__sftp.close()
+        self.__client.close()
+
+
+class ProbedBackup(NamedTuple):
+    """
+    What was found out about an exported backup, None if not known.
+    """
+    version: Optional[str] = None
+    size: Optional[int] = None
+
+
+class _BoundedReader:  # pylint: disable=too-few-public-methods
+    """
+    File wrapper that reports end of file after a number of bytes.
+    """
+
+    def __init__(self, fileobj, limit: int):
+        self.__fileobj = fileobj
+        self.__left = limit
+
+    def read(self, size: int = -1) -> bytes:
+        """ Read up to size bytes, stopping at the limit """
+        if size < 0 or size > self.__left:
+            size = self.__left
+        data = self.__fileobj.read(size) if size else b''
+        self.__left -= len(data)
+        return data
+
+
+def normalise_uri(uri: str) -> str:
+    """
+    BRO also accepts user@host/path, treat that as an SFTP URI.
+
+    :param uri: The export location
+    :return: The URI with a scheme
+    """
+    if '://' not in uri and '@' in uri:
+        return f'sftp://{uri}'
+    return uri
+
+
+def application_version(metadata: bytes) -> Optional[str]:
+    """
+    Get the APPLICATION_INFO product revision from a BRO backup metadata
+    file.
+
+    :param metadata: Contents of a JSON file from the backup tarball
+    :return: The product version or None if it isn't backup metadata
+    """
+    try:
+        backup = json.loads(metadata)
+    except ValueError:
+        return None
+    if not isinstance(backup, dict):
+        return None
+    for version in backup.get('softwareVersions') or []:
+        if isinstance(version, dict) and \
+                version.get('agentId') == APPLICATION_INFO:
+            return version.get('productRevision') or version.get('revision')
+    return None
+
+
+class BackupVersionProbe(BaseClass):
+    """
+    Look inside an exported backup tarball for its product version.
+    """
+
+    def __init__(self, max_scan_bytes: int = MAX_SCAN_BYTES,
+                 known_hosts: Optional[str] = None,
+                 accept_unknown_host_key: bool = False):
+        """
+        :param max_scan_bytes: Most bytes of a tarball to read
+        :param known_hosts: known_hosts file with the SFTP server's host
+            key, used as well as the system known_hosts
+        :param accept_unknown_host_key: Trust an SFTP server whose host key
+            isn't known
+        """
+        super().__init__()
+        self.max_scan_bytes = max_scan_bytes
+        self.known_hosts = known_hosts
+        self.accept_unknown_host_key = accept_unknown_host_key
+
+    def open_location(self, uri: str,
+                      password: str) -> Optional[BackupLocation]:
+        """
+        Connect to a backup export location.
+
+        :param uri: sftp://user@host[:port]/path, user@host/path or
+            file:///path
+        :param password: SFTP password
+        :return: The location or None if it can't be probed
+        """
+        parsed = urlparse(normalise_uri(uri))
+        if parsed.scheme == 'file':
+            return LocalLocation()
+        if parsed.scheme == 'sftp':
+            if not paramiko:
+                self.warning('paramiko is not installed, can not probe '
+                             'the backup over SFTP')
+                return None
+            if self.accept_unknown_host_key:
+                self.warning(f'Accepting any host key from {parsed.hostname}')
+            elif not self.known_hosts or \
+                    not os.path.isfile(self.known_hosts):
+                self.info(f'No {self.known_hosts or "known_hosts"} file, '
+                          f'the host key of {parsed.hostname} must be in '
+                          f'the system known_hosts to probe the backup')
+            return SftpLocation(parsed.hostname, parsed.port or 22,
+                                unquote(parsed.username or ''), password,
+                                self.known_hosts,
+                                self.accept_unknown_host_key)
+        self.info(f'Can not probe backups at {parsed.scheme or uri}')
+        return None
+
+    @staticmethod
+    def find_tarball(location: BackupLocation, path: str,
+                     backup_name: str) -> Optional[str]:
+        """
+        Find the tarball for a backup.
+
+        :param location: The backup location
+        :param path: The export directory
+        :param backup_name: A tarball name or a backup name, which matches
+            <backup_name>.tar.gz, or else the latest
+            <backup_name>-<creation time>.tar.gz
+        :return: Path of the tarball or None if there isn't one
+        """
+        if backup_name.endswith('.tar.gz'):
+            return posixpath.join(path, backup_name)
+        names = location.listdir(path)
+        if f'{backup_name}.tar.gz' in names:
+            return posixpath.join(path, f'{backup_name}.tar.gz')
+        pattern = re.compile(re.escape(backup_name) +
+                             r'-\d[\dTZ:.+-]*\.tar\.gz')
+        tarballs = sorted(name for name in names if pattern.fullmatch(name))
+        return posixpath.join(path, tarballs[-1]) if tarballs else None
+
+    def scan(self, fileobj) -> Optional[str]:
+        """
+        Stream a backup tarball looking for the backup metadata.
+
+        :param fileobj: The tarball
+        :return: The product version or None if it wasn't found
+        """
+        reader = _BoundedReader(fileobj, self.max_scan_bytes)
+        with tarfile.open(fileobj=reader, mode='r|gz') as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith('.json') \
+                        or member.size > MAX_METADATA_BYTES:
+                    continue
+                version = application_version(
+                    tar.extractfile(member).read())
+                if version:
+                    self.debug(f'Found {APPLICATION_INFO} in {member.name}')
+                    return version
+        return None
+
+    def product_version(self, uri: str, password: str,
+                        backup_name: str) -> Optional[str]:
+        """
+        Get the product version of an exported backup.
+
+        :param uri: The export location
+        :param password: SFTP password
+        :param backup_name: A tarball name or a backup name
+        :return: The product version or None if it couldn't be read
+        """
+        return self.probe(uri, password, backup_name).version
+
+    def probe(self, uri: str, password: str,
+              backup_name: str) -> ProbedBackup:
+        """
+        Get the product version and tarball size of an exported backup.
+
+        Any failure is logged and nothing returned, as the version is
+        checked again once the backup is imported.
+
+        :param uri: The export location
+        :param password: SFTP password
+        :param backup_name: A tarball name or a backup name
+        :return: The version and size, each None if it couldn't be read
+        """
+        location, size = None, None
+        try:
+            location = self.open_location(uri, password)
+            if not location:
+                return ProbedBackup()
+            path = unquote(urlparse(normalise_uri(uri)).path)
+            tarball = self.find_tarball(location, path, backup_name)
+            if not tarball:
+                self.info(f'No tarball for {backup_name} found at {uri}')
+                return ProbedBackup()
+            size = location.size(tarball)
+            self.info(f'Reading the product version from {tarball}, '
+                      f'{size} bytes')
+            with location.open(tarball) as fileobj:
+                version = self.scan(fileobj)
+            if not version:
+                self.info(f'No {APPLICATION_INFO} found in the first '
+                          f'{self.max_scan_bytes} bytes of {tarball}')
+            return ProbedBackup(version, size)
+        except PROBE_ERRORS as error:
+            self.warning(f'Could not probe {backup_name} at {uri}: {error}')
+            return ProbedBackup(size=size)
+        finally:
+            if location:
+                location.close()
@@ -15,10 +15,14 @@
 Class to execute a BRO backup manager configuration.
 """
 import sys
-import json
 from argparse import ArgumentParser, RawTextHelpFormatter
+from typing import Optional
 
-from common import BroCliBaseClass, get_parsed_args
+from bro_config_spec import RetentionSpec, parse_retention, \
+    parse_scheduling
+from common import BroCliBaseClass, add_plan_argument, \
+    add_timeout_argument, deadline, get_parsed_args
+from plan import planned
 from reset_bro_config_map import ResetBroConfigMap
 from bro_schedule_control import ScheduleControl
 
@@ -27,7 +31,8 @@ class BroBMConfig(BroCliBaseClass):
     Class to configure BRO backup manager.
     """
 
-    def execute_restore_backup_manager_config(self, backup: str, scope: str):
+    def execute_restore_backup_manager_config(
+            self, backup: str, scope: str, timeout: Optional[float] = None):
         """
         Execute a BRO restore backup manager config and wait for it to
         complete.
@@ -37,18 +42,21 @@ class BroBMConfig(BroCliBaseClass):
 
         :param backup: The backup name
         :param scope: The backup scope prefix
+        :param timeout: Seconds to wait for the restore, None to wait forever
         """
 
         action = self.bro_api().restore(backup, f"{scope}-bro")
 
-        self.wait_for_action(action)
+        self.wait_for_action(action, timeout)
 
-    def do_restore(self, backup_name: str, scope: str):
+    def do_restore(self, backup_name: str, scope: str,
+                   timeout: Optional[float] = None):
         """
         Execute a backup manager config restore.
 
         :param backup_name: A backup name
         :param scope: A backup scope prefix
+        :param timeout: Seconds to wait for the restore, None to wait forever
 
         """
         if scope == "ROLLBACK":
@@ -60,47 +68,34 @@ class BroBMConfig(BroCliBaseClass):
             backup_name = self.bro_api().backups(scope)[0].name
 
         self.info('Restoring backup manager config')
-        self.execute_restore_backup_manager_config(backup_name, scope)
+        self.execute_restore_backup_manager_config(backup_name, scope,
+                                                   timeout)
 
         self.info('Backup Manager config restore complete.')
 
 
-    def configure_retention(self, values=None):
+    def configure_retention(self, values=None,
+                            timeout: Optional[float] = None):
         """
         Configure backup retention.
 
-        :param values: BRO retention configurations from the Values file
+        :param values: A RetentionSpec, or the BRO retention JSON from the
+            Values file to parse
+        :param timeout: Seconds to wait for the housekeeping action, None to
+            wait forever
         """
-        retention_values = {}
-        limit = 2
-        auto_delete = True
-
-        try:
-            retention_values = json.loads(values)
-        except ValueError:
-            self.warning('No Retention Values Provided')
-
-        try:
-            limit = retention_values['limit']
-        except KeyError:
-            self.warning(f'Setting Retention limit to {limit}. '
-                         'No limit value provided')
-
-        try:
-            auto_delete = retention_values['autoDelete']
-        except KeyError:
-            self.warning(f'Setting Retention auto delete to {auto_delete}. '
-                       'No auto delete value provided')
+        spec = values if isinstance(values, RetentionSpec) \
+            else parse_retention(values)
 
         self.info('Configuring backup retention for DEFAULT '
                   'BRO backup manager.')
 
-        retention = self.bro_api().get_retention()
+        retention = self.get_retention()
         self.debug(f'Current Retention configuration: {retention}')
-        retention.purge = auto_delete
-        retention.limit = limit
-        self.wait_for_action(retention.apply())
-        retention = self.bro_api().get_retention()
+        retention.purge = spec.purge
+        retention.limit = spec.limit
+        self.wait_for_action(retention.apply(), timeout)
+        retention = self.get_retention()
         self.info(f'Updated Retention configuration: {retention}')
 
 def main(sys_args):
@@ -139,15 +134,25 @@ def main(sys_args):
                             required=False, metavar='retention',
                             default=None, help='BRO retention'
                                    ' configurations from the Values file')
+    add_timeout_argument(arg_parser)
+    add_plan_argument(arg_parser)
     args = get_parsed_args(sys_args, arg_parser)
 
-    if not args.backup == '-' and args.scope == "DEFAULT":
-        BroBMConfig().do_restore(args.backup, args.scope)
-    else:
-        BroBMConfig().configure_retention(args.retention)
-        ScheduleControl().configure_scheduling(args.values, args.secret)
-
-    ResetBroConfigMap().reset_restore_state(args.configmap)
+    with planned(args.plan):
+        clock = deadline(args.timeout, 'backup manager configuration')
+        if not args.backup == '-' and args.scope == "DEFAULT":
+            BroBMConfig().do_restore(args.backup, args.scope,
+                                     timeout=clock.remaining())
+        else:
+            # Check all the values before changing anything in BRO
+            retention = parse_retention(args.retention)
+            scheduling = parse_scheduling(args.values)
+            BroBMConfig().configure_retention(retention,
+                                              timeout=clock.remaining())
+            ScheduleControl().configure_scheduling(
+                scheduling, args.secret, timeout=clock.remaining())
+
+        ResetBroConfigMap().reset_restore_state(args.configmap)
 
 if __name__ == '__main__':  # pragma: no cover
     main(sys.argv[1:])
@@ -0,0 +1,199 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Parse and check the BRO scheduling and retention values from the Values
+file, before anything is changed in BRO.
+
+Values that can't be used raise a HookException, including a malformed
+every, start or stop value, so a typo fails the hook instead of silently
+configuring less scheduling than asked for. Schedules with no every, such
+as the old dayOfWeek and startTime ones, are skipped with a warning as the
+hooks have always done.
+"""
+import json
+import logging
+import re
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+from common import HookException
+
+SCHEDULE_INTERVAL_RE = re.compile(
+    r'^((?P<weeks>\d+)w)?((?P<days>\d+)d)?'
+    r'((?P<hours>\d+)h)?((?P<minutes>\d+)m)?$')
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+DEFAULT_PREFIX = 'SCHEDULED_BACKUP'
+DEFAULT_LIMIT = 2
+DEFAULT_PURGE = True
+
+LOG = logging.getLogger(__name__)
+
+
+class Interval(NamedTuple):
+    """
+    A backup interval, the parts of the every value and the optional
+    start and stop times.
+    """
+    weeks: Optional[str]
+    days: Optional[str]
+    hours: Optional[str]
+    minutes: Optional[str]
+    start: Optional[str] = None
+    stop: Optional[str] = None
+
+
+class ScheduleSpec(NamedTuple):
+    """
+    The DEFAULT scope backup scheduling to configure. Scheduling is
+    disabled if enabled is False.
+    """
+    enabled: bool
+    prefix: str = DEFAULT_PREFIX
+    intervals: Tuple[Interval, ...] = ()
+
+
+class RetentionSpec(NamedTuple):
+    """
+    The DEFAULT scope backup retention to configure.
+    """
+    limit: int = DEFAULT_LIMIT
+    purge: bool = DEFAULT_PURGE
+
+
+def _load(values: Optional[str], name: str) -> Optional[dict]:
+    """
+    :param values: JSON from the Values file
+    :param name: What the values are for, used in errors
+    :return: The values, None if there are none
+    """
+    try:
+        loaded = json.loads(values)
+    except (TypeError, ValueError) as error:
+        LOG.debug('Exception occurred: %s', error)
+        return None
+    if not isinstance(loaded, dict):
+        raise HookException(f'The {name} values must be a JSON object, '
+                            f'got {values}')
+    return loaded
+
+
+def parse_datetime(field: str, value) -> Optional[str]:
+    """
+    :param field: start or stop
+    :param value: The schedule's value
+    :return: The time as YYYY-mm-ddThh:mm:ss, None if the value is null
+    :raises HookException: If the time isn't valid
+    """
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, DATETIME_FORMAT).strftime(
+            DATETIME_FORMAT)
+    except (ValueError, TypeError) as error:
+        raise HookException(
+            f"Invalid schedule '{field}' value: '{value}', format should be "
+            f"YYYY-mm-ddThh:mm:ss") from error
+
+
+def parse_interval(schedule: dict) -> Optional[Interval]:
+    """
+    :param schedule: One of the schedules
+    :return: The interval, None if the schedule has no every value
+    :raises HookException: If the every value isn't a valid interval, or
+        a start or stop time isn't valid
+    """
+    if 'every' not in schedule:
+        LOG.warning('Skipping schedule with no every value: %s', schedule)
+        return None
+    every = schedule['every']
+    matches = SCHEDULE_INTERVAL_RE.match(every) \
+        if isinstance(every, str) and every else None
+    if not matches:
+        raise HookException(
+            f'Invalid schedule interval value: {every} in {schedule}')
+    return Interval(
+        matches.group('weeks'), matches.group('days'),
+        matches.group('hours'), matches.group('minutes'),
+        parse_datetime('start', schedule.get('start')),
+        parse_datetime('stop', schedule.get('stop')))
+
+
+def parse_scheduling(values: Optional[str]) -> ScheduleSpec:
+    """
+    Parse the scheduling values.
+
+    :param values: The scheduling JSON, anything that isn't JSON disables
+        scheduling
+    :return: The scheduling to configure
+    """
+    scheduling = _load(values, 'scheduling')
+    if scheduling is None:
+        return ScheduleSpec(enabled=False)
+
+    prefix = scheduling.get('backupPrefix')
+    if prefix is None:
+        LOG.warning('Setting Backup Prefix to %s. No Backup Prefix provided',
+                    DEFAULT_PREFIX)
+        prefix = DEFAULT_PREFIX
+    elif not isinstance(prefix, str) or not prefix:
+        raise HookException(f'Invalid backupPrefix: {prefix}')
+
+    schedules = scheduling.get('schedules')
+    if schedules is None:
+        LOG.warning('No schedules to create')
+        schedules = []
+    elif not isinstance(schedules, list) or \
+            not all(isinstance(item, dict) for item in schedules):
+        raise HookException(f'schedules must be a list of objects, '
+                            f'got {schedules}')
+    intervals = (parse_interval(schedule) for schedule in schedules)
+    return ScheduleSpec(True, prefix, tuple(
+        interval for interval in intervals if interval))
+
+
+def parse_retention(values: Optional[str]) -> RetentionSpec:
+    """
+    Parse the retention values.
+
+    :param values: The retention JSON, defaults are used for anything
+        missing
+    :return: The retention to configure
+    """
+    retention = _load(values, 'retention')
+    if retention is None:
+        LOG.warning('No Retention Values Provided')
+        retention = {}
+
+    limit = retention.get('limit')
+    if limit is None:
+        LOG.warning('Setting Retention limit to %s. No limit value provided',
+                    DEFAULT_LIMIT)
+        limit = DEFAULT_LIMIT
+    try:
+        if isinstance(limit, bool):
+            raise ValueError(limit)
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError(limit)
+    except (TypeError, ValueError) as error:
+        raise HookException(
+            f'Invalid retention limit: {limit}') from error
+
+    purge = retention.get('autoDelete')
+    if purge is None:
+        LOG.warning('Setting Retention auto delete to %s. No auto delete '
+                    'value provided', DEFAULT_PURGE)
+        purge = DEFAULT_PURGE
+    elif not isinstance(purge, bool):
+        raise HookException(f'Invalid retention autoDelete: {purge}')
+    return RetentionSpec(limit, purge)
@@ -14,11 +14,24 @@
 """
 Class to execute a BRO backup manager configuration restore.
 """
+import re
 import sys
-import time
 from argparse import ArgumentParser, RawTextHelpFormatter
+from typing import Dict, Optional
 
-from common import BroCliBaseClass, KubeApi, get_parsed_args
+from kubernetes.client import V1ConfigMap, V1ObjectMeta
+from kubernetes.client.exceptions import ApiException
+from lib.broapi import Action
+
+from action_history import ActionHistory
+from agent_tracker import AgentTracker
+from common import BroCliBaseClass, HookException, KubeApi, \
+    add_timeout_argument, get_parsed_args
+
+SCOPE = 'ROLLBACK'
+# Where the first attempt at an upgrade records the product version it
+# started from and the CREATE_BACKUP action, for retries to check against
+START_CONFIGMAP = 'eric-enm-pre-upgrade-backup'
 
 class BroPreUpgradeBackup(BroCliBaseClass):
     """
@@ -27,34 +40,169 @@ class BroPreUpgradeBackup(BroCliBaseClass):
     def __init__(self):
         super().__init__()
         self.__kube = KubeApi()
+        self.history = ActionHistory(self.__kube)
+        self.agents = AgentTracker(self.__kube, self)
+
+    def started(self, backup: str) -> Dict[str, str]:
+        """
+        Read what the first attempt at this upgrade recorded when it
+        started creating the backup, see record_start.
+
+        :param backup: The backup name
+        :return: The PRODUCT_VERSION and ACTION_ID recorded, empty if
+            nothing was recorded for this backup
+        """
+        try:
+            data = self.__kube.get_configmap(START_CONFIGMAP).data or {}
+        except ApiException as exception:
+            if exception.status != 404:
+                raise exception
+            return {}
+        return data if data.get('BACKUP') == backup else {}
+
+    def record_start(self, backup: str, version: str, action_id: str):
+        """
+        Record the installed product version and the CREATE_BACKUP action,
+        so a retry of the upgrade can check the backup against them.
+        A failed write is only logged, a retry then checks the backup
+        against the product version installed at the time.
+
+        :param backup: The backup name
+        :param version: The installed product version
+        :param action_id: The CREATE_BACKUP action ID
+        """
+        values = {'BACKUP': backup, 'PRODUCT_VERSION': version,
+                  'ACTION_ID': action_id}
+        try:
+            try:
+                self.__kube.patch_configmap_data(START_CONFIGMAP, values)
+            except ApiException as exception:
+                if exception.status != 404:
+                    raise exception
+                self.__kube.create_configmap(V1ConfigMap(
+                    metadata=V1ObjectMeta(name=START_CONFIGMAP),
+                    data=values))
+        except ApiException as exception:
+            self.warning('Could not record the start of %s in %s: %s %s',
+                         backup, START_CONFIGMAP, exception.status,
+                         exception.reason)
+
+    def check_version(self, backup: str, expected: str):
+        """
+        Fail if a backup isn't of the product version being upgraded from.
+
+        :param backup: The backup name
+        :param expected: The product version being upgraded from
+        """
+        version = self.product_version(self.get_backup(backup, SCOPE))
+        if version != expected:
+            raise HookException(
+                f'Backup {backup} is of product version {version}, not '
+                f'{expected} this upgrade started from, delete it before '
+                f'retrying the upgrade')
+
+    def existing_backup(self, backup: str,
+                        timeout: Optional[float] = None) -> bool:
+        """
+        Check for a pre-upgrade backup an earlier run of the hook created,
+        e.g. before a helm upgrade was retried. A COMPLETE backup is used
+        as is, and one still being created is waited for, if it is of the
+        product version the first attempt started from. Without a
+        recorded start that is the installed product version.
+
+        :param backup: The backup name
+        :param timeout: Seconds to wait for a running backup, None to wait
+            forever
+        :return: True if the backup exists and is complete, False if it
+            doesn't exist
+        """
+        existing = [item for item in self.bro_api().backups(SCOPE)
+                    if item.name == backup]
+        if not existing:
+            return False
+        started = self.started(backup)
+        expected = started.get('PRODUCT_VERSION') or \
+            self.__kube.product_version()
+        status = existing[0].status
+        if status == 'COMPLETE':
+            self.check_version(backup, expected)
+            self.info('Backup %s of %s is already COMPLETE, not creating '
+                      'it again', backup, expected)
+            return True
+        action = self.creating_action(backup, started.get('ACTION_ID'))
+        if action is None:
+            raise HookException(
+                f'Backup {backup} exists with status {status} and is not '
+                f'being created, delete it before retrying the upgrade')
+        self.info('Backup %s is %s, waiting for %s %s to complete',
+                  backup, status, action.name, action.id)
+        self.wait_for_action(action, timeout, record=False)
+        self.check_version(backup, expected)
+        return True
+
+    def creating_action(self, backup: str,
+                        action_id: Optional[str]) -> Optional[Action]:
+        """
+        Find the running CREATE_BACKUP of a backup. It is the action the
+        first attempt recorded if there is one, otherwise a running
+        CREATE_BACKUP whose additional info names the backup.
 
-    def execute_pre_upgrade(self, backup: str):
+        :param backup: The backup name
+        :param action_id: The action ID the first attempt recorded, None
+            if it didn't
+        :return: The running action, None if the backup isn't being
+            created
+        """
+        if action_id:
+            action = self.find_action(action_id, SCOPE)
+            return action if action is not None and \
+                action.state == 'RUNNING' else None
+        running = [action for action in self.bro_api().actions(SCOPE)
+                   if self.creates_backup(action, backup)]
+        return running[0] if running else None
+
+    @staticmethod
+    def creates_backup(action: Action, backup: str) -> bool:
+        """
+        Check if an action is a running CREATE_BACKUP whose additional info
+        names a backup.
+
+        :param action: The BRO action
+        :param backup: The backup name
+        :return: True if the action is creating the backup
+        """
+        if action.name != 'CREATE_BACKUP' or action.state != 'RUNNING':
+            return False
+        return re.search(rf'(?<![-.\w]){re.escape(backup)}(?![-.\w])',
+                         action.additional_info or '') is not None
+
+    def execute_pre_upgrade(self, backup: str,
+                            timeout: Optional[float] = None):
         """
         Creates Bro Pre-Upgrade Backup
 
         If the action completes, the response is checked. If the action is
         not in the SUCCESS state an Exception is raised
 
+        Nothing is created if the backup already exists, see
+        existing_backup.
+
         :param backup: The backup name
+        :param timeout: Seconds to wait overall, None to wait forever
         """
-        self.wait_bro_ready()
-
-        while True:
-            rollback_agents = self.__kube.get_pods_br_rollback_pod_list()
-            registered_agents = self.bro_api().status.agents
-
-            if all(agents in registered_agents for agents in rollback_agents):
-                self.info("All Agents of scope ROLLBACK are registered")
-                break
+        clock = self.deadline(timeout, f'pre-upgrade backup {backup}')
+        self.wait_bro_ready(clock.remaining())
+        if self.existing_backup(backup, clock.remaining()):
+            return
+        version = self.__kube.product_version()
 
-            self.info("Not all Agents of scope ROLLBACK are registered")
-            self.debug(f'rollback_agents: {rollback_agents}')
-            self.debug(f'registered_agents: {registered_agents}')
-            time.sleep(10)
+        rollback_agents = self.agents.wait_for_agents(None, clock, SCOPE)
+        self.info("All Agents of scope %s are registered", SCOPE)
 
-        action = self.bro_api().create(backup, "ROLLBACK")
+        action = self.bro_api().create(backup, SCOPE)
+        self.record_start(backup, version, action.id)
 
-        self.wait_for_action(action)
+        self.wait_for_action(action, clock.remaining(), len(rollback_agents))
 
 def main(sys_args):
     """
@@ -71,9 +219,11 @@ def main(sys_args):
     arg_parser.add_argument('-b', dest='backup', required=True,
         metavar='backup_name',
         help='Name of the BRO pre-upgrade backup to be created')
+    add_timeout_argument(arg_parser)
     args = get_parsed_args(sys_args, arg_parser)
 
-    BroPreUpgradeBackup().execute_pre_upgrade(args.backup)
+    BroPreUpgradeBackup().execute_pre_upgrade(args.backup,
+                                              timeout=args.timeout)
 
 if __name__ == '__main__':  # pragma: no cover
     main(sys.argv[1:])
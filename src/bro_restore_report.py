@@ -16,8 +16,11 @@ Class to execute a BRO restore.
 """
 import sys
 from argparse import ArgumentParser, RawTextHelpFormatter
+from typing import Optional
 
-from common import BroCliBaseClass, HookException, KubeApi, get_parsed_args
+from common import BroCliBaseClass, HookException, KubeApi, \
+    add_timeout_argument, get_parsed_args
+from progress import published_progress
 
 
 class BroRestoreReport(BroCliBaseClass):
@@ -29,12 +32,16 @@ class BroRestoreReport(BroCliBaseClass):
         super().__init__()
         self.__kube = KubeApi()
 
-    def show_restore_action(self, configmap: str, scope: str):
+    def show_restore_action(self, configmap: str, scope: str,
+                            timeout: Optional[float] = None):
         """
         Block until the current ongoing BRO action (if any) has completed.
+        The restore progress and ETA the restore runner published to the
+        configmap are shown first.
 
         :param configmap: Configmap with the restore action ID
         :param scope: The restore scope
+        :param timeout: Seconds to wait for the action, None to wait forever
 
         """
         self.info(f'Looking for a action ID in {configmap}')
@@ -45,23 +52,21 @@ class BroRestoreReport(BroCliBaseClass):
             self.info('No action ID set, skipping.')
             return
 
+        progress = published_progress(cfg_map.data, 'RESTORE')
+        if progress:
+            self.info(f'Restore progress: {progress}')
+
         self.info(f'Looking for BRO action {action_id}')
 
-        action = [act for act in self.bro_api().actions(scope) if
-                  act.id == action_id]
+        action = self.find_action(action_id, scope)
 
-        if not action:
+        if action is None:
             self.info(f'No action with ID {action_id} found in BRO, skipping.')
             return
 
-        if len(action) != 1:
-            raise HookException(
-                f'More than one action with id {action_id} found?')
-
-        action = action[0]
         if action.state == 'RUNNING':
             self.info(f'Action {action.id} is still RUNNING')
-            self.wait_for_action(action)
+            self.wait_for_action(action, timeout)
         else:
             self.info(f'Name: {action.name}')
             self.info(f'Scope: {action.scope}')
@@ -93,8 +98,10 @@ def main(sys_args):
     arg_parser.add_argument('-s', dest='scope', required=True,
                             metavar='scope',
                             help='The scope of the backup')
+    add_timeout_argument(arg_parser)
     args = get_parsed_args(sys_args, arg_parser)
-    BroRestoreReport().show_restore_action(args.configmap, args.scope)
+    BroRestoreReport().show_restore_action(args.configmap, args.scope,
+                                           timeout=args.timeout)
 
 
 if __name__ == '__main__':  # pragma: no cover
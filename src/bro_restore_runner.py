@@ -16,12 +16,30 @@ Class to execute a BRO restore.
 """
 import re
 import sys
-import time
 from argparse import ArgumentParser, RawTextHelpFormatter
-from typing import List
+from typing import Dict, List, Optional
 from kubernetes.client.exceptions import ApiException
+from lib.broapi import Action
 
-from common import BroCliBaseClass, HookException, KubeApi, get_parsed_args
+from action_history import ActionHistory, Overrun
+from agent_tracker import AgentTracker
+from common import BroCliBaseClass, DeadlineClock, HookException, KubeApi, \
+    add_timeout_argument, get_parsed_args
+from progress import ProgressTracker, handed_over_summary
+
+# Checkpoint keys in the backup-restore configmap, so a restarted runner
+# can find the restore an earlier run started.
+RESTORE_PHASE = 'RESTORE_PHASE'
+RESTORE_ACTION_BACKUP = 'RESTORE_ACTION_BACKUP'
+PHASE_RESTORING = 'restoring'
+PHASE_FINISHED = 'finished'
+# Publish the restore progress to the configmap at most this often, or
+# when it moves by PROGRESS_STEP.
+PROGRESS_INTERVAL = 60
+PROGRESS_STEP = 0.05
+# Stands for all the backup's agents, when BRO failed a restore because
+# none of them had registered.
+ALL_AGENTS = '*'
 
 class BroRestoreRunner(BroCliBaseClass):
     """
@@ -31,13 +49,20 @@ class BroRestoreRunner(BroCliBaseClass):
     def __init__(self):
         super().__init__()
         self.__kube = KubeApi()
+        self.progress = ProgressTracker('RESTORE', PROGRESS_INTERVAL,
+                                        PROGRESS_STEP)
+        self.history = ActionHistory(self.__kube)
+        self.agents = AgentTracker(self.__kube, self)
+        self.import_summary = handed_over_summary()
 
-    def _patch_bro_configmap(self, configmap: str, key: str, value: str):
+    def _patch_bro_configmap(self, configmap: str, values: Dict[str, str],
+                             timeout: Optional[float] = None):
+        clock = self.deadline(timeout, f'configmap {configmap} to exist')
         while True:
             try:
                 cfg_map = self.__kube.get_configmap(configmap)
 
-                cfg_map.data[key] = value
+                cfg_map.data.update(values)
 
                 self.__kube.patch_configmap(cfg_map)
 
@@ -45,69 +70,227 @@ class BroRestoreRunner(BroCliBaseClass):
             except ApiException as exception:
                 if exception.status != 404:
                     raise exception
-                time.sleep(5)
+                clock.sleep(5)
 
-    def execute_restore(self, backup: str, scope: str,
-                        configmap: str) -> List[str]:
+    def _read_checkpoint(self, configmap: str) -> Dict[str, str]:
         """
-        Execute a BRO restore and wait for it to complete.
+        Read the restore checkpoint an earlier run left in the configmap.
 
-        If the action completes, the response is checked. If the action is
-        not in the SUCCESS state, the response is checked for missing agents.
-        If there are missing agents True will be returned, anything else is
-        raised as an Exception
+        :param configmap: The backup-restore configmap
+        :return: The configmap data, empty if the configmap doesn't exist
+        """
+        try:
+            return self.__kube.get_configmap(configmap).data or {}
+        except ApiException as exception:
+            if exception.status != 404:
+                raise exception
+            return {}
+
+    def recorded_restore(self, backup: str, scope: str,
+                         configmap: str) -> Optional[Action]:
+        """
+        Find the restore action an earlier run of this backup recorded in
+        the configmap, e.g. before the executor pod was evicted.
 
         :param backup: The backup name
         :param scope: The backup scope
-        :param configmap: The configmap to record the action ID in.
+        :param configmap: The configmap the action ID is recorded in
+        :return: The recorded action or None if there isn't one in BRO
+        """
+        checkpoint = self._read_checkpoint(configmap)
+        action_id = checkpoint.get('RESTORE_ACTION_ID')
+        if not action_id or checkpoint.get(RESTORE_ACTION_BACKUP) != backup:
+            return None
+        self.info('Found checkpoint %s=%s for action %s', RESTORE_PHASE,
+                  checkpoint.get(RESTORE_PHASE), action_id)
+        action = self.find_action(action_id, scope)
+        if action is None:
+            self.info('No action with ID %s found in BRO.', action_id)
+        return action
 
-        :return: True if required agents haven't registered with BRO yet.
+    def _publish_progress(self, configmap: str, info: Optional[str]):
         """
+        Write the restore progress and ETA to the configmap.
+        A failed write is only logged, it doesn't stop the restore.
 
-        action = self.bro_api().restore(backup, scope)
-        id_recorded = False
+        :param configmap: The backup-restore configmap
+        :param info: BRO's progress info for the action
+        """
+        values = self.progress.values(info)
+        try:
+            self.__kube.patch_configmap_data(configmap, values)
+        except ApiException as exception:
+            self.warning('Could not publish the restore progress to %s: '
+                         '%s %s', configmap, exception.status,
+                         exception.reason)
+
+    def _monitor_restore(self,  # pylint: disable=too-many-arguments
+                         action: Action, backup: str, configmap: str,
+                         clock: DeadlineClock, id_recorded: bool,
+                         interval: float = 10,
+                         overrun: Optional[Overrun] = None) -> bool:
+        """
+        Wait for a restore action to complete, recording its ID and
+        progress in the configmap, and check the result.
+
+        :param action: The restore action
+        :param backup: The backup name
+        :param configmap: The configmap to record the action ID in.
+        :param clock: The clock to sleep on
+        :param id_recorded: True if the action ID is already recorded
+        :param interval: Seconds between polls of the action
+        :param overrun: Warns once the restore runs for much longer than
+            usual
+
+        :return: The agents the restore failed for not having, see
+            missing_agents, empty if it succeeded.
+        """
+        started = clock.now()
         while action.state == 'RUNNING':
-            self.info(f'{action.name} is {action.state} at '
-                      f'{action.progress:.0%}'
-                      f'{action.progress_info}')
-            maps = self.__kube.list_configmaps()
-            if not id_recorded and configmap in maps:
+            if overrun:
+                overrun.check(clock.now() - started)
+            progress, info = action.progress, action.progress_info
+            self.info('%s is RUNNING at %.0f%%%s', action.name, progress * 100,
+                      info)
+            self.progress.record(clock.now(), progress)
+            if not id_recorded and configmap in self.__kube.list_configmaps():
                 # The backup-restore-configmap may not be created yet so keep
-                # trying to store the action ID, if not already done.
-                self._patch_bro_configmap(
-                    configmap, 'RESTORE_ACTION_ID', action.id)
+                # trying to store the action ID, if not already done, with
+                # the import throughput the trigger couldn't record.
+                values = dict(self.progress.values(info),
+                              **self.import_summary)
+                values.update({'RESTORE_ACTION_ID': action.id,
+                               RESTORE_ACTION_BACKUP: backup,
+                               RESTORE_PHASE: PHASE_RESTORING})
+                self._patch_bro_configmap(configmap, values,
+                                          clock.remaining())
                 id_recorded = True
-            time.sleep(10)
+            elif id_recorded and self.progress.due():
+                self._publish_progress(configmap, info)
+            clock.sleep(interval)
 
         self.log_action(action)
 
         add_info = action.additional_info or 'None'
         add_info = add_info.replace('\n', ' ')
-        waiting = False
-        if 'Agents with the following IDs are required' in add_info:
-            _match = re.search(r'.*?\[(.*)]', action.additional_info)
-            waiting = _match is not None
-        elif 'Failing job for not having any registered agents' in add_info:
+        missing = self.missing_agents(add_info)
+        if missing == [ALL_AGENTS]:
             self.info('No agents have registered yet.')
-            waiting = True
 
-        if action.result != 'SUCCESS' and not waiting:
+        if action.result != 'SUCCESS' and not missing:
             raise HookException(
                 f'Action {action.name} failed with '
                 f'result {action.result}: {add_info}')
-        return waiting
+        return missing
+
+    @staticmethod
+    def missing_agents(additional_info: str) -> List[str]:
+        """
+        Get the agents a restore failed for not having, from the action's
+        additional info.
+
+        :param additional_info: The action's additional info
+        :return: The agent IDs, [ALL_AGENTS] if no agents had registered,
+            empty if the restore didn't fail for missing agents
+        """
+        if 'Agents with the following IDs are required' in additional_info:
+            _match = re.search(r'.*?\[(.*)]', additional_info)
+            if _match:
+                return [agent.strip() for agent in _match.group(1).split(',')
+                        if agent.strip()]
+        elif 'Failing job for not having any registered agents' in \
+                additional_info:
+            return [ALL_AGENTS]
+        return []
+
+    def execute_restore(self,  # pylint: disable=too-many-arguments
+                        backup: str, scope: str, configmap: str,
+                        timeout: Optional[float] = None,
+                        size: Optional[int] = None) -> List[str]:
+        """
+        Execute a BRO restore and wait for it to complete.
+
+        If the action completes, the response is checked. If the action is
+        not in the SUCCESS state, the response is checked for missing agents.
+        If there are missing agents they are returned, anything else is
+        raised as an Exception
+
+        A warning is logged if the restore runs for much longer than
+        earlier restores of backups of a similar size, or it times out then
+        if the history fails stuck actions, and its duration is added to
+        the history if it succeeds.
+
+        :param backup: The backup name
+        :param scope: The backup scope
+        :param configmap: The configmap to record the action ID in.
+        :param timeout: Seconds to wait for the restore, None to wait forever
+        :param size: The backup size, the number of agents in it
+
+        :return: The agents the restore failed for not having, see
+            missing_agents, empty if it succeeded.
+        """
+        limit = self.history.limit('RESTORE', scope, size)
+        interval = self.history.poll_interval('RESTORE', scope, size)
+
+        action = self.bro_api().restore(backup, scope)
+        description = f'restore action {action.id}'
+        if limit is not None:
+            usual = self.history.predicted('RESTORE', scope, size)
+            description += f' (restores usually take {usual:.0f}s)'
+        clock = self.deadline(self.history.timeout(timeout, limit),
+                              description)
+        started = clock.now()
+        missing = self._monitor_restore(
+            action, backup, configmap, clock, False, interval,
+            self.history.overrun(f'Restore action {action.id}', limit))
+        if not missing:
+            self.history.record('RESTORE', scope, clock.now() - started, size)
+        return missing
+
+    def resume_restore(self, backup: str, scope: str, configmap: str,
+                       timeout: Optional[float] = None) -> \
+            Optional[List[str]]:
+        """
+        Re-attach to a restore an earlier run started, instead of starting
+        a new one. A running action is waited on, a successful one is
+        accepted as is. A failed one is left for a new restore to retry.
+
+        :param backup: The backup name
+        :param scope: The backup scope
+        :param configmap: The configmap the action ID is recorded in
+        :param timeout: Seconds to wait for the restore, None to wait forever
+
+        :return: None if there was nothing to resume, otherwise the agents
+            the restore failed for not having, empty if it succeeded.
+        """
+        action = self.recorded_restore(backup, scope, configmap)
+        if action is None:
+            return None
+        if action.state != 'RUNNING' and action.result != 'SUCCESS':
+            self.info('Recorded %s %s ended with %s, starting a new '
+                      'restore.', action.name, action.id, action.result)
+            return None
+        self.info('Resuming %s %s', action.name, action.id)
+        clock = self.deadline(timeout, f'restore action {action.id}')
+        return self._monitor_restore(action, backup, configmap, clock, True)
 
     def do_restore(self, backup_name: str, configmap: str,
-                   scope: str):
+                   scope: str, timeout: Optional[float] = None):
         """
         Execute a restore. This will wait for the required BEO services to
         register before triggering anything.
 
+        If the configmap records a restore of the same backup that is still
+        running in BRO, or that completed, it is resumed rather than
+        restarted.
+
         :param backup_name: A backup name
         :param scope: A backup scope
         :param configmap: The config map to store the restore action ID in
+        :param timeout: Seconds to wait overall, None to wait forever
 
         """
+        clock = self.deadline(timeout, f'restore of {backup_name}')
 
         # Wait for all required agents to register
         # try to prevent a load of restore failure errors for
@@ -120,20 +303,29 @@ class BroRestoreRunner(BroCliBaseClass):
         if 'APPLICATION_INFO' in required_agents:
             required_agents.remove('APPLICATION_INFO')
 
-        waiting = True
-        while waiting:
-            while not all(agent in self.bro_api().status.agents
-                          for agent in required_agents):
-                self.info('Waiting for all agents '
-                          'to register before proceeding')
-                time.sleep(30)
+        missing = self.resume_restore(backup_name, scope, configmap,
+                                      clock.remaining())
+        if missing is None:
+            missing = [ALL_AGENTS]
+        elif missing:
+            self.info('Resumed restore failed because of missing agents')
+        while missing:
+            self.agents.wait_for_agents(
+                required_agents if ALL_AGENTS in missing else missing, clock)
             self.info('Executing BRO restore')
-            waiting = self.execute_restore(backup_name, scope, configmap)
-            if waiting:
-                self.info('Restore failed because of missing agents')
+            missing = self.execute_restore(backup_name, scope, configmap,
+                                           clock.remaining(),
+                                           len(required_agents))
+            if missing:
+                self.info('Restore failed because of missing agents: %s',
+                          ', '.join(missing))
 
         self.info('Setting RESTORE_STATE=finished')
-        self._patch_bro_configmap(configmap, 'RESTORE_STATE', 'finished')
+        self._patch_bro_configmap(
+            configmap, dict(self.progress.values(finished=True),
+                            RESTORE_STATE='finished',
+                            **{RESTORE_PHASE: PHASE_FINISHED}),
+            clock.remaining())
         self.info('Restore complete.')
 
 
@@ -160,8 +352,10 @@ def main(sys_args):
     arg_parser.add_argument('-c', dest='configmap', required=True,
                             metavar='configmap',
                             help='The backup-restore configmap')
+    add_timeout_argument(arg_parser)
     args = get_parsed_args(sys_args, arg_parser)
-    BroRestoreRunner().do_restore(args.backup, args.configmap, args.scope)
+    BroRestoreRunner().do_restore(args.backup, args.configmap, args.scope,
+                                  timeout=args.timeout)
 
 
 if __name__ == '__main__':  # pragma: no cover
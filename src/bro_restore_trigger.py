@@ -13,20 +13,30 @@
 # *****************************************************************************
 """
 Class to import a backup and trigger a restore in the background.
-This will return once the restore job has started and not wait for it.
+This will return once the restore job has started and not wait for it,
+unless --wait is given, then it follows the job's logs until it finishes
+and exits with its result.
 """
 
+import json
 import os
 import sys
 from argparse import ArgumentParser, RawTextHelpFormatter
 from os.path import join
 from socket import gethostname
+from typing import Dict, Optional, Tuple
 
-from kubernetes.client import V1Container, V1Job, V1JobSpec, V1ObjectMeta, \
-    V1PodSpec, V1PodTemplateSpec, V1LocalObjectReference
+from kubernetes.client import V1Job
+from kubernetes.client.exceptions import ApiException
 
+from action_history import ActionHistory
+from backup_probe import BackupVersionProbe
 from common import BroCliBaseClass, HookException, KubeApi, \
-    KubeBatchBaseClass, get_parsed_args
+    KubeBatchBaseClass, add_plan_argument, add_timeout_argument, \
+    get_parsed_args
+from job_template import JobTemplate
+from plan import planned, planning
+from progress import SUMMARY_ENV
 
 
 class BroImportAndRestoreTrigger(KubeBatchBaseClass):
@@ -35,18 +45,35 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
     run the actual restore action
     """
 
-    def __init__(self):
+    def __init__(self, accept_unknown_host_key: bool = False):
+        """
+        :param accept_unknown_host_key: Trust the SFTP server's host key
+            even if it isn't in known_hosts or the externalStorageKnownHosts
+            secret
+        """
         super().__init__()
+        self.accept_unknown_host_key = accept_unknown_host_key
         self.brocli = BroCliBaseClass()
         self.__kube = KubeApi()
-
-    def import_backup(self, secrets: str, backup_name: str, scope: str):
+        self.brocli.history = ActionHistory(self.__kube)
+        self.__enm_product_version = None
+        self.import_summary: Dict[str, str] = {}
+
+    def import_backup(self,  # pylint: disable=too-many-arguments
+                      secrets: str, backup_name: str, scope: str,
+                      timeout: Optional[float] = None,
+                      configmap: Optional[str] = None):
         """
         Import a backup from an SFTP server.
 
-        :param secrets: Directory containing the SFTP server URI and password
+        :param secrets: Directory containing the SFTP server URI and
+            password, and optionally its known_hosts as
+            externalStorageKnownHosts
         :param backup_name: The backup to import
         :param scope: The backup scope
+        :param timeout: Seconds to wait for the import, None to wait forever
+        :param configmap: The backup-restore-configmap to record the
+            import's throughput in, None to only log it
 
         """
 
@@ -72,8 +99,24 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
                     f'Backup {backup_name} does not exist in BRO'
                     f' and have no SFTP secrets so can\'t try to'
                     f' import it either!')
+            # Reject a backup from another product version before spending
+            # the time on a full import.
+            probed = BackupVersionProbe(
+                known_hosts=join(secrets, 'externalStorageKnownHosts'),
+                accept_unknown_host_key=self.accept_unknown_host_key
+            ).probe(uri, password, backup_name)
+            if probed.version is not None:
+                self.check_product_version(self.enm_product_version(),
+                                           probed.version)
             self.info(f'Importing {backup_name} from {uri}')
-            self.brocli.import_backup(backup_name, uri, password)
+            summary = self.brocli.import_backup(backup_name, uri, password,
+                                                timeout, probed.size)
+            if configmap and summary:
+                self.record_import(configmap, summary)
+            if planning():
+                self.info('Plan only, the product version is checked once '
+                          'the backup is imported.')
+                return
 
         else:
             self.info(f'BRO has a backup called {backup_name}')
@@ -86,23 +129,75 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
         else:
             backup = self.brocli.get_backup(backup_name, scope)
 
-        product_version_cm = self.__kube.get_configmap(
-            'product-version-configmap')
-        enm_product_version = product_version_cm.metadata.annotations[
-            'ericsson.com/product-revision']
+        self.check_product_version(self.enm_product_version(),
+                                   self.brocli.product_version(backup))
+        self.info('Product versions match')
 
-        for service in backup.services:
-            if service.agent_id == 'APPLICATION_INFO':
-                backup_product_version = service.version
+    def record_import(self, configmap: str, summary: Dict[str, str]):
+        """
+        Write an import's throughput summary to the configmap.
+        A failed write is only logged, it doesn't stop the restore.
 
-        if backup_product_version == enm_product_version:
-            self.info('Product versions match')
-        else:
+        The configmap isn't created until after the pre-install hooks, so
+        if it doesn't exist yet the summary is handed to the restore job,
+        which records it with the restore action ID.
+
+        :param configmap: The backup-restore configmap
+        :param summary: The IMPORT_* values from the import
+        """
+        try:
+            self.__kube.patch_configmap_data(configmap, summary)
+        except ApiException as exception:
+            if exception.status == 404:
+                self.info(f'{configmap} does not exist yet, the restore job '
+                          f'will record the import throughput')
+                self.import_summary = summary
+                return
+            self.warning(f'Could not record the import throughput in '
+                         f'{configmap}: {exception.status} '
+                         f'{exception.reason}')
+
+    def enm_product_version(self) -> str:
+        """
+        Get the installed ENM product version. It is only read once.
+
+        :return: The product revision of product-version-configmap
+        """
+        if self.__enm_product_version is None:
+            self.__enm_product_version = self.__kube.product_version()
+        return self.__enm_product_version
+
+    @staticmethod
+    def check_product_version(enm_product_version: str,
+                              backup_product_version: Optional[str]):
+        """
+        Fail if a backup is from a different product version.
+
+        :param enm_product_version: The installed ENM product version
+        :param backup_product_version: The backup product version
+        """
+        if backup_product_version != enm_product_version:
             raise HookException(
                 f'ENM product version {enm_product_version} and '
                 f'backup product version {backup_product_version} '
                 'do not match')
 
+    def own_image(self) -> Tuple[str, str]:
+        """
+        Get the image and pull policy of this pod's first container, for
+        charts that don't set $HOOK_IMAGE.
+        The pod name is taken from $HOOK_POD_NAME if the chart sets it with
+        the downward API, otherwise the hostname.
+
+        :return: The image and the image pull policy
+        """
+        this_pod = self.api_core().read_namespaced_pod(
+            os.environ.get('HOOK_POD_NAME') or gethostname(),
+            self.namespace()
+        )
+        container = this_pod.spec.containers[0]
+        return container.image, container.image_pull_policy
+
     def create_job_definition(self,  # pylint: disable=too-many-arguments
                               job_name: str, backup_name: str,
                               configmap: str, account: str,
@@ -126,39 +221,20 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
         if not bro_port:
             raise HookException(f'$BRO_PORT is not set in {gethostname()}')
 
-        pull_secret_name = os.environ.get('PULL_SECRET')
-
-        this_pod = self.api_core().read_namespaced_pod(
-            gethostname(),
-            self.namespace()
-        )
-
-        exec_container = V1Container(
-            name='executor',
-            image=this_pod.spec.containers[0].image,
-            image_pull_policy=this_pod.spec.containers[0].image_pull_policy,
+        env = {'BRO_HOST': bro_host, 'BRO_PORT': bro_port}
+        if self.import_summary:
+            env[SUMMARY_ENV] = json.dumps(self.import_summary)
+        job = JobTemplate().render(
+            job_name,
             command=['/bin/sh', '-c',
                      f'exec_hook bro_restore_runner.py '
                      f'-b {backup_name} -c {configmap} -s {scope}'],
-            env=[
-                {'name': 'BRO_HOST', 'value': bro_host},
-                {'name': 'BRO_PORT', 'value': bro_port}
-            ]
-        )
-        pod_template = V1PodTemplateSpec(
-            metadata=V1ObjectMeta(
-                annotations={'backup_name': backup_name}
-            ),
-            spec=V1PodSpec(
-                service_account=account,
-                restart_policy='Never',
-                containers=[exec_container],
-                image_pull_secrets=[V1LocalObjectReference(
-                    name=pull_secret_name)] if pull_secret_name else None))
-        job_spec = V1JobSpec(template=pod_template, backoff_limit=0)
-        job = V1Job(api_version="batch/v1", kind="Job",
-                    metadata=V1ObjectMeta(name=job_name),
-                    spec=job_spec)
+            env=env,
+            service_account=account,
+            annotations={'backup_name': backup_name},
+            pull_secret=os.environ.get('PULL_SECRET'),
+            fallback_image=self.own_image)
+        exec_container = job.spec.template.spec.containers[0]
         self.info('job_def:')
         self.info(f'\tname: {job.metadata.name}')
         self.info(f'\timage: {exec_container.image}')
@@ -167,7 +243,8 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
 
     def trigger_restore(self,  # pylint: disable=too-many-arguments
                         job_name: str, backup_name: str, configmap: str,
-                        account: str, scope: str):
+                        account: str, scope: str,
+                        timeout: Optional[float] = None, wait: bool = False):
         """
         Execute a BRO restore in a background batch.job
 
@@ -176,11 +253,19 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
         :param configmap: The configmap to store the restore action ID in
         :param account: The serviceaccount to run the Job as
         :param scope: The backup scope
+        :param timeout: Seconds to wait for a previous job to delete, and the
+            job to finish if waiting, None to wait forever
+        :param wait: Wait for the job to finish, following its logs
+        :raises HookException: If waiting and the job failed
 
         """
+        clock = self.deadline(timeout, f'restore job {job_name}')
 
         if backup_name.endswith('.tar.gz'):
-            backup_name =  self.brocli.bro_api().backups(scope)[0].name
+            backups = self.brocli.bro_api().backups(scope)
+            # A plan run didn't import it, keep the file name
+            if backups or not planning():
+                backup_name = backups[0].name
 
         job = self.create_job_definition(
             job_name, backup_name, configmap, account, scope)
@@ -188,7 +273,7 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
         self.info(
             f'Triggering restore job {job_name} for {scope}/{backup_name}.')
         if job_name in self.list_jobs():
-            self.delete_job(job_name)
+            self.delete_job(job_name, clock.remaining())
             self.info('Replacing previous job.')
 
         api_response = self.api_batch().create_namespaced_job(
@@ -196,15 +281,20 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
             job,
         )
         self.info(f'Triggered restore job, status={api_response.status}')
+        if wait and not self.wait_for_job(job_name, clock.remaining()):
+            raise HookException(f'Restore job {job_name} failed')
 
     def import_and_trigger(self,  # pylint: disable=too-many-arguments
                            account: str, secrets: str, job_name: str,
-                           backup_name: str, configmap: str, scope: str):
+                           backup_name: str, configmap: str, scope: str,
+                           timeout: Optional[float] = None,
+                           wait: bool = False):
         """
         (Optionally) import a backup a trigger a restore in a
         background batch.job
 
-        :param account: serviceacount to that allows configmap patch & get
+        :param account: serviceacount to that allows configmap patch, get
+        and create
         :param secrets: Directory containing the SFTP uri and password
         secrets files
         :param job_name: Name of the background restore job
@@ -212,10 +302,15 @@ class BroImportAndRestoreTrigger(KubeBatchBaseClass):
         :param configmap: The backup-restore-configmap holding the state
         :param scope: The backup scope
         of the current restore
+        :param timeout: Seconds to wait overall, None to wait forever
+        :param wait: Wait for the restore job to finish
 
         """
-        self.import_backup(secrets, backup_name, scope)
-        self.trigger_restore(job_name, backup_name, configmap, account, scope)
+        clock = self.deadline(timeout, f'restore of {backup_name} to trigger')
+        self.import_backup(secrets, backup_name, scope, clock.remaining(),
+                           configmap)
+        self.trigger_restore(job_name, backup_name, configmap, account, scope,
+                             clock.remaining(), wait)
 
 
 def main(sys_args):
@@ -233,12 +328,14 @@ def main(sys_args):
     arg_parser.add_argument('-S', dest='secrets', required=True,
                             metavar='secrets',
                             help='Location of the uri and password '
-                                 'SFTP secrets files.')
+                                 'SFTP secrets files, and optionally\n'
+                                 'externalStorageKnownHosts with the SFTP '
+                                 'host key.')
 
     arg_parser.add_argument('-A', dest='account', required=True,
                             metavar='serviceaccount',
                             help='The serviceaccount with Role permissions '
-                                 'for configmap patch & get')
+                                 'for configmap patch, get & create')
 
     arg_parser.add_argument('-b', dest='backup', required=True,
                             metavar='backup_name',
@@ -254,16 +351,30 @@ def main(sys_args):
     arg_parser.add_argument('-c', dest='configmap', required=True,
                             metavar='configmap',
                             help='Name of the back-restore configmap')
+    arg_parser.add_argument('--wait', dest='wait', action='store_true',
+                            help='Wait for the restore job to finish, '
+                                 'showing its logs,\nand exit with its '
+                                 'result')
+    arg_parser.add_argument('--accept-unknown-host-key',
+                            dest='accept_unknown_host_key',
+                            action='store_true',
+                            help='Trust the SFTP server even if its host '
+                                 'key is not known, when reading\nthe '
+                                 'backup product version before the import')
+    add_timeout_argument(arg_parser)
+    add_plan_argument(arg_parser)
 
     args = get_parsed_args(sys_args, arg_parser)
-    trigger = BroImportAndRestoreTrigger()
-    try:
-        trigger.import_and_trigger(
-        args.account, args.secrets, args.job, args.backup, args.configmap,
-        args.scope)
-    except Exception as import_exception: # pylint: disable=broad-except
-        trigger.debug(f'Caught exception: {str(import_exception)}')
-        sys.exit(1)
+    with planned(args.plan):
+        trigger = BroImportAndRestoreTrigger(args.accept_unknown_host_key)
+        try:
+            trigger.import_and_trigger(
+                args.account, args.secrets, args.job, args.backup,
+                args.configmap, args.scope, timeout=args.timeout,
+                wait=args.wait)
+        except Exception as import_exception: # pylint: disable=broad-except
+            trigger.debug(f'Caught exception: {str(import_exception)}')
+            sys.exit(1)
 
 
 if __name__ == '__main__':  # pragma: no cover
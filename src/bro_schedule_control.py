@@ -15,18 +15,14 @@
 Class to execute a BRO backup manager configuration restore.
 """
 import base64
-import json
-import re
 import sys
 
 from argparse import ArgumentParser, RawTextHelpFormatter
-from datetime import datetime
+from typing import Optional, Tuple
 
-from common import BroCliBaseClass, KubeApi, get_parsed_args
-
-SCHEDULE_INTERVAL_RE = re.compile(
-                        r'^((?P<weeks>\d+)w)?((?P<days>\d+)d)?'
-                        r'((?P<hours>\d+)h)?((?P<minutes>\d+)m)?$')
+from bro_config_spec import Interval, ScheduleSpec, parse_scheduling
+from common import BroCliBaseClass, KubeApi, add_timeout_argument, \
+    get_parsed_args
 
 
 class ScheduleControl(BroCliBaseClass):
@@ -38,25 +34,27 @@ class ScheduleControl(BroCliBaseClass):
         super().__init__()
         self.__kube = KubeApi()
 
-    def configure_scheduling(self, values=None, secret_name=None):
+    def configure_scheduling(self, values=None, secret_name=None,
+                             timeout: Optional[float] = None):
         """
         Uses scheduling configurations from the Values file to create user
         defined schedules for the DEFAULT scope.
+
+        The values are checked before BRO is changed at all.
+
+        :param values: A ScheduleSpec, or the scheduling JSON to parse
+        :param secret_name: Secret with the export URI and password
+        :param timeout: Seconds to wait for BRO, None to wait forever
         """
-        self.wait_bro_ready()
-        schedule = self.bro_api().get_schedule()
-        scheduling_values = {}
-        has_scheduling = True
-
-        try:
-            scheduling_values = json.loads(values)
-        except ValueError as exc:
-            self.debug(f'Exception occurred: {exc}')
-            has_scheduling = False
-        if not (has_scheduling or scheduling_values):
+        spec = values if isinstance(values, ScheduleSpec) \
+            else parse_scheduling(values)
+        clock = self.deadline(timeout, 'BRO scheduling to be configured')
+        self.wait_bro_ready(clock.remaining())
+        schedule = self.get_schedule()
+        if not spec.enabled:
             self.info('Disabling backup scheduling.')
             schedule.update(enabled=False)
-            self.delete_schedules()
+            self.delete_schedules(clock.remaining())
             return
         self.info("Enabling backup scheduling.")
 
@@ -74,7 +72,7 @@ class ScheduleControl(BroCliBaseClass):
             self.info(f"Starting delete for '{secret_name}' Secret")
             response = self.__kube.delete_secret(secret_name)
             self.debug(f"response: {response}")
-            if response.status == 'Success':
+            if response and response.status == 'Success':
                 self.info(f"Secret '{secret_name}' deleted successfully")
 
         if not (export_password or export_uri):
@@ -83,91 +81,43 @@ class ScheduleControl(BroCliBaseClass):
             export_password = None
             export_uri = None
 
-        try:
-            backup_prefix = scheduling_values['backupPrefix']
-        except KeyError:
-            backup_prefix = "SCHEDULED_BACKUP"
-            self.warning(f'Setting Backup Prefix to {backup_prefix}. '
-                       'No Backup Prefix provided')
-
         schedule.update(
             True,
-            backup_prefix,
+            spec.prefix,
             auto_export,
             export_password,
             export_uri)
-        self.delete_schedules()
-
-        try:
-            self._add_schedules(schedule, scheduling_values['schedules'])
-        except KeyError as exc:
-            self.debug(f'Exception occurred: {exc}')
-            self.warning("No schedules to create")
-
-    def _add_schedules(self, schedule=None, schedules=None):
-        if schedules:
-            for a_schedule in schedules:
-                if 'every' in a_schedule:
-                    every = self.validate_backup_interval(SCHEDULE_INTERVAL_RE,
-                                                    a_schedule['every'])
-                    start_datetime = None
-                    if 'start' in a_schedule:
-                        start_datetime = self.validate_datetime(
-                            'start', a_schedule['start'])
-                    stop_datetime = None
-                    if 'stop' in a_schedule:
-                        stop_datetime = self.validate_datetime(
-                            'stop',a_schedule['stop'])
-                    if every:
-                        matches = SCHEDULE_INTERVAL_RE.search(every)
-                        interval = schedule.interval_add(
-                            matches.group('weeks'),
-                            matches.group('days'),
-                            matches.group('hours'),
-                            matches.group('minutes'),
-                            start_time=start_datetime,
-                            stop_time=stop_datetime)
-                        self.debug(f'Added backup interval {interval.id}\n')
-
-    def delete_schedules(self):
+        self.delete_schedules(clock.remaining())
+        self._add_schedules(schedule, spec.intervals)
+
+    def _add_schedules(self, schedule, intervals: Tuple[Interval, ...]):
+        for interval in intervals:
+            added = schedule.interval_add(
+                interval.weeks, interval.days, interval.hours,
+                interval.minutes, start_time=interval.start,
+                stop_time=interval.stop)
+            self.debug(f'Added backup interval {added.id}\n')
+
+    def delete_schedules(self, timeout: Optional[float] = None):
         """
         Deletes all schedules for DEFAULT scope
+
+        :param timeout: Seconds to wait for BRO, None to wait forever
         """
-        self.wait_bro_ready()
-        schedule_config = self.bro_api().get_schedule()
+        self.wait_bro_ready(timeout)
+        schedule_config = self.get_schedule()
         for interval in schedule_config.intervals:
             schedule_config.interval_delete(interval.id)
 
-    def validate_backup_interval(self, interval_regex, value):
-        """Check that schedule interval is properly formatted.
-            Returns 'None' if validation fails.
-        """
-        if not value or not interval_regex.match(value):
-            self.warning(
-                f"Invalid schedule interval value: {value}")
-            return None
-        return value
-
-    def validate_datetime(self, action, value):
-        """Check that schedule start|stop datetime is properly formatted.
-            Returns 'None' if validation fails.
-        """
-        try:
-            datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
-            return value
-        except (ValueError, TypeError):
-            self.warning(
-                f"Invalid schedule '{action}' value: '{value}', "
-                "format should be YYYY-mm-ddThh:mm:ss")
-            return None
-
-    def enable_scheduling(self, is_enabled):
+    def enable_scheduling(self, is_enabled, timeout: Optional[float] = None):
         """
         Enable/disable backup scheduling for DEFAULT scope
+
+        :param timeout: Seconds to wait for BRO, None to wait forever
         """
-        self.wait_bro_ready()
+        self.wait_bro_ready(timeout)
 
-        schedule = self.bro_api().get_schedule()
+        schedule = self.get_schedule()
         schedule.update(enabled=is_enabled)
 
 def main(sys_args):
@@ -187,10 +137,11 @@ def main(sys_args):
 
     arg_parser.add_argument('--enabled', dest='is_enabled',
         action='store_true', help='Enable Scheduling')
+    add_timeout_argument(arg_parser)
 
     args = get_parsed_args(sys_args, arg_parser)
 
-    ScheduleControl().enable_scheduling(args.is_enabled)
+    ScheduleControl().enable_scheduling(args.is_enabled, timeout=args.timeout)
 
 
 if __name__ == '__main__':  # pragma: no cover
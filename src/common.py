@@ -13,26 +13,897 @@
 """
 Common classes and functions for hook scripts.
 """
+# pylint: disable=too-many-lines
+import atexit
+import inspect
 import logging
 import os
-import sys
+import queue
+import random
+import threading
 import time
 from argparse import ArgumentParser, Namespace
+from concurrent.futures import Future, wait as wait_futures
+from contextlib import contextmanager
+from functools import partial, wraps
 from os.path import exists
-from typing import List
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, \
+    Optional, Tuple
 
+from kubernetes import watch
 from kubernetes.client import ApiClient, BatchV1Api, CoreV1Api, V1ConfigMap, \
-    V1DeleteOptions, V1Status, V1Service
+    V1DeleteOptions, V1Job, V1Status, V1Service
 from kubernetes.client.exceptions import ApiException
 from kubernetes.config import ConfigException, load_incluster_config, \
     load_kube_config
 from lib.broapi import Action, Backup, Bro
 from requests.exceptions import ConnectionError as connection_err
+from requests.exceptions import RequestException
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+
+from hook_logging import set_log_context, setup_logging, thread_log_context
+from plan import PlannedResult, is_mutation, planning, skip_wait, \
+    use_plan
+from progress import TransferTracker
+
+# Statuses worth retrying, 429 is the API server asking us to back off.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Calls that change state and can't safely be repeated if the first attempt
+# may have been acted on, these are only retried on a 429.
+NON_IDEMPOTENT_PREFIXES = ('create', 'restore', 'import', 'export')
+# Calls that are retried, but whose retry gets a 404 if the first attempt
+# was acted on, so a 404 after a retry means the call succeeded.
+DELETE_PREFIXES = ('delete',)
+# Errors that mean the request may not have reached the API at all.
+TRANSPORT_ERRORS = (RequestException, Urllib3HTTPError, ConnectionError,
+                    TimeoutError)
+API_ERRORS = (ApiException,) + TRANSPORT_ERRORS
+# Longest a single watch request stays open, watches are resumed from the
+# last resource version seen until they're done or their deadline passes.
+WATCH_SECONDS = 60
+# How often a job's pods are looked for while there are no logs to follow,
+# and how long the logs are given to finish once the job has.
+LOG_POLL_SECONDS = 5
+LOG_DRAIN_SECONDS = 30
+# Log an import's throughput at most this often, or when it moves by
+# IMPORT_LOG_STEP, and warn when it hasn't moved for IMPORT_STALL_SECONDS,
+# which can be set in the environment.
+IMPORT_LOG_SECONDS = 30
+IMPORT_LOG_STEP = 0.1
+IMPORT_STALL_SECONDS = 600
+
 
 class HookException(Exception):
     """ Generic exception for any hook errors """
 
 
+class HookTimeoutException(HookException):
+    """ A hook gave up waiting because its deadline passed """
+
+
+class CircuitOpenException(HookException):
+    """ An API has failed too often in a row, calls to it fail fast """
+
+
+class Clock:
+    """
+    Interface for reading the time and sleeping. All hook waits go through
+    a Clock so they can be bounded by a deadline or run on virtual time.
+    """
+
+    def now(self) -> float:
+        """
+        Get the current time. Only the difference between two readings is
+        meaningful.
+
+        :return: Current time in seconds
+        """
+        raise NotImplementedError
+
+    def sleep(self, seconds: float):
+        """
+        Block for a number of seconds.
+
+        :param seconds: Seconds to sleep
+        """
+        raise NotImplementedError
+
+
+class WallClock(Clock):
+    """
+    The real clock, using time.monotonic() and time.sleep()
+    """
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """
+    A clock that only moves when something sleeps on it.
+    Every sleep is recorded in ``sleeps``.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.current = start
+        self.sleeps = []
+
+    def now(self) -> float:
+        return self.current
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.current += seconds
+
+
+class DeadlineClock(Clock):
+    """
+    Wrap a clock with a deadline. A sleep that would pass the deadline is
+    cut short so the caller gets one last check, and sleeping once the
+    deadline has passed raises HookTimeoutException.
+    A timeout of None never expires.
+    """
+
+    def __init__(self, clock: Clock, timeout: Optional[float],
+                 description: str):
+        self.__clock = clock
+        self.__timeout = timeout
+        self.__description = description
+        self.__expires = None if timeout is None else clock.now() + timeout
+
+    def now(self) -> float:
+        return self.__clock.now()
+
+    def remaining(self) -> Optional[float]:
+        """
+        Get the time left before the deadline.
+
+        :return: Seconds left, or None if there is no deadline
+        """
+        if self.__expires is None:
+            return None
+        return max(0.0, self.__expires - self.__clock.now())
+
+    def check(self):
+        """
+        Raise HookTimeoutException if the deadline has passed.
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise HookTimeoutException(
+                f'Timed out after {self.__timeout}s waiting for '
+                f'{self.__description}')
+
+    def sleep(self, seconds: float):
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self.__clock.sleep(seconds)
+
+
+_CLOCK = WallClock()
+
+
+def get_clock() -> Clock:
+    """
+    Get the clock all hook waits use.
+
+    :return: The current Clock
+    """
+    return _CLOCK
+
+
+def set_clock(clock: Clock) -> Clock:
+    """
+    Replace the clock all hook waits use, e.g. with a VirtualClock.
+
+    :param clock: The new Clock
+    :return: The previous Clock
+    """
+    global _CLOCK  # pylint: disable=global-statement
+    previous, _CLOCK = _CLOCK, clock
+    return previous
+
+
+def deadline(timeout: Optional[float], description: str) -> DeadlineClock:
+    """
+    Start a deadline on the current clock.
+
+    :param timeout: Seconds until the deadline, None for no deadline
+    :param description: What is being waited for, used in the timeout error
+    :return: A DeadlineClock to sleep on
+    """
+    return DeadlineClock(get_clock(), timeout, description)
+
+
+def watch_timeout(clock: DeadlineClock,
+                  seconds: float = WATCH_SECONDS) -> int:
+    """
+    Get the timeout for the next watch request, so a watch never runs past
+    the deadline.
+
+    :param clock: The deadline
+    :param seconds: Longest to watch for
+    :return: Whole seconds to watch for, at least 1
+    :raises HookTimeoutException: If the deadline has passed
+    """
+    clock.check()
+    remaining = clock.remaining()
+    if remaining is not None:
+        seconds = min(seconds, remaining)
+    return max(1, int(seconds))
+
+
+def shortest_timeout(*timeouts: Optional[float]) -> Optional[float]:
+    """
+    :param timeouts: Seconds, None for no timeout
+    :return: The shortest of the timeouts, None if none are set
+    """
+    timeouts = [timeout for timeout in timeouts if timeout is not None]
+    return min(timeouts) if timeouts else None
+
+
+def _env_float(name: str, default: float) -> float:
+    """
+    Read a number from the environment.
+
+    :param name: Environment variable name
+    :param default: Value to use if it's not set
+    :return: The value
+    """
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    """
+    Get the HTTP status of a failed API call.
+
+    :param error: ApiException or a requests/urllib3 error
+    :return: The status, or None if no response was received
+    """
+    if isinstance(error, ApiException):
+        return error.status or None
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Get the Retry-After seconds a failed API call asked for.
+
+    :param error: ApiException or a requests error
+    :return: Seconds to wait, or None if the header isn't there or is a date
+    """
+    headers = getattr(error, 'headers', None) or getattr(
+        getattr(error, 'response', None), 'headers', None)
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Fail calls fast once an API has failed a number of times in a row.
+    After reset_after seconds calls are let through again, a success closes
+    the circuit and another failure opens it again.
+    """
+
+    def __init__(self, name: str, threshold: int = 5,
+                 reset_after: float = 30.0):
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened = None
+        self.__lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check a call can go ahead.
+
+        :raises CircuitOpenException: If the circuit is open
+        """
+        with self.__lock:
+            if self.opened is not None and \
+                    get_clock().now() - self.opened < self.reset_after:
+                raise CircuitOpenException(
+                    f'{self.name} is unavailable, {self.failures} calls '
+                    f'failed in a row')
+
+    def success(self):
+        """ Record a call that got an answer from the API """
+        with self.__lock:
+            self.failures = 0
+            self.opened = None
+
+    def failure(self):
+        """ Record a call that got no answer, or a server error """
+        with self.__lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened = get_clock().now()
+
+
+class RetryPolicy:  # pylint: disable=too-many-instance-attributes
+    """
+    Retry failed API calls with jittered exponential backoff.
+
+    Transport errors and RETRYABLE_STATUSES are retried, a Retry-After
+    header overrides the backoff. A call gives up after a number of
+    attempts or once retrying would pass its deadline, and all calls share
+    a budget of retries so a struggling API isn't hammered. The budget
+    refills over budget_seconds, so early failures in a long restore don't
+    leave its later calls without retries.
+    """
+
+    def __init__(self, name: str,  # pylint: disable=too-many-arguments
+                 attempts: int = 5, base_delay: float = 0.5,
+                 max_delay: float = 10.0, timeout: Optional[float] = 60.0,
+                 budget: int = 50, request_timeout: Optional[float] = 30.0,
+                 breaker: Optional[CircuitBreaker] = None,
+                 budget_seconds: float = 600.0):
+        self.name = name
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.capacity = budget
+        self.budget_seconds = budget_seconds
+        self.request_timeout = request_timeout
+        self.breaker = breaker or CircuitBreaker(name)
+        self.logger = logging.getLogger(__name__)
+        self.__lock = threading.Lock()
+        self.__tokens = float(budget)
+        self.__refilled = None
+
+    @classmethod
+    def from_environment(cls, name: str) -> 'RetryPolicy':
+        """
+        Create a policy using any HOOK_API_* overrides in the environment:
+        HOOK_API_TIMEOUT (seconds per request), HOOK_API_RETRIES (attempts
+        per call), HOOK_API_RETRY_TIMEOUT (seconds to keep retrying a call),
+        HOOK_API_RETRY_BUDGET (retries across all calls) and
+        HOOK_API_RETRY_BUDGET_SECONDS (seconds for a used up budget to
+        refill).
+
+        :param name: The API name, used in logs and errors
+        :return: A RetryPolicy
+        """
+        return cls(name,
+                   attempts=int(_env_float('HOOK_API_RETRIES', 5)),
+                   timeout=_env_float('HOOK_API_RETRY_TIMEOUT', 60.0),
+                   budget=int(_env_float('HOOK_API_RETRY_BUDGET', 50)),
+                   request_timeout=_env_float('HOOK_API_TIMEOUT', 30.0),
+                   budget_seconds=_env_float('HOOK_API_RETRY_BUDGET_SECONDS',
+                                             600.0))
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Get the delay before a retry.
+
+        :param attempt: The retry number, starting at 1
+        :return: Seconds to wait, between half and all of the
+            exponential delay
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def __refill(self):
+        now = get_clock().now()
+        if self.__refilled is not None and self.budget_seconds > 0:
+            self.__tokens = min(
+                float(self.capacity), self.__tokens + (
+                    now - self.__refilled) * self.capacity /
+                self.budget_seconds)
+        self.__refilled = now
+
+    @property
+    def budget(self) -> int:
+        """
+        :return: Retries left in the budget
+        """
+        with self.__lock:
+            self.__refill()
+            return int(self.__tokens)
+
+    def __take_retry(self) -> bool:
+        with self.__lock:
+            self.__refill()
+            if self.__tokens < 1:
+                return False
+            self.__tokens -= 1
+            return True
+
+    def __record(self, error: Exception) -> Optional[int]:
+        status = _error_status(error)
+        if status is None or status >= 500:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return status
+
+    @staticmethod
+    def retryable(status: Optional[int], idempotent: bool) -> bool:
+        """
+        Check if a failed call can be retried.
+
+        :param status: HTTP status, None if there was no response
+        :param idempotent: If the call can safely be repeated
+        :return: True if the call should be retried
+        """
+        if not idempotent:
+            return status == 429
+        return status is None or status in RETRYABLE_STATUSES
+
+    def call(self, func: Callable, description: str, *args,
+             idempotent: bool = True, delete: bool = False,
+             **kwargs) -> Any:
+        """
+        Call an API method, retrying it if it fails.
+
+        :param func: The API method
+        :param description: Name of the call, for logs and errors
+        :param idempotent: If False only retry when rate limited
+        :param delete: If True a 404 on a retry means an earlier attempt
+            deleted the object, and None is returned
+        :return: Whatever func returns
+        :raises CircuitOpenException: If the API has been failing
+        """
+        clock = deadline(self.timeout, f'{self.name} {description}')
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = func(*args, **kwargs)
+            except API_ERRORS as error:
+                status = self.__record(error)
+                if delete and attempt and status == 404:
+                    self.logger.info('%s %s retry found it already '
+                                     'deleted', self.name, description)
+                    return None
+                if not self.retryable(status, idempotent):
+                    raise
+                attempt += 1
+                delay = _retry_after(error)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                remaining = clock.remaining()
+                if attempt >= self.attempts or \
+                        remaining is not None and delay >= remaining:
+                    raise
+                if not self.__take_retry():
+                    self.logger.warning('%s retry budget used up, not '
+                                        'retrying %s', self.name, description)
+                    raise
+                self.logger.warning(
+                    '%s %s failed (%s), retry %d/%d in %.1fs', self.name,
+                    description, status or error.__class__.__name__,
+                    attempt, self.attempts - 1, delay)
+                clock.sleep(delay)
+                continue
+            self.breaker.success()
+            return result
+
+
+_POLICIES: Dict[str, RetryPolicy] = {}
+
+
+def retry_policy(name: str) -> RetryPolicy:
+    """
+    Get the RetryPolicy for an API, shared by everything in the process so
+    the retry budget and circuit breaker see all calls.
+
+    :param name: The API name
+    :return: The RetryPolicy
+    """
+    if name not in _POLICIES:
+        _POLICIES[name] = RetryPolicy.from_environment(name)
+    return _POLICIES[name]
+
+
+class RateLimiter:  # pylint: disable=too-many-instance-attributes
+    """
+    Token bucket limiting how fast calls are made. Up to burst calls go
+    straight through, after that calls are spaced out to qps per second.
+    A qps of 0 or less turns the limiter off.
+    """
+
+    def __init__(self, name: str, qps: float, burst: int):
+        self.name = name
+        self.qps = qps
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = None
+        self.throttled_calls = 0
+        self.throttled_seconds = 0.0
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls, name: str) -> 'RateLimiter':
+        """
+        Create a limiter using HOOK_API_QPS (default 5) and HOOK_API_BURST
+        (default 10) from the environment.
+
+        :param name: The API name, used in logs
+        :return: A RateLimiter
+        """
+        return cls(name, _env_float('HOOK_API_QPS', 5.0),
+                   int(_env_float('HOOK_API_BURST', 10)))
+
+    def acquire(self):
+        """
+        Take a token, sleeping until one is available.
+        """
+        if self.qps <= 0:
+            return
+        clock = get_clock()
+        with self.__lock:
+            now = clock.now()
+            if self.updated is None or now < self.updated:
+                # First call, or the clock was swapped for another one
+                self.tokens = float(self.burst)
+            else:
+                self.tokens = min(float(self.burst), self.tokens +
+                                  (now - self.updated) * self.qps)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.qps if self.tokens < 0 else 0.0
+            if wait:
+                self.throttled_calls += 1
+                self.throttled_seconds += wait
+        if wait:
+            clock.sleep(wait)
+
+    def report(self):
+        """
+        Log how much the limiter slowed calls down, if at all.
+        """
+        if self.throttled_calls:
+            logging.getLogger(__name__).info(
+                '%s calls throttled %d times for %.1fs in total (%.1f qps, '
+                'burst %d)', self.name, self.throttled_calls,
+                self.throttled_seconds, self.qps, self.burst)
+
+
+_LIMITERS: Dict[str, RateLimiter] = {}
+
+
+def rate_limiter(name: str) -> RateLimiter:
+    """
+    Get the RateLimiter for an API, shared by everything in the process.
+    The time spent throttled is logged when the process exits.
+
+    :param name: The API name
+    :return: The RateLimiter
+    """
+    if name not in _LIMITERS:
+        _LIMITERS[name] = RateLimiter.from_environment(name)
+        atexit.register(_LIMITERS[name].report)
+    return _LIMITERS[name]
+
+
+def kube_rate_limiter() -> RateLimiter:
+    """
+    Get the RateLimiter for Kubernetes calls. Each HookTarget namespace
+    gets its own, so a fleet run allows each namespace the calls the hook
+    would make when run in it, up to the fleet's thread limit times
+    HOOK_API_QPS in all.
+
+    :return: The RateLimiter for the thread's namespace
+    """
+    target = current_target()
+    return rate_limiter(f'kubernetes {target.namespace}'
+                        if target is not None else 'kubernetes')
+
+
+class ApiProxy:
+    """
+    Stands in for a CoreV1Api, BatchV1Api or Bro instance, sending every
+    public method call and property read through a RetryPolicy.
+    If request_timeout is set it's passed as _request_timeout on calls
+    that don't set one, and if limiter is set every attempt takes a token
+    from it first.
+    In a plan run, reads are counted and changes are only recorded.
+    """
+
+    def __init__(self, target: Any, policy: RetryPolicy,
+                 request_timeout: Optional[float] = None,
+                 limiter: Optional[RateLimiter] = None):
+        self._target = target
+        self._policy = policy
+        self._request_timeout = request_timeout
+        self._limiter = limiter
+
+    @property
+    def __class__(self):
+        # isinstance() checks against the wrapped API class still pass
+        return self._target.__class__
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            return getattr(self._target, name)
+        if isinstance(getattr(type(self._target), name, None), property):
+            self.__planned(name)
+            return self._policy.call(self.__limited(getattr), name,
+                                     self._target, name)
+        value = getattr(self._target, name)
+        if not inspect.ismethod(value):
+            return value
+        # Keep the docstring, kubernetes.watch reads the return type from it
+        return wraps(value)(partial(self.__call, value, name))
+
+    def __limited(self, func: Callable) -> Callable:
+        if not self._limiter:
+            return func
+
+        def limited(*args, **kwargs):
+            self._limiter.acquire()
+            return func(*args, **kwargs)
+        return limited
+
+    def __planned(self, name: str, *args, **kwargs) -> Optional[Any]:
+        plan = planning()
+        if plan is None:
+            return None
+        api = type(self._target).__name__
+        if is_mutation(name):
+            return plan.change(api, name, args, kwargs)
+        plan.read(api, name)
+        return None
+
+    def __call(self, method: Callable, name: str, *args, **kwargs) -> Any:
+        planned = self.__planned(name, *args, **kwargs)
+        if planned is not None:
+            return planned
+        if self._request_timeout is not None:
+            kwargs.setdefault('_request_timeout', self._request_timeout)
+        return self._policy.call(
+            self.__limited(method), name, *args,
+            idempotent=not name.startswith(NON_IDEMPOTENT_PREFIXES),
+            delete=name.startswith(DELETE_PREFIXES), **kwargs)
+
+
+class BroCache:
+    """
+    Read-through cache of BRO's status, schedule and retention settings,
+    shared by the BroCliBaseClass instances in a hook.
+
+    Entries expire after ttl seconds, and are dropped when the hook calls
+    a method on a cached object, e.g. schedule.update() or
+    retention.apply(). BRO counts as ready once it has answered, until a
+    BRO call fails.
+    """
+
+    def __init__(self, ttl: float = 10.0):
+        self.ttl = ttl
+        self.ready = False
+        self.__entries: Dict[str, Tuple[float, Any]] = {}
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> 'BroCache':
+        """
+        Create a cache with the TTL from $HOOK_BRO_CACHE_TTL, 0 disables
+        caching.
+
+        :return: A BroCache
+        """
+        return cls(_env_float('HOOK_BRO_CACHE_TTL', 10.0))
+
+    def get(self, key: str, read: Callable[[], Any]) -> Any:
+        """
+        Get a cached value, reading it if it isn't cached or has expired.
+
+        :param key: The cache key
+        :param read: Called to read the value from BRO
+        :return: The value
+        """
+        now = get_clock().now()
+        with self.__lock:
+            entry = self.__entries.get(key)
+        if entry and 0 <= now - entry[0] < self.ttl:
+            return entry[1]
+        value = read()
+        self.put(key, value, now)
+        return value
+
+    def put(self, key: str, value: Any, now: Optional[float] = None):
+        """
+        Cache a value.
+
+        :param key: The cache key
+        :param value: The value
+        :param now: When the value was read, default now
+        """
+        with self.__lock:
+            self.__entries[key] = (
+                get_clock().now() if now is None else now, value)
+
+    def invalidate(self, key: Optional[str] = None):
+        """
+        Drop a cached value.
+
+        :param key: The cache key, None to drop everything
+        """
+        with self.__lock:
+            if key is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(key, None)
+
+
+class _Invalidating:
+    """
+    Stands in for a cached BRO object, dropping it from the cache when one
+    of its methods is called, as they change it in BRO. In a plan run the
+    methods are only recorded.
+    """
+
+    def __init__(self, target: Any, cache: BroCache, key: str):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_cache', cache)
+        object.__setattr__(self, '_key', key)
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._target, name)
+        if name.startswith('_') or not inspect.ismethod(value):
+            return value
+
+        @wraps(value)
+        def invalidating(*args, **kwargs):
+            plan = planning()
+            if plan is not None:
+                return plan.change(type(self._target).__name__, name, args,
+                                   kwargs)
+            try:
+                return value(*args, **kwargs)
+            finally:
+                self._cache.invalidate(self._key)
+        return invalidating
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._target, name, value)
+
+    def __str__(self) -> str:
+        return str(self._target)
+
+    def __repr__(self) -> str:
+        return repr(self._target)
+
+
+_BRO_CLIENTS: Dict[tuple, Tuple[ApiProxy, BroCache]] = {}
+
+
+def bro_client(host: str, port: int,
+               policy: Optional[RetryPolicy] = None) -> \
+        Tuple[ApiProxy, BroCache]:
+    """
+    Get the BRO client for a host and port, shared by all the hook's
+    BroCliBaseClass instances along with its BroCache.
+
+    :param host: BRO host name
+    :param port: BRO port
+    :param policy: RetryPolicy for a new client, default the 'bro' policy
+    :return: The client and its cache
+    """
+    key = (Bro, host, port)
+    if key not in _BRO_CLIENTS:
+        # lib.broapi doesn't take a per request timeout, BRO calls only
+        # get the retries and circuit breaker.
+        _BRO_CLIENTS[key] = (
+            ApiProxy(Bro(host=host, port=port),
+                     policy or retry_policy('bro')),
+            BroCache.from_environment())
+    return _BRO_CLIENTS[key]
+
+
+def reset_shared_state():
+    """
+    Forget the retry policies, rate limiters and BRO clients shared by the
+    process, so their next users get new ones. Used by the unit tests so
+    no test sees the breaker state or tokens an earlier one left behind.
+    """
+    _POLICIES.clear()
+    _LIMITERS.clear()
+    _BRO_CLIENTS.clear()
+
+
+class HookTarget(NamedTuple):
+    """
+    The namespace and BRO that hook classes work on, when a hook is run
+    across many namespaces instead of on the pod's own. api_client is
+    shared by all the namespaces' KubeApi instances.
+    """
+    namespace: str
+    bro_host: Optional[str] = None
+    bro_port: Optional[int] = None
+    api_client: Optional[ApiClient] = None
+
+
+_TARGET = threading.local()
+
+
+def current_target() -> Optional[HookTarget]:
+    """
+    :return: The HookTarget set in this thread, None to use the pod's own
+        namespace and $BRO_HOST
+    """
+    return getattr(_TARGET, 'target', None)
+
+
+@contextmanager
+def hook_target(target: HookTarget) -> Iterator[HookTarget]:
+    """
+    Point the hook classes created in this thread at another namespace
+    until the block ends, and add the namespace to the thread's logs.
+
+    :param target: The namespace and BRO to use
+    :return: The target
+    """
+    previous = current_target()
+    _TARGET.target = target
+    try:
+        with thread_log_context(namespace=target.namespace):
+            yield target
+    finally:
+        _TARGET.target = previous
+
+
+def run_on_daemon_threads(func: Callable[[Any], Any], items: List[Any],
+                          max_workers: int,
+                          timeout: Optional[float]) -> List[Future]:
+    """
+    Call a function for each item, a bounded number at a time, and wait for
+    the calls to finish.
+
+    The calls run on daemon threads, unlike a ThreadPoolExecutor's, so a
+    call still stuck in the API when the wait times out doesn't keep the
+    hook from exiting. They're part of the caller's plan, if it has one.
+
+    :param func: Called with each item
+    :param items: The items
+    :param max_workers: Most calls to run at once
+    :param timeout: Seconds to wait for all the calls, None to wait until
+        each one either completes or fails
+    :return: A future for each item, in order. Calls that didn't finish in
+        time have futures that aren't done, and calls not yet started are
+        cancelled.
+    """
+    futures = [Future() for _ in items]
+    pending: queue.Queue = queue.Queue()
+    for item, future in zip(items, futures):
+        pending.put((item, future))
+
+    plan = planning()
+
+    def worker():
+        with use_plan(plan):
+            while True:
+                try:
+                    item, future = pending.get_nowait()
+                except queue.Empty:
+                    return
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(func(item))
+                except Exception as error:  # pylint: disable=broad-except
+                    future.set_exception(error)
+
+    for _ in range(min(max_workers, len(items))):
+        threading.Thread(target=worker, daemon=True).start()
+    wait_futures(futures, timeout=timeout)
+    for future in futures:
+        future.cancel()
+    return futures
+
+
 class BaseClass:
     """
     Base class for all hooks.
@@ -41,41 +912,62 @@ class BaseClass:
 
     def __init__(self):
         super().__init__()
-        logging.basicConfig(
-            stream=sys.stdout, level=logging.DEBUG,
-            format='%(asctime)-20s [%(name)s]  %(levelname)-18s %(message)s')
+        setup_logging()
         self.logger = logging.getLogger(__name__)
-        logging.getLogger('kubernetes.client.rest').setLevel(logging.INFO)
 
-    def info(self, message):
+    def info(self, message, *args):
         """
         Log a message as INFO level
 
-        :param message: Message to log.
+        :param message: Message to log, %-formatted with args if given.
+        :param args: Arguments for message, only formatted if it's logged
 
         """
-        self.logger.info(message)
+        self.logger.info(message, *args)
 
-    def warning(self, message):
+    def warning(self, message, *args):
         """
         Log the current message as ERROR level.
 
-        :param message: Message to log
+        :param message: Message to log, %-formatted with args if given.
+        :param args: Arguments for message, only formatted if it's logged
 
         """
-        self.logger.warning(message)
+        self.logger.warning(message, *args)
 
-    def debug(self, message):
+    def debug(self, message, *args):
         """
         Log the current message as DEBUG level.
 
-        :param message: Message to log
+        :param message: Message to log, %-formatted with args if given.
+        :param args: Arguments for message, only formatted if it's logged
 
         """
-        self.logger.debug(message)
+        self.logger.debug(message, *args)
 
+    @staticmethod
+    def clock() -> Clock:
+        """
+        Get the clock to read the time and sleep with.
 
-class KubeApi(BaseClass):
+        :return: The current Clock
+        """
+        return get_clock()
+
+    @staticmethod
+    def deadline(timeout: Optional[float], description: str) -> DeadlineClock:
+        """
+        Start a deadline on the current clock.
+
+        :param timeout: Seconds until the deadline, None for no deadline
+        :param description: What is being waited for, used in the timeout
+            error
+        :return: A DeadlineClock to sleep on
+        """
+        return deadline(timeout, description)
+
+
+class KubeApi(BaseClass):  # pylint: disable=too-many-public-methods
     """
     Common kubernetes API methods.
     """
@@ -98,18 +990,29 @@ class KubeApi(BaseClass):
 
     def _read_namespace_file(self):
         """
-        Get the current Pods namespace from the serviceaccount namespace file
+        Get the current Pods namespace from the serviceaccount namespace file,
+        or the namespace of the thread's HookTarget
 
         """
+        target = current_target()
+        if target is not None:
+            self.__namespace = target.namespace
+            self.logger.debug('Namespace set to "%s"', self.namespace())
+            return
         ns_file = os.environ['SA_NAMESPACE'] \
             if 'SA_NAMESPACE' in os.environ \
             else KubeApi.namespace_file()
 
         with open(ns_file, encoding="utf-8") as _r:
             self.__namespace = _r.readline()
+        set_log_context(namespace=self.__namespace)
         self.logger.debug('Namespace set to "%s"', self.namespace())
 
     def _load_config(self):
+        target = current_target()
+        if target is not None and target.api_client is not None:
+            self.__set_api_client(target.api_client)
+            return
         self.debug('Loading K8s client config')
         try:
             load_incluster_config()
@@ -130,8 +1033,14 @@ class KubeApi(BaseClass):
                     'load_incluster_config:{incluster_error}:'
                     'load_kube_config:{kubecfg_error}'
                 )
-        self.__api_client = ApiClient()
-        self.__api_core = CoreV1Api(self.__api_client)
+        self.__set_api_client(ApiClient())
+
+    def __set_api_client(self, api_client: ApiClient):
+        self.__api_client = api_client
+        policy = retry_policy('kubernetes')
+        self.__api_core = ApiProxy(CoreV1Api(self.__api_client), policy,
+                                   policy.request_timeout,
+                                   kube_rate_limiter())
 
     def namespace(self) -> str:
         """
@@ -186,24 +1095,22 @@ class KubeApi(BaseClass):
             self.debug(f"Secret '{secret}' not found: {exc}")
         return None
 
-    def delete_secret(self, secret: str) -> V1Status:
+    def delete_secret(self, secret: str) -> Optional[V1Status]:
         """
-        Delete a secret
+        Delete a secret, a secret that doesn't exist is left alone.
 
         :param secret: secret name
+        :return: The delete status, None if the secret doesn't exist
         """
-
-        while True:
-            try:
-                status = self.api_core().delete_namespaced_secret(
-                    secret, self.namespace(), grace_period_seconds=0
-                )
-
-                return status
-            except ApiException as exception:
-                if exception.status != 404:
-                    raise exception
-                time.sleep(5)
+        try:
+            return self.api_core().delete_namespaced_secret(
+                secret, self.namespace(), grace_period_seconds=0
+            )
+        except ApiException as exception:
+            if exception.status != 404:
+                raise exception
+            self.info(f"Secret '{secret}' does not exist")
+            return None
 
     def get_configmap(self, configmap: str) -> V1ConfigMap:
         """
@@ -216,6 +1123,16 @@ class KubeApi(BaseClass):
             configmap, self.namespace(), pretty=True
         )
 
+    def product_version(self) -> str:
+        """
+        Get the installed ENM product version.
+
+        :return: The product revision of product-version-configmap
+        """
+        return self.get_configmap(
+            'product-version-configmap').metadata.annotations[
+                'ericsson.com/product-revision']
+
     def list_configmaps(self) -> List[str]:
         """
         Get a list of configmaps
@@ -239,6 +1156,17 @@ class KubeApi(BaseClass):
             configmap
         )
 
+    def patch_configmap_data(self, name: str, data: Dict[str, str]):
+        """
+        Merge keys into a configmap's data with a single patch, without
+        reading it first.
+
+        :param name: Configmap name
+        :param data: Keys and values to set
+        """
+        self.api_core().patch_namespaced_config_map(
+            name, self.namespace(), {'data': data})
+
     def replace_configmap(self, name, body):
         """
         Replaces a configmap
@@ -302,26 +1230,116 @@ class KubeApi(BaseClass):
         return [service.metadata.name for service in services]
 
 
-    def delete_service(self, svc_name: str):
+    def delete_service(self, svc_name: str,
+                       timeout: Optional[float] = None):
         """
         Delete a service.
 
         :param svc_name: The service name
+        :param timeout: Seconds to wait for the deletion, None to wait forever
 
         """
+        clock = self.deadline(timeout, f'service {svc_name} to delete')
         if svc_name in self.list_services():
             options = V1DeleteOptions(
                 propagation_policy='Foreground',
                 grace_period_seconds=5)
             self.api_core().delete_namespaced_service(
                 svc_name, self.namespace(), body=options)
-            self.info(f'Waiting for service {svc_name} to delete.')
-            while svc_name in self.list_services():
-                time.sleep(1)
-            self.info(f'Existing service {svc_name} deleted.')
+            if not skip_wait(f'service {svc_name} to delete'):
+                self.info(f'Waiting for service {svc_name} to delete.')
+                while svc_name in self.list_services():
+                    clock.sleep(1)
+                self.info(f'Existing service {svc_name} deleted.')
         else:
             self.info(f'Service {svc_name} does not exist to delete.')
 
+    def watch_object(self, list_method: Callable, name: str,
+                     done: Callable[[Optional[Any]], bool],
+                     clock: DeadlineClock) -> Any:
+        """
+        Watch one object until done returns True for it. The object is
+        listed once and then watched, each watch resuming from the last
+        resource version seen, it's only listed again if a watch expires.
+
+        :param list_method: The namespaced list method for the object's
+            kind, e.g. api_core().list_namespaced_config_map
+        :param name: The object name
+        :param done: Called with the object each time it's seen, and with
+            None if it doesn't exist or was deleted
+        :param clock: Deadline for done to return True
+        :return: The object done returned True for
+        :raises HookTimeoutException: If the deadline passes first
+        """
+        return self.watch_objects(
+            list_method, lambda objects: done(objects.get(name)), clock,
+            field_selector=f'metadata.name={name}').get(name)
+
+    def watch_objects(self, list_method: Callable,
+                      done: Callable[[Dict[str, Any]], bool],
+                      clock: DeadlineClock, **selectors) -> Dict[str, Any]:
+        """
+        Watch the objects of a kind until done returns True for them. They
+        are listed once and then watched, each watch resuming from the last
+        resource version seen, they're only listed again if a watch
+        expires.
+
+        :param list_method: The namespaced list method for the kind, e.g.
+            api_core().list_namespaced_service
+        :param done: Called with the objects by name after the listing and
+            each change
+        :param clock: Deadline for done to return True
+        :param selectors: field_selector and label_selector to list with
+        :return: The objects done returned True for, by name
+        :raises HookTimeoutException: If the deadline passes first
+        """
+        objects, resource_version = self.__list_objects(list_method,
+                                                        selectors)
+        matched = done(objects)
+        while not matched:
+            seconds = watch_timeout(clock)
+            try:
+                matched, resource_version = self.__watch_objects(
+                    list_method, selectors, objects, done, resource_version,
+                    seconds)
+            except ApiException as error:
+                if error.status != 410:
+                    raise
+                self.debug(f'Watch expired, listing again {selectors}')
+                objects, resource_version = self.__list_objects(
+                    list_method, selectors)
+                matched = done(objects)
+        return objects
+
+    def __list_objects(self, list_method: Callable,
+                       selectors: Dict[str, str]) -> \
+            Tuple[Dict[str, Any], Optional[str]]:
+        listing = list_method(self.namespace(), **selectors)
+        return {item.metadata.name: item for item in listing.items}, \
+            listing.metadata.resource_version
+
+    def __watch_objects(self,  # pylint: disable=too-many-arguments
+                        list_method: Callable, selectors: Dict[str, str],
+                        objects: Dict[str, Any],
+                        done: Callable[[Dict[str, Any]], bool],
+                        resource_version: Optional[str], seconds: int) -> \
+            Tuple[bool, Optional[str]]:
+        watcher = watch.Watch()
+        for event in watcher.stream(
+                list_method, self.namespace(), **selectors,
+                resource_version=resource_version, timeout_seconds=seconds,
+                _request_timeout=seconds + 10):
+            found = event['object']
+            if event['type'] == 'DELETED':
+                objects.pop(found.metadata.name, None)
+            else:
+                objects[found.metadata.name] = found
+            if done(objects):
+                watcher.stop()
+                return True, watcher.resource_version
+        return False, watcher.resource_version
+
+
 class BroCliBaseClass(BaseClass):
     """
     Base class for BROCLI interaction
@@ -330,9 +1348,17 @@ class BroCliBaseClass(BaseClass):
 
     def __init__(self):
         super().__init__()
-        self.__bro_api = Bro(
-            host=os.environ['BRO_HOST'],
-            port=int(os.environ['BRO_PORT']))
+        target = current_target()
+        if target is not None and target.bro_host:
+            # Each namespace's BRO gets its own retries and circuit breaker
+            self.__policy = retry_policy(f'bro {target.namespace}')
+            endpoint = target.bro_host, int(target.bro_port)
+        else:
+            self.__policy = retry_policy('bro')
+            endpoint = os.environ['BRO_HOST'], int(os.environ['BRO_PORT'])
+        self.__bro_api, self.__cache = bro_client(*endpoint, self.__policy)
+        # An action_history.ActionHistory, set by hooks that can keep one
+        self.history = None
 
     def bro_api(self) -> Bro:
 
@@ -343,18 +1369,56 @@ class BroCliBaseClass(BaseClass):
         """
         return self.__bro_api
 
-    def wait_bro_ready(self):
+    def bro_cache(self) -> BroCache:
+        """
+        Get the cache of BRO reads.
+
+        :return: The BroCache shared with the hook's other BRO classes
+        """
+        return self.__cache
+
+    def get_schedule(self) -> Any:
         """
-        Wait until BRO is ready
+        Get the DEFAULT scope backup schedule, cached.
+
+        :return: The Schedule, calling its methods drops it from the cache
+        """
+        return _Invalidating(self.__cache.get(
+            'schedule', self.bro_api().get_schedule), self.__cache,
+                             'schedule')
+
+    def get_retention(self) -> Any:
+        """
+        Get the DEFAULT scope backup retention, cached.
+
+        :return: The Retention, calling its methods drops it from the cache
+        """
+        return _Invalidating(self.__cache.get(
+            'retention', self.bro_api().get_retention), self.__cache,
+                             'retention')
+
+    def wait_bro_ready(self, timeout: Optional[float] = None):
+        """
+        Wait until BRO is ready. BRO is only asked again if a BRO call has
+        failed since it was last found to be ready.
+
+        :param timeout: Seconds to wait, None to wait forever
         """
+        if self.__cache.ready and not self.__policy.breaker.failures:
+            self.debug('BRO is ready')
+            return
+        self.__cache.ready = False
+        clock = self.deadline(timeout, 'BRO to be ready')
         while True:
             try:
                 status = self.bro_api().status
-                self.debug(f"BRO Status: {status}")
+                self.debug('BRO Status: %s', status)
                 break
-            except connection_err:
+            except (connection_err, CircuitOpenException):
                 self.info("Waiting for BRO to be ready")
-                time.sleep(10)
+                clock.sleep(10)
+        self.__cache.put('status', status)
+        self.__cache.ready = True
 
     def exists(self, backup_name: str, scope: str) -> bool:
         """
@@ -368,18 +1432,37 @@ class BroCliBaseClass(BaseClass):
         existing = [backup.name for backup in current]
         return backup_name in existing
 
-    def import_backup(self, backup_name: str, sftp_uri: str, password: str):
+    def import_backup(self,  # pylint: disable=too-many-arguments
+                      backup_name: str, sftp_uri: str, password: str,
+                      timeout: Optional[float] = None,
+                      size_bytes: Optional[int] = None) -> Dict[str, str]:
         """
         Import it from the SFTP source and wait for the import to complete.
+        The transfer rate and ETA are logged while it runs, and a warning
+        if its progress stops moving.
         :param backup_name: The backup name
         :param sftp_uri: URI of the SFTP server,
             format: <user>@<hostname>/<data_path>
         :param password: SFTP password
+        :param timeout: Seconds to wait for the import, None to wait forever
+        :param size_bytes: Size of the exported backup, None if not known
+        :return: The import's throughput summary as configmap data, empty
+            in plan mode
 
         """
         action = self.bro_api().import_backup(
             backup_name, sftp_uri, password)
-        self.wait_for_action(action)
+        tracker = TransferTracker(
+            'IMPORT', size_bytes, IMPORT_LOG_SECONDS, IMPORT_LOG_STEP,
+            _env_float('IMPORT_STALL_SECONDS', IMPORT_STALL_SECONDS))
+        self.wait_for_action(action, timeout, tracker=tracker)
+        if tracker.started is None:
+            return {}
+        summary = tracker.summary(self.clock().now())
+        self.info(f'Imported {backup_name} in {summary["IMPORT_SECONDS"]}s'
+                  + (f' at {summary["IMPORT_MB_PER_SECOND"]} MB/s'
+                     if summary['IMPORT_MB_PER_SECOND'] else ''))
+        return summary
 
     def get_backup(self, backup_name: str, scope: str) -> Backup:
         """
@@ -391,24 +1474,105 @@ class BroCliBaseClass(BaseClass):
         """
         return self.bro_api().get_backup(backup_name, scope)
 
-    def wait_for_action(self, action: Action):
+    @staticmethod
+    def product_version(backup: Backup) -> Optional[str]:
+        """
+        Get the product version a backup was taken of.
+
+        :param backup: The backup details, see get_backup
+        :return: The APPLICATION_INFO agent's version, None if the backup
+            has no APPLICATION_INFO
+        """
+        for service in backup.services or []:
+            if service.agent_id == 'APPLICATION_INFO':
+                return service.version
+        return None
+
+    def find_action(self, action_id: str, scope: str) -> Optional[Action]:
+        """
+        Look up an action by ID.
+
+        :param action_id: The action ID
+        :param scope: The action scope
+        :return: The action or None if BRO doesn't have it
+        """
+        actions = [act for act in self.bro_api().actions(scope)
+                   if act.id == action_id]
+        if len(actions) > 1:
+            raise HookException(
+                f'More than one action with id {action_id} found?')
+        return actions[0] if actions else None
+
+    def wait_for_action(self,  # pylint: disable=too-many-arguments
+                        action: Action, timeout: Optional[float] = None,
+                        size: Optional[int] = None, record: bool = True,
+                        tracker: Optional[TransferTracker] = None):
         """
         Wait for an action to complete.
 
+        With a history, a warning is logged once the action has run for
+        much longer than it usually takes, or it times out then if the
+        history fails stuck actions, and successful runs are added to the
+        history.
+
         :param action: The action to monitor and wait for completion.
+        :param timeout: Seconds to wait, None to wait forever
+        :param size: The backup size, the number of agents in it, used to
+            pick the history of similar backups
+        :param record: Add the duration to the history, False if the
+            action was started before this wait
+        :param tracker: Report the action as a transfer, at the tracker's
+            cadence instead of every poll
 
         """
+        if isinstance(action, PlannedResult):
+            skip_wait(f'BRO action {action.name} to complete', action=True)
+            return
+        name, scope = action.name, action.scope
+        overrun, interval = None, 5
+        description = f'action {action.id} to complete'
+        if self.history:
+            limit = self.history.limit(name, scope, size)
+            interval = self.history.poll_interval(name, scope, size, 5)
+            if limit is not None:
+                usual = self.history.predicted(name, scope, size)
+                description += f' ({name} usually takes {usual:.0f}s)'
+            overrun = self.history.overrun(f'{name} {action.id}', limit)
+            timeout = self.history.timeout(timeout, limit)
+        clock = self.deadline(timeout, description)
+        started = clock.now()
         self.info(f'Waiting for action {action.id} to complete.')
+        if tracker:
+            tracker.record(clock.now(), 0.0)
         while action.state == 'RUNNING':
-            self.info(f'{action.name} {action.id} is {action.state}. '
-                      f'Progress: {action.progress:.0%}')
-            time.sleep(5)
+            if overrun:
+                overrun.check(clock.now() - started)
+            if tracker:
+                self.__track(action, tracker, clock.now())
+            else:
+                self.info('%s %s is %s. Progress: %.0f%%', action.name,
+                          action.id, action.state, action.progress * 100)
+            clock.sleep(interval)
 
         self.log_action(action)
 
         if action.result != 'SUCCESS':
             raise HookException(
                 f'Action {action.name} failed with result {action.result}')
+        if self.history and record:
+            self.history.record(name, scope, clock.now() - started, size)
+
+    def __track(self, action: Action, tracker: TransferTracker,
+                now: float):
+        tracker.record(now, action.progress)
+        if tracker.new_stall():
+            self.warning(f'{action.name} {action.id} has not progressed '
+                         f'for {tracker.idle():.0f}s, stalled at '
+                         f'{action.progress:.0%}')
+        if tracker.due():
+            self.info(f'{action.name} {action.id} is {action.state}: '
+                      f'{tracker.describe()}')
+            tracker.mark_published()
 
     def log_action(self, action: Action):
         """
@@ -433,7 +1597,10 @@ class KubeBatchBaseClass(KubeApi):
 
     def __init__(self):
         super().__init__()
-        self.__api_batch = BatchV1Api(self.api_client())
+        policy = retry_policy('kubernetes')
+        self.__api_batch = ApiProxy(BatchV1Api(self.api_client()), policy,
+                                    policy.request_timeout,
+                                    kube_rate_limiter())
 
     def api_batch(self) -> BatchV1Api:
         """
@@ -452,26 +1619,119 @@ class KubeBatchBaseClass(KubeApi):
         jobs = self.api_batch().list_namespaced_job(self.namespace()).items
         return [job.metadata.name for job in jobs]
 
-    def delete_job(self, job_name: str):
+    def delete_job(self, job_name: str, timeout: Optional[float] = None):
         """
         Delete a batch job.
 
         :param job_name: The job name
+        :param timeout: Seconds to wait for the deletion, None to wait forever
 
         """
+        clock = self.deadline(timeout, f'job {job_name} to delete')
         if job_name in self.list_jobs():
             options = V1DeleteOptions(
                 propagation_policy='Foreground',
                 grace_period_seconds=5)
             self.api_batch().delete_namespaced_job(
                 job_name, self.namespace(), body=options)
-            self.info('Waiting for job to delete.')
-            while job_name in self.list_jobs():
-                time.sleep(1)
-            self.info(f'Existing job {job_name} deleted.')
+            if not skip_wait(f'job {job_name} to delete'):
+                self.info('Waiting for job to delete.')
+                while job_name in self.list_jobs():
+                    clock.sleep(1)
+                self.info(f'Existing job {job_name} deleted.')
         else:
             self.info(f'Job {job_name} does not exist to delete.')
 
+    @staticmethod
+    def job_result(job: Optional[V1Job]) -> Optional[bool]:
+        """
+        :param job: A job
+        :return: True if the job is Complete, False if it Failed, None if
+            it's still running
+        """
+        conditions = job.status.conditions if job and job.status else None
+        for condition in conditions or []:
+            if condition.status == 'True' and \
+                    condition.type in ('Complete', 'Failed'):
+                return condition.type == 'Complete'
+        return None
+
+    def wait_for_job(self, job_name: str, timeout: Optional[float] = None,
+                     follow_logs: bool = True) -> bool:
+        """
+        Watch a job until it completes or fails, writing its pods' logs to
+        this hook's log as they're written.
+
+        :param job_name: The job name
+        :param timeout: Seconds to wait, None to wait forever
+        :param follow_logs: Write the job's pod logs while waiting
+        :return: True if the job completed, False if it failed
+        :raises HookException: If the job doesn't exist or is deleted
+        :raises HookTimeoutException: If the job doesn't finish in time
+        """
+        if skip_wait(f'job {job_name} to complete'):
+            return True
+        clock = self.deadline(timeout, f'job {job_name} to complete')
+
+        def finished(job: Optional[V1Job]) -> bool:
+            if job is None:
+                raise HookException(f'Job {job_name} does not exist')
+            return self.job_result(job) is not None
+
+        stop = threading.Event()
+        follower = threading.Thread(
+            target=self.__follow_logs, args=(job_name, stop),
+            name=f'{job_name}-logs', daemon=True)
+        if follow_logs:
+            follower.start()
+        try:
+            job = self.watch_object(self.api_batch().list_namespaced_job,
+                                    job_name, finished, clock)
+        finally:
+            stop.set()
+            if follow_logs:
+                follower.join(LOG_DRAIN_SECONDS)
+        completed = self.job_result(job)
+        self.info(f'Job {job_name} '
+                  f'{"completed" if completed else "failed"}.')
+        return completed
+
+    def __follow_logs(self, job_name: str, stop: threading.Event):
+        """
+        Write the logs of each of a job's pods once it has started, until
+        the job has finished and all its pods' logs are written.
+        """
+        followed = set()
+        while True:
+            finishing = stop.is_set()
+            try:
+                pods = self.api_core().list_namespaced_pod(
+                    self.namespace(),
+                    label_selector=f'job-name={job_name}').items
+                for pod in pods:
+                    name = pod.metadata.name
+                    if name not in followed and \
+                            pod.status.phase != 'Pending':
+                        followed.add(name)
+                        self.__write_log(name)
+            except API_ERRORS as error:
+                self.debug(f'Could not read the {job_name} logs: {error}')
+            if finishing:
+                return
+            stop.wait(LOG_POLL_SECONDS)
+
+    def __write_log(self, pod_name: str):
+        # No request timeout, the log is followed until the pod stops
+        response = self.api_core().read_namespaced_pod_log(
+            pod_name, self.namespace(), follow=True,
+            _preload_content=False, _request_timeout=None)
+        try:
+            for line in response:
+                self.info('%s: %s', pod_name,
+                          line.decode('utf-8', 'replace').rstrip())
+        finally:
+            response.release_conn()
+
 
 def get_parsed_args(args: List[str], arg_parser: ArgumentParser) -> Namespace:
     """
@@ -487,3 +1747,30 @@ def get_parsed_args(args: List[str], arg_parser: ArgumentParser) -> Namespace:
         print(arg_parser.format_help())
         raise SystemExit(2)
     return arg_parser.parse_args(args)
+
+
+def add_timeout_argument(arg_parser: ArgumentParser):
+    """
+    Add the -t/--timeout option bounding how long a hook waits overall.
+    The default comes from $HOOK_TIMEOUT, if set, otherwise there is no
+    limit.
+
+    :param arg_parser: The ArgumentParser to add the option to
+    """
+    default = os.environ.get('HOOK_TIMEOUT')
+    arg_parser.add_argument('-t', '--timeout', dest='timeout', type=float,
+                            metavar='seconds',
+                            default=float(default) if default else None,
+                            help='Give up waiting after this many seconds')
+
+
+def add_plan_argument(arg_parser: ArgumentParser):
+    """
+    Add the --plan option, to make the reads and print the changes a hook
+    would make, without making them.
+
+    :param arg_parser: The ArgumentParser to add the option to
+    """
+    arg_parser.add_argument('--plan', dest='plan', action='store_true',
+                            help='Print the changes the hook would make and '
+                                 'its API calls,\nwithout changing anything')
@@ -15,26 +15,30 @@
 Class to delete jobs created by chart hooks, helm doesn't do this.
 """
 from argparse import ArgumentParser, RawTextHelpFormatter
-from typing import List
+from typing import List, Optional
 
 import sys
 
-from common import KubeBatchBaseClass, get_parsed_args
+from common import KubeBatchBaseClass, add_plan_argument, \
+    add_timeout_argument, get_parsed_args
+from plan import planned
 
 
 class DeleteHookJobs(KubeBatchBaseClass):
     """
     Delete a list of jobs
     """
-    def hook_cleanup(self, jobs: List[str]):
+    def hook_cleanup(self, jobs: List[str], timeout: Optional[float] = None):
         """
         Delete a list of batch.jobs
         :param jobs: List of job names to delete
+        :param timeout: Seconds to wait overall, None to wait forever
 
         """
+        clock = self.deadline(timeout, f'jobs {jobs} to delete')
         for job_name in jobs:
             self.info(f'Deleting job {job_name}')
-            self.delete_job(job_name)
+            self.delete_job(job_name, clock.remaining())
             self.info(f'Job {job_name} deleted.')
 
 
@@ -52,8 +56,11 @@ def main(sys_args):
     arg_parser.add_argument('-j', dest='jobs', required=True,
                             metavar='job', nargs='?', action='append',
                             help='Job name.')
+    add_timeout_argument(arg_parser)
+    add_plan_argument(arg_parser)
     args = get_parsed_args(sys_args, arg_parser)
-    DeleteHookJobs().hook_cleanup(args.jobs)
+    with planned(args.plan):
+        DeleteHookJobs().hook_cleanup(args.jobs, timeout=args.timeout)
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -15,26 +15,117 @@
 Class to delete secrets.
 """
 from argparse import ArgumentParser, RawTextHelpFormatter
+from functools import partial
 
 import sys
-from typing import List
+from typing import Dict, List, Optional
+
+from kubernetes.client.exceptions import ApiException
+
+from common import TRANSPORT_ERRORS, HookException, KubeApi, \
+    add_plan_argument, add_timeout_argument, get_parsed_args, \
+    run_on_daemon_threads
+from plan import planned
+
+DELETED = 'deleted'
+ABSENT = 'absent'
+TIMED_OUT = 'timed out'
+MAX_WORKERS = 8
+SECRET_TIMEOUT = 30.0
 
-from common import KubeApi, get_parsed_args
 
 class DeleteSecrets(KubeApi):
     """
     Delete the given list of secrets.
     """
-    def cleanup_secrets(self, secrets: List[str]):
+    def delete_if_present(self, secret: str,
+                          secret_timeout: float = SECRET_TIMEOUT) -> str:
         """
-        Delete the given list of secrets
-        :param secrets: List of secret names to delete
+        Delete a secret, a secret that's already gone counts as deleted.
+
+        :param secret: Secret name
+        :param secret_timeout: Request timeout for the delete
+        :return: DELETED, ABSENT or the reason the delete failed
+        """
+        try:
+            self.api_core().delete_namespaced_secret(
+                secret, self.namespace(), grace_period_seconds=0,
+                _request_timeout=secret_timeout)
+            return DELETED
+        except ApiException as error:
+            if error.status == 404:
+                return ABSENT
+            return f'failed: {error.status} {error.reason}'
+        except (HookException,) + TRANSPORT_ERRORS as error:
+            return f'failed: {error}'
+
+    def delete_labelled(self, label_selector: str,
+                        secret_timeout: float = SECRET_TIMEOUT) -> \
+            Dict[str, str]:
+        """
+        Delete all secrets matching a label selector in one call.
 
+        :param label_selector: Kubernetes label selector
+        :param secret_timeout: Request timeout for each call
+        :return: DELETED for each matching secret name
         """
-        for secret in secrets:
-            self.info(f'Deleting secret {secret}')
-            self.delete_secret(secret)
-            self.info(f'Secret {secret} deleted.')
+        secrets = self.api_core().list_namespaced_secret(
+            self.namespace(), label_selector=label_selector,
+            _request_timeout=secret_timeout).items
+        names = [secret.metadata.name for secret in secrets]
+        if names:
+            self.api_core().delete_collection_namespaced_secret(
+                self.namespace(), label_selector=label_selector,
+                grace_period_seconds=0, _request_timeout=secret_timeout)
+        self.info(f'Deleted {len(names)} secrets matching {label_selector}')
+        return {name: DELETED for name in names}
+
+    def cleanup_secrets(self, secrets: List[str],
+                        timeout: Optional[float] = None,
+                        label_selector: Optional[str] = None,
+                        secret_timeout: float = SECRET_TIMEOUT) -> \
+            Dict[str, str]:
+        """
+        Delete the given list of secrets concurrently, secrets that don't
+        exist count as deleted.
+
+        :param secrets: List of secret names to delete
+        :param timeout: Seconds to wait for all deletes, None to wait until
+            each one either completes or fails
+        :param label_selector: Also delete all secrets matching this
+            selector with one call
+        :param secret_timeout: Request timeout for each delete
+        :return: Result of each delete, by secret name
+        :raises HookException: If any secret could not be deleted
+        """
+        results = {}
+        if label_selector:
+            results.update(self.delete_labelled(label_selector,
+                                                secret_timeout))
+        remaining = [secret for secret in dict.fromkeys(secrets or [])
+                     if secret not in results]
+        if remaining:
+            results.update(self.__delete_concurrently(
+                remaining, timeout, secret_timeout))
+
+        for secret, result in results.items():
+            self.info(f'Secret {secret}: {result}')
+        failed = {secret: result for secret, result in results.items()
+                  if result not in (DELETED, ABSENT)}
+        if failed:
+            raise HookException(f'Failed to delete secrets: {failed}')
+        return results
+
+    def __delete_concurrently(self, secrets: List[str],
+                              timeout: Optional[float],
+                              secret_timeout: float) -> Dict[str, str]:
+        self.info(f'Deleting secrets {secrets}')
+        futures = run_on_daemon_threads(
+            partial(self.delete_if_present, secret_timeout=secret_timeout),
+            secrets, MAX_WORKERS, timeout)
+        return {secret: future.result() if future.done() and
+                not future.cancelled() else TIMED_OUT
+                for secret, future in zip(secrets, futures)}
 
 
 def main(sys_args):
@@ -48,11 +139,26 @@ def main(sys_args):
         formatter_class=RawTextHelpFormatter,
         description='Delete a list of secrets.'
     )
-    arg_parser.add_argument('-s', dest='secrets', required=True,
-                            metavar='secret', nargs='?', action='append',
+    arg_parser.add_argument('-s', dest='secrets', metavar='secret',
+                            nargs='?', action='append',
                             help='Secret name.')
+    arg_parser.add_argument('-l', dest='label_selector', default=None,
+                            help='Delete all secrets matching this label '
+                                 'selector.')
+    arg_parser.add_argument('--secret-timeout', dest='secret_timeout',
+                            type=float, default=SECRET_TIMEOUT,
+                            metavar='seconds',
+                            help='Request timeout for each delete.')
+    add_timeout_argument(arg_parser)
+    add_plan_argument(arg_parser)
     args = get_parsed_args(sys_args, arg_parser)
-    DeleteSecrets().cleanup_secrets(args.secrets)
+    if not (args.secrets or args.label_selector):
+        arg_parser.error('one of -s or -l is required')
+    with planned(args.plan):
+        DeleteSecrets().cleanup_secrets(
+            args.secrets, timeout=args.timeout,
+            label_selector=args.label_selector,
+            secret_timeout=args.secret_timeout)
 
 
 if __name__ == '__main__':  # pragma: no cover
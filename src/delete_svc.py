@@ -16,33 +16,130 @@ Class to delete service for .......
 """
 from argparse import ArgumentParser, RawTextHelpFormatter
 
-
 import sys
+from typing import Any, Dict, List, Optional, Set
+
+from kubernetes.client import V1DeleteOptions
+from kubernetes.client.exceptions import ApiException
 
-from common import KubeApi, get_parsed_args
+from common import DeadlineClock, HookTimeoutException, KubeApi, \
+    add_plan_argument, add_timeout_argument, deadline, get_parsed_args, \
+    run_on_daemon_threads
+from plan import planned, skip_wait
+
+MAX_WORKERS = 8
 
 class DeleteService(KubeApi):
     """
     Delete a SVC
     """
-    def service_cleanup(self, service):
+    def service_cleanup(self, service, timeout: Optional[float] = None):
         """
         Delete a Service
         :param service: List of service names to delete
+        :param timeout: Seconds to wait for the deletion, None to wait forever
 
         """
         clusterip = service.spec.cluster_ip
         service_name = service.metadata.name
         if clusterip is not None:
-            self.info(f'Deleting Service {service_name}')
-            self.delete_service(service_name)
-            self.info(f'Service ({service_name}) deleted.')
+            self.info('Deleting Service %s', service_name)
+            self.delete_service(service_name, timeout)
+            self.info('Service (%s) deleted.', service_name)
 
 
     def service(self, service):
         service_name = self.list_service_details(service)
         return service_name
 
+    def batch_cleanup(self, services: List[str],
+                      timeout: Optional[float] = None) -> List[str]:
+        """
+        Delete services with one listing, concurrent deletes and a watch
+        for them all to go, instead of listing per service per second.
+
+        :param services: Service names to delete
+        :param timeout: Seconds to wait for the deletions, None to wait
+            forever
+        :return: Names of the services that were deleted
+        """
+        clock = self.deadline(timeout, f'services {services} to delete')
+        listing = self.api_core().list_namespaced_service(self.namespace())
+        to_delete = [svc.metadata.name for svc in listing.items
+                     if svc.metadata.name in services and
+                     svc.spec.cluster_ip is not None]
+        for skipped in sorted(set(services) - set(to_delete)):
+            self.debug("Skip the cleanup for service %s", skipped)
+        if not to_delete:
+            return []
+
+        self.info('Deleting Services %s', to_delete)
+        futures = run_on_daemon_threads(self.__delete, to_delete,
+                                        MAX_WORKERS, clock.remaining())
+        stuck = [name for name, future in zip(to_delete, futures)
+                 if not future.done() or future.cancelled()]
+        if stuck:
+            raise HookTimeoutException(
+                f'Timed out after {timeout}s deleting services {stuck}')
+        pending = {future.result() for future in futures if future.result()}
+        if skip_wait(f'services {sorted(pending)} to delete'):
+            return to_delete
+        self.wait_deleted(pending, clock)
+        self.info('Services %s deleted.', to_delete)
+        return to_delete
+
+    def __delete(self, service_name: str) -> Optional[str]:
+        options = V1DeleteOptions(
+            propagation_policy='Foreground',
+            grace_period_seconds=5)
+        try:
+            self.api_core().delete_namespaced_service(
+                service_name, self.namespace(), body=options)
+        except ApiException as error:
+            if error.status != 404:
+                raise
+            return None
+        return service_name
+
+    def wait_deleted(self, pending: Set[str], clock: DeadlineClock):
+        """
+        Watch for services to be deleted.
+
+        :param pending: Names of the services being deleted, emptied as
+            they go
+        :param clock: Deadline for the services to go
+        """
+        def all_gone(services: Dict[str, Any]) -> bool:
+            for name in sorted(pending.difference(services)):
+                self.info('Service (%s) deleted.', name)
+            pending.intersection_update(services)
+            return not pending
+
+        self.watch_objects(self.api_core().list_namespaced_service,
+                           all_gone, clock)
+
+
+def cleanup(del_svc: DeleteService, services: List[str], batch: bool,
+            timeout: Optional[float] = None):
+    """
+    Delete the services, one by one or as a batch.
+
+    :param del_svc: The DeleteService to use
+    :param services: Service names to delete
+    :param batch: True to delete them all together
+    :param timeout: Seconds to wait overall, None to wait forever
+    """
+    if batch:
+        del_svc.batch_cleanup(services, timeout)
+        return
+    clock = deadline(timeout, f'services {services} to delete')
+    for svc in services:
+        service_details = del_svc.service(svc)
+        if service_details is not None:
+            del_svc.service_cleanup(service_details, clock.remaining())
+        else:
+            del_svc.debug("Skip the cleanup for service %s", svc)
+
 
 def main(sys_args):
     """
@@ -58,15 +155,14 @@ def main(sys_args):
     arg_parser.add_argument('-s', dest='services', required=True,
                             metavar='service', nargs='?', action='append',
                             help='Service name.')
+    arg_parser.add_argument('--batch', dest='batch', action='store_true',
+                            help='Delete all the services together and '
+                                 'watch for them to go.')
+    add_timeout_argument(arg_parser)
+    add_plan_argument(arg_parser)
     args = get_parsed_args(sys_args, arg_parser)
-    services = args.services
-    del_svc = DeleteService()
-    for svc in services:
-        service_details = del_svc.service(svc)
-        if service_details is not None:
-            del_svc.service_cleanup(service_details)
-        else:
-            del_svc.debug(f"Skip the cleanup for service {svc}")
+    with planned(args.plan):
+        cleanup(DeleteService(), args.services, args.batch, args.timeout)
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -0,0 +1,272 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Run a hook operation against many ENM namespaces at once, e.g. to disable
+backup scheduling across a shared cluster before maintenance.
+
+Namespaces are given by name or with a label selector. Each one is run in
+its own thread, up to a limit, with that namespace's BRO and the one
+Kubernetes API client, and the results are printed as a table at the end.
+Each namespace's calls are rate limited to HOOK_API_QPS on their own, so
+--workers bounds the total rate to the API server.
+"""
+import os
+import sys
+from argparse import ArgumentParser, Namespace, RawTextHelpFormatter
+from functools import partial
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from bro_restore_report import BroRestoreReport
+from bro_schedule_control import ScheduleControl
+from common import DeadlineClock, HookException, HookTarget, KubeApi, \
+    add_plan_argument, add_timeout_argument, get_clock, get_parsed_args, \
+    hook_target, run_on_daemon_threads
+from delete_hook_jobs import DeleteHookJobs
+from plan import planned
+from reset_bro_config_map import ResetBroConfigMap
+
+MAX_WORKERS = 8
+BRO_HOST = 'eric-ctrl-bro.{namespace}'
+BRO_PORT = 7001
+OK = 'OK'
+FAILED = 'FAILED'
+TIMED_OUT = 'TIMED OUT'
+
+# An operation is called with the parsed args and the seconds it has left,
+# from a thread pointed at the namespace.
+Operation = Callable[[Namespace, Optional[float]], None]
+
+
+class FleetResult(NamedTuple):
+    """
+    How an operation went in one namespace.
+    """
+    namespace: str
+    result: str
+    seconds: float = 0.0
+    detail: str = ''
+
+
+def enable_scheduling(args: Namespace, timeout: Optional[float]):
+    """
+    Enable or disable BRO backup scheduling.
+
+    :param args: Parsed args, enabled is the setting
+    :param timeout: Seconds to wait for BRO, None to wait forever
+    """
+    ScheduleControl().enable_scheduling(args.enabled, timeout)
+
+
+def hook_cleanup(args: Namespace, timeout: Optional[float]):
+    """
+    Delete hook jobs.
+
+    :param args: Parsed args, jobs are the job names
+    :param timeout: Seconds to wait for the deletes, None to wait forever
+    """
+    DeleteHookJobs().hook_cleanup(args.jobs, timeout)
+
+
+def reset_restore_state(args: Namespace, _timeout: Optional[float]):
+    """
+    Reset the backup-restore-configmap.
+
+    :param args: Parsed args, configmap is the configmap name
+    """
+    ResetBroConfigMap().reset_restore_state(args.configmap)
+
+
+def show_restore_action(args: Namespace, timeout: Optional[float]):
+    """
+    Report the restore action, waiting for it if it's still running.
+
+    :param args: Parsed args, configmap and scope of the restore
+    :param timeout: Seconds to wait for the action, None to wait forever
+    """
+    BroRestoreReport().show_restore_action(args.configmap, args.scope,
+                                           timeout)
+
+
+class FleetRunner(KubeApi):
+    """
+    Run an operation in many namespaces, a bounded number at a time.
+    """
+
+    def __init__(self, bro_host: str = BRO_HOST, bro_port: int = BRO_PORT,
+                 max_workers: int = MAX_WORKERS):
+        super().__init__()
+        self.bro_host = bro_host
+        self.bro_port = bro_port
+        self.max_workers = max_workers
+
+    def namespaces(self, names: Optional[List[str]] = None,
+                   label_selector: Optional[str] = None) -> List[str]:
+        """
+        Get the namespaces to run in.
+
+        :param names: Namespace names
+        :param label_selector: Also run in namespaces matching this selector
+        :return: The namespace names, each only once
+        """
+        found = list(names or [])
+        if label_selector:
+            found.extend(namespace.metadata.name for namespace in
+                         self.api_core().list_namespace(
+                             label_selector=label_selector).items)
+        return list(dict.fromkeys(found))
+
+    def target(self, namespace: str) -> HookTarget:
+        """
+        :param namespace: A namespace name
+        :return: The namespace with its BRO and the shared API client
+        """
+        return HookTarget(namespace,
+                          self.bro_host.format(namespace=namespace),
+                          self.bro_port, self.api_client())
+
+    def run(self, namespaces: List[str], operation: Operation,
+            args: Namespace, timeout: Optional[float] = None) -> \
+            List[FleetResult]:
+        """
+        Run an operation in each namespace.
+
+        :param namespaces: The namespaces to run in
+        :param operation: The operation
+        :param args: Parsed args passed to the operation
+        :param timeout: Seconds to wait for all the namespaces, None to wait
+            until each one either completes or fails
+        :return: The result in each namespace, in the order given
+        """
+        if not namespaces:
+            return []
+        clock = self.deadline(timeout, f'{len(namespaces)} namespaces')
+        self.info(f'Running {operation.__name__} in {len(namespaces)} '
+                  f'namespaces, {self.max_workers} at a time')
+        futures = run_on_daemon_threads(
+            partial(self.__run_one, operation=operation, args=args,
+                    clock=clock),
+            namespaces, self.max_workers, clock.remaining())
+        return [future.result() if future.done() and not future.cancelled()
+                else FleetResult(namespace, TIMED_OUT)
+                for namespace, future in zip(namespaces, futures)]
+
+    def __run_one(self, namespace: str, operation: Operation,
+                  args: Namespace, clock: DeadlineClock) -> FleetResult:
+        started = get_clock().now()
+        try:
+            with hook_target(self.target(namespace)):
+                operation(args, clock.remaining())
+            result, detail = OK, ''
+        except Exception as error:  # pylint: disable=broad-except
+            self.warning(f'{operation.__name__} failed in {namespace}: '
+                         f'{error}')
+            result, detail = FAILED, str(error) or type(error).__name__
+        return FleetResult(namespace, result,
+                           get_clock().now() - started, detail)
+
+
+def result_table(results: List[FleetResult]) -> str:
+    """
+    :param results: Results from FleetRunner.run
+    :return: The results as a text table
+    """
+    rows = [('NAMESPACE', 'RESULT', 'SECONDS', 'DETAIL')] + [
+        (result.namespace, result.result, f'{result.seconds:.1f}',
+         result.detail.replace('\n', ' ')) for result in results]
+    widths = [max(len(row[column]) for row in rows) for column in range(3)]
+    lines = ['  '.join(value.ljust(width) for value, width in
+                       zip(row, widths)) + '  ' + row[3] for row in rows]
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result.result] = counts.get(result.result, 0) + 1
+    lines.append(', '.join(f'{count} {result}'
+                           for result, count in sorted(counts.items())))
+    return '\n'.join(line.rstrip() for line in lines)
+
+
+def main(sys_args):
+    """
+    Main method, parses args and calls classes.
+
+    :param sys_args: sys.argv[1:]
+
+    """
+    arg_parser = ArgumentParser(
+        formatter_class=RawTextHelpFormatter,
+        description='Run a hook operation in many namespaces at once.'
+    )
+    arg_parser.add_argument('-n', dest='namespaces', metavar='namespace',
+                            action='append', help='Namespace name.')
+    arg_parser.add_argument('-l', dest='label_selector', default=None,
+                            help='Run in all namespaces matching this label '
+                                 'selector.')
+    arg_parser.add_argument('-w', '--workers', dest='workers', type=int,
+                            default=MAX_WORKERS, metavar='count',
+                            help='Namespaces to run in at the same time.')
+    arg_parser.add_argument('--bro-host', dest='bro_host', default=BRO_HOST,
+                            help='BRO host in each namespace, {namespace} '
+                                 'is replaced\nwith the namespace name.')
+    arg_parser.add_argument('--bro-port', dest='bro_port', type=int,
+                            default=int(os.environ.get('BRO_PORT',
+                                                       BRO_PORT)),
+                            help='BRO port in each namespace.')
+    add_timeout_argument(arg_parser)
+    add_plan_argument(arg_parser)
+
+    operations = arg_parser.add_subparsers(dest='operation_name',
+                                           metavar='operation')
+    operations.required = True
+    scheduling = operations.add_parser(
+        'scheduling', help='Enable or disable BRO backup scheduling.')
+    setting = scheduling.add_mutually_exclusive_group(required=True)
+    setting.add_argument('--enable', dest='enabled', action='store_true')
+    setting.add_argument('--disable', dest='enabled', action='store_false')
+    scheduling.set_defaults(operation=enable_scheduling)
+    jobs = operations.add_parser('delete-jobs', help='Delete hook jobs.')
+    jobs.add_argument('-j', dest='jobs', required=True, metavar='job',
+                      action='append', help='Job name.')
+    jobs.set_defaults(operation=hook_cleanup)
+    reset = operations.add_parser(
+        'reset-restore-state', help='Reset the backup-restore-configmap.')
+    reset.add_argument('-c', dest='configmap', required=True,
+                       metavar='configmap',
+                       help='Name of the back-restore configmap')
+    reset.set_defaults(operation=reset_restore_state)
+    report = operations.add_parser(
+        'restore-report', help='Report the last restore action.')
+    report.add_argument('-c', dest='configmap', required=True,
+                        metavar='configmap',
+                        help='Configmap with the action id')
+    report.add_argument('-s', dest='scope', required=True, metavar='scope',
+                        help='The scope of the backup')
+    report.set_defaults(operation=show_restore_action)
+
+    args = get_parsed_args(sys_args, arg_parser)
+    if not (args.namespaces or args.label_selector):
+        arg_parser.error('one of -n or -l is required')
+    if args.workers < 1:
+        arg_parser.error('--workers must be at least 1')
+    with planned(args.plan):
+        runner = FleetRunner(args.bro_host, args.bro_port, args.workers)
+        namespaces = runner.namespaces(args.namespaces, args.label_selector)
+        if not namespaces:
+            raise HookException('No namespaces to run in')
+        results = runner.run(namespaces, args.operation, args,
+                             args.timeout)
+        print(result_table(results), flush=True)
+    if any(result.result != OK for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main(sys.argv[1:])
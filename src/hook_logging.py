@@ -0,0 +1,298 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Logging for the hooks, set up once per process.
+
+Records go through a queue to a background thread that writes them to
+stdout, so a slow log pipe doesn't hold up the hook. INFO and DEBUG
+messages already logged in the last few minutes are counted instead of
+written, and the count is added when the message is next written.
+
+Configured from the environment:
+    HOOK_LOG_LEVEL: the log level, default DEBUG
+    HOOK_LOG_FORMAT: text (default) or json
+    HOOK_LOG_REPEAT_INTERVAL: seconds a repeated message is held back for,
+        default 300, 0 to write every message
+    HOOK_NAME: hook name in JSON logs, default the script name
+    HOOK_PHASE: helm hook phase in JSON logs, e.g. pre-upgrade
+
+A thread can add its own fields, e.g. the namespace it's working on when
+a hook runs across many namespaces. They are added to its JSON records and
+put before the message in text.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator, List, Optional, Tuple
+
+TEXT_FORMAT = '%(asctime)-20s [%(name)s]  %(levelname)-18s %(message)s'
+DEFAULT_REPEAT_INTERVAL = 300.0
+# Distinct messages tracked for repeats, the oldest are forgotten first
+MAX_TRACKED = 256
+
+_CONTEXT = {
+    'hook': os.environ.get('HOOK_NAME') or os.path.splitext(
+        os.path.basename(sys.argv[0] or ''))[0],
+    'phase': os.environ.get('HOOK_PHASE', ''),
+    'namespace': os.environ.get('POD_NAMESPACE', '')}
+_LOCK = threading.Lock()
+_LISTENER = None
+_LOCAL = threading.local()
+
+
+def set_log_context(**fields: str):
+    """
+    Set fields added to every JSON log record, e.g. namespace.
+
+    :param fields: Field names and values
+    """
+    _CONTEXT.update(fields)
+
+
+@contextmanager
+def thread_log_context(**fields: str) -> Iterator[None]:
+    """
+    Add fields to the records logged by this thread, until the block ends.
+
+    :param fields: Field names and values
+    """
+    previous = getattr(_LOCAL, 'fields', {})
+    _LOCAL.fields = dict(previous, **fields)
+    try:
+        yield
+    finally:
+        _LOCAL.fields = previous
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, str]:
+    return getattr(record, 'fields', None) or {}
+
+
+class ContextFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """
+    Copies the logging thread's fields to the record, before it's queued
+    for the writing thread.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.fields = dict(getattr(_LOCAL, 'fields', {}))
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """
+    TEXT_FORMAT, with the record's thread fields before the message.
+    """
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        prefix = ''.join(f'[{value}] ' for value in _fields(record).values())
+        if prefix:
+            record.message = prefix + record.message
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the hook context fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(
+                record.created, timezone.utc).isoformat(
+                    timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()}
+        entry.update(_CONTEXT)
+        entry.update(_fields(record))
+        return json.dumps(entry)
+
+
+class RepeatCompactor:
+    """
+    Holds back INFO and DEBUG messages written less than interval seconds
+    ago, counting them.
+    """
+
+    def __init__(self, interval: float = DEFAULT_REPEAT_INTERVAL,
+                 max_tracked: int = MAX_TRACKED):
+        self.interval = interval
+        self.max_tracked = max_tracked
+        # (logger, level, message) -> [time written, repeats held back]
+        self.__seen = OrderedDict()
+
+    def process(self, record: logging.LogRecord) -> List[logging.LogRecord]:
+        """
+        :param record: A record to write
+        :return: The records to write now, none if the record is a repeat
+        """
+        if self.interval <= 0 or record.levelno >= logging.WARNING:
+            return [record]
+        key = (record.name, record.levelno, record.getMessage(),
+               tuple(_fields(record).items()))
+        seen = self.__seen.get(key)
+        if seen and record.created - seen[0] < self.interval:
+            seen[1] += 1
+            return []
+        released = []
+        if seen:
+            self.__seen.pop(key)
+            if seen[1]:
+                record.msg = f'{key[2]} ({seen[1]} repeats in the last ' \
+                             f'{record.created - seen[0]:.0f}s)'
+                record.args = None
+        elif len(self.__seen) >= self.max_tracked:
+            released = self.__summary(*self.__seen.popitem(last=False))
+        self.__seen[key] = [record.created, 0]
+        return released + [record]
+
+    def flush(self) -> List[logging.LogRecord]:
+        """
+        :return: Summaries of the repeats still held back
+        """
+        records = []
+        while self.__seen:
+            records.extend(self.__summary(*self.__seen.popitem(last=False)))
+        return records
+
+    @staticmethod
+    def __summary(key: Tuple[str, int, str, tuple],
+                  seen: List) -> List[logging.LogRecord]:
+        name, level, message, fields = key
+        if not seen[1]:
+            return []
+        record = logging.LogRecord(
+            name, level, '', 0, f'{message} ({seen[1]} repeats)', None,
+            None)
+        record.fields = dict(fields)
+        return [record]
+
+
+class StdoutHandler(logging.StreamHandler):
+    """
+    Writes to sys.stdout as it is when the record is written, so records
+    written at exit still work if sys.stdout was replaced.
+    """
+
+    @property
+    def stream(self):
+        """ The current sys.stdout """
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, _stream):
+        pass
+
+
+class CompactingHandler(logging.Handler):
+    """
+    Passes records through a RepeatCompactor to another handler.
+    """
+
+    def __init__(self, target: logging.Handler, compactor: RepeatCompactor):
+        super().__init__()
+        self.target = target
+        self.compactor = compactor
+
+    def emit(self, record: logging.LogRecord):
+        for released in self.compactor.process(record):
+            self.target.handle(released)
+
+    def flush(self):
+        self.target.flush()
+
+    def close(self):
+        for released in self.compactor.flush():
+            self.target.handle(released)
+        self.target.flush()
+        super().close()
+
+
+def _repeat_interval() -> float:
+    value = os.environ.get('HOOK_LOG_REPEAT_INTERVAL')
+    try:
+        return float(value) if value else DEFAULT_REPEAT_INTERVAL
+    except ValueError:
+        return DEFAULT_REPEAT_INTERVAL
+
+
+def _level() -> int:
+    level = logging.getLevelName(
+        os.environ.get('HOOK_LOG_LEVEL', 'DEBUG').upper())
+    return level if isinstance(level, int) else logging.DEBUG
+
+
+def setup_logging(stream=None) -> Optional[QueueListener]:
+    """
+    Send the root logger's records to stdout through a background thread.
+    Only the first call does anything.
+
+    :param stream: Where to write, default sys.stdout
+    :return: The listener writing the records, None if logging was
+        already set up
+    """
+    global _LISTENER  # pylint: disable=global-statement
+    with _LOCK:
+        if _LISTENER is not None:
+            return None
+        output = logging.StreamHandler(stream) if stream else \
+            StdoutHandler()
+        output.setFormatter(
+            JsonFormatter()
+            if os.environ.get('HOOK_LOG_FORMAT', '').lower() == 'json'
+            else TextFormatter())
+        handler = CompactingHandler(output, RepeatCompactor(
+            _repeat_interval()))
+        _LISTENER = QueueListener(queue.Queue(), handler)
+
+        root = logging.getLogger()
+        queued = QueueHandler(_LISTENER.queue)
+        queued.addFilter(ContextFilter())
+        root.addHandler(queued)
+        root.setLevel(_level())
+        logging.getLogger('kubernetes.client.rest').setLevel(logging.INFO)
+        _LISTENER.start()
+        atexit.register(stop_logging)
+        return _LISTENER
+
+
+def stop_logging():
+    """
+    Write out the queued records and the repeat counts, and stop the
+    background thread.
+    """
+    global _LISTENER  # pylint: disable=global-statement
+    with _LOCK:
+        listener, _LISTENER = _LISTENER, None
+    if listener is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler) and \
+                handler.queue is listener.queue:
+            root.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,176 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Build the Jobs hooks start in the background from an optional
+pre-rendered Job template and values the chart puts in the environment.
+
+The chart sets, on the hook container:
+    HOOK_IMAGE, HOOK_IMAGE_PULL_POLICY: image for the job, usually the
+        hook's own image
+    HOOK_JOB_TEMPLATE: path of a rendered Job manifest (YAML or JSON) to
+        start from, e.g. mounted from a configmap
+    HOOK_JOB_TTL: ttlSecondsAfterFinished, default 3600
+    HOOK_JOB_ACTIVE_DEADLINE: activeDeadlineSeconds, default 86400
+    HOOK_JOB_CPU_REQUEST, HOOK_JOB_MEMORY_REQUEST: resource requests,
+        default 100m and 128Mi
+Anything set in the template takes precedence over the defaults.
+"""
+import json
+import os
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import yaml
+from kubernetes.client import ApiClient, V1Container, V1EnvVar, V1Job, \
+    V1JobSpec, V1LocalObjectReference, V1ObjectMeta, V1PodSpec, \
+    V1PodTemplateSpec, V1ResourceRequirements
+
+from common import BaseClass, HookException
+
+ENV_IMAGE = 'HOOK_IMAGE'
+ENV_PULL_POLICY = 'HOOK_IMAGE_PULL_POLICY'
+ENV_TEMPLATE = 'HOOK_JOB_TEMPLATE'
+ENV_TTL = 'HOOK_JOB_TTL'
+ENV_ACTIVE_DEADLINE = 'HOOK_JOB_ACTIVE_DEADLINE'
+ENV_CPU_REQUEST = 'HOOK_JOB_CPU_REQUEST'
+ENV_MEMORY_REQUEST = 'HOOK_JOB_MEMORY_REQUEST'
+
+DEFAULT_TTL = 3600
+DEFAULT_ACTIVE_DEADLINE = 86400
+DEFAULT_CPU_REQUEST = '100m'
+DEFAULT_MEMORY_REQUEST = '128Mi'
+
+
+def load_template(path: str) -> V1Job:
+    """
+    Read a rendered Job manifest.
+
+    :param path: YAML or JSON file
+    :return: The Job
+    """
+    try:
+        with open(path, encoding='utf-8') as _reader:
+            manifest = yaml.safe_load(_reader)
+    except (OSError, yaml.YAMLError) as error:
+        raise HookException(
+            f'Could not read the job template {path}: {error}') from error
+    if not isinstance(manifest, dict) or manifest.get('kind') != 'Job':
+        raise HookException(f'{path} is not a Job manifest')
+    return ApiClient().deserialize(
+        SimpleNamespace(data=json.dumps(manifest)), 'V1Job')
+
+
+class JobTemplate(BaseClass):
+    """
+    Render background Jobs from a template and the environment.
+    """
+
+    def __init__(self, environ: Optional[Dict[str, str]] = None):
+        super().__init__()
+        self.environ = os.environ if environ is None else environ
+
+    def __int(self, name: str, default: int) -> int:
+        value = self.environ.get(name)
+        try:
+            return int(value) if value else default
+        except ValueError as error:
+            raise HookException(
+                f'${name} is not a number: {value}') from error
+
+    def template(self) -> V1Job:
+        """
+        Get the Job to start from, the HOOK_JOB_TEMPLATE manifest or an
+        empty one with a single container.
+
+        :return: The template Job
+        """
+        path = self.environ.get(ENV_TEMPLATE)
+        if path:
+            self.debug(f'Using job template {path}')
+            return load_template(path)
+        return V1Job(spec=V1JobSpec(template=V1PodTemplateSpec(
+            spec=V1PodSpec(containers=[V1Container(name='executor')]))))
+
+    def render(self,  # pylint: disable=too-many-arguments
+               name: str, command: List[str], env: Dict[str, str],
+               service_account: str, annotations: Dict[str, str],
+               pull_secret: Optional[str] = None,
+               fallback_image: Optional[Callable[[], Tuple[str, str]]] =
+               None) -> V1Job:
+        """
+        Render a Job that runs a command once.
+
+        :param name: The job name
+        :param command: Command for the first container
+        :param env: Environment variables added to the first container
+        :param service_account: The serviceaccount to run the job as
+        :param annotations: Annotations added to the pod template
+        :param pull_secret: Image pull secret name
+        :param fallback_image: Called for the image and pull policy if
+            neither $HOOK_IMAGE or the template set an image
+        :return: The Job
+        """
+        job = self.template()
+        job.api_version = 'batch/v1'
+        job.kind = 'Job'
+        job.metadata = job.metadata or V1ObjectMeta()
+        job.metadata.name = name
+        job.metadata.resource_version = None
+
+        spec = job.spec
+        if spec.backoff_limit is None:
+            spec.backoff_limit = 0
+        if spec.ttl_seconds_after_finished is None:
+            spec.ttl_seconds_after_finished = self.__int(ENV_TTL, DEFAULT_TTL)
+        if spec.active_deadline_seconds is None:
+            spec.active_deadline_seconds = self.__int(
+                ENV_ACTIVE_DEADLINE, DEFAULT_ACTIVE_DEADLINE)
+
+        pod = spec.template
+        pod.metadata = pod.metadata or V1ObjectMeta()
+        pod.metadata.annotations = dict(pod.metadata.annotations or {},
+                                        **annotations)
+        pod.spec.service_account = service_account
+        pod.spec.service_account_name = service_account
+        pod.spec.restart_policy = 'Never'
+        if pull_secret and not pod.spec.image_pull_secrets:
+            pod.spec.image_pull_secrets = [
+                V1LocalObjectReference(name=pull_secret)]
+
+        container = pod.spec.containers[0]
+        container.image = self.environ.get(ENV_IMAGE) or container.image
+        container.image_pull_policy = self.environ.get(ENV_PULL_POLICY) or \
+            container.image_pull_policy
+        if not container.image and fallback_image:
+            image, pull_policy = fallback_image()
+            container.image = image
+            container.image_pull_policy = container.image_pull_policy or \
+                pull_policy
+        if not container.image:
+            raise HookException(f'No image set for job {name}, set '
+                                f'${ENV_IMAGE} or use a job template')
+        container.command = command
+        container.args = None
+        container.env = [var for var in container.env or []
+                         if var.name not in env] + \
+            [V1EnvVar(name=key, value=value) for key, value in env.items()]
+        if not container.resources or not container.resources.requests:
+            container.resources = V1ResourceRequirements(
+                limits=container.resources.limits
+                if container.resources else None,
+                requests={
+                    'cpu': self.environ.get(ENV_CPU_REQUEST) or
+                           DEFAULT_CPU_REQUEST,
+                    'memory': self.environ.get(ENV_MEMORY_REQUEST) or
+                              DEFAULT_MEMORY_REQUEST})
+        return job
@@ -0,0 +1,215 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Plan mode, a hook run with --plan makes its reads against Kubernetes and
+BRO but only records the changes it would make, then prints them with an
+estimate of the API calls a real run would cost.
+
+Calls are sorted into reads and changes by method name. Waits for a
+change to take effect are skipped, they are counted as one poll each, so
+the estimate is the least a real run would make.
+
+The plan belongs to the thread that started it, like a HookTarget, so a
+plan run and a real run can share a process. Threads doing a run's work
+join its plan with use_plan.
+"""
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Method names that change something in Kubernetes or BRO, anything else is
+# a read.
+MUTATING_PREFIXES = ('create', 'delete', 'patch', 'replace', 'restore',
+                     'import', 'export', 'update', 'apply', 'interval_add',
+                     'interval_delete')
+
+_PLAN = threading.local()
+
+
+class PlannedResult:  # pylint: disable=too-few-public-methods
+    """
+    Returned instead of the result of a change that wasn't made. It
+    passes for a successful Kubernetes status or a completed BRO action.
+    """
+    state = 'COMPLETE'
+    result = 'SUCCESS'
+    status = 'Success'
+    progress = 1.0
+    additional_info = 'Planned, not run'
+    scope = None
+
+    def __init__(self, call_id: str, name: str):
+        self.id = call_id  # pylint: disable=invalid-name
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f'PlannedResult({self.id}, {self.name})'
+
+
+def is_mutation(method: str) -> bool:
+    """
+    :param method: An API method name
+    :return: True if the method changes something
+    """
+    return method.startswith(MUTATING_PREFIXES)
+
+
+def _target(args: tuple, kwargs: Dict[str, Any]) -> str:
+    """
+    :return: The name of the object a call is for, the name in its body or
+        its first string argument, '' if neither
+    """
+    for value in (kwargs.get('body'),) + args:
+        name = getattr(getattr(value, 'metadata', None), 'name', None)
+        if isinstance(name, str):
+            return name
+    if args and isinstance(args[0], str):
+        return args[0]
+    return ''
+
+
+class Plan:
+    """
+    The reads made and the changes and waits skipped during a plan run.
+    """
+
+    def __init__(self):
+        self.reads = Counter()
+        self.changes: List[Tuple[str, str]] = []
+        self.waits: List[str] = []
+        self.actions = 0
+        self.__lock = threading.Lock()
+
+    def read(self, api: str, method: str):
+        """
+        Count a read that was made.
+
+        :param api: The API class name, e.g. CoreV1Api
+        :param method: The method or property read
+        """
+        with self.__lock:
+            self.reads[f'{api}.{method}'] += 1
+
+    def change(self, api: str, method: str, args: tuple = (),
+               kwargs: Optional[Dict[str, Any]] = None) -> PlannedResult:
+        """
+        Record a change that wasn't made.
+
+        :param api: The API class name, e.g. BatchV1Api
+        :param method: The method that would have been called
+        :param args: Its positional arguments
+        :param kwargs: Its keyword arguments
+        :return: A stand in for the call's result
+        """
+        target = _target(args, kwargs or {})
+        with self.__lock:
+            self.changes.append((f'{api}.{method}', target))
+            return PlannedResult(f'planned-{len(self.changes)}', method)
+
+    def wait(self, description: str, action: bool = False):
+        """
+        Record a skipped wait.
+
+        :param description: What would have been waited for
+        :param action: True if it's a wait for a BRO action
+        """
+        with self.__lock:
+            self.waits.append(description)
+            self.actions += int(action)
+
+    def api_calls(self) -> int:
+        """
+        :return: Estimated API calls for a real run, at least one poll is
+            counted for each skipped wait
+        """
+        return sum(self.reads.values()) + len(self.changes) + len(self.waits)
+
+    def report(self) -> str:
+        """
+        :return: The plan as text
+        """
+        lines = ['Plan only, nothing was changed.',
+                 f'Changes ({len(self.changes)}):']
+        lines.extend(f'  {call}({target!r})' if target else f'  {call}()'
+                     for call, target in self.changes)
+        lines.append(f'Waits skipped ({len(self.waits)}):')
+        lines.extend(f'  {description}' for description in self.waits)
+        lines.append(f'Reads made ({sum(self.reads.values())}):')
+        lines.extend(f'  {call} x{count}'
+                     for call, count in sorted(self.reads.items()))
+        lines.append(f'Estimated API calls: {self.api_calls()}, '
+                     f'BRO actions: {self.actions}')
+        return '\n'.join(lines)
+
+
+def planning() -> Optional[Plan]:
+    """
+    :return: The current thread's plan, None if this isn't a plan run
+    """
+    return getattr(_PLAN, 'plan', None)
+
+
+def skip_wait(description: str, action: bool = False) -> bool:
+    """
+    Check if a wait should be skipped, because this is a plan run and what
+    it waits for was never changed.
+
+    :param description: What would be waited for
+    :param action: True if it's a wait for a BRO action
+    :return: True if the wait was recorded and should be skipped
+    """
+    plan = planning()
+    if plan is None:
+        return False
+    plan.wait(description, action)
+    return True
+
+
+@contextmanager
+def use_plan(plan: Optional[Plan]) -> Iterator[Optional[Plan]]:
+    """
+    Record this thread's calls in a plan until the block ends, e.g. the
+    plan of the thread that handed it work.
+
+    :param plan: The plan, None for a real run
+    :return: The plan
+    """
+    previous = planning()
+    _PLAN.plan = plan
+    try:
+        yield plan
+    finally:
+        _PLAN.plan = previous
+
+
+@contextmanager
+def planned(enabled: bool, stream=None) -> Iterator[Optional[Plan]]:
+    """
+    Run the body as a plan if enabled, printing the plan when it ends,
+    whether it ended with an error or not.
+
+    :param enabled: True for a plan run, the --plan option
+    :param stream: Where to print the plan, default sys.stdout
+    :return: The Plan, None if not enabled
+    """
+    if not enabled:
+        yield None
+        return
+    plan = Plan()
+    try:
+        with use_plan(plan):
+            yield plan
+    finally:
+        print(plan.report(), file=stream or sys.stdout, flush=True)
@@ -0,0 +1,276 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Track the progress of a BRO action, estimate when it will finish and
+decide when the progress is worth publishing.
+
+Transfers such as imports also get a throughput from the size of the
+backup, and are flagged as stalled when their progress stops moving.
+"""
+import json
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+MB = 1024 * 1024
+# A transfer summary handed to the restore job, for it to record once the
+# configmap exists
+SUMMARY_ENV = 'HOOK_IMPORT_SUMMARY'
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class ProgressTracker:
+    """
+    Keeps the recent progress samples of an action.
+
+    Progress is published at most once every interval seconds, unless it
+    has moved by at least step since it was last published.
+    """
+
+    def __init__(self, prefix: str, interval: float = 30.0,
+                 step: float = 0.05, window: int = 10):
+        """
+        :param prefix: Prefix of the published keys, e.g. RESTORE
+        :param interval: Seconds between publishing the same progress
+        :param step: Progress change, 0 to 1, worth publishing straight away
+        :param window: Number of samples the ETA is worked out from
+        """
+        self.prefix = prefix
+        self.interval = interval
+        self.step = step
+        self.history = deque(maxlen=max(2, window))
+        self.last_published = None
+
+    def record(self, now: float, progress: float):
+        """
+        Add a progress sample.
+
+        :param now: Clock time of the sample
+        :param progress: Progress, 0 to 1
+        """
+        self.history.append((now, progress))
+
+    def rate(self) -> Optional[float]:
+        """
+        :return: Progress per second over the recent samples, None if
+            there aren't enough of them
+        """
+        if len(self.history) < 2:
+            return None
+        (first_time, first), (last_time, last) = \
+            self.history[0], self.history[-1]
+        if last_time <= first_time:
+            return None
+        return (last - first) / (last_time - first_time)
+
+    def eta(self) -> Optional[float]:
+        """
+        :return: Estimated seconds until the action completes, None if
+            it can't be estimated yet
+        """
+        rate = self.rate()
+        if not rate or rate <= 0:
+            return None
+        return max(0.0, (1 - self.history[-1][1]) / rate)
+
+    def due(self) -> bool:
+        """
+        :return: True if the latest sample should be published
+        """
+        if not self.history:
+            return False
+        if self.last_published is None:
+            return True
+        now, progress = self.history[-1]
+        published_time, published = self.last_published
+        return now - published_time >= self.interval or \
+            abs(progress - published) >= self.step
+
+    def mark_published(self):
+        """
+        Remember the latest sample was published.
+        """
+        if self.history:
+            self.last_published = self.history[-1]
+
+    def values(self, info: Optional[str] = None,
+               finished: bool = False) -> Dict[str, str]:
+        """
+        Get the latest progress as configmap data, and remember it was
+        published.
+
+        :param info: BRO's progress info for the action
+        :param finished: Report the action as complete
+        :return: <prefix>_PROGRESS (percent), <prefix>_PROGRESS_INFO,
+            <prefix>_ETA_SECONDS (empty if unknown) and
+            <prefix>_PROGRESS_UPDATED (UTC)
+        """
+        progress, eta = (1.0, 0.0) if finished else (
+            self.history[-1][1] if self.history else 0.0, self.eta())
+        self.mark_published()
+        return {
+            f'{self.prefix}_PROGRESS': f'{progress * 100:.0f}',
+            f'{self.prefix}_PROGRESS_INFO': ' '.join((info or '').split()),
+            f'{self.prefix}_ETA_SECONDS': '' if eta is None else
+            f'{eta:.0f}',
+            f'{self.prefix}_PROGRESS_UPDATED': _utc_now()}
+
+
+def published_progress(data: Optional[Dict[str, str]],
+                       prefix: str) -> Optional[str]:
+    """
+    Describe the progress a ProgressTracker published to a configmap.
+
+    :param data: The configmap data
+    :param prefix: Prefix of the published keys, e.g. RESTORE
+    :return: The progress, ETA, update time and info as one line, None if
+        no progress was published
+    """
+    data = data or {}
+    progress = data.get(f'{prefix}_PROGRESS')
+    if not progress:
+        return None
+    eta = data.get(f'{prefix}_ETA_SECONDS')
+    parts = [f'{progress}%', f'ETA {eta}s' if eta else 'ETA unknown']
+    updated = data.get(f'{prefix}_PROGRESS_UPDATED')
+    if updated:
+        parts.append(f'updated {updated}')
+    info = data.get(f'{prefix}_PROGRESS_INFO')
+    return ', '.join(parts) + (f': {info}' if info else '')
+
+
+def handed_over_summary() -> Dict[str, str]:
+    """
+    :return: The transfer summary in $HOOK_IMPORT_SUMMARY, see
+        TransferTracker.summary, empty if there isn't one
+    """
+    try:
+        summary = json.loads(os.environ.get(SUMMARY_ENV) or '{}')
+    except ValueError:
+        return {}
+    if not isinstance(summary, dict):
+        return {}
+    return {str(key): str(value) for key, value in summary.items()}
+
+
+class TransferTracker(ProgressTracker):
+    """
+    Progress of an action that moves a known amount of data.
+
+    The size may not be known, then only the progress and ETA are
+    reported.
+    """
+
+    def __init__(self, prefix: str,  # pylint: disable=too-many-arguments
+                 size: Optional[int] = None, interval: float = 30.0,
+                 step: float = 0.1, stall_window: float = 600.0,
+                 window: int = 10):
+        """
+        :param prefix: Prefix of the published keys, e.g. IMPORT
+        :param size: Bytes to transfer, None if not known
+        :param interval: Seconds between reporting the same progress
+        :param step: Progress change, 0 to 1, worth reporting straight away
+        :param stall_window: Seconds without progress before the transfer
+            is stalled
+        :param window: Number of samples the rate is worked out from
+        """
+        super().__init__(prefix, interval, step, window)
+        self.size = size
+        self.stall_window = stall_window
+        self.stalls = 0
+        self.started = None
+        self.moved = None
+        self.__stalled = False
+
+    def record(self, now: float, progress: float):
+        if self.started is None:
+            self.started = now
+        if self.moved is None or progress > self.history[-1][1]:
+            self.moved = now
+            self.__stalled = False
+        super().record(now, progress)
+
+    def idle(self) -> float:
+        """
+        :return: Seconds since the progress last moved
+        """
+        if not self.history:
+            return 0.0
+        return self.history[-1][0] - self.moved
+
+    def new_stall(self) -> bool:
+        """
+        Check if the transfer has stalled, only once per stall.
+
+        :return: True if the progress has just gone stall_window seconds
+            without moving
+        """
+        if self.__stalled or self.idle() < self.stall_window:
+            return False
+        self.__stalled = True
+        self.stalls += 1
+        return True
+
+    def throughput(self) -> Optional[float]:
+        """
+        :return: Recent bytes per second, None if the size or the rate
+            isn't known
+        """
+        rate = self.rate()
+        if self.size is None or rate is None:
+            return None
+        return max(0.0, rate) * self.size
+
+    def describe(self) -> str:
+        """
+        :return: The latest progress, data moved, throughput and ETA as
+            one line
+        """
+        progress = self.history[-1][1] if self.history else 0.0
+        parts = [f'{progress:.0%}']
+        if self.size is not None:
+            parts.append(f'{progress * self.size / MB:.0f}/'
+                         f'{self.size / MB:.0f} MB')
+        throughput = self.throughput()
+        if throughput is not None:
+            parts.append(f'{throughput / MB:.1f} MB/s')
+        eta = self.eta()
+        parts.append('ETA unknown' if eta is None else f'ETA {eta:.0f}s')
+        if self.__stalled:
+            parts.append(f'stalled {self.idle():.0f}s')
+        return ', '.join(parts)
+
+    def summary(self, now: float) -> Dict[str, str]:
+        """
+        Get the throughput of the whole transfer as configmap data.
+
+        :param now: Clock time the transfer finished
+        :return: <prefix>_SECONDS, <prefix>_BYTES and
+            <prefix>_MB_PER_SECOND (empty if the size isn't known),
+            <prefix>_STALLS and <prefix>_FINISHED (UTC)
+        """
+        seconds = now - self.started if self.started is not None else 0.0
+        average = self.size / MB / seconds \
+            if self.size is not None and seconds > 0 else None
+        return {
+            f'{self.prefix}_SECONDS': f'{seconds:.0f}',
+            f'{self.prefix}_BYTES': '' if self.size is None else
+            str(self.size),
+            f'{self.prefix}_MB_PER_SECOND': '' if average is None else
+            f'{average:.1f}',
+            f'{self.prefix}_STALLS': str(self.stalls),
+            f'{self.prefix}_FINISHED': _utc_now()}
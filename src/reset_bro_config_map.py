@@ -19,7 +19,8 @@ from argparse import ArgumentParser, RawTextHelpFormatter
 
 import sys
 
-from common import KubeApi, get_parsed_args
+from common import KubeApi, add_plan_argument, get_parsed_args
+from plan import planned
 
 
 class ResetBroConfigMap(KubeApi):
@@ -66,8 +67,10 @@ def main(sys_args):
     arg_parser.add_argument('-c', dest='configmap', required=True,
                             metavar='configmap',
                             help='Name of the back-restore configmap')
+    add_plan_argument(arg_parser)
     args = get_parsed_args(sys_args, arg_parser)
-    ResetBroConfigMap().reset_restore_state(args.configmap)
+    with planned(args.plan):
+        ResetBroConfigMap().reset_restore_state(args.configmap)
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -20,7 +20,8 @@ from argparse import ArgumentParser, RawTextHelpFormatter
 from kubernetes import client
 from kubernetes.client.exceptions import ApiException
 
-from common import KubeApi, get_parsed_args
+from common import KubeApi, add_plan_argument, get_parsed_args
+from plan import planned, planning
 
 
 
@@ -43,6 +44,9 @@ class UpgradeState(KubeApi):
         cmap.metadata = client.V1ObjectMeta(name=cm_name)
         cmap.data = upgrade_state
         try:
+            if planning() is not None:
+                # A planned replace can't fail, check there's one to replace
+                self.get_configmap(cm_name)
             self.replace_configmap(cm_name, cmap)
             self.info('Configmap Replaced')
             self.info(f'Upgrade State Set to {upgrade_state}')
@@ -70,10 +74,12 @@ def main(sys_args):
 
     arg_parser.add_argument('--full', dest='is_partial',
                             action='store_false', help='Enable Scheduling')
+    add_plan_argument(arg_parser)
 
     args = get_parsed_args(sys_args, arg_parser)
 
-    UpgradeState().set_upgrade_state(args.is_partial)
+    with planned(args.plan):
+        UpgradeState().set_upgrade_state(args.is_partial)
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -0,0 +1,90 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Wait for a key in the backup-restore-configmap to have a value, e.g. for
+RESTORE_STATE to be finished, watching the configmap instead of polling
+it. Returns as soon as the value is seen.
+"""
+import sys
+from argparse import ArgumentParser, RawTextHelpFormatter
+from typing import Optional
+
+from kubernetes.client import V1ConfigMap
+
+from common import KubeApi, add_timeout_argument, get_parsed_args
+
+
+class RestoreStateWaiter(KubeApi):
+    """
+    Wait for a configmap key to be set to a value.
+    """
+
+    def wait_for_value(self, configmap: str, key: str, value: str,
+                       timeout: Optional[float] = None):
+        """
+        Wait for a configmap key to have a value. The configmap is read
+        once and then watched, it's only read again if the watch expires.
+        A configmap that doesn't exist yet is waited for.
+
+        :param configmap: The configmap name
+        :param key: The key in the configmap data
+        :param value: The value to wait for
+        :param timeout: Seconds to wait, None to wait forever
+        :raises HookTimeoutException: If the value isn't set in time
+        """
+        description = f'{key}={value} in configmap {configmap}'
+        self.info(f'Waiting for {description}')
+
+        def has_value(cfg_map: Optional[V1ConfigMap]) -> bool:
+            if cfg_map is None:
+                self.info(f'Configmap {configmap} does not exist')
+                return False
+            current = (cfg_map.data or {}).get(key)
+            self.debug(f'{key} is {current!r}')
+            return current == value
+
+        self.watch_object(self.api_core().list_namespaced_config_map,
+                          configmap, has_value,
+                          self.deadline(timeout, description))
+        self.info(f'{key} is {value} in {configmap}')
+
+
+def main(sys_args):
+    """
+    Main method, parses args and calls classes.
+
+    :param sys_args: sys.argv[1:]
+
+    """
+    arg_parser = ArgumentParser(
+        formatter_class=RawTextHelpFormatter,
+        description='Wait for a value in the backup-restore-configmap.'
+    )
+    arg_parser.add_argument('-c', dest='configmap', required=True,
+                            metavar='configmap',
+                            help='Name of the back-restore configmap')
+    arg_parser.add_argument('-k', dest='key', default='RESTORE_STATE',
+                            metavar='key',
+                            help='The key to wait for, default '
+                                 'RESTORE_STATE')
+    arg_parser.add_argument('-v', dest='value', default='finished',
+                            metavar='value',
+                            help='The value to wait for, default finished')
+    add_timeout_argument(arg_parser)
+    args = get_parsed_args(sys_args, arg_parser)
+    RestoreStateWaiter().wait_for_value(args.configmap, args.key, args.value,
+                                        timeout=args.timeout)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main(sys.argv[1:])
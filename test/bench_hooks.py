@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Run every hook end to end against the local simulator and report the wall
+time and number of Kubernetes and BRO API calls each one makes.
+
+Usage:
+    PYTHONPATH=src/:test/:test/bur_cli/src/ python3 test/bench_hooks.py
+"""
+import base64
+import importlib
+import json
+import logging
+import sys
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+from hook_simulator import HookSimulator, SimulatorConfig
+
+CONFIG_MAP = 'backup-restore-configmap'
+BACKUP = 'PreUpgradeBackup'
+JOB = 'eric-enm-bro-restore-executor-job'
+SECRET = 'hook-sftp-secret'
+SERVICES = ['eric-enm-svc-a', 'eric-enm-svc-b']
+SECRETS = ['eric-enm-credentials-a', 'eric-enm-credentials-b']
+SCHEDULING = json.dumps({
+    'backupPrefix': 'SCHEDULED_BACKUP',
+    'schedules': [{'every': '1d', 'start': '2030-01-01T04:00:00'},
+                  {'every': '1w2d'}]})
+RETENTION = json.dumps({'limit': 2, 'autoDelete': True})
+
+
+def scenario(workdir: str) -> list:
+    """
+    The hook invocations, in the order an upgrade and rollback runs them.
+
+    :param workdir: Directory for the SFTP secrets files
+    :return: List of (label, module, args)
+    """
+    return [
+        ('upgrade_state', 'upgrade_state', ['--partial']),
+        ('schedule_disable', 'bro_schedule_control', ['--disabled']),
+        ('pre_upgrade_backup', 'bro_pre_upgrade_backup_trigger',
+         ['-b', BACKUP]),
+        ('restore_trigger', 'bro_restore_trigger',
+         ['-S', workdir, '-A', 'hook-restore-sa', '-b', BACKUP, '-j', JOB,
+          '-s', 'ROLLBACK', '-c', CONFIG_MAP]),
+        ('restore_runner', 'bro_restore_runner',
+         ['-b', BACKUP, '-s', 'ROLLBACK', '-c', CONFIG_MAP]),
+        ('restore_report', 'bro_restore_report',
+         ['-c', CONFIG_MAP, '-s', 'ROLLBACK']),
+        ('bm_config', 'bro_bm_config',
+         ['-b', '-', '-s', '-', '-c', CONFIG_MAP, '-S', SECRET,
+          '-V', SCHEDULING, '-R', RETENTION]),
+        ('partial_rollback', 'bro_partial_rollback', None),
+        ('delete_hook_jobs', 'delete_hook_jobs', ['-j', JOB]),
+        ('delete_svc', 'delete_svc',
+         [arg for svc in SERVICES for arg in ('-s', svc)]),
+        ('delete_secrets', 'delete_secrets',
+         [arg for sec in SECRETS for arg in ('-s', sec)]),
+        ('reset_bro_config_map', 'reset_bro_config_map',
+         ['-c', CONFIG_MAP]),
+    ]
+
+
+def seed(sim: HookSimulator):
+    """
+    Add the objects the scenario needs on top of the simulator defaults.
+
+    :param sim: The simulator
+    """
+    def encode(value):
+        return base64.b64encode(value.encode()).decode()
+
+    nsp = sim.config.namespace
+    sim.kube.add('secrets', nsp, {
+        'metadata': {'name': SECRET},
+        'data': {'externalStorageURI': encode('sftp://u@127.0.0.1:22/b'),
+                 'externalStorageCredentials': encode('secret')}})
+    for name in SECRETS:
+        sim.kube.add('secrets', nsp, {'metadata': {'name': name},
+                                      'data': {'k': encode('v')}})
+    for name in SERVICES:
+        sim.kube.add('services', nsp, sim.service(name))
+
+
+def run_hook(module_name: str, args) -> str:
+    """
+    Run a hook's main() in this process.
+
+    :param module_name: The hook module
+    :param args: The hook arguments, None if main() takes none
+    :return: Error message or an empty string if the hook succeeded
+    """
+    module = importlib.import_module(module_name)
+    try:
+        if args is None:
+            module.main()
+        else:
+            module.main(list(args))
+    except SystemExit as exit_error:
+        if exit_error.code not in (0, None):
+            return f'exit {exit_error.code}'
+    except Exception as error:  # pylint: disable=broad-except
+        return f'{error.__class__.__name__}: {error}'
+    return ''
+
+
+def run(config: SimulatorConfig) -> list:
+    """
+    Run the scenario once.
+
+    :param config: The simulator configuration
+    :return: A result dict per hook
+    """
+    results = []
+    with HookSimulator(config) as sim:
+        sim.apply_environment()
+        seed(sim)
+        for label, module_name, args in scenario(sim.workdir):
+            sim.reset_calls()
+            start = time.perf_counter()
+            error = run_hook(module_name, args)
+            elapsed = time.perf_counter() - start
+            results.append({
+                'hook': label,
+                'ok': not error,
+                'error': error,
+                'wall_seconds': round(elapsed, 3),
+                'kube_calls': sum(sim.calls('kube').values()),
+                'bro_calls': sum(sim.calls('bro').values()),
+                'calls': dict(sim.calls())})
+    return results
+
+
+def report(results: list, verbose: bool = False):
+    """
+    Print a results table.
+
+    :param results: Results from run()
+    :param verbose: Also print the per endpoint call counts
+    """
+    print(f'{"hook":<22} {"ok":<4} {"wall(s)":>9} {"kube":>6} {"bro":>6}')
+    for res in results:
+        print(f'{res["hook"]:<22} {"yes" if res["ok"] else "NO":<4} '
+              f'{res["wall_seconds"]:>9.3f} {res["kube_calls"]:>6} '
+              f'{res["bro_calls"]:>6}  {res["error"]}')
+        if verbose:
+            for endpoint, count in sorted(res['calls'].items()):
+                print(f'    {count:>6}  {endpoint}')
+    print(f'{"total":<27} '
+          f'{sum(r["wall_seconds"] for r in results):>9.3f} '
+          f'{sum(r["kube_calls"] for r in results):>6} '
+          f'{sum(r["bro_calls"] for r in results):>6}')
+
+
+def main(sys_args):
+    """
+    Main method, parses args and runs the benchmark.
+
+    :param sys_args: sys.argv[1:]
+
+    """
+    arg_parser = ArgumentParser(
+        formatter_class=RawTextHelpFormatter,
+        description='Run all hooks against a local Kubernetes/BRO '
+                    'simulator and report wall time and API calls.')
+    arg_parser.add_argument('--action-duration', type=float, default=2.0,
+                            help='Seconds each BRO action takes')
+    arg_parser.add_argument('--latency', type=float, default=0.0,
+                            help='Seconds of latency per API request')
+    arg_parser.add_argument('--agents', type=int, default=2,
+                            help='Number of BRO agents')
+    arg_parser.add_argument('--pods', type=int, default=0,
+                            help='Number of filler pods in the namespace')
+    arg_parser.add_argument('--services', type=int, default=0,
+                            help='Number of filler services')
+    arg_parser.add_argument('--jobs', type=int, default=0,
+                            help='Number of filler jobs')
+    arg_parser.add_argument('--actions', type=int, default=0,
+                            help='Number of finished BRO actions per scope')
+    arg_parser.add_argument('--json', dest='json_file', default=None,
+                            help='Write the results to this file as JSON')
+    arg_parser.add_argument('-v', dest='verbose', action='store_true',
+                            help='Show per endpoint counts and hook logs')
+    args = arg_parser.parse_args(sys_args)
+
+    config = SimulatorConfig()
+    config.action_duration = args.action_duration
+    config.kube_latency = config.bro_latency = args.latency
+    config.agents = [f'eric-enm-agent-{i}' for i in range(args.agents)]
+    config.rollback_agents = list(config.agents)
+    config.filler_pods = args.pods
+    config.filler_services = args.services
+    config.filler_jobs = args.jobs
+    config.filler_actions = args.actions
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    results = run(config)
+    report(results, args.verbose)
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as _writer:
+            json.dump({'config': vars(config), 'results': results},
+                      _writer, indent=2)
+    if not all(res['ok'] for res in results):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main(sys.argv[1:])
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Run the hook wait loops against in-process fakes on a virtual clock and
+report simulated wall time, sleep time and API calls per hook.
+
+The results can be written as a baseline and later runs compared against
+it, exiting non-zero if a hook got slower or chattier.
+
+Usage:
+    PYTHONPATH=src/:test/:test/bur_cli/src/ python3 \\
+        test/bench_wait_loops.py --json wait_loops.json
+    PYTHONPATH=src/:test/:test/bur_cli/src/ python3 \\
+        test/bench_wait_loops.py --baseline wait_loops.json
+"""
+import importlib
+import json
+import logging
+import sys
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+from common import rate_limiter
+from hook_fakes import FakeCluster
+
+CONFIG_MAP = 'backup-restore-configmap'
+BACKUP = 'PreUpgradeBackup'
+SECRET = 'hook-sftp-secret'
+SCHEDULING = json.dumps({
+    'backupPrefix': 'SCHEDULED_BACKUP',
+    'schedules': [{'every': '1d', 'start': '2030-01-01T04:00:00'},
+                  {'every': '1w2d'}, {'every': '12h'}]})
+RETENTION = json.dumps({'limit': 2, 'autoDelete': True})
+COMPARED = ('api_calls', 'simulated_seconds', 'sleeps')
+
+
+def agents(count: int) -> list:
+    """
+    :param count: Number of agents
+    :return: Agent IDs
+    """
+    return [f'eric-enm-agent-{i}' for i in range(count)]
+
+
+def ready_time(index: int, agent_interval: float) -> float:
+    """
+    :param index: Index of the agent
+    :param agent_interval: Seconds between agents registering
+    :return: When the agent's pod goes Ready, a little before it registers
+    """
+    return max(0.0, (index + 1) * agent_interval - 5)
+
+
+def delete_hook_jobs(sizes: dict):
+    """ Delete a few jobs out of a namespace full of them """
+    cluster = FakeCluster()
+    for i in range(sizes['jobs']):
+        cluster.batch.add_job(f'job-{i}')
+    args = [arg for i in range(5) for arg in ('-j', f'job-{i}')]
+    return cluster, args
+
+
+def delete_svc(sizes: dict):
+    """ Delete a few services out of a namespace full of pods/services """
+    cluster = FakeCluster()
+    for i in range(sizes['pods']):
+        cluster.core.add_pod(f'pod-{i}')
+        cluster.core.add_service(f'svc-{i}')
+    args = [arg for i in range(5) for arg in ('-s', f'svc-{i}')]
+    return cluster, args
+
+
+def delete_svc_batch(sizes: dict):
+    """ As delete_svc, with one listing and a watch """
+    cluster, args = delete_svc(sizes)
+    return cluster, args + ['--batch']
+
+
+delete_svc_batch.hook = 'delete_svc'
+
+
+def delete_secrets(sizes: dict):
+    """ Delete labelled and named secrets, some already gone """
+    cluster = FakeCluster()
+    for i in range(sizes['secrets']):
+        cluster.core.add_secret(f'credentials-{i}',
+                                labels={'app': 'hook-credentials'})
+        cluster.core.add_secret(f'secret-{i}')
+    args = [arg for i in range(0, sizes['secrets'] * 2, 2)
+            for arg in ('-s', f'secret-{i}')]
+    return cluster, args + ['-l', 'app=hook-credentials']
+
+
+def bro_pre_upgrade_backup_trigger(sizes: dict):
+    """ Wait for rollback agents to register then take a backup """
+    ids = agents(sizes['agents'])
+    cluster = FakeCluster(agents=ids, agent_interval=sizes['agent_interval'],
+                          durations={'CREATE_BACKUP': 600})
+    for i in range(sizes['pods']):
+        labels, annotations = {}, {}
+        ready_at = 0.0
+        if i < len(ids):
+            labels = {'adpbrlabelkey': ids[i]}
+            annotations = {'backupType': 'ROLLBACK'}
+            ready_at = ready_time(i, sizes['agent_interval'])
+        cluster.core.add_pod(f'pod-{i}', labels, annotations,
+                             ready_at=ready_at)
+    cluster.core.add_configmap('product-version-configmap', annotations={
+        'ericsson.com/product-revision': cluster.bro.product_version})
+    return cluster, ['-b', BACKUP]
+
+
+def bro_pre_upgrade_backup_retry(sizes: dict):
+    """ As bro_pre_upgrade_backup_trigger, retried after the backup was
+    taken """
+    cluster, args = bro_pre_upgrade_backup_trigger(sizes)
+    cluster.bro.add_backup(BACKUP, 'ROLLBACK')
+    return cluster, args
+
+
+bro_pre_upgrade_backup_retry.hook = 'bro_pre_upgrade_backup_trigger'
+
+
+def bro_restore_runner(sizes: dict):
+    """ Wait for agents to register then restore """
+    ids = agents(sizes['agents'])
+    cluster = FakeCluster(agents=ids, agent_interval=sizes['agent_interval'],
+                          durations={'RESTORE': 1800})
+    cluster.bro.add_backup(BACKUP, 'ROLLBACK')
+    for i, agent in enumerate(ids):
+        cluster.core.add_pod(f'pod-{i}', {'adpbrlabelkey': agent},
+                             ready_at=ready_time(i, sizes['agent_interval']))
+    cluster.core.add_configmap(CONFIG_MAP, {'RESTORE_ACTION_ID': '',
+                                            'RESTORE_STATE': ''})
+    return cluster, ['-b', BACKUP, '-s', 'ROLLBACK', '-c', CONFIG_MAP]
+
+
+def bro_restore_report(sizes: dict):
+    """ Find the recorded restore among many actions and wait for it """
+    cluster = FakeCluster(durations={'RESTORE': 900})
+    cluster.bro.add_actions('ROLLBACK', sizes['actions'])
+    action = cluster.bro.start('RESTORE', 'ROLLBACK')
+    cluster.core.add_configmap(CONFIG_MAP, {'RESTORE_ACTION_ID': action.id})
+    return cluster, ['-c', CONFIG_MAP, '-s', 'ROLLBACK']
+
+
+def bro_schedule_control(sizes: dict):  # pylint: disable=unused-argument
+    """ Enable scheduling """
+    return FakeCluster(), ['--enabled']
+
+
+def bro_bm_config(sizes: dict):  # pylint: disable=unused-argument
+    """ Configure retention and scheduling """
+    cluster = FakeCluster(durations={'HOUSEKEEPING': 30})
+    cluster.core.add_configmap(CONFIG_MAP, {'RESTORE_STATE': 'finished'})
+    cluster.core.add_secret(SECRET, {
+        'externalStorageURI': 'c2Z0cDovL3VAaG9zdDoyMi9i',
+        'externalStorageCredentials': 'c2VjcmV0'})
+    return cluster, ['-b', '-', '-s', '-', '-c', CONFIG_MAP, '-S', SECRET,
+                     '-V', SCHEDULING, '-R', RETENTION]
+
+
+SCENARIOS = (delete_hook_jobs, delete_svc, delete_svc_batch, delete_secrets,
+             bro_pre_upgrade_backup_trigger, bro_pre_upgrade_backup_retry,
+             bro_restore_runner, bro_restore_report, bro_schedule_control,
+             bro_bm_config)
+
+
+def run_scenario(scenario, sizes: dict) -> dict:
+    """
+    Set up a scenario and run its hook main() on the virtual clock.
+
+    :param scenario: Scenario function, named after the hook module
+        unless it has a hook attribute naming the module
+    :param sizes: Scenario sizes
+    :return: Result dict
+    """
+    cluster, args = scenario(sizes)
+    module = importlib.import_module(
+        getattr(scenario, 'hook', scenario.__name__))
+    limiter = rate_limiter('kubernetes')
+    throttled = limiter.throttled_seconds
+    error = ''
+    start = time.perf_counter()
+    with cluster.installed():
+        try:
+            module.main(args)
+        except SystemExit as exit_error:
+            if exit_error.code not in (0, None):
+                error = f'exit {exit_error.code}'
+        except Exception as exc:  # pylint: disable=broad-except
+            error = f'{exc.__class__.__name__}: {exc}'
+    return {
+        'hook': scenario.__name__,
+        'ok': not error,
+        'error': error,
+        'simulated_seconds': round(cluster.clock.current, 3),
+        'sleep_seconds': round(sum(cluster.clock.sleeps), 3),
+        'sleeps': len(cluster.clock.sleeps),
+        'api_calls': cluster.counter.total(),
+        'core_calls': cluster.counter.total('core'),
+        'batch_calls': cluster.counter.total('batch'),
+        'bro_calls': cluster.counter.total('bro'),
+        'throttled_seconds': round(limiter.throttled_seconds - throttled, 3),
+        'cpu_seconds': round(time.perf_counter() - start, 3),
+        'calls': dict(cluster.counter.calls)}
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """
+    Compare results against a baseline.
+
+    :param results: Results from run_scenario()
+    :param baseline: A previously written results file
+    :param tolerance: Allowed relative increase, e.g. 0.1 for 10%
+    :return: List of regression messages
+    """
+    previous = {res['hook']: res for res in baseline['results']}
+    regressions = []
+    for res in results:
+        if res['hook'] not in previous:
+            continue
+        for metric in COMPARED:
+            old, new = previous[res['hook']][metric], res[metric]
+            if new > old * (1 + tolerance) + 1:
+                regressions.append(
+                    f'{res["hook"]}: {metric} went from {old} to {new}')
+    return regressions
+
+
+def report(results: list, verbose: bool = False):
+    """
+    Print a results table.
+
+    :param results: Results from run_scenario()
+    :param verbose: Also print the per method call counts
+    """
+    print(f'{"hook":<32} {"ok":<4} {"sim(s)":>9} {"slept(s)":>9} '
+          f'{"sleeps":>7} {"calls":>7} {"core":>6} {"batch":>6} {"bro":>6} '
+          f'{"throttled(s)":>12}')
+    for res in results:
+        print(f'{res["hook"]:<32} {"yes" if res["ok"] else "NO":<4} '
+              f'{res["simulated_seconds"]:>9.0f} '
+              f'{res["sleep_seconds"]:>9.0f} {res["sleeps"]:>7} '
+              f'{res["api_calls"]:>7} {res["core_calls"]:>6} '
+              f'{res["batch_calls"]:>6} {res["bro_calls"]:>6} '
+              f'{res["throttled_seconds"]:>12.1f}  {res["error"]}')
+        if verbose:
+            for method, count in sorted(res['calls'].items()):
+                print(f'    {count:>7}  {method}')
+
+
+def main(sys_args):
+    """
+    Main method, parses args and runs the benchmark.
+
+    :param sys_args: sys.argv[1:]
+
+    """
+    arg_parser = ArgumentParser(
+        formatter_class=RawTextHelpFormatter,
+        description='Run the hook wait loops on a virtual clock and report '
+                    'simulated time, sleep time and API calls.')
+    arg_parser.add_argument('--jobs', type=int, default=500,
+                            help='Number of jobs in the namespace')
+    arg_parser.add_argument('--pods', type=int, default=800,
+                            help='Number of pods (and services) in the '
+                                 'namespace')
+    arg_parser.add_argument('--secrets', type=int, default=20,
+                            help='Number of labelled (and named) secrets')
+    arg_parser.add_argument('--agents', type=int, default=50,
+                            help='Number of BRO agents')
+    arg_parser.add_argument('--agent-interval', type=float, default=20.0,
+                            help='Seconds between agent registrations')
+    arg_parser.add_argument('--actions', type=int, default=2000,
+                            help='Number of finished BRO actions')
+    arg_parser.add_argument('--json', dest='json_file', default=None,
+                            help='Write the results to this file as JSON')
+    arg_parser.add_argument('--baseline', default=None,
+                            help='Compare against this results file and '
+                                 'exit 1 on a regression')
+    arg_parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Allowed relative increase over the '
+                                 'baseline')
+    arg_parser.add_argument('-v', dest='verbose', action='store_true',
+                            help='Show per method counts and hook logs')
+    args = arg_parser.parse_args(sys_args)
+    sizes = {'jobs': args.jobs, 'pods': args.pods, 'secrets': args.secrets,
+             'agents': args.agents, 'agent_interval': args.agent_interval,
+             'actions': args.actions}
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    results = [run_scenario(scenario, sizes) for scenario in SCENARIOS]
+    report(results, args.verbose)
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as _writer:
+            json.dump({'sizes': sizes, 'results': results}, _writer,
+                      indent=2)
+
+    failed = not all(res['ok'] for res in results)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as _reader:
+            baseline = json.load(_reader)
+        if baseline.get('sizes') != sizes:
+            print(f'Baseline sizes {baseline.get("sizes")} differ from '
+                  f'{sizes}, not comparing.')
+        else:
+            regressions = compare(results, baseline, args.tolerance)
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+            failed = failed or bool(regressions)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main(sys.argv[1:])
@@ -3,11 +3,13 @@ Utility functions for test_hook
 '''
 import re
 import urllib.request
-
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from distutils.version import LooseVersion
 from html.parser import HTMLParser
-from time import sleep, time
+from time import monotonic
 
+from common import HookTimeoutException, deadline
 from helm3procs import add_helm_repo, helm_get_chart_from_repo, \
     helm_install_chart_from_repo_with_dict
 from utilprocs import log
@@ -131,6 +133,80 @@ def helm_deploy_chart(name,  # pylint: disable=too-many-arguments
     log(f'Deployment of test agent {"completed" if wait else "in progress"}')
 
 
+class PhaseTimer:
+    '''
+    Record how long each phase of the test run takes.
+    '''
+    def __init__(self):
+        self.started = monotonic()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the block as a phase, failed or not.
+        :param name: Name of the phase in the report
+        """
+        started = monotonic()
+        try:
+            yield
+        finally:
+            self.phases.append((name, monotonic() - started))
+
+    def report(self):
+        """
+        :return: One line per phase in the order they finished, then the
+            time since the timer was created. Phases can overlap, so they
+            don't add up to the total.
+        """
+        width = max([len(name) for name, _ in self.phases] + [5])
+        lines = [f'{name:<{width}}  {seconds:7.1f}s'
+                 for name, seconds in self.phases]
+        lines.append(f'{"Total":<{width}}  '
+                     f'{monotonic() - self.started:7.1f}s')
+        return '\n'.join(lines)
+
+
+def run_concurrently(*tasks):
+    """
+    Run independent tasks in threads and wait for all of them.
+    :param tasks: Functions taking no arguments
+    :return: The tasks' results, in order
+    :raises: The first task's exception, once every task has finished
+    """
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = [executor.submit(task) for task in tasks]
+    return [future.result() for future in futures]
+
+
+def wait_until(condition, timeout, description, interval=1,
+               max_interval=10):
+    """
+    Wait for a condition, checking it straight away and then at intervals
+    that double up to max_interval.
+    :param condition: Function returning a true value once the wait is over
+    :param timeout: Seconds to wait for
+    :param description: What is being waited for, for the log and error
+    :param interval: Seconds before the second check
+    :param max_interval: Longest seconds between checks
+    :return: The condition's true value
+    :raises BurException: If the condition isn't met in time
+    """
+    clock = deadline(timeout, description)
+    started = clock.now()
+    while True:
+        result = condition()
+        if result:
+            log(f'Done waiting for {description} after '
+                f'{clock.now() - started:.0f}s')
+            return result
+        try:
+            clock.sleep(interval)
+        except HookTimeoutException as error:
+            log(str(error))
+            raise BurException(str(error)) from error
+        interval = min(interval * 2, max_interval)
+
 
 def wait_for_agent(agents, bro, timeout=600):
     """
@@ -139,21 +215,11 @@ def wait_for_agent(agents, bro, timeout=600):
     :param bro: instance of Bro class
     :param timeout: timeout for agents to register
     """
-    log(f"Entered wait_for_agents with registered agents: {bro.status.agents}")
-    agents.sort()
-    end_time = time() + timeout
+    expected = sorted(agents)
 
-    while True:
-        if time() > end_time:
-            log('Timed out waiting for agents to register')
-            raise BurException('Wait for Agent Timeout')
-
-        log("Waiting for brAgent to register with BRO...")
-        log(f"Registered agents: {bro.status.agents}")
+    def registered():
         registered_agents = sorted(bro.status.agents)
-        log(f'We have registered {registered_agents} and expect {agents}')
-        if agents == registered_agents:
-            log('All agents are now registered')
-            return
-        log("Not all agents are registered")
-        sleep(5)
+        log(f'We have registered {registered_agents} and expect {expected}')
+        return registered_agents == expected
+
+    wait_until(registered, timeout, 'agents to register', max_interval=5)
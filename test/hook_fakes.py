@@ -0,0 +1,639 @@
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+In-process fakes of CoreV1Api, BatchV1Api and the brocli Bro interface,
+driven by the hooks' VirtualClock so wait loops run in simulated time.
+
+Every call is counted per API so a run can report its API cost.
+"""
+import json
+import os
+from collections import Counter, namedtuple
+from contextlib import ExitStack
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from kubernetes.client import ApiClient, V1ConfigMap, V1ConfigMapList, \
+    V1Container, V1Job, V1JobList, V1ListMeta, V1ObjectMeta, V1Pod, \
+    V1PodCondition, V1PodList, V1PodSpec, V1PodStatus, V1Secret, \
+    V1SecretList, V1Service, V1ServiceList, V1ServiceSpec, V1Status
+from kubernetes.client.exceptions import ApiException
+
+from common import VirtualClock, set_clock
+
+FakeService = namedtuple('Service', ['name', 'agent_id', 'version'])
+FakeStatus = namedtuple('Status', ['agents', 'action'])
+
+
+class SimulationTimeout(Exception):
+    """ Raised when a hook runs past the simulated time limit """
+
+
+class LimitedClock(VirtualClock):
+    """
+    A VirtualClock that gives up once too much simulated time has passed,
+    so a hook stuck in a wait loop can't hang the benchmark.
+    """
+
+    def __init__(self, limit: float = 7 * 24 * 3600.0):
+        super().__init__()
+        self.limit = limit
+
+    def sleep(self, seconds: float):
+        super().sleep(seconds)
+        if self.current > self.limit:
+            raise SimulationTimeout(
+                f'Simulated time limit of {self.limit}s exceeded')
+
+
+class ApiCounter:
+    """
+    Count calls per API and method.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+
+    def __call__(self, api: str, method: str):
+        self.calls[f'{api}.{method}'] += 1
+
+    def total(self, api: str = None) -> int:
+        """
+        :param api: Only count calls to this API, e.g. 'core'
+        :return: Number of calls
+        """
+        return sum(count for key, count in self.calls.items()
+                   if api is None or key.startswith(f'{api}.'))
+
+
+def _not_found(kind: str, name: str) -> ApiException:
+    error = ApiException(status=404, reason='Not Found')
+    error.body = f'{kind} "{name}" not found'
+    return error
+
+
+class FakeWatchResponse:
+    """
+    Streamed response of a watch request, one JSON event per line.
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def stream(self, amt=None, decode_content=None):  # pylint: disable=W0613
+        """ Yield the event lines """
+        for event in self.events:
+            yield json.dumps(event) + '\n'
+
+    def close(self):
+        """ Stop the stream """
+        self.events.close()
+
+    def release_conn(self):
+        """ Nothing to release """
+
+
+class FakeCoreV1Api:  # pylint: disable=too-many-instance-attributes
+    """
+    CoreV1Api holding configmaps, secrets, pods and services in memory.
+    Deleted services linger for ``delete_delay`` virtual seconds, pods
+    given a ``ready_at`` virtual time go Ready then.
+    """
+
+    def __init__(self, clock: LimitedClock, counter: ApiCounter,
+                 delete_delay: float = 3.0):
+        self.clock = clock
+        self.count = counter
+        self.delete_delay = delete_delay
+        self.configmaps = {}
+        self.secrets = {}
+        self.pods = {}
+        self.services = {}
+        self._deleting = {}
+        self._ready_at = {}
+
+    def _purge(self):
+        for name, when in list(self._deleting.items()):
+            if self.clock.now() >= when:
+                self.services.pop(name, None)
+                del self._deleting[name]
+
+    def add_pod(self, name: str, labels=None, annotations=None,
+                image='hooks:latest', ready_at: float = 0.0):
+        # pylint: disable=too-many-arguments
+        """ Add a pod """
+        self.pods[name] = V1Pod(
+            metadata=V1ObjectMeta(name=name, labels=labels or {},
+                                  annotations=annotations or {}),
+            spec=V1PodSpec(containers=[V1Container(
+                name='main', image=image, image_pull_policy='Always')]),
+            status=V1PodStatus(conditions=[
+                V1PodCondition(type='Ready', status='False')]))
+        self._ready_at[name] = ready_at
+        self._ready_pods()
+
+    def _ready_pods(self) -> list:
+        """ Mark the pods that are due as Ready """
+        readied = []
+        for name, when in list(self._ready_at.items()):
+            if self.clock.now() >= when:
+                del self._ready_at[name]
+                self.pods[name].status.conditions[0].status = 'True'
+                readied.append(self.pods[name])
+        return readied
+
+    def add_service(self, name: str, cluster_ip='10.0.0.1'):
+        """ Add a service """
+        self.services[name] = V1Service(
+            metadata=V1ObjectMeta(name=name),
+            spec=V1ServiceSpec(cluster_ip=cluster_ip))
+
+    def add_configmap(self, name: str, data=None, annotations=None):
+        """ Add a configmap """
+        self.configmaps[name] = V1ConfigMap(
+            metadata=V1ObjectMeta(name=name, annotations=annotations),
+            data=dict(data or {}))
+
+    def add_secret(self, name: str, data=None, labels=None):
+        """ Add a secret """
+        self.secrets[name] = V1Secret(
+            metadata=V1ObjectMeta(name=name, labels=labels or {}),
+            data=dict(data or {}))
+
+    def _labelled(self, label_selector=None) -> list:
+        """ Secrets matching a key=value,... label selector """
+        wanted = dict(term.split('=', 1) for term in
+                      (label_selector or '').split(',') if term)
+        return [secret for secret in self.secrets.values()
+                if all(secret.metadata.labels.get(key) == value
+                       for key, value in wanted.items())]
+
+    # pylint: disable=missing-function-docstring,unused-argument
+    def read_namespaced_config_map(self, name, namespace, **kwargs):
+        self.count('core', 'read_namespaced_config_map')
+        if name not in self.configmaps:
+            raise _not_found('configmaps', name)
+        return self.configmaps[name]
+
+    def list_namespaced_config_map(self, namespace, **kwargs):
+        self.count('core', 'list_namespaced_config_map')
+        return V1ConfigMapList(items=list(self.configmaps.values()))
+
+    def patch_namespaced_config_map(self, name, namespace, body, **kwargs):
+        self.count('core', 'patch_namespaced_config_map')
+        if name not in self.configmaps:
+            raise _not_found('configmaps', name)
+        data = body.get('data') if isinstance(body, dict) else body.data
+        self.configmaps[name].data.update(data or {})
+        return self.configmaps[name]
+
+    def replace_namespaced_config_map(self, name, namespace, body, **kwargs):
+        self.count('core', 'replace_namespaced_config_map')
+        if name not in self.configmaps:
+            raise _not_found('configmaps', name)
+        self.configmaps[name] = body
+        return body
+
+    def create_namespaced_config_map(self, namespace, body, **kwargs):
+        self.count('core', 'create_namespaced_config_map')
+        self.configmaps[body.metadata.name] = body
+        return body
+
+    def delete_namespaced_config_map(self, name, namespace, **kwargs):
+        self.count('core', 'delete_namespaced_config_map')
+        self.configmaps.pop(name, None)
+        return V1Status(status='Success')
+
+    def read_namespaced_secret(self, name, namespace, **kwargs):
+        self.count('core', 'read_namespaced_secret')
+        if name not in self.secrets:
+            raise _not_found('secrets', name)
+        return self.secrets[name]
+
+    def delete_namespaced_secret(self, name, namespace, **kwargs):
+        self.count('core', 'delete_namespaced_secret')
+        if name not in self.secrets:
+            raise _not_found('secrets', name)
+        del self.secrets[name]
+        return V1Status(status='Success')
+
+    def list_namespaced_secret(self, namespace, label_selector=None,
+                               **kwargs):
+        self.count('core', 'list_namespaced_secret')
+        return V1SecretList(items=self._labelled(label_selector))
+
+    def delete_collection_namespaced_secret(self, namespace,
+                                            label_selector=None, **kwargs):
+        self.count('core', 'delete_collection_namespaced_secret')
+        for secret in self._labelled(label_selector):
+            del self.secrets[secret.metadata.name]
+        return V1Status(status='Success')
+
+    def list_namespaced_pod(self, namespace, watch=False,
+                            label_selector=None, timeout_seconds=None,
+                            **kwargs):
+        """
+        List pods, or watch for them to go Ready.
+
+        :return: V1PodList
+        """
+        self.count('core', 'list_namespaced_pod')
+        if watch:
+            return FakeWatchResponse(self._readiness(timeout_seconds or 1800))
+        self._ready_pods()
+        return V1PodList(metadata=V1ListMeta(resource_version='1'),
+                         items=[pod for pod in self.pods.values()
+                                if not label_selector or label_selector in
+                                pod.metadata.labels])
+
+    def _readiness(self, timeout_seconds):
+        """ Move the clock forward to each pod going Ready """
+        end = self.clock.now() + timeout_seconds
+        serializer = ApiClient()
+        while True:
+            due = sorted(when for when in self._ready_at.values()
+                         if when <= end)
+            if not due:
+                break
+            if due[0] > self.clock.now():
+                self.clock.sleep(due[0] - self.clock.now())
+            for pod in self._ready_pods():
+                yield {'type': 'MODIFIED', 'object':
+                       serializer.sanitize_for_serialization(pod)}
+        if end > self.clock.now():
+            self.clock.sleep(end - self.clock.now())
+
+    def read_namespaced_pod(self, name, namespace, **kwargs):
+        self.count('core', 'read_namespaced_pod')
+        if name not in self.pods:
+            raise _not_found('pods', name)
+        return self.pods[name]
+
+    def read_namespaced_service(self, name, namespace, **kwargs):
+        self.count('core', 'read_namespaced_service')
+        self._purge()
+        if name not in self.services:
+            raise _not_found('services', name)
+        return self.services[name]
+
+    def list_namespaced_service(self, namespace, watch=False,
+                                timeout_seconds=None, **kwargs):
+        """
+        List services, or watch for them to be deleted.
+
+        :return: V1ServiceList
+        """
+        self.count('core', 'list_namespaced_service')
+        if watch:
+            return FakeWatchResponse(self._deletions(timeout_seconds or 1800))
+        self._purge()
+        return V1ServiceList(metadata=V1ListMeta(resource_version='1'),
+                             items=list(self.services.values()))
+
+    def _deletions(self, timeout_seconds):
+        """ Move the clock forward to each service deletion """
+        end = self.clock.now() + timeout_seconds
+        serializer = ApiClient()
+        while True:
+            due = sorted((when, name) for name, when in self._deleting.items()
+                         if when <= end)
+            if not due:
+                break
+            when, name = due[0]
+            if when > self.clock.now():
+                self.clock.sleep(when - self.clock.now())
+            del self._deleting[name]
+            service = self.services.pop(name, None)
+            if service:
+                yield {'type': 'DELETED', 'object':
+                       serializer.sanitize_for_serialization(service)}
+        if end > self.clock.now():
+            self.clock.sleep(end - self.clock.now())
+
+    def delete_namespaced_service(self, name, namespace, **kwargs):
+        self.count('core', 'delete_namespaced_service')
+        self._purge()
+        if name not in self.services:
+            raise _not_found('services', name)
+        self._deleting[name] = self.clock.now() + self.delete_delay
+        return V1Status(status='Success')
+
+
+class FakeBatchV1Api:
+    """
+    BatchV1Api holding jobs in memory. Deleted jobs linger for
+    ``delete_delay`` virtual seconds.
+    """
+
+    def __init__(self, clock: LimitedClock, counter: ApiCounter,
+                 delete_delay: float = 3.0):
+        self.clock = clock
+        self.count = counter
+        self.delete_delay = delete_delay
+        self.jobs = {}
+        self._deleting = {}
+
+    def add_job(self, name: str):
+        """ Add a job """
+        self.jobs[name] = V1Job(metadata=V1ObjectMeta(name=name))
+
+    def _purge(self):
+        for name, when in list(self._deleting.items()):
+            if self.clock.now() >= when:
+                self.jobs.pop(name, None)
+                del self._deleting[name]
+
+    # pylint: disable=missing-function-docstring,unused-argument
+    def list_namespaced_job(self, namespace, **kwargs):
+        self.count('batch', 'list_namespaced_job')
+        self._purge()
+        return V1JobList(items=list(self.jobs.values()))
+
+    def create_namespaced_job(self, namespace, body, **kwargs):
+        self.count('batch', 'create_namespaced_job')
+        self._purge()
+        self.jobs[body.metadata.name] = body
+        return body
+
+    def delete_namespaced_job(self, name, namespace, **kwargs):
+        self.count('batch', 'delete_namespaced_job')
+        self._purge()
+        if name not in self.jobs:
+            raise _not_found('jobs', name)
+        self._deleting[name] = self.clock.now() + self.delete_delay
+        return V1Status(status='Success')
+
+
+class FakeAction:
+    """
+    A BRO action whose state and progress follow the virtual clock.
+    Reading state or progress counts as a BRO call, like the live
+    brocli Action does.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, bro, name: str, scope: str, duration: float,
+                 result: str = 'SUCCESS', additional_info: str = None):
+        # pylint: disable=too-many-arguments
+        self._bro = bro
+        self._start = bro.clock.now()
+        self._duration = duration
+        self._result = result
+        self.id = str(bro.next_id())  # pylint: disable=invalid-name
+        self.name = name
+        self.scope = scope
+        self.additional_info = additional_info
+        self.start_time = self._start
+        self.completion_time = None
+
+    def _done(self) -> bool:
+        return self._bro.clock.now() - self._start >= self._duration
+
+    @property
+    def state(self) -> str:
+        """ The action state """
+        self._bro.count('bro', 'action')
+        return 'FINISHED' if self._done() else 'RUNNING'
+
+    @property
+    def progress(self) -> float:
+        """ The action progress """
+        if self._done() or not self._duration:
+            return 1.0
+        return (self._bro.clock.now() - self._start) / self._duration
+
+    @property
+    def progress_info(self) -> str:
+        """ The action progress info """
+        return ''
+
+    @property
+    def result(self) -> str:
+        """ The action result """
+        return self._result if self._done() else 'NOT_AVAILABLE'
+
+
+class FakeInterval:  # pylint: disable=too-few-public-methods
+    """ A schedule interval """
+
+    def __init__(self, interval_id: str):
+        self.id = interval_id  # pylint: disable=invalid-name
+
+
+class FakeSchedule:
+    """ BRO scheduler configuration """
+
+    def __init__(self, bro):
+        self._bro = bro
+        self.enabled = True
+        self.prefix = 'SCHEDULED_BACKUP'
+        self.intervals = []
+        self.recent_created = None
+
+    def update(self, enabled=None, prefix=None, export=None,
+               export_password=None, export_uri=None):
+        """ Update the scheduler configuration """
+        # pylint: disable=too-many-arguments,unused-argument
+        self._bro.count('bro', 'schedule.update')
+        self.enabled = enabled
+        self.prefix = prefix or self.prefix
+
+    def interval_add(self, weeks=None, days=None, hours=None, minutes=None,
+                     start_time=None, stop_time=None):
+        """ Add a periodic interval """
+        # pylint: disable=too-many-arguments,unused-argument
+        self._bro.count('bro', 'schedule.interval_add')
+        interval = FakeInterval(str(self._bro.next_id()))
+        self.intervals.append(interval)
+        return interval
+
+    def interval_delete(self, interval_id):
+        """ Delete a periodic interval """
+        self._bro.count('bro', 'schedule.interval_delete')
+        self.intervals = [i for i in self.intervals if i.id != interval_id]
+
+
+class FakeRetention:  # pylint: disable=too-few-public-methods
+    """ BRO housekeeping configuration """
+
+    def __init__(self, bro):
+        self._bro = bro
+        self.limit = 1
+        self.purge = True
+
+    def apply(self) -> FakeAction:
+        """ Apply the housekeeping configuration """
+        self._bro.count('bro', 'retention.apply')
+        return self._bro.start('HOUSEKEEPING', 'DEFAULT')
+
+
+class FakeBro:
+    """
+    The brocli Bro interface backed by in-memory state.
+
+    Agents register ``agent_interval`` virtual seconds apart.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, clock: LimitedClock, counter: ApiCounter,
+                 agents=None, agent_interval: float = 0.0,
+                 durations=None, product_version: str = '24.1.1'):
+        # pylint: disable=too-many-arguments
+        self.clock = clock
+        self.count = counter
+        self.agent_ids = list(agents or [])
+        self.agent_interval = agent_interval
+        self.durations = dict(durations or {})
+        self.product_version = product_version
+        self.backup_store = {}
+        self.action_store = {}
+        self.schedule = FakeSchedule(self)
+        self.retention = FakeRetention(self)
+        self._seq = 1000
+
+    def __call__(self, *args, **kwargs):
+        """ Stand in for the Bro(host=, port=) constructor """
+        return self
+
+    def next_id(self) -> int:
+        """ :return: A new unique ID """
+        self._seq += 1
+        return self._seq
+
+    def add_backup(self, name: str, scope: str):
+        """ Add a backup containing all agents """
+        services = [FakeService('Ericsson Network Manager',
+                                'APPLICATION_INFO', self.product_version)]
+        services += [FakeService(agent, agent, '1.0')
+                     for agent in self.agent_ids]
+        backup = namedtuple('Backup', ['name', 'id', 'status', 'services'])(
+            name, name, 'COMPLETE', services)
+        self.backup_store.setdefault(scope, {})[name] = backup
+
+    def add_actions(self, scope: str, count: int):
+        """ Add finished actions """
+        for _ in range(count):
+            action = FakeAction(self, 'CREATE_BACKUP', scope, 0)
+            self.action_store.setdefault(scope, []).append(action)
+
+    def start(self, name: str, scope: str, backup: str = None,
+              result='SUCCESS', additional_info=None) -> FakeAction:
+        """ Start a timed action """
+        action = FakeAction(self, name, scope, self.durations.get(name, 60),
+                            result, additional_info)
+        self.action_store.setdefault(scope, []).append(action)
+        if name in ('CREATE_BACKUP', 'IMPORT') and backup:
+            self.add_backup(backup, scope)
+        return action
+
+    def registered(self) -> list:
+        """ :return: Agents registered at the current virtual time """
+        if not self.agent_interval:
+            return list(self.agent_ids)
+        count = int(self.clock.now() // self.agent_interval)
+        return self.agent_ids[:count]
+
+    @property
+    def status(self) -> FakeStatus:
+        """ BRO status """
+        self.count('bro', 'status')
+        return FakeStatus(self.registered(), None)
+
+    # pylint: disable=missing-function-docstring
+    def backups(self, scope):
+        self.count('bro', 'backups')
+        return list(self.backup_store.get(scope, {}).values())
+
+    def get_backup(self, name, scope):
+        self.count('bro', 'get_backup')
+        return self.backup_store[scope][name]
+
+    def actions(self, scope):
+        self.count('bro', 'actions')
+        return list(self.action_store.get(scope, []))
+
+    def create(self, name, scope):
+        self.count('bro', 'create')
+        return self.start('CREATE_BACKUP', scope, name)
+
+    def restore(self, name, scope):
+        self.count('bro', 'restore')
+        required = [s.agent_id for s in self.backup_store[scope][name]
+                    .services if s.agent_id != 'APPLICATION_INFO']
+        missing = [a for a in required if a not in self.registered()]
+        if missing:
+            return self.start('RESTORE', scope, name, 'FAILURE',
+                              'Agents with the following IDs are '
+                              f'required:\n[{", ".join(missing)}]')
+        return self.start('RESTORE', scope, name)
+
+    def import_backup(self, name, uri, password):
+        # pylint: disable=unused-argument
+        self.count('bro', 'import_backup')
+        return self.start('IMPORT', 'DEFAULT', name)
+
+    def get_schedule(self, scope='DEFAULT'):
+        # pylint: disable=unused-argument
+        self.count('bro', 'get_schedule')
+        return self.schedule
+
+    def get_retention(self, scope='DEFAULT'):
+        # pylint: disable=unused-argument
+        self.count('bro', 'get_retention')
+        return self.retention
+
+
+class FakeCluster:  # pylint: disable=too-few-public-methods
+    """
+    A namespace worth of fake APIs sharing one virtual clock and counter.
+
+    Usage::
+
+        cluster = FakeCluster()
+        cluster.core.add_service('svc')
+        with cluster.installed():
+            delete_svc.main(['-s', 'svc'])
+        print(cluster.clock.current, cluster.counter.calls)
+    """
+
+    def __init__(self, namespace: str = 'enm-bench',
+                 delete_delay: float = 3.0, **bro_args):
+        self.namespace = namespace
+        self.clock = LimitedClock()
+        self.counter = ApiCounter()
+        self.core = FakeCoreV1Api(self.clock, self.counter, delete_delay)
+        self.batch = FakeBatchV1Api(self.clock, self.counter, delete_delay)
+        self.bro = FakeBro(self.clock, self.counter, **bro_args)
+
+    def installed(self) -> ExitStack:
+        """
+        Patch the fakes and the virtual clock into the hooks.
+
+        :return: A context manager that removes the patches on exit
+        """
+        stack = ExitStack()
+        workdir = stack.enter_context(TemporaryDirectory())
+        ns_file = os.path.join(workdir, 'namespace')
+        with open(ns_file, 'w', encoding='utf-8') as _writer:
+            _writer.write(self.namespace)
+        stack.enter_context(patch.dict(os.environ, {
+            'SA_NAMESPACE': ns_file, 'BRO_HOST': 'bro', 'BRO_PORT': '7001'}))
+        for target, new in (
+                ('common.load_incluster_config', lambda: None),
+                ('common.CoreV1Api', lambda *_: self.core),
+                ('common.BatchV1Api', lambda *_: self.batch),
+                ('common.Bro', self.bro)):
+            stack.enter_context(patch(target, new=new))
+        previous = set_clock(self.clock)
+        stack.callback(set_clock, previous)
+        return stack
@@ -0,0 +1,1160 @@
+#!/usr/bin/env python3
+# *****************************************************************************
+# Ericsson AB                                                            SCRIPT
+# *****************************************************************************
+#
+# (c) 2024 Ericsson AB - All rights reserved.
+#
+# The copyright to the computer program(s) herein is the property
+# of Ericsson AB, Sweden. The programs may be used and/or copied only
+# with the written permission from Ericsson AB or in accordance with
+# the terms and conditions stipulated in the agreement/contract under
+# which the program(s) have been supplied.
+# *****************************************************************************
+"""
+Local stand-ins for the Kubernetes API server and the BRO REST API.
+
+Only the subset of the APIs used by the hooks is implemented:
+ - core/v1 configmaps, secrets, pods, services and namespaces
+ - batch/v1 jobs
+ - get/list/create/replace/patch/delete, deletecollection and watches
+ - BRO /v1 health, backup-manager backups, actions, scheduler,
+   periodic events and housekeeping
+
+Every request is counted so callers can report the API cost of a hook.
+"""
+# pylint: disable=too-many-lines
+import copy
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from argparse import ArgumentParser, RawTextHelpFormatter
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+from socket import gethostname
+from tempfile import mkdtemp
+from urllib.parse import parse_qs, unquote, urlparse
+
+KUBE_CORE_RE = re.compile(
+    r'^/api/v1/namespaces/(?P<ns>[^/]+)/'
+    r'(?P<resource>configmaps|secrets|pods|services)'
+    r'(?:/(?P<name>[^/]+))?(?:/(?P<sub>log|status))?$')
+KUBE_BATCH_RE = re.compile(
+    r'^/apis/batch/v1/namespaces/(?P<ns>[^/]+)/(?P<resource>jobs)'
+    r'(?:/(?P<name>[^/]+))?(?:/(?P<sub>status))?$')
+KUBE_NAMESPACES_RE = re.compile(r'^/api/v1/namespaces(?:/(?P<name>[^/]+))?$')
+
+BRO_RE = re.compile(
+    r'^/v1/backup-manager/(?P<bm>[^/]+)/'
+    r'(?P<kind>backup|action|scheduler|housekeeping)'
+    r'(?:/(?P<sub>periodic-event|[^/]+))?(?:/(?P<event>[^/]+))?$')
+
+KINDS = {
+    'configmaps': ('v1', 'ConfigMap'),
+    'secrets': ('v1', 'Secret'),
+    'pods': ('v1', 'Pod'),
+    'services': ('v1', 'Service'),
+    'jobs': ('batch/v1', 'Job'),
+    'namespaces': ('v1', 'Namespace'),
+}
+
+EVENT_HISTORY = 10000
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _merge(target: dict, patch: dict) -> dict:
+    """
+    Apply a JSON merge patch, close enough to a strategic merge patch for
+    the objects the hooks patch.
+
+    :param target: The object to patch, updated in place
+    :param patch: The patch
+    :return: The patched object
+    """
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+    return target
+
+
+def _lookup(obj: dict, path: str):
+    for part in path.split('.'):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(part)
+    return obj
+
+
+def label_selector_matches(selector: str, labels: dict) -> bool:
+    """
+    Check a set of labels against an equality/existence based selector.
+
+    :param selector: Label selector, e.g. "app=x,tier!=db,adpbrlabelkey"
+    :param labels: The object labels
+    :return: True if all the selector terms match
+    """
+    labels = labels or {}
+    for term in filter(None, (t.strip() for t in (selector or '').split(','))):
+        if '!=' in term:
+            key, value = term.split('!=', 1)
+            if labels.get(key.strip()) == value.strip():
+                return False
+        elif '=' in term:
+            key, value = term.replace('==', '=').split('=', 1)
+            if labels.get(key.strip()) != value.strip():
+                return False
+        elif term.startswith('!'):
+            if term[1:] in labels:
+                return False
+        elif term not in labels:
+            return False
+    return True
+
+
+def field_selector_matches(selector: str, obj: dict) -> bool:
+    """
+    Check an object against an equality based field selector.
+
+    :param selector: Field selector, e.g. "metadata.name=x"
+    :param obj: The object
+    :return: True if all the selector terms match
+    """
+    for term in filter(None, (t.strip() for t in (selector or '').split(','))):
+        negate = '!=' in term
+        key, value = term.replace('!=', '=').replace('==', '=').split('=', 1)
+        matched = str(_lookup(obj, key.strip())) == value.strip()
+        if matched == negate:
+            return False
+    return True
+
+
+class SimulatorConfig:
+    """
+    Tunables for the simulated cluster and BRO.
+    """
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+
+    def __init__(self, namespace='enm-sim'):
+        self.namespace = namespace
+        # Per request latency added to every response, in seconds
+        self.kube_latency = 0.0
+        self.bro_latency = 0.0
+        # Time a Foreground delete takes to finalise
+        self.delete_delay = 0.5
+        # Time a created Job takes to complete, None means never
+        self.job_duration = 1.0
+        # Default BRO action duration and per action type overrides
+        self.action_duration = 2.0
+        self.action_durations = {}
+        # Time after start-up before the agents register with BRO
+        self.agent_registration_delay = 0.0
+        self.agents = ['eric-enm-agent-0', 'eric-enm-agent-1']
+        self.rollback_agents = list(self.agents)
+        self.product_version = '24.1.1'
+        # Filler objects to give list calls a realistic size
+        self.filler_pods = 0
+        self.filler_services = 0
+        self.filler_jobs = 0
+        self.filler_configmaps = 0
+        self.filler_actions = 0
+        self.watch_timeout = 30
+
+    def duration(self, action_name: str) -> float:
+        """
+        Get the simulated duration for a BRO action
+
+        :param action_name: Action name, e.g. RESTORE
+        :return: Duration in seconds
+        """
+        return float(self.action_durations.get(action_name,
+                                               self.action_duration))
+
+
+class ApiError(Exception):
+    """ An error to return as a Kubernetes Status or BRO error body """
+
+    def __init__(self, code: int, reason: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.reason = reason
+        self.message = message
+
+    def body(self) -> dict:
+        """
+        Get the error response body.
+
+        :return: A Kubernetes Status dict
+        """
+        return {'kind': 'Status', 'apiVersion': 'v1', 'metadata': {},
+                'status': 'Failure', 'message': self.message,
+                'reason': self.reason, 'code': self.code}
+
+
+class KubeStore:
+    """
+    In-memory object store with resource versions and a watch event log.
+    """
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self._cond = threading.Condition()
+        self._objects = {}
+        self._events = []
+        self._rv = 0
+
+    def _bucket(self, resource, namespace):
+        return self._objects.setdefault((resource, namespace), {})
+
+    def _emit(self, resource, namespace, event_type, obj):
+        self._rv += 1
+        obj['metadata']['resourceVersion'] = str(self._rv)
+        self._events.append((self._rv, resource, namespace, event_type,
+                             copy.deepcopy(obj)))
+        if len(self._events) > EVENT_HISTORY:
+            del self._events[:len(self._events) - EVENT_HISTORY]
+        self._cond.notify_all()
+
+    def resource_version(self) -> str:
+        """
+        :return: The current store resource version
+        """
+        with self._cond:
+            return str(self._rv)
+
+    def add(self, resource: str, namespace: str, obj: dict) -> dict:
+        """
+        Create an object.
+
+        :param resource: Resource type, e.g. configmaps
+        :param namespace: The namespace
+        :param obj: The object
+        :return: The stored object
+        """
+        api_version, kind = KINDS[resource]
+        obj = copy.deepcopy(obj)
+        obj.setdefault('apiVersion', api_version)
+        obj.setdefault('kind', kind)
+        meta = obj.setdefault('metadata', {})
+        if not meta.get('name') and meta.get('generateName'):
+            meta['name'] = meta['generateName'] + uuid.uuid4().hex[:5]
+        name = meta.get('name')
+        if not name:
+            raise ApiError(422, 'Invalid', 'metadata.name is required')
+        with self._cond:
+            bucket = self._bucket(resource, namespace)
+            if name in bucket:
+                raise ApiError(409, 'AlreadyExists',
+                               f'{resource} "{name}" already exists')
+            meta['namespace'] = namespace
+            meta.setdefault('uid', str(uuid.uuid4()))
+            meta.setdefault('creationTimestamp', _now())
+            bucket[name] = obj
+            self._emit(resource, namespace, 'ADDED', obj)
+            return copy.deepcopy(obj)
+
+    def get(self, resource: str, namespace: str, name: str) -> dict:
+        """
+        Read an object.
+
+        :return: A copy of the object
+        """
+        with self._cond:
+            obj = self._bucket(resource, namespace).get(name)
+            if obj is None:
+                raise ApiError(404, 'NotFound',
+                               f'{resource} "{name}" not found')
+            return copy.deepcopy(obj)
+
+    def list(self, resource: str, namespace: str, label_selector=None,
+             field_selector=None) -> dict:
+        """
+        List objects.
+
+        :return: A <Kind>List dict
+        """
+        api_version, kind = KINDS[resource]
+        with self._cond:
+            items = [copy.deepcopy(obj) for obj in
+                     self._bucket(resource, namespace).values()
+                     if label_selector_matches(
+                         label_selector, obj['metadata'].get('labels'))
+                     and field_selector_matches(field_selector, obj)]
+            return {'apiVersion': api_version, 'kind': f'{kind}List',
+                    'metadata': {'resourceVersion': str(self._rv)},
+                    'items': items}
+
+    def update(self, resource: str, namespace: str, name: str,
+               body: dict, merge: bool) -> dict:
+        """
+        Replace or merge patch an object.
+
+        :return: The updated object
+        """
+        with self._cond:
+            bucket = self._bucket(resource, namespace)
+            current = bucket.get(name)
+            if current is None:
+                raise ApiError(404, 'NotFound',
+                               f'{resource} "{name}" not found')
+            if merge:
+                body = dict(body)
+                body.pop('metadata', None)
+                obj = _merge(current, body)
+            else:
+                obj = copy.deepcopy(body)
+                obj['metadata'] = dict(current['metadata'],
+                                       **{k: v for k, v in
+                                          obj.get('metadata', {}).items()
+                                          if v is not None})
+                obj.setdefault('apiVersion', current['apiVersion'])
+                obj.setdefault('kind', current['kind'])
+            bucket[name] = obj
+            self._emit(resource, namespace, 'MODIFIED', obj)
+            return copy.deepcopy(obj)
+
+    def delete(self, resource: str, namespace: str, name: str,
+               delay: float = 0.0) -> dict:
+        """
+        Delete an object, optionally finalising it after a delay.
+
+        :return: A Status dict
+        """
+        with self._cond:
+            obj = self._bucket(resource, namespace).get(name)
+            if obj is None:
+                raise ApiError(404, 'NotFound',
+                               f'{resource} "{name}" not found')
+            if delay > 0:
+                if not obj['metadata'].get('deletionTimestamp'):
+                    obj['metadata']['deletionTimestamp'] = _now()
+                    self._emit(resource, namespace, 'MODIFIED', obj)
+                    _later(delay, self._finalise, resource, namespace, name)
+            else:
+                self._finalise(resource, namespace, name)
+        if resource == 'jobs':
+            for pod in self.list('pods', namespace,
+                                 f'job-name={name}')['items']:
+                self.delete('pods', namespace, pod['metadata']['name'],
+                            delay)
+        return {'kind': 'Status', 'apiVersion': 'v1', 'metadata': {},
+                'status': 'Success',
+                'details': {'name': name, 'kind': resource}}
+
+    def _finalise(self, resource, namespace, name):
+        with self._cond:
+            obj = self._bucket(resource, namespace).pop(name, None)
+            if obj is not None:
+                self._emit(resource, namespace, 'DELETED', obj)
+
+    def events_since(self, resource: str, namespace: str, since: int,
+                     timeout: float) -> list:
+        """
+        Block until there are events newer than a resource version.
+
+        :param resource: Resource type
+        :param namespace: The namespace
+        :param since: Resource version to resume from
+        :param timeout: Max time to wait for new events
+        :return: List of (rv, type, object), None if the resource
+                 version is too old
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._events and since < self._events[0][0] - 1:
+                    return None
+                found = [(rv, e_type, obj) for rv, res, ns, e_type, obj
+                         in self._events
+                         if rv > since and res == resource and
+                         ns == namespace]
+                remaining = deadline - time.monotonic()
+                if found or remaining <= 0:
+                    return found
+                self._cond.wait(remaining)
+
+
+def _later(delay, func, *args):
+    timer = threading.Timer(delay, func, args)
+    timer.daemon = True
+    timer.start()
+
+
+class BroStore:  # pylint: disable=too-many-instance-attributes
+    """
+    In-memory BRO with time based action progress.
+    """
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self._lock = threading.RLock()
+        self._started = time.monotonic()
+        self._managers = {}
+        self._action_seq = 10000
+        self._ongoing = None
+
+    def agents(self) -> list:
+        """
+        :return: The registered agents
+        """
+        elapsed = time.monotonic() - self._started
+        if elapsed < self.config.agent_registration_delay:
+            return []
+        return list(self.config.agents)
+
+    def manager(self, bm_id: str) -> dict:
+        """
+        Get or create a backup manager
+
+        :param bm_id: Backup manager ID
+        :return: The backup manager state
+        """
+        with self._lock:
+            if bm_id not in self._managers:
+                self._managers[bm_id] = {
+                    'backups': {}, 'actions': [], 'events': [],
+                    'scheduler': {
+                        'adminState': 'UNLOCKED',
+                        'scheduledBackupName': 'SCHEDULED_BACKUP',
+                        'mostRecentlyCreatedAutoBackup': None,
+                        'nextScheduledTime': None,
+                        'autoExport': 'DISABLED',
+                        'autoExportUri': None,
+                        'autoExportPassword': None},
+                    'housekeeping': {'auto-delete': 'enabled',
+                                     'max-stored-manual-backups': 1}}
+            return self._managers[bm_id]
+
+    def add_backup(self, bm_id: str, name: str, agents=None):
+        """
+        Add a COMPLETE backup.
+
+        :param bm_id: Backup manager ID
+        :param name: Backup name
+        :param agents: Agents included in the backup, defaults to all
+        """
+        versions = [{'agentId': 'APPLICATION_INFO',
+                     'productName': 'Ericsson Network Manager',
+                     'productNumber': 'AOM 901 151',
+                     'productRevision': self.config.product_version,
+                     'date': _now(), 'description': '', 'type': ''}]
+        for agent in self.config.agents if agents is None else agents:
+            versions.append({'agentId': agent, 'productName': agent,
+                             'productNumber': '', 'productRevision': '1.0',
+                             'date': _now(), 'description': '',
+                             'type': ''})
+        with self._lock:
+            self.manager(bm_id)['backups'][name] = {
+                'id': name, 'name': name, 'creationTime': _now(),
+                'status': 'COMPLETE', 'creationType': 'MANUAL',
+                'userLabel': '', 'softwareVersions': versions}
+
+    def add_completed_actions(self, bm_id: str, count: int):
+        """
+        Add historical, finished actions to a backup manager.
+        """
+        with self._lock:
+            actions = self.manager(bm_id)['actions']
+            for _ in range(count):
+                self._action_seq += 1
+                actions.append({
+                    'id': str(self._action_seq), 'name': 'CREATE_BACKUP',
+                    'state': 'FINISHED', 'result': 'SUCCESS',
+                    'progressPercentage': 1.0, 'additionalInfo': '',
+                    'progressInfo': '', 'startTime': _now(),
+                    'completionTime': _now(), 'lastUpdateTime': _now(),
+                    'payload': {}, '_done': True})
+
+    def start_action(self, bm_id: str, name: str, payload: dict) -> str:
+        """
+        Start an action
+
+        :return: The action ID
+        """
+        with self._lock:
+            self._tick()
+            if self._ongoing is not None:
+                raise ApiError(409, 'Conflict',
+                               'Another action is already running')
+            self._action_seq += 1
+            action = {
+                'id': str(self._action_seq), 'name': name,
+                'state': 'RUNNING', 'result': 'NOT_AVAILABLE',
+                'progressPercentage': 0.0, 'additionalInfo': '',
+                'progressInfo': '', 'startTime': _now(),
+                'completionTime': None, 'lastUpdateTime': _now(),
+                'payload': payload or {}, '_done': False,
+                '_bm': bm_id, '_start': time.monotonic(),
+                '_duration': self.config.duration(name)}
+            self.manager(bm_id)['actions'].append(action)
+            self._ongoing = action
+            return action['id']
+
+    def _tick(self):
+        action = self._ongoing
+        if action is None:
+            return
+        elapsed = time.monotonic() - action['_start']
+        duration = action['_duration']
+        action['lastUpdateTime'] = _now()
+        if elapsed < duration:
+            action['progressPercentage'] = round(elapsed / duration, 2)
+            return
+        self._finish(action)
+        self._ongoing = None
+
+    def _finish(self, action):
+        manager = self.manager(action['_bm'])
+        payload = action['payload']
+        result, info = 'SUCCESS', ''
+        if action['name'] == 'CREATE_BACKUP':
+            self.add_backup(action['_bm'], payload.get('backupName'))
+        elif action['name'] == 'IMPORT':
+            name = payload.get('uri', '').rstrip('/').split('/')[-1]
+            name = re.sub(r'(-\d{4}-.*)?\.tar\.gz$', '', name)
+            self.add_backup(action['_bm'], name)
+        elif action['name'] == 'DELETE_BACKUP':
+            manager['backups'].pop(payload.get('backupName'), None)
+        elif action['name'] == 'RESTORE':
+            backup = manager['backups'].get(payload.get('backupName'))
+            registered = self.agents()
+            required = [v['agentId'] for v in
+                        (backup or {}).get('softwareVersions', [])
+                        if v['agentId'] != 'APPLICATION_INFO']
+            missing = [a for a in required if a not in registered]
+            if backup is None:
+                result, info = 'FAILURE', 'Backup not found'
+            elif not registered:
+                result = 'FAILURE'
+                info = 'Failing job for not having any registered agents'
+            elif missing:
+                result = 'FAILURE'
+                info = ('Agents with the following IDs are required:\n'
+                        f'[{", ".join(missing)}]')
+        action.update({'state': 'FINISHED', 'result': result,
+                       'progressPercentage': 1.0, 'additionalInfo': info,
+                       'completionTime': _now(), '_done': True})
+
+    @staticmethod
+    def _public(action: dict) -> dict:
+        return {k: v for k, v in action.items() if not k.startswith('_')}
+
+    def health(self) -> dict:
+        """
+        :return: The BRO health body
+        """
+        with self._lock:
+            self._tick()
+            ongoing = {}
+            if self._ongoing:
+                ongoing = {'backupManagerId': self._ongoing['_bm'],
+                           'actionId': self._ongoing['id']}
+            return {'status': 'Healthy', 'availability':
+                    'Busy' if ongoing else 'Available',
+                    'ongoingAction': ongoing,
+                    'registeredAgents': self.agents()}
+
+    def actions(self, bm_id: str) -> dict:
+        """
+        :return: The action list body
+        """
+        with self._lock:
+            self._tick()
+            return {'actions': [self._public(a) for a in
+                                self.manager(bm_id)['actions']]}
+
+    def action(self, bm_id: str, action_id: str) -> dict:
+        """
+        :return: An action body
+        """
+        with self._lock:
+            self._tick()
+            for action in self.manager(bm_id)['actions']:
+                if action['id'] == action_id:
+                    return self._public(action)
+        raise ApiError(404, 'NotFound', f'Action {action_id} not found')
+
+    def backups(self, bm_id: str) -> dict:
+        """
+        :return: The backup list body
+        """
+        with self._lock:
+            self._tick()
+            return {'backups': [
+                {k: v for k, v in b.items() if k != 'softwareVersions'}
+                for b in self.manager(bm_id)['backups'].values()]}
+
+    def backup(self, bm_id: str, name: str) -> dict:
+        """
+        :return: A backup body
+        """
+        with self._lock:
+            self._tick()
+            backup = self.manager(bm_id)['backups'].get(name)
+            if backup is None:
+                raise ApiError(404, 'NotFound', f'Backup {name} not found')
+            return copy.deepcopy(backup)
+
+    def add_event(self, bm_id: str, body: dict) -> dict:
+        """
+        Add a periodic scheduler event.
+
+        :return: The event ID body
+        """
+        with self._lock:
+            self._action_seq += 1
+            event = dict(body, id=str(self._action_seq))
+            self.manager(bm_id)['events'].append(event)
+            return {'id': event['id']}
+
+    def delete_event(self, bm_id: str, event_id: str):
+        """
+        Delete a periodic scheduler event.
+        """
+        with self._lock:
+            events = self.manager(bm_id)['events']
+            events[:] = [e for e in events if e['id'] != event_id]
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    """
+    Request handler shared by the Kubernetes and BRO stand-ins.
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'HookSimulator/1.0'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """ Keep the request log out of the hook output """
+
+    def read_body(self):
+        """
+        :return: The decoded JSON request body
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_body(self, code: int, body, content_type='application/json'):
+        """
+        Send a complete response.
+
+        :param code: HTTP status code
+        :param body: dict to send as JSON, or raw bytes
+        :param content_type: The content type
+        """
+        data = body if isinstance(body, bytes) else \
+            json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        sim = self.server.simulator
+        latency = self.server.latency()
+        if latency:
+            time.sleep(latency)
+        try:
+            self.server.route(self, method, unquote(url.path), query)
+        except ApiError as error:
+            sim.count(f'{self.server.backend}-error', method,
+                      f'{error.code} {error.reason}')
+            self.send_body(error.code, error.body())
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def do_GET(self):  # pylint: disable=invalid-name,missing-function-docstring
+        self._dispatch('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name,missing-function-docstring
+        self._dispatch('POST')
+
+    def do_PUT(self):  # pylint: disable=invalid-name,missing-function-docstring
+        self._dispatch('PUT')
+
+    def do_PATCH(self):  # pylint: disable=invalid-name,missing-function-docstring
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):  # pylint: disable=invalid-name,missing-function-docstring
+        self._dispatch('DELETE')
+
+    def stream_watch(self, events):
+        """
+        Stream watch events, one JSON document per line, until the
+        generator is exhausted.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for event in events:
+            self.wfile.write(json.dumps(event).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, simulator, backend, route, latency):
+        super().__init__(('127.0.0.1', 0), SimulatorHandler)
+        self.simulator = simulator
+        self.backend = backend
+        self.route = route
+        self.latency = latency
+
+
+class HookSimulator:
+    """
+    Local Kubernetes API server and BRO stand-in.
+
+    Usage::
+
+        with HookSimulator(SimulatorConfig()) as sim:
+            sim.apply_environment()
+            ... run hooks ...
+            print(sim.calls())
+    """
+
+    def __init__(self, config: SimulatorConfig = None):
+        self.config = config or SimulatorConfig()
+        self.kube = KubeStore(self.config)
+        self.bro = BroStore(self.config)
+        self._counts = Counter()
+        self._count_lock = threading.Lock()
+        self._servers = []
+        self.workdir = None
+
+    # ---------------------------------------------------------------- admin
+    def start(self):
+        """
+        Seed the stores and start both servers on ephemeral ports.
+        """
+        self.seed()
+        self._servers = [
+            _Server(self, 'kube', self._route_kube,
+                    lambda: self.config.kube_latency),
+            _Server(self, 'bro', self._route_bro,
+                    lambda: self.config.bro_latency)]
+        for server in self._servers:
+            thread = threading.Thread(target=server.serve_forever,
+                                      daemon=True)
+            thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the servers.
+        """
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    @property
+    def kube_url(self) -> str:
+        """
+        :return: Base URL of the Kubernetes API stand-in
+        """
+        return f'http://127.0.0.1:{self._servers[0].server_address[1]}'
+
+    @property
+    def bro_port(self) -> int:
+        """
+        :return: Port of the BRO stand-in
+        """
+        return self._servers[1].server_address[1]
+
+    def count(self, backend: str, method: str, what: str):
+        """
+        Count an API request.
+        """
+        with self._count_lock:
+            self._counts[(backend, f'{method} {what}')] += 1
+
+    def calls(self, backend: str = None) -> Counter:
+        """
+        Get the API request counts.
+
+        :param backend: 'kube' or 'bro', None for both
+        :return: Counter of '<METHOD> <endpoint>' to request count
+        """
+        with self._count_lock:
+            return Counter({f'{b}:{k}' if backend is None else k: v
+                            for (b, k), v in self._counts.items()
+                            if backend in (None, b)})
+
+    def reset_calls(self):
+        """
+        Reset the API request counts.
+        """
+        with self._count_lock:
+            self._counts.clear()
+
+    def write_kubeconfig(self) -> str:
+        """
+        Write a kubeconfig pointing at the Kubernetes stand-in.
+
+        :return: Path to the kubeconfig file
+        """
+        if not self.workdir:
+            self.workdir = mkdtemp(prefix='hook-simulator-')
+        path = join(self.workdir, 'kubeconfig')
+        with open(path, 'w', encoding='utf-8') as _writer:
+            json.dump({
+                'apiVersion': 'v1', 'kind': 'Config',
+                'current-context': 'sim',
+                'clusters': [{'name': 'sim',
+                              'cluster': {'server': self.kube_url}}],
+                'users': [{'name': 'sim', 'user': {}}],
+                'contexts': [{'name': 'sim', 'context': {
+                    'cluster': 'sim', 'user': 'sim',
+                    'namespace': self.config.namespace}}]}, _writer)
+        return path
+
+    def environment(self) -> dict:
+        """
+        Get the environment the hooks need to use the simulator.
+
+        :return: Environment variables
+        """
+        kubeconfig = self.write_kubeconfig()
+        ns_file = join(self.workdir, 'namespace')
+        with open(ns_file, 'w', encoding='utf-8') as _writer:
+            _writer.write(self.config.namespace)
+        return {'KUBECONFIG': kubeconfig, 'SA_NAMESPACE': ns_file,
+                'BRO_HOST': '127.0.0.1', 'BRO_PORT': str(self.bro_port)}
+
+    def apply_environment(self, environ=None):
+        """
+        Point the hooks in this process at the simulator.
+
+        :param environ: Environment to update, defaults to os.environ
+        """
+        if environ is None:
+            environ = os.environ
+        environ.pop('KUBERNETES_SERVICE_HOST', None)
+        environ.update(self.environment())
+        # The kubernetes client reads $KUBECONFIG once, at import time
+        kube_config = sys.modules.get('kubernetes.config.kube_config')
+        if kube_config is not None:
+            kube_config.KUBE_CONFIG_DEFAULT_LOCATION = environ['KUBECONFIG']
+
+    def seed(self):
+        """
+        Create the objects the hooks expect to find, plus any filler.
+        """
+        cfg = self.config
+        nsp = cfg.namespace
+        self.kube.add('namespaces', '', {'metadata': {
+            'name': nsp, 'labels': {'app': 'enm'}}})
+        self.kube.add('configmaps', nsp, {
+            'metadata': {'name': 'backup-restore-configmap'},
+            'data': {'RESTORE_STATE': '', 'RESTORE_SCOPE': '',
+                     'RESTORE_BACKUP_NAME': '', 'RESTORE_ACTION_ID': ''}})
+        self.kube.add('configmaps', nsp, {'metadata': {
+            'name': 'product-version-configmap',
+            'annotations': {
+                'ericsson.com/product-revision': cfg.product_version}}})
+        self.kube.add('pods', nsp, self.pod(gethostname(), {}))
+        for index, agent in enumerate(cfg.agents):
+            annotations = {'backupType': 'ROLLBACK'} \
+                if agent in cfg.rollback_agents else {}
+            self.kube.add('pods', nsp, self.pod(
+                f'{agent}-{index}', {'adpbrlabelkey': agent}, annotations))
+        for index in range(cfg.filler_pods):
+            self.kube.add('pods', nsp, self.pod(f'filler-{index}',
+                                                {'app': 'filler'}))
+        for index in range(cfg.filler_services):
+            self.kube.add('services', nsp, self.service(f'filler-{index}'))
+        for index in range(cfg.filler_jobs):
+            self.kube.add('jobs', nsp, self.job(f'filler-{index}'))
+        for index in range(cfg.filler_configmaps):
+            self.kube.add('configmaps', nsp, {
+                'metadata': {'name': f'filler-{index}'},
+                'data': {'key': 'value'}})
+        self.bro.add_completed_actions('DEFAULT', cfg.filler_actions)
+        self.bro.add_completed_actions('ROLLBACK', cfg.filler_actions)
+
+    @staticmethod
+    def pod(name: str, labels: dict, annotations: dict = None,
+            phase: str = 'Running') -> dict:
+        """
+        :return: A pod body
+        """
+        return {'metadata': {'name': name, 'labels': labels,
+                             'annotations': annotations or {}},
+                'spec': {'containers': [{
+                    'name': 'main', 'image': 'sim/hooks:latest',
+                    'imagePullPolicy': 'IfNotPresent'}]},
+                'status': {'phase': phase, 'podIP': '127.0.0.1',
+                           'conditions': [{
+                               'type': 'Ready', 'status':
+                               'True' if phase == 'Running' else 'False'}]}}
+
+    @staticmethod
+    def service(name: str, cluster_ip: str = '10.0.0.1') -> dict:
+        """
+        :return: A service body
+        """
+        return {'metadata': {'name': name},
+                'spec': {'clusterIP': cluster_ip,
+                         'ports': [{'port': 80, 'protocol': 'TCP'}]}}
+
+    @staticmethod
+    def job(name: str) -> dict:
+        """
+        :return: A completed job body
+        """
+        return {'metadata': {'name': name},
+                'spec': {'backoffLimit': 0, 'template': {
+                    'metadata': {}, 'spec': {
+                        'restartPolicy': 'Never',
+                        'containers': [{'name': 'main',
+                                        'image': 'sim/hooks:latest'}]}}},
+                'status': {'succeeded': 1, 'conditions': [
+                    {'type': 'Complete', 'status': 'True'}]}}
+
+    def _run_job(self, namespace, job):
+        name = job['metadata']['name']
+        pod = self.pod(f'{name}-{uuid.uuid4().hex[:5]}',
+                       {'job-name': name}, phase='Running')
+        self.kube.add('pods', namespace, pod)
+        if self.config.job_duration is None:
+            return
+
+        def _complete():
+            try:
+                self.kube.update('pods', namespace, pod['metadata']['name'],
+                                 {'status': {'phase': 'Succeeded'}}, True)
+                self.kube.update('jobs', namespace, name, {'status': {
+                    'succeeded': 1, 'conditions': [
+                        {'type': 'Complete', 'status': 'True'}]}}, True)
+            except ApiError:
+                pass
+        _later(self.config.job_duration, _complete)
+
+    # ---------------------------------------------------------- kubernetes
+    def _route_kube(self, handler, method, path, query):
+        # pylint: disable=too-many-locals,too-many-branches
+        match = KUBE_CORE_RE.match(path) or KUBE_BATCH_RE.match(path)
+        if match:
+            namespace = match.group('ns')
+            resource = match.group('resource')
+            name = match.group('name')
+            sub = match.group('sub')
+        else:
+            match = KUBE_NAMESPACES_RE.match(path)
+            if not match:
+                raise ApiError(404, 'NotFound', f'No route for {path}')
+            namespace, resource, name, sub = '', 'namespaces', \
+                match.group('name'), None
+
+        watching = str(query.get('watch', '')).lower() in ('true', '1')
+        what = resource + ('/{name}' if name else '') + \
+            (f'/{sub}' if sub else '') + (' watch' if watching else '')
+        self.count('kube', method, what)
+
+        if method == 'GET' and sub == 'log':
+            self.kube.get(resource, namespace, name)
+            handler.send_body(200, f'simulated log for {name}\n'.encode(),
+                          'text/plain')
+        elif method == 'GET' and watching:
+            self._watch(handler, resource, namespace, name, query)
+        elif method == 'GET' and name:
+            handler.send_body(200, self.kube.get(resource, namespace, name))
+        elif method == 'GET':
+            handler.send_body(200, self.kube.list(
+                resource, namespace, query.get('labelSelector'),
+                query.get('fieldSelector')))
+        elif method == 'POST':
+            obj = self.kube.add(resource, namespace, handler.read_body())
+            if resource == 'jobs':
+                self._run_job(namespace, obj)
+            handler.send_body(201, obj)
+        elif method in ('PUT', 'PATCH'):
+            handler.send_body(200, self.kube.update(
+                resource, namespace, name, handler.read_body(),
+                merge=method == 'PATCH'))
+        elif method == 'DELETE' and name:
+            body = handler.read_body()
+            grace = body.get('gracePeriodSeconds',
+                             query.get('gracePeriodSeconds'))
+            delay = 0.0 if str(grace) == '0' else self.config.delete_delay
+            handler.send_body(200, self.kube.delete(resource, namespace, name,
+                                                delay))
+        elif method == 'DELETE':
+            items = self.kube.list(resource, namespace,
+                                   query.get('labelSelector'),
+                                   query.get('fieldSelector'))
+            for item in items['items']:
+                self.kube.delete(resource, namespace,
+                                 item['metadata']['name'])
+            handler.send_body(200, {'kind': 'Status', 'apiVersion': 'v1',
+                                'metadata': {}, 'status': 'Success'})
+        else:
+            raise ApiError(405, 'MethodNotAllowed', method)
+
+    def _watch(self, handler, resource, namespace, name, query):
+        field_selector = query.get('fieldSelector')
+        if name:
+            field_selector = f'metadata.name={name}'
+        label_selector = query.get('labelSelector')
+        timeout = float(query.get('timeoutSeconds') or
+                        self.config.watch_timeout)
+        since = query.get('resourceVersion')
+
+        def _events():
+            deadline = time.monotonic() + timeout
+            if since in (None, '', '0'):
+                initial = self.kube.list(resource, namespace,
+                                         label_selector, field_selector)
+                last = int(initial['metadata']['resourceVersion'])
+                for obj in initial['items']:
+                    yield {'type': 'ADDED', 'object': obj}
+            else:
+                last = int(since)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                found = self.kube.events_since(resource, namespace, last,
+                                               remaining)
+                if found is None:
+                    yield {'type': 'ERROR', 'object': ApiError(
+                        410, 'Expired',
+                        f'too old resource version: {last}').body()}
+                    return
+                for rv, e_type, obj in found:
+                    last = rv
+                    if label_selector_matches(
+                            label_selector, obj['metadata'].get('labels')) \
+                            and field_selector_matches(field_selector, obj):
+                        yield {'type': e_type, 'object': obj}
+
+        handler.stream_watch(_events())
+
+    # ----------------------------------------------------------------- bro
+    def _route_bro(self, handler, method, path, query):
+        # pylint: disable=unused-argument,too-many-branches
+        path = path.rstrip('/')
+        self.count('bro', method, re.sub(
+            r'/backup-manager/[^/]+', '/backup-manager/{id}',
+            re.sub(r'/(action|backup|periodic-event)/[^/]+$',
+                   r'/\1/{id}', path)))
+        if path in ('/v1/health', '/v3/health'):
+            handler.send_body(200, self.bro.health())
+            return
+        if path == '/v1/backup-manager':
+            handler.send_body(200, {'backupManagers': [
+                {'id': bm, 'backupType': '', 'backupDomain': ''}
+                for bm in ('DEFAULT', 'ROLLBACK', 'DEFAULT-bro')]})
+            return
+        match = BRO_RE.match(path)
+        if not match:
+            raise ApiError(404, 'NotFound', f'No route for {path}')
+        bm_id, kind = match.group('bm'), match.group('kind')
+        sub, event = match.group('sub'), match.group('event')
+        manager = self.bro.manager(bm_id)
+
+        if kind == 'backup':
+            handler.send_body(200, self.bro.backup(bm_id, sub) if sub
+                          else self.bro.backups(bm_id))
+        elif kind == 'action' and method == 'POST':
+            body = handler.read_body()
+            action_id = self.bro.start_action(
+                bm_id, body.get('action'), body.get('payload'))
+            handler.send_body(201, {'id': action_id})
+        elif kind == 'action':
+            handler.send_body(200, self.bro.action(bm_id, sub) if sub
+                          else self.bro.actions(bm_id))
+        elif kind == 'housekeeping' and method == 'POST':
+            body = handler.read_body()
+            manager['housekeeping'].update(body)
+            handler.send_body(201, {'id': self.bro.start_action(
+                bm_id, 'HOUSEKEEPING', body)})
+        elif kind == 'housekeeping':
+            handler.send_body(200, manager['housekeeping'])
+        elif kind == 'scheduler' and sub == 'periodic-event':
+            if method == 'POST':
+                handler.send_body(201, self.bro.add_event(bm_id,
+                                                      handler.read_body()))
+            elif method == 'DELETE':
+                self.bro.delete_event(bm_id, event)
+                handler.send_body(204, b'')
+            elif event:
+                found = [e for e in manager['events'] if e['id'] == event]
+                if not found:
+                    raise ApiError(404, 'NotFound', event)
+                handler.send_body(200, found[0])
+            else:
+                handler.send_body(200, {'events': manager['events']})
+        elif kind == 'scheduler' and method in ('PUT', 'POST', 'PATCH'):
+            manager['scheduler'].update(handler.read_body())
+            handler.send_body(200, manager['scheduler'])
+        elif kind == 'scheduler':
+            handler.send_body(200, manager['scheduler'])
+        else:
+            raise ApiError(405, 'MethodNotAllowed', method)
+
+
+def main(sys_args):
+    """
+    Run the simulator until interrupted.
+
+    :param sys_args: sys.argv[1:]
+
+    """
+    arg_parser = ArgumentParser(
+        formatter_class=RawTextHelpFormatter,
+        description='Run a local Kubernetes API and BRO stand-in for the '
+                    'hooks.\nPrints the environment the hooks need.')
+    arg_parser.add_argument('-n', dest='namespace', default='enm-sim',
+                            help='Namespace to simulate')
+    arg_parser.add_argument('--action-duration', type=float, default=2.0,
+                            help='Seconds a BRO action takes')
+    arg_parser.add_argument('--latency', type=float, default=0.0,
+                            help='Seconds of latency added to each request')
+    arg_parser.add_argument('--pods', type=int, default=0,
+                            help='Number of filler pods')
+    args = arg_parser.parse_args(sys_args)
+
+    config = SimulatorConfig(args.namespace)
+    config.action_duration = args.action_duration
+    config.kube_latency = config.bro_latency = args.latency
+    config.filler_pods = args.pods
+    with HookSimulator(config) as sim:
+        for key, value in sim.environment().items():
+            print(f'export {key}={value}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main(sys.argv[1:])
@@ -1,7 +1,6 @@
 import datetime
 import os
 import subprocess
-import time
 from datetime import datetime, timedelta
 
 from helm3procs import helm_delete_release, \
@@ -11,13 +10,16 @@ from kubernetes.client.exceptions import ApiException
 from utilprocs import log, execute_command
 
 from bro_test_utils import helm_deploy_chart, wait_for_agent, \
-    latest_chart_version, BurException
+    latest_chart_version, BurException, PhaseTimer, run_concurrently, \
+    wait_until
 from lib.broapi import Bro
-from common import KubeApi, BroCliBaseClass
+from common import HookException, KubeApi, KubeBatchBaseClass, \
+    BroCliBaseClass
 
 SCOPE = 'ROLLBACK'
 BACKUP_NAME = 'PreUpgradeBackup'
 CONFIG_MAP = "backup-restore-configmap"
+RESTORE_JOB = 'eric-enm-bro-restore-executor-job'
 
 SECRET_NAME = 'hook-sftp-secret'
 SFTP_PASSWORD = '12shroot'
@@ -39,6 +41,10 @@ BRO_AGENT = f'{TEST_AGENT_RELEASE}-bragent'
 SIDECAR_AGENT = 'sidecar-agent'
 POD_AGENT = 'pod-agent'
 AGENTS = [POD_AGENT, SIDECAR_AGENT, BRO_AGENT]
+# Seconds to wait for BRO to show the result of a test's action
+BRO_UPDATE_TIMEOUT = 60
+
+PHASES = PhaseTimer()
 
 
 def create_restore_configmap():
@@ -76,11 +82,17 @@ def create_service_account():
         rules=[
             client.V1PolicyRule(
                 api_groups=[""], resources=["configmaps", "pods"],
-                verbs=["get", "list", "patch", "delete"]
+                verbs=["get", "list", "watch", "patch", "delete"]
+            ),
+            client.V1PolicyRule(
+                api_groups=[""], resources=["configmaps"], verbs=["create"]
+            ),
+            client.V1PolicyRule(
+                api_groups=[""], resources=["pods/log"], verbs=["get"]
             ),
             client.V1PolicyRule(
                 api_groups=["batch"], resources=["jobs"],
-                verbs=["create", "list", "delete"]
+                verbs=["create", "get", "list", "watch", "delete"]
             )
         ],
     )
@@ -209,39 +221,20 @@ def set_schedule_control(input_option):
 
 def restore_runner_check():
     """
-    Checks the status of the executor pod responsible for restoring a backup.
-    It logs the progress and raises an assertion error if the pod does not
-    reach the 'Succeeded' state within a specified number of attempts.
+    Watches the executor job responsible for restoring a backup, logging
+    its pod's output, and raises an assertion error if the job does not
+    complete.
     """
     log("Running executor job to restore the backup...")
-    max_attempts = 5
-    attempts = 0
-    time.sleep(5)
-    pod_phase = ''
-    while attempts < max_attempts:
-        try:
-            executor_pod = get_pod("eric-enm-bro-restore-executor-job-")
-            if not executor_pod:
-                command_output = local_execute_command(
-                    "kubectl describe jobs/"
-                    "eric-enm-bro-restore-executor-job "
-                    "-n hook-test-ns")
-                log(f"The restore job is not running {command_output}.")
-                break
-            v1_core_api = client.CoreV1Api()
-            pod_info = v1_core_api.read_namespaced_pod_status(
-                executor_pod, NAMESPACE)
-            pod_phase = pod_info.status.phase
-            if pod_phase in ('Failed', 'Succeeded'):
-                break
-        except ApiException as err:
-            log(f"Exception when reading pod status: {err}.")
-        attempts += 1
-        log(f"Restore status: {pod_phase}")
-        time.sleep(5)
-    assert pod_phase == "Succeeded", \
-        ('Restore Executor job status is not "Succeeded". '
-         f'Actual status: "{pod_phase}".')
+    try:
+        completed = KubeBatchBaseClass().wait_for_job(RESTORE_JOB,
+                                                      timeout=300)
+    except HookException as err:
+        command_output = local_execute_command(
+            f"kubectl describe jobs/{RESTORE_JOB} -n {NAMESPACE}")
+        log(f"The restore job is not running {command_output}.")
+        raise AssertionError(f'Restore executor job: {err}') from err
+    assert completed, 'Restore executor job failed.'
 
 
 def restore_process(scope, backup_name):
@@ -257,7 +250,8 @@ def restore_process(scope, backup_name):
     response = ''
     log("=======Deleting BrAgent Test Chart=======")
     helm_delete_release(TEST_AGENT_RELEASE, NAMESPACE, timeout=300)
-    time.sleep(5)
+    wait_until(lambda: BRO_AGENT not in BRO.status.agents,
+               BRO_UPDATE_TIMEOUT, f'{BRO_AGENT} to deregister')
     log("Test Chart is Deleted ...\n")
     # Deploy Test Chart in restore mode
     log("============Deploying Test Chart in restore mode==============")
@@ -353,29 +347,40 @@ def run_backup_manager_config(backupname="-", scope="-",
 def check_last_created_backup():
     """
     This function queries BRO to get the schedule information
-    and checks if there is a recently created backup.
-    If the maximum number of attempts is reached without
-    success an error is raised.
+    and waits for a recently created backup.
+    If there is none before BRO_UPDATE_TIMEOUT an error is raised.
     :return:
         str: The name of the last backup created by BRO Scheduler.
     """
     log("Check if the backup is created")
-    max_attempts = 6
-    attempts = 0
-    while attempts < max_attempts:
+
+    def recent_created():
         try:
-            schedule = BRO.get_schedule("DEFAULT")
-            if schedule.recent_created:
-                print(f"This is the last backup created by BRO Scheduler \
-                {schedule.recent_created}.")
-                return schedule.recent_created
-            print("BRO Scheduler hasn't created any backups yet.")
-            time.sleep(5)
-            attempts += 1
+            created = BRO.get_schedule("DEFAULT").recent_created
         except ApiException as api_exception:
-            print(f"Exception when reading pod status: {api_exception}.")
-    assert attempts < max_attempts, ("Max attempts reached "
-                                     "without success Backup created.")
+            print(f"Exception when reading the schedule: {api_exception}.")
+            return None
+        if not created:
+            print("BRO Scheduler hasn't created any backups yet.")
+        return created
+
+    try:
+        backup_name = wait_until(recent_created, BRO_UPDATE_TIMEOUT,
+                                 'a scheduled backup')
+    except BurException as err:
+        raise AssertionError('No backup created by the BRO Scheduler '
+                             f'in time: {err}') from err
+    print("This is the last backup created by BRO Scheduler "
+          f"{backup_name}.")
+    return backup_name
+
+
+def scheduled_intervals():
+    """
+    :return: The DEFAULT schedule if it has intervals, else None
+    """
+    schedule = BRO.get_schedule("DEFAULT")
+    return schedule if schedule.intervals else None
 
 
 def generate_restore_report(scope):
@@ -401,10 +406,8 @@ def deploy_required_resources():
         The deployment of required resources for the restore process.
     """
     log('============== Deploying required resources ==========')
-    create_restore_configmap()
-    create_service_account()
-    create_secret()
-    create_sftp_config_file()
+    run_concurrently(create_restore_configmap, create_service_account,
+                     create_secret, create_sftp_config_file)
 
 
 def extract_command_output(command_output, regex_word):
@@ -490,13 +493,12 @@ def test_create_preupgrade_backup():
     except ValueError as err:  # pylint: disable=broad-except
         print(f' {err}')
     else:
-        i = 0
-        while i < 6:
-            time.sleep(5)
-            backups_list = BRO.backups(SCOPE)
-            if len(backups_list) > 0:
-                break
-            i += 1
+        try:
+            backups_list = wait_until(lambda: BRO.backups(SCOPE),
+                                      BRO_UPDATE_TIMEOUT,
+                                      f'a backup in {SCOPE}')
+        except BurException as err:
+            print(f' {err}')
     assert len(backups_list) > 0, \
         'Failed to create a backup in time.'
     backup = backups_list[0]
@@ -511,15 +513,16 @@ def test_create_preupgrade_backup():
 
 def test_rollback_restore():
     print('\n======================================\n')
-    deploy_required_resources()
     log("Running Rollback Restore Process ...")
-    restore_result = restore_process("ROLLBACK", BACKUP_NAME)
+    with PHASES.phase('rollback restore'):
+        restore_result = restore_process("ROLLBACK", BACKUP_NAME)
     assert restore_result == 'restore', \
         ("Restore executor job was not triggered successfully. "
          f"Actual command response '{restore_result}' "
          "does not match expected response 'restore'.")
     log(f'Restoring backup: {BACKUP_NAME}, in scope ROLLBACK.')
-    restore_runner_check()
+    with PHASES.phase('rollback restore job'):
+        restore_runner_check()
 
 
 def test_generate_rollback_report():
@@ -568,12 +571,11 @@ def test_set_config():
         print(f'Exception found in create bro config - {err}.')
     else:
         try:
-            time.sleep(10)
-            schedule = BRO.get_schedule("DEFAULT")
+            schedule = wait_until(scheduled_intervals, BRO_UPDATE_TIMEOUT,
+                                  'the schedule interval')
             retention = BRO.get_retention("DEFAULT")
-            if schedule.intervals:
-                log(f"This is the interval {schedule.intervals[0]}.")
-                schedule_interval = schedule.intervals
+            log(f"This is the interval {schedule.intervals[0]}.")
+            schedule_interval = schedule.intervals
         except BurException as bur_exception:
             print("Exception when reading the interval schedule:"
                   f" {bur_exception}.")
@@ -613,18 +615,21 @@ def test_full_restore():
     assert bro_class.exists(backup_name, "DEFAULT"), \
         f"Backup '{backup_name}' does not exist."
     BRO.delete(backup_name, "DEFAULT")
-    time.sleep(5)
+    wait_until(lambda: not bro_class.exists(backup_name, "DEFAULT"),
+               BRO_UPDATE_TIMEOUT, f'backup {backup_name} to be deleted')
 
     backup_filename = f'{backup_name}.tar.gz'
     log(f"Running full backup restore from"
         f" external with {backup_filename}")
-    restore_result = restore_process("DEFAULT", backup_filename)
+    with PHASES.phase('full restore'):
+        restore_result = restore_process("DEFAULT", backup_filename)
     assert restore_result == 'restore', \
         ("Restore executor job was not triggered successfully. "
          f"Actual command response '{restore_result}' "
          "does not match expected response 'restore'.")
     log(f'Restoring backup: {BACKUP_NAME}, in scope DEFAULT.')
-    restore_runner_check()
+    with PHASES.phase('full restore job'):
+        restore_runner_check()
 
 
 def test_generate_full_restore_report():
@@ -653,10 +658,33 @@ def test_restore_config():
     log("Successfully restored BM configuration.")
 
 
+def deploy_test_chart():
+    """
+    Deploy the test agent chart and wait for its agents to register.
+    """
+    with PHASES.phase('test chart install'):
+        helm_deploy_chart(name=CHART_NAME,
+                          repo=HELM_REPO,
+                          version=BASELINE_CHART_VERSION,
+                          options={"brAgent.backupTypeList[0]": "ROLLBACK"},
+                          namespace=NAMESPACE)
+    with PHASES.phase('agent registration'):
+        wait_for_agent(AGENTS, BRO)
+
+
+def timed_required_resources():
+    """
+    Deploy the resources the restore tests need, as a timed phase.
+    """
+    with PHASES.phase('required resources'):
+        deploy_required_resources()
+
+
 def setup():
     """
     Setup function for nostests, deploys the helm chart specified by the OS
     var, baseline_chart_name, then waits for the agents to register.
+    The resources the restore tests need are deployed at the same time.
     """
     global BASELINE_CHART_VERSION  # pylint: disable=global-statement
     if BASELINE_CHART_VERSION == 'latest':
@@ -671,12 +699,8 @@ def setup():
             raise
     log(f'Test setup using chart version: {BASELINE_CHART_VERSION}.')
     try:
-        helm_deploy_chart(name=CHART_NAME,
-                          repo=HELM_REPO,
-                          version=BASELINE_CHART_VERSION,
-                          options={"brAgent.backupTypeList[0]": "ROLLBACK"},
-                          namespace=NAMESPACE)
-        wait_for_agent(AGENTS, BRO)
+        with PHASES.phase('setup'):
+            run_concurrently(deploy_test_chart, timed_required_resources)
         log("Set up is finished. \n")
     except Exception as err:  # pylint: disable=broad-except
         log(f'Exception during setup: {err}.')
@@ -699,3 +723,4 @@ def teardown():
     else:
         log(f'{TEST_AGENT_RELEASE} does not exist.')
     log('Teardown complete.')
+    log(f'Time spent per phase:\n{PHASES.report()}')
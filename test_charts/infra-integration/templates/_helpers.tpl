@@ -112,4 +112,10 @@ The BRO restore wait foreground job
 */}}
 {{- define "infra-integration.broRestoreReportJobName" -}}
 {{- print "eric-enm-bro-restore-report-job" -}}
-{{- end -}}
\ No newline at end of file
+{{- end -}}
+{{/*
+The extra permissions for the BRO restore hooks
+*/}}
+{{- define "infra-integration.hookRoleName" -}}
+{{- print "eric-enm-bro-restore-hook-role" -}}
+{{- end -}}
@@ -0,0 +1,62 @@
+"""
+pytest hooks for the unit tests.
+
+The hooks' waits run on the clock from common.set_clock, so a test that
+waits should patch time.sleep or use BaseTestCase.virtual_clock. Sleeping
+for real fails the test instead of slowing the whole suite down, and
+tests that still take longer than SLOW_TEST_SECONDS are listed at the end
+of the run.
+
+Every test starts with fresh retry policies, rate limiters and BRO
+clients, so results don't depend on which tests ran before in the same
+worker.
+"""
+import time
+
+import pytest
+
+from common import reset_shared_state
+
+SLOW_TEST_SECONDS = 1.0
+
+
+def _no_sleep(seconds):
+    raise AssertionError(
+        f'time.sleep({seconds}) called for real, patch time.sleep or use '
+        f'BaseTestCase.virtual_clock()')
+
+
+@pytest.fixture(autouse=True)
+def no_real_sleep(monkeypatch):
+    """
+    Fail any test that calls time.sleep without patching it. Tests that
+    patch time.sleep themselves replace this.
+    """
+    monkeypatch.setattr(time, 'sleep', _no_sleep)
+
+
+@pytest.fixture(autouse=True)
+def shared_state():
+    """
+    Start each test without the API state earlier tests left in common.
+    """
+    reset_shared_state()
+    yield
+    reset_shared_state()
+
+
+def pytest_terminal_summary(terminalreporter):
+    """
+    List the tests slower than SLOW_TEST_SECONDS.
+    """
+    slow = sorted(
+        (report for report in terminalreporter.stats.get('passed', [])
+         + terminalreporter.stats.get('failed', [])
+         if report.when == 'call' and report.duration > SLOW_TEST_SECONDS),
+        key=lambda report: report.duration, reverse=True)
+    if slow:
+        terminalreporter.write_sep('=', f'{len(slow)} tests slower than '
+                                        f'{SLOW_TEST_SECONDS}s')
+        for report in slow:
+            terminalreporter.write_line(
+                f'{report.duration:.2f}s {report.nodeid}')
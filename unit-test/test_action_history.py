@@ -0,0 +1,143 @@
+import json
+import os
+from unittest.mock import MagicMock, PropertyMock, patch
+
+from kubernetes.client.exceptions import ApiException
+from kubernetes.client.models.v1_config_map import V1ConfigMap
+
+from action_history import ActionHistory, history_key, percentile, \
+    size_bucket
+from common import BroCliBaseClass, HookTimeoutException
+from test_common import BaseTestCase
+
+
+def history(durations=None, key='RESTORE.DEFAULT.any'):
+    kube = MagicMock(name='m_kube')
+    data = {key: json.dumps(durations)} if durations is not None else {}
+    kube.get_configmap.return_value = V1ConfigMap(data=data)
+    return ActionHistory(kube, 'history'), kube
+
+
+class TestActionHistory(BaseTestCase):
+    def test_keys(self):
+        self.assertEqual('any', size_bucket(None))
+        self.assertEqual('s1', size_bucket(1))
+        self.assertEqual('s16', size_bucket(9))
+        self.assertEqual('s16', size_bucket(16))
+        self.assertEqual('RESTORE.DEFAULT.s32',
+                         history_key('RESTORE', 'DEFAULT', 20))
+        self.assertEqual('IMPORT.my_scope.any',
+                         history_key('IMPORT', 'my scope', None))
+
+    def test_percentile(self):
+        self.assertEqual(3, percentile([5, 1, 3], 0.5))
+        self.assertEqual(19, percentile(list(range(1, 21)), 0.95))
+        self.assertEqual(1, percentile([1], 0.95))
+
+    def test_not_enough_history(self):
+        klass, _ = history([100, 200])
+        self.assertIsNone(klass.predicted('RESTORE', 'DEFAULT'))
+        self.assertIsNone(klass.limit('RESTORE', 'DEFAULT'))
+        self.assertEqual(5, klass.poll_interval('RESTORE', 'DEFAULT',
+                                                default=5))
+
+    def test_predictions(self):
+        klass, kube = history([600, 300, 900, 1200])
+        self.assertEqual(600, klass.predicted('RESTORE', 'DEFAULT'))
+        self.assertEqual(1200, klass.p95('RESTORE', 'DEFAULT'))
+        self.assertEqual(3600, klass.limit('RESTORE', 'DEFAULT'))
+        self.assertEqual(10, klass.poll_interval('RESTORE', 'DEFAULT'))
+        self.assertIsNone(klass.limit('RESTORE', 'DEFAULT', 8))
+        kube.get_configmap.assert_called_once_with('history')
+
+        klass, _ = history([60000] * 3)
+        self.assertEqual(60, klass.poll_interval('RESTORE', 'DEFAULT'))
+
+    def test_unreadable(self):
+        klass, kube = history()
+        kube.get_configmap.side_effect = ApiException(status=403)
+        self.assertEqual([], klass.durations('RESTORE', 'DEFAULT'))
+        klass, _ = history('not a list')
+        self.assertEqual([], klass.durations('RESTORE', 'DEFAULT'))
+
+    def test_record(self):
+        klass, kube = history(list(range(1, 21)))
+        klass.record('RESTORE', 'DEFAULT', 42.04)
+        kube.patch_configmap_data.assert_called_once_with(
+            'history',
+            {'RESTORE.DEFAULT.any': json.dumps(
+                [float(duration) for duration in range(2, 21)] + [42.0])})
+        self.assertEqual(42, klass.durations('RESTORE', 'DEFAULT')[-1])
+
+    def test_record_creates_configmap(self):
+        klass, kube = history()
+        kube.patch_configmap_data.side_effect = ApiException(status=404)
+        klass.record('IMPORT', 'DEFAULT', 10, 3)
+        body = kube.create_configmap.call_args[0][0]
+        self.assertEqual('history', body.metadata.name)
+        self.assertEqual({'IMPORT.DEFAULT.s4': '[10]'}, body.data)
+
+    def test_record_failure_ignored(self):
+        klass, kube = history()
+        kube.patch_configmap_data.side_effect = ApiException(status=500)
+        klass.record('IMPORT', 'DEFAULT', 10)
+        kube.create_configmap.assert_not_called()
+        self.assertEqual([], klass.durations('IMPORT', 'DEFAULT'))
+
+    @patch('common.Bro')
+    @patch.dict(os.environ, {'HOOK_FAIL_STUCK_ACTIONS': 'true'})
+    def test_wait_for_action_stuck(self, _bro):
+        action = MagicMock(name='m_action', id='12345', state='RUNNING',
+                           progress=0.5, scope='DEFAULT')
+        action.name = 'RESTORE'
+        clock = self.virtual_clock()
+        klass = BroCliBaseClass()
+        klass.history, _ = history([1000, 1000, 1000])
+        with self.assertRaises(HookTimeoutException) as error:
+            klass.wait_for_action(action, 86400)
+        self.assertEqual(3000, clock.now())
+        self.assertEqual({10}, set(clock.sleeps))
+        self.assertIn('usually takes 1000s', str(error.exception))
+
+    @patch('common.Bro')
+    def test_wait_for_action_overrun(self, _bro):
+        clock = self.virtual_clock()
+        action = MagicMock(name='m_action', id='12345', progress=0.5,
+                           scope='DEFAULT', result='SUCCESS',
+                           additional_info=None)
+        action.name = 'RESTORE'
+        type(action).state = PropertyMock(
+            side_effect=lambda: 'RUNNING' if clock.now() < 5000
+            else 'COMPLETE')
+        klass = BroCliBaseClass()
+        klass.history, _ = history([1000, 1000, 1000])
+        with self.assertLogs('common', 'WARNING') as logs:
+            klass.wait_for_action(action, 86400)
+        self.assertEqual(5000, clock.now())
+        self.assertEqual(1, len(logs.output))
+        self.assertIn('RESTORE 12345 has been running for 3010s, longer '
+                      'than the 3000s', logs.output[0])
+
+    def test_timeout(self):
+        klass, _ = history()
+        self.assertFalse(klass.fail_stuck)
+        self.assertEqual(100, klass.timeout(100, 50))
+        self.assertFalse(klass.overrun('x', 50).check(40))
+        self.assertTrue(klass.overrun('x', 50).check(60))
+        with patch.dict(os.environ, {'HOOK_FAIL_STUCK_ACTIONS': 'true'}):
+            klass, _ = history()
+        self.assertEqual(50, klass.timeout(100, 50))
+        self.assertEqual(50, klass.timeout(None, 50))
+        self.assertFalse(klass.overrun('x', 50).check(60))
+
+    @patch('common.Bro')
+    def test_wait_for_action_recorded(self, _bro):
+        action = MagicMock(name='m_action', id='12345', state='COMPLETE',
+                           result='SUCCESS', scope='DEFAULT',
+                           additional_info=None, progress=1)
+        action.name = 'CREATE_BACKUP'
+        klass = BroCliBaseClass()
+        klass.history, kube = history()
+        klass.wait_for_action(action, size=5)
+        kube.patch_configmap_data.assert_called_once_with(
+            'history', {'CREATE_BACKUP.DEFAULT.s8': '[0.0]'})
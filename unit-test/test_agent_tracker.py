@@ -0,0 +1,170 @@
+from unittest.mock import MagicMock, PropertyMock, patch
+
+from kubernetes.client import V1ListMeta, V1ObjectMeta, V1Pod, \
+    V1PodCondition, V1PodList, V1PodStatus
+from kubernetes.client.exceptions import ApiException
+
+from agent_tracker import AgentPod, AgentTracker, agent_pod
+from common import BroCliBaseClass, DeadlineClock, HookException, \
+    HookTimeoutException, KubeApi, VirtualClock
+from test_common import BaseTestCase, PATCH_load_incluster_config, \
+    PATCH_load_kube_config
+
+
+def pod(name, agent, ready=False, backup_type=None):
+    return V1Pod(
+        metadata=V1ObjectMeta(
+            name=name, labels={'adpbrlabelkey': agent} if agent else {},
+            annotations={'backupType': backup_type} if backup_type else {}),
+        status=V1PodStatus(conditions=[V1PodCondition(
+            type='Ready', status=str(ready))]))
+
+
+def listing(*pods):
+    return V1PodList(metadata=V1ListMeta(resource_version='10'),
+                     items=list(pods))
+
+
+class TestAgentTracker(BaseTestCase):
+
+    def tracker(self, p_bro_api, *registered):
+        m_status = MagicMock(name='m_status')
+        p_bro_api.return_value.status = m_status
+        type(m_status).agents = PropertyMock(side_effect=list(registered))
+        return AgentTracker(KubeApi(), BroCliBaseClass())
+
+    def test_agent_pod(self):
+        self.assertEqual(AgentPod('a1', True, 'ROLLBACK'),
+                         agent_pod(pod('p1', 'a1', True, 'ROLLBACK')))
+        self.assertEqual(AgentPod('a2', False),
+                         agent_pod(V1Pod(metadata=V1ObjectMeta(
+                             name='p2', labels={'adpbrlabelkey': 'a2'}))))
+        self.assertIsNone(agent_pod(pod('p3', None, True)))
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.watch.Watch')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_wait_for_agents(self, p_bro_api, p_core, p_watch):
+        clock = VirtualClock()
+        p_core.return_value.list_namespaced_pod.return_value = listing(
+            pod('p1', 'a1', True), pod('p2', 'a2'))
+
+        def stream(*_args, **kwargs):
+            if p_watch.return_value.stream.call_count == 3:
+                clock.sleep(3)
+                return iter([{'type': 'MODIFIED',
+                              'object': pod('p2', 'a2', True)}])
+            clock.sleep(kwargs['timeout_seconds'])
+            return iter([])
+        p_watch.return_value.stream.side_effect = stream
+
+        tracker = self.tracker(p_bro_api, [], ['a1'], ['a1'], ['a1', 'a2'],
+                               ['a1', 'a2'], ['a1', 'a2', 'a3'])
+        with self.assertLogs('common', 'INFO') as logs:
+            self.assertEqual(['a1', 'a2', 'a3'], tracker.wait_for_agents(
+                ['a1', 'a2', 'a3'], DeadlineClock(clock, None, 'agents')))
+        self.assertEqual([2, 4, 8, 2, 4], [
+            stream_call[1]['timeout_seconds'] for stream_call in
+            p_watch.return_value.stream.call_args_list])
+        self.assertEqual(17, clock.now())
+        p_core.return_value.list_namespaced_pod.assert_called_once_with(
+            self.namespace(), label_selector='adpbrlabelkey')
+        output = '\n'.join(logs.output)
+        self.assertIn('Waiting for 3 of 3 agents to register: a1, a2, a3, '
+                      '1 with Ready pods', output)
+        self.assertIn('Agent a1 registered after 2s', output)
+        self.assertIn('Pods Ready for a2', output)
+        self.assertIn('Agent a2 registered after 11s', output)
+        self.assertIn('All 3 agents registered after 17s', output)
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.watch.Watch')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_wait_for_backup_type(self, p_bro_api, p_core, p_watch):
+        clock = VirtualClock()
+        p_core.return_value.list_namespaced_pod.side_effect = [
+            listing(pod('p1', 'a1', False, 'ROLLBACK'), pod('p2', 'a2')),
+            listing(pod('p1', 'a1', True, 'ROLLBACK'),
+                    pod('p3', 'a3', True, 'ROLLBACK'))]
+
+        def expired(*_args, **_kwargs):
+            clock.sleep(1)
+            raise ApiException(status=410)
+        p_watch.return_value.stream.side_effect = expired
+
+        tracker = self.tracker(p_bro_api, [], ['a1', 'a3'])
+        self.assertEqual(['a1', 'a3'], tracker.wait_for_agents(
+            None, DeadlineClock(clock, None, 'agents'), 'ROLLBACK'))
+        self.assertEqual(['a1', 'a3'], tracker.agents())
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.watch.Watch')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_timeout(self, p_bro_api, p_core, p_watch):
+        clock = VirtualClock()
+        p_core.return_value.list_namespaced_pod.return_value = listing()
+
+        def stream(*_args, **kwargs):
+            clock.sleep(kwargs['timeout_seconds'])
+            return iter([{'type': 'ADDED', 'object': pod('p1', 'a1')}])
+        p_watch.return_value.stream.side_effect = stream
+
+        tracker = self.tracker(p_bro_api, *[[]] * 20)
+        with self.assertRaises(HookTimeoutException):
+            tracker.wait_for_agents(['a1'],
+                                    DeadlineClock(clock, 300, 'agents'))
+        self.assertEqual([2, 4, 8, 16] + [30] * 9, [
+            stream_call[1]['timeout_seconds'] for stream_call in
+            p_watch.return_value.stream.call_args_list])
+        self.assertEqual({'p1': AgentPod('a1', False)}, tracker.pods)
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.watch.Watch')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_pods_forbidden(self, p_bro_api, p_core, p_watch):
+        clock = VirtualClock()
+        p_core.return_value.list_namespaced_pod.side_effect = \
+            ApiException(status=403, reason='Forbidden')
+
+        tracker = self.tracker(p_bro_api, [], ['a1'], ['a1', 'a2'])
+        with self.assertLogs('common', 'WARNING') as logs:
+            self.assertEqual(['a1', 'a2'], tracker.wait_for_agents(
+                ['a1', 'a2'], DeadlineClock(clock, None, 'agents')))
+        self.assertEqual([10, 10], clock.sleeps)
+        self.assertFalse(tracker.watching)
+        p_watch.return_value.stream.assert_not_called()
+        self.assertIn('Cannot read the agent pods (403 Forbidden), polling '
+                      'BRO every 10s', logs.output[0])
+
+        with self.assertRaises(HookException):
+            tracker.wait_for_agents(None, DeadlineClock(clock, None, 'agents'),
+                                    'ROLLBACK')
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.watch.Watch')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_watch_forbidden(self, p_bro_api, p_core, p_watch):
+        clock = VirtualClock()
+        p_core.return_value.list_namespaced_pod.return_value = listing(
+            pod('p1', 'a1'))
+        p_watch.return_value.stream.side_effect = ApiException(status=403)
+
+        tracker = self.tracker(p_bro_api, [], [], ['a1'])
+        self.assertEqual(['a1'], tracker.wait_for_agents(
+            ['a1'], DeadlineClock(clock, None, 'agents')))
+        p_watch.return_value.stream.assert_called_once()
+        self.assertEqual([2, 10], clock.sleeps)
+        self.assertEqual({}, tracker.pods)
+        p_core.return_value.list_namespaced_pod.side_effect = \
+            ApiException(status=500)
+        self.assertRaises(ApiException, tracker.list_pods)
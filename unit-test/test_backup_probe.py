@@ -0,0 +1,143 @@
+import io
+import json
+import os
+import tarfile
+from os.path import join
+from unittest.mock import MagicMock, patch
+
+from backup_probe import BackupVersionProbe, LocalLocation, ProbedBackup, \
+    application_version, normalise_uri
+from test_common import BaseTestCase
+
+
+def write_tarball(path, files):
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, data in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def metadata(version):
+    return json.dumps({
+        'id': 'backup', 'status': 'COMPLETE',
+        'softwareVersions': [
+            {'agentId': 'eric-enm-agent', 'productRevision': '1.0'},
+            {'agentId': 'APPLICATION_INFO', 'productRevision': version}
+        ]}).encode()
+
+
+class TestBackupVersionProbe(BaseTestCase):
+
+    def uri(self):
+        return f'file://{self.tmpdir}'
+
+    def test_application_version(self):
+        self.assertEqual('24.1', application_version(metadata('24.1')))
+        self.assertIsNone(application_version(b'not json'))
+        self.assertIsNone(application_version(b'[1, 2]'))
+        self.assertIsNone(application_version(b'{"id": "x"}'))
+
+    def test_normalise_uri(self):
+        self.assertEqual('sftp://u@host/path', normalise_uri('u@host/path'))
+        self.assertEqual('file:///path', normalise_uri('file:///path'))
+
+    def test_product_version_tarball(self):
+        write_tarball(join(self.tmpdir, 'backup-2024.tar.gz'), [
+            ('DEFAULT/backup/agent/data.bin', os.urandom(2048)),
+            ('DEFAULT/backups/backup.json', metadata('24.1'))])
+        probe = BackupVersionProbe()
+        self.assertEqual('24.1', probe.product_version(
+            self.uri(), '', 'backup-2024.tar.gz'))
+        self.assertEqual('24.1', probe.product_version(
+            self.uri(), '', 'backup'))
+        self.assertIsNone(probe.product_version(self.uri(), '', 'other'))
+
+    def test_probe_size(self):
+        tarball = join(self.tmpdir, 'backup.tar.gz')
+        write_tarball(tarball, [
+            ('DEFAULT/backups/backup.json', metadata('24.1'))])
+        probe = BackupVersionProbe()
+        self.assertEqual(('24.1', os.path.getsize(tarball)), probe.probe(
+            self.uri(), '', 'backup'))
+        self.assertEqual(ProbedBackup(), probe.probe(
+            self.uri(), '', 'other'))
+
+        with open(join(self.tmpdir, 'corrupt.tar.gz'), 'wb') as _writer:
+            _writer.write(b'not a tarball')
+        self.assertEqual((None, 13), probe.probe(
+            self.uri(), '', 'corrupt.tar.gz'))
+
+    def test_find_tarball(self):
+        for name in ('foo.tar.gz', 'foo-old.tar.gz', 'foobar.tar.gz',
+                     'foo-2024-01-02T10:00:00.123456Z.tar.gz'):
+            write_tarball(join(self.tmpdir, name), [])
+        find = BackupVersionProbe.find_tarball
+        self.assertEqual(join(self.tmpdir, 'foo.tar.gz'),
+                         find(LocalLocation(), self.tmpdir, 'foo'))
+        os.remove(join(self.tmpdir, 'foo.tar.gz'))
+        self.assertEqual(
+            join(self.tmpdir, 'foo-2024-01-02T10:00:00.123456Z.tar.gz'),
+            find(LocalLocation(), self.tmpdir, 'foo'))
+        self.assertIsNone(find(LocalLocation(), self.tmpdir, 'fo'))
+        self.assertIsNone(find(LocalLocation(), self.tmpdir, 'foo-ol'))
+
+    @patch('backup_probe.paramiko')
+    def test_sftp_host_key(self, p_paramiko):
+        client = p_paramiko.SSHClient.return_value
+        known_hosts = join(self.tmpdir, 'externalStorageKnownHosts')
+        with open(known_hosts, 'w') as _writer:
+            _writer.write('sftp ssh-ed25519 AAAA\n')
+
+        BackupVersionProbe(known_hosts=known_hosts).open_location(
+            'sftp://user@sftp:2222/backups', 'password')
+        client.load_system_host_keys.assert_called_once_with()
+        client.load_host_keys.assert_called_once_with(known_hosts)
+        client.set_missing_host_key_policy.assert_called_once_with(
+            p_paramiko.RejectPolicy.return_value)
+        p_paramiko.AutoAddPolicy.assert_not_called()
+        self.assertEqual(('sftp',), client.connect.call_args[0])
+        self.assertEqual(2222, client.connect.call_args[1]['port'])
+
+        client.reset_mock()
+        with self.assertLogs('common', 'WARNING'):
+            BackupVersionProbe(accept_unknown_host_key=True).open_location(
+                'user@sftp/backups', 'password')
+        client.load_host_keys.assert_not_called()
+        client.set_missing_host_key_policy.assert_called_once_with(
+            p_paramiko.AutoAddPolicy.return_value)
+
+    @patch('backup_probe.paramiko')
+    def test_sftp_unknown_host_key(self, p_paramiko):
+        p_paramiko.SSHException = type('SSHException', (Exception,), {})
+        p_paramiko.SSHClient.return_value.connect.side_effect = \
+            p_paramiko.SSHException('Server not found in known_hosts')
+        with patch('backup_probe.PROBE_ERRORS', (p_paramiko.SSHException,)):
+            with self.assertLogs('common', 'WARNING') as logs:
+                self.assertEqual(ProbedBackup(), BackupVersionProbe().probe(
+                    'sftp://user@sftp/backups', 'password', 'backup'))
+        self.assertIn('not found in known_hosts', logs.output[0])
+
+    def test_product_version_not_found(self):
+        write_tarball(join(self.tmpdir, 'backup.tar.gz'), [
+            ('DEFAULT/backup/agent/data.bin', os.urandom(64 * 1024)),
+            ('DEFAULT/backups/backup.json', metadata('24.1'))])
+        probe = BackupVersionProbe(max_scan_bytes=1024)
+        self.assertIsNone(probe.product_version(
+            self.uri(), '', 'backup.tar.gz'))
+
+        write_tarball(join(self.tmpdir, 'nometa.tar.gz'), [
+            ('DEFAULT/backups/backup.json', b'{"id": "backup"}')])
+        self.assertIsNone(BackupVersionProbe().product_version(
+            self.uri(), '', 'nometa.tar.gz'))
+
+    def test_product_version_errors(self):
+        probe = BackupVersionProbe()
+        self.assertIsNone(probe.product_version(
+            self.uri(), '', 'missing.tar.gz'))
+        with open(join(self.tmpdir, 'corrupt.tar.gz'), 'wb') as _writer:
+            _writer.write(b'not a tarball')
+        self.assertIsNone(probe.product_version(
+            self.uri(), '', 'corrupt.tar.gz'))
+        self.assertIsNone(probe.product_version(
+            'externalStorageURI', '', 'backup.tar.gz'))
@@ -6,6 +6,7 @@ from kubernetes.client.models.v1_object_meta import V1ObjectMeta
 
 from test_common import BaseTestCase, BroAction, BroBackup
 from bro_bm_config import BroBMConfig, main
+from bro_config_spec import RetentionSpec, ScheduleSpec
 from common import HookException
 
 class TestBroBMConfig(BaseTestCase):
@@ -154,7 +155,7 @@ class TestBroBMConfig(BaseTestCase):
 
         main(['-b', 'some_backup', '-s', 'DEFAULT', '-c', 'br_config_map'])
         m_do_restore.assert_called_once_with(
-            'some_backup', 'DEFAULT')
+            'some_backup', 'DEFAULT', timeout=None)
         m_reset_restore_state.assert_called_once_with('br_config_map')
 
     @patch('bro_bm_config.ScheduleControl')
@@ -180,7 +181,8 @@ class TestBroBMConfig(BaseTestCase):
         p_reset_bro_config_map.return_value.reset_restore_state = m_reset_restore_state
 
         main(['-b', '-', '-s', '-', '-c', 'br_config_map', '--values', args_values])
-        m_configure_scheduling.assert_called_once_with(args_values, None)
+        m_configure_scheduling.assert_called_once_with(
+            ScheduleSpec(True, 'S_B', ()), None, timeout=None)
         m_reset_restore_state.assert_called_once_with('br_config_map')
 
     @patch('bro_bm_config.ResetBroConfigMap')
@@ -201,6 +203,8 @@ class TestBroBMConfig(BaseTestCase):
         p_reset_bro_config_map.return_value.reset_restore_state = m_reset_restore_state
 
         main(['-b', '-', '-s', '-', '-c', 'br_config_map', '--values', args_values])
-        m_configure_retention.assert_called_once()
-        m_configure_scheduling.assert_called_once_with(args_values, None)
+        m_configure_retention.assert_called_once_with(RetentionSpec(2, True),
+                                                      timeout=None)
+        m_configure_scheduling.assert_called_once_with(
+            ScheduleSpec(True, 'S_B', ()), None, timeout=None)
         m_reset_restore_state.assert_called_once_with('br_config_map')
@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from bro_config_spec import Interval, RetentionSpec, ScheduleSpec, \
+    parse_retention, parse_scheduling
+from common import HookException
+
+
+class TestParseScheduling(TestCase):
+    def test_disabled(self):
+        self.assertEqual(ScheduleSpec(enabled=False), parse_scheduling('-'))
+        self.assertEqual(ScheduleSpec(enabled=False), parse_scheduling(None))
+
+    def test_defaults(self):
+        self.assertEqual(ScheduleSpec(True, 'SCHEDULED_BACKUP', ()),
+                         parse_scheduling('{}'))
+
+    def test_intervals(self):
+        spec = parse_scheduling(
+            '{"backupPrefix": "NIGHTLY", "schedules": ['
+            '{"every": "1w2d", "start": "2022-10-22T04:00:00"},'
+            '{"every": "6h30m", "stop": "2022-10-23T05:00:00"},'
+            '{"every": "1d", "start": null},'
+            '{"dayOfWeek": "Tue", "startTime": "02:00"}, {"start": "x"}]}')
+        self.assertEqual('NIGHTLY', spec.prefix)
+        self.assertEqual((
+            Interval('1', '2', None, None, '2022-10-22T04:00:00', None),
+            Interval(None, None, '6', '30', None, '2022-10-23T05:00:00'),
+            Interval(None, '1', None, None, None, None)), spec.intervals)
+        with self.assertRaises(AttributeError):
+            spec.prefix = 'OTHER'
+
+    def test_invalid(self):
+        for values in ('null', '"1d"', '{"backupPrefix": ""}',
+                       '{"schedules": "1d"}', '{"schedules": [null]}'):
+            self.assertRaises(HookException, parse_scheduling, values)
+
+    def test_invalid_schedule(self):
+        for schedule in ('{"every": "1week"}', '{"every": null}',
+                         '{"every": ""}', '{"every": "1d", "start": "x"}',
+                         '{"every": "1d", "stop": "2022/10/22"}',
+                         '{"every": "1d", "stop": "null"}'):
+            with self.assertRaises(HookException, msg=schedule):
+                parse_scheduling(
+                    f'{{"schedules": [{{"every": "1d"}}, {schedule}]}}')
+
+
+class TestParseRetention(TestCase):
+    def test_defaults(self):
+        self.assertEqual(RetentionSpec(2, True), parse_retention(None))
+        self.assertEqual(RetentionSpec(2, True), parse_retention('{}'))
+
+    def test_values(self):
+        self.assertEqual(RetentionSpec(5, False), parse_retention(
+            '{"limit": "5", "autoDelete": false}'))
+
+    def test_invalid(self):
+        for values in ('[]', '{"limit": "many"}', '{"limit": 0}',
+                       '{"limit": true}', '{"autoDelete": "yes"}'):
+            self.assertRaises(HookException, parse_retention, values)
@@ -1,10 +1,36 @@
+from collections import namedtuple
 from unittest.mock import MagicMock, PropertyMock, patch
 
+from kubernetes.client.exceptions import ApiException
+from kubernetes.client.models.v1_config_map import V1ConfigMap
+from kubernetes.client.models.v1_object_meta import V1ObjectMeta
+
 from test_common import BaseTestCase, BroAction, BroBackup, PATCH_load_incluster_config, \
     PATCH_load_kube_config
 from bro_pre_upgrade_backup_trigger import BroPreUpgradeBackup, main
 from common import HookException
 
+Backup = namedtuple('Backup', ['name', 'status'])
+Service = namedtuple('Service', ['name', 'agent_id', 'version'])
+
+
+def installed(core, version='12.34', started=None):
+    def read(name, *_args, **_kwargs):
+        if name == 'product-version-configmap':
+            return V1ConfigMap(metadata=V1ObjectMeta(
+                name=name,
+                annotations={'ericsson.com/product-revision': version}))
+        if name == 'eric-enm-pre-upgrade-backup' and started:
+            return V1ConfigMap(data=dict(started, BACKUP='test'))
+        raise ApiException(status=404)
+    core.return_value.read_namespaced_config_map.side_effect = read
+
+
+def backup_of(version):
+    return BroBackup('test', [
+        Service('Ericsson Network Manager', 'APPLICATION_INFO', version)])
+
+
 class TestBroPreUpgradeBackupTrigger(BaseTestCase):
 
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
@@ -31,9 +57,19 @@ class TestBroPreUpgradeBackupTrigger(BaseTestCase):
             name='m_create', side_effect=[a1])
         m_bro.create = m_create
 
+        installed(p_core)
+        p_core.return_value.patch_namespaced_config_map.side_effect = \
+            ApiException(status=404)
+
         klass = BroPreUpgradeBackup()
         klass.execute_pre_upgrade("test")
         m_create.assert_called_once_with("test", "ROLLBACK")
+        created = {args[1].metadata.name: args[1].data for args, _ in
+                   p_core.return_value.create_namespaced_config_map
+                   .call_args_list}
+        self.assertEqual({'BACKUP': 'test', 'PRODUCT_VERSION': '12.34',
+                          'ACTION_ID': '12345'},
+                         created['eric-enm-pre-upgrade-backup'])
 
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
     @patch('common.load_kube_config', new=PATCH_load_kube_config)
@@ -62,5 +98,153 @@ class TestBroPreUpgradeBackupTrigger(BaseTestCase):
         klass = BroPreUpgradeBackup()
         self.assertRaises(HookException, klass.execute_pre_upgrade, 'test')
 
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_execute_pre_upgrade_backup_complete(self, p_bro_api, p_core):
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+        m_bro.backups.return_value = [Backup('other', 'INCOMPLETE'),
+                                      Backup('test', 'COMPLETE')]
+        m_bro.get_backup.return_value = backup_of('12.34')
+        installed(p_core)
+
+        BroPreUpgradeBackup().execute_pre_upgrade('test')
+        m_bro.backups.assert_called_once_with('ROLLBACK')
+        m_bro.get_backup.assert_called_once_with('test', 'ROLLBACK')
+        m_bro.create.assert_not_called()
+        m_bro.actions.assert_not_called()
+        p_core.return_value.list_namespaced_pod.assert_not_called()
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_execute_pre_upgrade_backup_other_version(self, p_bro_api,
+                                                      p_core):
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+        m_bro.backups.return_value = [Backup('test', 'COMPLETE')]
+        m_bro.get_backup.return_value = backup_of('12.30')
+        installed(p_core)
+
+        with self.assertRaises(HookException) as error:
+            BroPreUpgradeBackup().execute_pre_upgrade('test')
+        self.assertIn('product version 12.30, not 12.34 this upgrade '
+                      'started from', str(error.exception))
+        m_bro.create.assert_not_called()
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_execute_pre_upgrade_backup_partly_upgraded(self, p_bro_api,
+                                                        p_core):
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+        m_bro.backups.return_value = [Backup('test', 'COMPLETE')]
+        m_bro.get_backup.return_value = backup_of('12.34')
+        # The first attempt already bumped the installed product version
+        installed(p_core, '12.40', {'PRODUCT_VERSION': '12.34',
+                                    'ACTION_ID': '12345'})
+
+        BroPreUpgradeBackup().execute_pre_upgrade('test')
+        m_bro.create.assert_not_called()
+
+        m_bro.get_backup.return_value = backup_of('12.40')
+        self.assertRaises(HookException,
+                          BroPreUpgradeBackup().execute_pre_upgrade, 'test')
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('time.sleep')
+    @patch('common.Bro')
+    def test_execute_pre_upgrade_backup_running(self, p_bro_api, p_sleep,
+                                                p_core):
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+        m_bro.backups.return_value = [Backup('test', 'INCOMPLETE')]
+
+        m_bro.get_backup.return_value = backup_of('12.34')
+        installed(p_core, started={'PRODUCT_VERSION': '12.34',
+                                   'ACTION_ID': '12345'})
+
+        action = MagicMock(name='m_action', id='12345', scope='ROLLBACK',
+                           result='SUCCESS', additional_info=None,
+                           progress=0.5)
+        action.name = 'CREATE_BACKUP'
+        m_state = PropertyMock(
+            side_effect=['RUNNING', 'RUNNING', 'RUNNING', 'COMPLETE',
+                         'COMPLETE'])
+        type(action).state = m_state
+        finished = MagicMock(name='m_finished', id='12344',
+                             state='COMPLETE')
+        finished.name = 'CREATE_BACKUP'
+        other = MagicMock(name='m_other', id='12346', state='RUNNING',
+                          additional_info='Creating backup test')
+        other.name = 'CREATE_BACKUP'
+        m_bro.actions.return_value = [finished, other, action]
+
+        BroPreUpgradeBackup().execute_pre_upgrade('test')
+        m_bro.create.assert_not_called()
+        m_bro.actions.assert_called_once_with('ROLLBACK')
+        self.assertEqual(1, p_sleep.call_count)
+        # The finished backup is checked too
+        m_bro.get_backup.assert_called_once_with('test', 'ROLLBACK')
+        p_core.return_value.patch_namespaced_config_map.assert_not_called()
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_execute_pre_upgrade_backup_running_other_version(
+            self, p_bro_api, p_core):
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+        m_bro.backups.return_value = [Backup('test', 'INCOMPLETE')]
+        m_bro.get_backup.return_value = backup_of('12.30')
+        installed(p_core)
+        action = MagicMock(name='m_action', id='12345', state='RUNNING',
+                           additional_info='Creating backup test')
+        action.name = 'CREATE_BACKUP'
+        with patch.object(BroPreUpgradeBackup, 'wait_for_action') as p_wait:
+            with self.assertRaises(HookException) as error:
+                m_bro.actions.return_value = [action]
+                BroPreUpgradeBackup().execute_pre_upgrade('test')
+        p_wait.assert_called_once_with(action, None, record=False)
+        self.assertIn('product version 12.30', str(error.exception))
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_execute_pre_upgrade_backup_incomplete(self, p_bro_api, _core):
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+        m_bro.backups.return_value = [Backup('test', 'CORRUPTED')]
+        m_bro.actions.return_value = []
+        installed(_core)
+
+        with self.assertRaises(HookException) as error:
+            BroPreUpgradeBackup().execute_pre_upgrade('test')
+        self.assertIn('status CORRUPTED', str(error.exception))
+        m_bro.create.assert_not_called()
+
+    def test_creates_backup(self):
+        action = MagicMock(name='m_action', state='RUNNING',
+                           additional_info='Backup test is being created')
+        action.name = 'CREATE_BACKUP'
+        self.assertTrue(BroPreUpgradeBackup.creates_backup(action, 'test'))
+        self.assertFalse(BroPreUpgradeBackup.creates_backup(action, 'tes'))
+        action.additional_info = 'Backup test-2 is being created'
+        self.assertFalse(BroPreUpgradeBackup.creates_backup(action, 'test'))
+        action.additional_info = None
+        self.assertFalse(BroPreUpgradeBackup.creates_backup(action, 'test'))
+        action.additional_info = 'test'
+        action.state = 'COMPLETE'
+        self.assertFalse(BroPreUpgradeBackup.creates_backup(action, 'test'))
+
     def test_main_missing_args(self):
         self.assertRaises(SystemExit, main, [])
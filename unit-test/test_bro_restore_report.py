@@ -77,6 +77,28 @@ class TestBroRestoreWait(BaseTestCase):
         finally:
             type(action_run_complete).state = list
 
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.Bro')
+    @patch('common.CoreV1Api')
+    def test_show_restore_progress(self, p_core, p_bro_api):
+        p_core.return_value.read_namespaced_config_map.return_value = \
+            V1ConfigMap(data={
+                'RESTORE_ACTION_ID': '12', 'RESTORE_PROGRESS': '40',
+                'RESTORE_PROGRESS_INFO': 'Stage: EXECUTION',
+                'RESTORE_ETA_SECONDS': '90',
+                'RESTORE_PROGRESS_UPDATED': '2024-01-02T03:04:05Z'})
+        p_bro_api.return_value.actions.return_value = [BroAction(
+            name='RESTORE', id='12', progress_info=None, result='SUCCESS',
+            state='COMPLETE', scope='DEFAULT', start_time='',
+            completion_time='', progress=1, additional_info=None)]
+
+        with self.assertLogs('common', 'INFO') as logs:
+            BroRestoreReport().show_restore_action('cfg_map', 'DEFAULT')
+        self.assertIn('Restore progress: 40%, ETA 90s, updated '
+                      '2024-01-02T03:04:05Z: Stage: EXECUTION',
+                      '\n'.join(logs.output))
+
     @patch('bro_restore_report.BroRestoreReport')
     def test_main(self, p_report_hook):
         p_report_hook.return_value = MagicMock(
@@ -86,4 +108,5 @@ class TestBroRestoreWait(BaseTestCase):
 
         self.assertRaises(SystemExit, main, [])
         main(['-c', 'cfm_map', '-s', 'DEFAULT'])
-        m_show_restore_action.assert_called_once_with('cfm_map', 'DEFAULT')
+        m_show_restore_action.assert_called_once_with('cfm_map', 'DEFAULT',
+                                                      timeout=None)
@@ -1,5 +1,7 @@
-from unittest.mock import MagicMock, PropertyMock, call, patch
+import os
+from unittest.mock import ANY, MagicMock, PropertyMock, call, patch
 
+from kubernetes.client.exceptions import ApiException
 from kubernetes.client.models.v1_config_map import V1ConfigMap
 from kubernetes.client.models.v1_config_map_list import V1ConfigMapList
 from kubernetes.client.models.v1_object_meta import V1ObjectMeta
@@ -7,7 +9,7 @@ from kubernetes.client.models.v1_object_meta import V1ObjectMeta
 from test_common import BaseTestCase, BroAction, PATCH_load_incluster_config, \
     PATCH_load_kube_config, BroBackup, BroService
 from bro_restore_runner import BroRestoreRunner, main
-from common import HookException
+from common import DeadlineClock, HookException, VirtualClock
 
 
 class TestBroRestoreRunner(BaseTestCase):
@@ -52,8 +54,12 @@ class TestBroRestoreRunner(BaseTestCase):
             klass = BroRestoreRunner()
             waiting = klass.execute_restore('backup', 'ROLLBACK', 'cfg-map')
             self.assertFalse(waiting)
-            m_patch.assert_called_once_with('cfg-map', self.namespace(),
-                                            cfg_map)
+            m_patch.assert_any_call('cfg-map', self.namespace(), cfg_map)
+            m_patch.assert_called_with(
+                'eric-enm-hook-action-history', self.namespace(),
+                {'data': {'RESTORE.ROLLBACK.any': '[0.0]'}})
+            self.assertEqual('12345', cfg_map.data['RESTORE_ACTION_ID'])
+            self.assertEqual('0', cfg_map.data['RESTORE_PROGRESS'])
         finally:
             type(a1).state = str
 
@@ -76,8 +82,15 @@ class TestBroRestoreRunner(BaseTestCase):
 
         m_bro.restore = MagicMock(name='m_restore', return_value=a1)
         klass = BroRestoreRunner()
-        waiting = klass.execute_restore('backup', 'ROLLBACK', 'cfg-map')
-        self.assertTrue(waiting)
+        missing = klass.execute_restore('backup', 'ROLLBACK', 'cfg-map')
+        self.assertEqual(['s1', 's2', 's3'], missing)
+
+    def test_missing_agents(self):
+        self.assertEqual(['s1', 's2'], BroRestoreRunner.missing_agents(
+            'Agents with the following IDs are required: [s1, s2]'))
+        self.assertEqual(['*'], BroRestoreRunner.missing_agents(
+            'Failing job for not having any registered agents'))
+        self.assertEqual([], BroRestoreRunner.missing_agents('None'))
 
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
     @patch('common.load_kube_config', new=PATCH_load_kube_config)
@@ -109,7 +122,8 @@ class TestBroRestoreRunner(BaseTestCase):
             metadata=V1ObjectMeta(name='cfg-map'),
             data={}
         )
-        p_core.return_value.read_namespaced_config_map.side_effect = [cfg_map]
+        p_core.return_value.read_namespaced_config_map.side_effect = [
+            cfg_map, cfg_map]
 
         m_patch_namespaced_config_map = MagicMock(name='m_patch')
         p_core.return_value.patch_namespaced_config_map = \
@@ -118,36 +132,170 @@ class TestBroRestoreRunner(BaseTestCase):
         m_bro = MagicMock(name='m_bro')
         p_bro_api.return_value = m_bro
 
-        m_agents = PropertyMock(name='m_agents', side_effect=[
-            ['postgres'],
-            ['postgres', 'eric-enm-mdt-bro-agent'],
-            ['postgres', 'eric-enm-mdt-bro-agent'],
-            ['postgres', 'eric-enm-mdt-bro-agent'],
-            ['postgres', 'eric-enm-mdt-bro-agent']
-        ])
-        m_status = PropertyMock(name='m_status', return_value=m_agents)
-        m_bro.status = m_status
-
-        type(m_status).agents = m_agents
-
         m_bro.get_backup.return_value = BroBackup(
             'backup', [BroService('mdt', 'eric-enm-mdt-bro-agent'), BroService('pg', 'postgres')]
         )
 
         klass = BroRestoreRunner()
+        klass.agents = MagicMock(name='m_agents')
         klass.execute_restore = MagicMock(
-            name='m_execute_restore', side_effect=[True, False])
-        try:
-            klass.do_restore('backup', 'cfg-map', 'ROLLBACK')
-        finally:
-            type(m_status).agents = list
+            name='m_execute_restore',
+            side_effect=[['eric-enm-mdt-bro-agent'], []])
+        klass.do_restore('backup', 'cfg-map', 'ROLLBACK')
+        self.assertEqual([
+            call(['eric-enm-mdt-bro-agent', 'postgres'], ANY),
+            call(['eric-enm-mdt-bro-agent'], ANY)],
+            klass.agents.wait_for_agents.call_args_list)
 
         self.assertIn('RESTORE_STATE', cfg_map.data)
         self.assertEqual('finished', cfg_map.data['RESTORE_STATE'])
         m_patch_namespaced_config_map.assert_called_once_with(
             'cfg-map', self.namespace(), cfg_map)
 
-        p_sleep.assert_called_once_with(30)
+        p_sleep.assert_not_called()
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('time.sleep')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_do_restore_resume_running(self, p_bro_api, p_core, p_sleep):
+        cfg_map = V1ConfigMap(
+            metadata=V1ObjectMeta(name='cfg-map'),
+            data={'RESTORE_ACTION_ID': '12345',
+                  'RESTORE_ACTION_BACKUP': 'backup',
+                  'RESTORE_PHASE': 'restoring'}
+        )
+        p_core.return_value.read_namespaced_config_map.return_value = cfg_map
+        m_patch = p_core.return_value.patch_namespaced_config_map
+
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+        m_bro.get_backup.return_value = BroBackup(
+            'backup', [BroService('pg', 'postgres')])
+
+        m_state = PropertyMock(name='m_state', side_effect=[
+            'RUNNING', 'RUNNING', 'FINISHED', 'FINISHED'])
+        running = MagicMock(name='m_action', id='12345', result='SUCCESS',
+                            progress=0.5, progress_info='',
+                            additional_info=None)
+        type(running).state = m_state
+        m_bro.actions.return_value = [running]
+
+        klass = BroRestoreRunner()
+        klass.do_restore('backup', 'cfg-map', 'ROLLBACK')
+
+        m_bro.restore.assert_not_called()
+        m_bro.actions.assert_called_once_with('ROLLBACK')
+        p_sleep.assert_called_once_with(10)
+        self.assertEqual(2, m_patch.call_count)
+        progress = m_patch.call_args_list[0][0][2]['data']
+        self.assertEqual('50', progress['RESTORE_PROGRESS'])
+        self.assertEqual('', progress['RESTORE_ETA_SECONDS'])
+        m_patch.assert_called_with('cfg-map', self.namespace(), cfg_map)
+        self.assertEqual('finished', cfg_map.data['RESTORE_STATE'])
+        self.assertEqual('finished', cfg_map.data['RESTORE_PHASE'])
+        self.assertEqual('100', cfg_map.data['RESTORE_PROGRESS'])
+        self.assertEqual('0', cfg_map.data['RESTORE_ETA_SECONDS'])
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('time.sleep')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_resume_restore(self, p_bro_api, p_core, _sleep):
+        cfg_map = V1ConfigMap(
+            metadata=V1ObjectMeta(name='cfg-map'),
+            data={'RESTORE_ACTION_ID': '12345',
+                  'RESTORE_ACTION_BACKUP': 'other_backup'}
+        )
+        p_core.return_value.read_namespaced_config_map.return_value = cfg_map
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+
+        klass = BroRestoreRunner()
+        self.assertIsNone(
+            klass.resume_restore('backup', 'ROLLBACK', 'cfg-map'))
+        m_bro.actions.assert_not_called()
+
+        cfg_map.data['RESTORE_ACTION_BACKUP'] = 'backup'
+        m_bro.actions.return_value = []
+        self.assertIsNone(
+            klass.resume_restore('backup', 'ROLLBACK', 'cfg-map'))
+
+        failed = MagicMock(name='m_failed', id='12345', state='FINISHED',
+                           result='FAILURE')
+        m_bro.actions.return_value = [failed]
+        self.assertIsNone(
+            klass.resume_restore('backup', 'ROLLBACK', 'cfg-map'))
+
+        done = MagicMock(name='m_done', id='12345', state='FINISHED',
+                         result='SUCCESS', additional_info=None, progress=1)
+        m_bro.actions.return_value = [done]
+        self.assertFalse(
+            klass.resume_restore('backup', 'ROLLBACK', 'cfg-map'))
+        m_bro.restore.assert_not_called()
+
+        p_core.return_value.read_namespaced_config_map.side_effect = \
+            ApiException(status=404)
+        self.assertIsNone(
+            klass.resume_restore('backup', 'ROLLBACK', 'cfg-map'))
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_monitor_restore_progress(self, p_bro_api, p_core):
+        m_patch = p_core.return_value.patch_namespaced_config_map
+        clock = VirtualClock()
+        progress = iter([0.1, 0.12, 0.14, 0.25, 0.26])
+        action = MagicMock(name='m_action', id='12345', result='SUCCESS',
+                           progress_info='', additional_info=None)
+        type(action).state = PropertyMock(side_effect=lambda: 'RUNNING' if
+                                          clock.now() < 50 else 'FINISHED')
+        type(action).progress = PropertyMock(
+            side_effect=lambda: next(progress, 1.0))
+
+        klass = BroRestoreRunner()
+        klass._monitor_restore(action, 'backup', 'cfg-map',
+                               DeadlineClock(clock, None, 'restore'), True)
+
+        published = [args[2]['data']['RESTORE_PROGRESS']
+                     for args, _ in m_patch.call_args_list]
+        self.assertEqual(['10', '25'], published)
+        self.assertEqual('150', m_patch.call_args[0][2]['data'][
+            'RESTORE_ETA_SECONDS'])
+        m_patch.side_effect = ApiException(status=404)
+        klass._publish_progress('cfg-map', 'info')
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    @patch.dict(os.environ, {'HOOK_IMPORT_SUMMARY':
+                             '{"IMPORT_SECONDS": "100", "IMPORT_STALLS": 0}'})
+    def test_monitor_restore_import_summary(self, _bro, p_core):
+        cfg_map = V1ConfigMap(metadata=V1ObjectMeta(name='cfg-map'),
+                              data={})
+        # The configmap is only created after the restore started
+        p_core.return_value.list_namespaced_config_map.side_effect = [
+            V1ConfigMapList(items=[]), V1ConfigMapList(items=[cfg_map])]
+        p_core.return_value.read_namespaced_config_map.return_value = cfg_map
+        clock = VirtualClock()
+        action = MagicMock(name='m_action', id='12345', result='SUCCESS',
+                           progress=0.5, progress_info='',
+                           additional_info=None)
+        type(action).state = PropertyMock(side_effect=lambda: 'RUNNING' if
+                                          clock.now() < 30 else 'FINISHED')
+
+        klass = BroRestoreRunner()
+        klass._monitor_restore(action, 'backup', 'cfg-map',
+                               DeadlineClock(clock, None, 'restore'), False)
+
+        p_core.return_value.patch_namespaced_config_map.assert_called_once()
+        self.assertEqual('12345', cfg_map.data['RESTORE_ACTION_ID'])
+        self.assertEqual('100', cfg_map.data['IMPORT_SECONDS'])
+        self.assertEqual('0', cfg_map.data['IMPORT_STALLS'])
 
     @patch('bro_restore_runner.BroRestoreRunner')
     def test_main(self, p_bro_restore_runner):
@@ -159,4 +307,4 @@ class TestBroRestoreRunner(BaseTestCase):
         self.assertRaises(SystemExit, main, [])
         main(['-b', 'some_backup', '-c', 'br_config_map', '-s', 'ROLLBACK'])
         m_do_restore.assert_called_once_with(
-            'some_backup', 'br_config_map', 'ROLLBACK')
+            'some_backup', 'br_config_map', 'ROLLBACK', timeout=None)
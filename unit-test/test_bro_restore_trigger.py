@@ -1,8 +1,12 @@
+import json
 import os
 from collections import namedtuple
 from os.path import join
 from unittest.mock import ANY, MagicMock, patch
 
+import yaml
+
+from kubernetes.client.exceptions import ApiException
 from kubernetes.client.models.v1_config_map import V1ConfigMap
 from kubernetes.client.models.v1_container import V1Container
 from kubernetes.client.models.v1_job import V1Job
@@ -11,12 +15,15 @@ from kubernetes.client.models.v1_object_meta import V1ObjectMeta
 from kubernetes.client.models.v1_pod import V1Pod
 from kubernetes.client.models.v1_pod_spec import V1PodSpec
 
+from backup_probe import ProbedBackup
 from bro_restore_trigger import BroImportAndRestoreTrigger, main
 from common import HookException
 from test_common import BaseTestCase, BroAction, BroBackup, \
     PATCH_load_incluster_config, PATCH_load_kube_config
 
 BroService = namedtuple('Service', ['name', 'agent_id', 'version'])
+CHART_VALUES = join(os.path.dirname(__file__), os.pardir, 'test_charts',
+                    'infra-integration', 'values.yaml')
 
 
 class TestBroImportTrigger(BaseTestCase):
@@ -93,7 +100,9 @@ class TestBroImportTrigger(BaseTestCase):
             )
         )
 
-        p_apicore.return_value.read_namespaced_config_map.side_effect = [pv_cfg_map]
+        # No import history yet, then the product version
+        p_apicore.return_value.read_namespaced_config_map.side_effect = [
+            ApiException(status=404), pv_cfg_map]
 
         m_product_number_config_map = MagicMock(name='m_product_number')
         p_apicore.return_value.product_number_config_map = \
@@ -126,11 +135,115 @@ class TestBroImportTrigger(BaseTestCase):
                        'externalStorageCredentials'), 'w') as _writer:
             _writer.write('externalStorageCredentials')
 
-        klass.import_backup(self.tmpdir, 'external_backup', 'ROLLBACK')
+        klass.import_backup(self.tmpdir, 'external_backup', 'ROLLBACK',
+                            configmap='backup-restore')
         m_import_backup.assert_called_once_with(
             'external_backup',
             'externalStorageURI',
             'externalStorageCredentials')
+        name, _, body = \
+            m_apicore.patch_namespaced_config_map.call_args[0]
+        self.assertEqual('backup-restore', name)
+        self.assertEqual('', body['data']['IMPORT_BYTES'])
+        self.assertEqual('0', body['data']['IMPORT_STALLS'])
+
+        self.assertEqual({}, klass.import_summary)
+
+        m_apicore.patch_namespaced_config_map.side_effect = \
+            ApiException(status=404)
+        p_apicore.return_value.read_namespaced_config_map.side_effect = [
+            ApiException(status=404)]
+        klass.import_backup(self.tmpdir, 'external_backup', 'ROLLBACK',
+                            configmap='backup-restore')
+        # The configmap doesn't exist yet, the restore job records it
+        self.assertEqual('0', klass.import_summary['IMPORT_STALLS'])
+        with patch.dict(os.environ, {'HOOK_IMAGE': 'hooks:1.0'}):
+            job = klass.create_job_definition(
+                'test_job', 'external_backup', 'backup-restore', 'acc',
+                'ROLLBACK')
+        env = {var.name: var.value
+               for var in job.spec.template.spec.containers[0].env}
+        self.assertEqual(klass.import_summary,
+                         json.loads(env['HOOK_IMPORT_SUMMARY']))
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('bro_restore_trigger.BackupVersionProbe')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_import_backup_version_probe(self, p_bro_api, p_apicore,
+                                         p_probe):
+        m_bro = MagicMock(name='m_bro')
+        p_bro_api.return_value = m_bro
+        m_bro.backups.return_value = []
+        p_apicore.return_value.read_namespaced_config_map.side_effect = [
+            V1ConfigMap(metadata=V1ObjectMeta(
+                name='product-version-configmap',
+                annotations={'ericsson.com/product-revision': '12.34'}))]
+        p_probe.return_value.probe.return_value = ProbedBackup('11.00', 10)
+
+        with open(join(self.tmpdir, 'externalStorageURI'), 'w') as _writer:
+            _writer.write('sftp://user@sftp/backups')
+        with open(join(self.tmpdir,
+                       'externalStorageCredentials'), 'w') as _writer:
+            _writer.write('password')
+
+        klass = BroImportAndRestoreTrigger()
+        self.assertRaises(HookException, klass.import_backup, self.tmpdir,
+                          'backup.tar.gz', 'ROLLBACK')
+        p_probe.return_value.probe.assert_called_once_with(
+            'sftp://user@sftp/backups', 'password', 'backup.tar.gz')
+        p_probe.assert_called_once_with(
+            known_hosts=join(self.tmpdir, 'externalStorageKnownHosts'),
+            accept_unknown_host_key=False)
+        m_bro.import_backup.assert_not_called()
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('backup_probe.paramiko')
+    @patch('common.CoreV1Api')
+    @patch('common.Bro')
+    def test_import_backup_default_chart(self, p_bro_api, p_apicore,
+                                         p_paramiko):
+        with open(CHART_VALUES) as _reader:
+            restore = yaml.safe_load(_reader)['global']['restore']
+        # The chart only mounts the secret, with no host key in it
+        self.assertFalse(restore['acceptUnknownHostKey'])
+        m_bro = p_bro_api.return_value
+        m_bro.backups.return_value = []
+        backup = BroBackup('backup', [BroService(
+            'Ericsson Network Manager', 'APPLICATION_INFO', '11.00')])
+        m_bro.get_backup.return_value = backup
+        m_bro.import_backup.return_value = BroAction(
+            name='IMPORT', id='1', progress_info=None, result='SUCCESS',
+            state='COMPLETE', scope='DEFAULT', start_time='',
+            completion_time='', progress=1, additional_info=None)
+        p_apicore.return_value.read_namespaced_config_map.return_value = \
+            V1ConfigMap(metadata=V1ObjectMeta(
+                name='product-version-configmap',
+                annotations={'ericsson.com/product-revision': '12.34'}))
+        p_paramiko.SSHException = type('SSHException', (Exception,), {})
+        p_paramiko.SSHClient.return_value.connect.side_effect = \
+            p_paramiko.SSHException('Server not found in known_hosts')
+        with open(join(self.tmpdir, 'externalStorageURI'), 'w') as _writer:
+            _writer.write('sftp://user@sftp/backups')
+        with open(join(self.tmpdir,
+                       'externalStorageCredentials'), 'w') as _writer:
+            _writer.write('password')
+
+        klass = BroImportAndRestoreTrigger(
+            restore['acceptUnknownHostKey'])
+        with patch('backup_probe.PROBE_ERRORS', (p_paramiko.SSHException,)):
+            with self.assertLogs('common', 'INFO') as logs:
+                self.assertRaises(HookException, klass.import_backup,
+                                  self.tmpdir, 'backup', 'ROLLBACK')
+        p_paramiko.SSHClient.return_value.set_missing_host_key_policy. \
+            assert_called_once_with(p_paramiko.RejectPolicy.return_value)
+        self.assertTrue(any('system known_hosts' in line
+                            for line in logs.output))
+        # The probe failing only defers the version check to the import
+        m_bro.import_backup.assert_called_once_with(
+            'backup', 'sftp://user@sftp/backups', 'password')
 
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
     @patch('common.load_kube_config', new=PATCH_load_kube_config)
@@ -167,6 +280,25 @@ class TestBroImportTrigger(BaseTestCase):
             '-c bro-cm -s ROLLBACK',
             cmd_line)
 
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.Bro')
+    @patch('common.CoreV1Api')
+    def test_create_job_definition_hook_image(self, p_apicore, _):
+        klass = BroImportAndRestoreTrigger()
+
+        with patch.dict(os.environ, {'HOOK_IMAGE': 'hooks:1.0',
+                                     'HOOK_IMAGE_PULL_POLICY': 'Always'}):
+            job = klass.create_job_definition(
+                'test_job', 'test_backup', 'bro-cm', 'acc', 'ROLLBACK')
+
+        p_apicore.return_value.read_namespaced_pod.assert_not_called()
+        container = job.spec.template.spec.containers[0]
+        self.assertEqual('hooks:1.0', container.image)
+        self.assertEqual('Always', container.image_pull_policy)
+        self.assertEqual(3600, job.spec.ttl_seconds_after_finished)
+        self.assertEqual('acc', job.spec.template.spec.service_account)
+
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
     @patch('common.load_kube_config', new=PATCH_load_kube_config)
     @patch('common.Bro')
@@ -250,6 +382,14 @@ class TestBroImportTrigger(BaseTestCase):
             'eric-enm-restore-job', self.namespace(), body=ANY
         )
 
+        m_batchapi.list_namespaced_job.side_effect = [V1JobList(items=[])]
+        with patch.object(klass, 'wait_for_job',
+                          return_value=False) as m_wait_for_job:
+            self.assertRaises(HookException, klass.trigger_restore,
+                              'eric-enm-restore-job', 'backup_name',
+                              'cfgmap', 'acc', 'ROLLBACK', 60, wait=True)
+        m_wait_for_job.assert_called_once_with('eric-enm-restore-job', ANY)
+
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
     @patch('common.load_kube_config', new=PATCH_load_kube_config)
     @patch('common.Bro')
@@ -337,4 +477,21 @@ class TestBroImportTrigger(BaseTestCase):
               ])
         m_import_and_trigger.assert_called_once_with(
             'serviceaccount', '/secrets', 'runner_job', 'backup', 'cfg_map',
-            'ROLLBACK')
+            'ROLLBACK', timeout=None, wait=False)
+
+        m_import_and_trigger.side_effect = HookException('job failed')
+        with self.assertRaises(SystemExit) as error:
+            main(['-S', '/secrets', '-A', 'serviceaccount', '-b', 'backup',
+                  '-j', 'runner_job', '-s', 'ROLLBACK', '-c', 'cfg_map',
+                  '--wait'])
+        self.assertEqual(1, error.exception.code)
+        m_import_and_trigger.assert_called_with(
+            'serviceaccount', '/secrets', 'runner_job', 'backup', 'cfg_map',
+            'ROLLBACK', timeout=None, wait=True)
+        p_bro_restore_trigger.assert_called_with(False)
+
+        m_import_and_trigger.side_effect = None
+        main(['-S', '/secrets', '-A', 'serviceaccount', '-b', 'backup',
+              '-j', 'runner_job', '-s', 'ROLLBACK', '-c', 'cfg_map',
+              '--accept-unknown-host-key'])
+        p_bro_restore_trigger.assert_called_with(True)
@@ -80,16 +80,11 @@ class TestBroScheduleControl(BaseTestCase):
                     '"schedules":[{"every":"1w","start":"2022-10-22T04:00:00"},'\
                                 '{"every":"3d","stop":"2022-10-22T12:00:00"},'\
                                 '{"every":"2d4m","stop":"2022-10-28T04:20:50","start":"2022-10-24T12:12:12"},'\
-                                '{"every":null,"start":"2022-10-28T04:20:50"},'\
-                                '{"every":"5h","stop":"null"},'\
                                 '{"every":"6h30m","start":null},'\
                                 '{"6h30m":"every","start":"2022-10-24T12:12:12"},'\
                                 '{"every":"0w0d0h0m","start":"2022-10-24T12:12:12"},'\
                                 '{"every ":"15m"},'\
-                                '{"start":"2022-10-24T12:12:12"},'\
-                                '{"every":"1week","start":"2022-10-24T12:12:12"},'\
-                                '{"every":"50m","start":"2022/10/24 12:12:12"},'\
-                                '{"every":"1d","start":"22-10-24T12:12:12"}]}'
+                                '{"start":"2022-10-24T12:12:12"}]}'
         klass.configure_scheduling(m_values, "secret-name")
         m_schedule.update.assert_called_once_with(
             True,
@@ -97,6 +92,10 @@ class TestBroScheduleControl(BaseTestCase):
             True,
             'somepassword',
             'sftp://user@something:/some_path/')
+        self.assertEqual(5, m_schedule.interval_add.call_count)
+        m_schedule.interval_add.assert_any_call(
+            None, '2', None, '4', start_time='2022-10-24T12:12:12',
+            stop_time='2022-10-28T04:20:50')
 
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
     @patch('common.load_kube_config', new=PATCH_load_kube_config)
@@ -155,6 +154,25 @@ class TestBroScheduleControl(BaseTestCase):
         klass.enable_scheduling(False)
         m_schedule.update.assert_called_once()
 
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.Bro')
+    def test_configure_scheduling_invalid(self, p_bro_api):
+        klass = ScheduleControl()
+        for values in ('[]', '{"backupPrefix": 1}',
+                       '{"schedules": {"every": "1d"}}',
+                       '{"schedules": ["1d"]}',
+                       '{"schedules": [{"every": null}]}',
+                       '{"schedules": [{"every": "1week"}]}',
+                       '{"schedules": [{"every": "5h", "stop": "null"}]}',
+                       '{"schedules": [{"every": "50m", '
+                       '"start": "2022/10/24 12:12:12"}]}',
+                       '{"schedules": [{"every": "1d", '
+                       '"start": "22-10-24T12:12:12"}]}'):
+            self.assertRaises(HookException, klass.configure_scheduling,
+                              values)
+        p_bro_api.return_value.get_schedule.assert_not_called()
+
     def test_main_missing_args(self):
         self.assertRaises(SystemExit, main, [])
 
@@ -164,4 +182,4 @@ class TestBroScheduleControl(BaseTestCase):
         m_scheduling_control = MagicMock(name='m_scheduling_control')
         p_schedule_control.return_value.enable_scheduling = m_scheduling_control
         main(['--disabled'])
-        m_scheduling_control.assert_called_once_with(False)
+        m_scheduling_control.assert_called_once_with(False, timeout=None)
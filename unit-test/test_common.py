@@ -1,9 +1,10 @@
+import atexit
 import os
 import shutil
 from argparse import ArgumentParser
 from collections import namedtuple
 from os.path import isdir, join
-from tempfile import gettempdir
+from tempfile import mkdtemp
 from unittest import TestCase
 from unittest.mock import ANY, MagicMock, PropertyMock, mock_open, patch
 
@@ -14,6 +15,8 @@ from kubernetes.client.exceptions import ApiException
 from kubernetes.client.models.v1_config_map import V1ConfigMap
 from kubernetes.client.models.v1_job import V1Job
 from kubernetes.client.models.v1_job_list import V1JobList
+from kubernetes.client import V1JobCondition, V1JobStatus, V1ListMeta, \
+    V1Pod, V1PodList, V1PodStatus
 from kubernetes.client.models.v1_object_meta import V1ObjectMeta
 from kubernetes.client.models.v1_secret import V1Secret
 from kubernetes.client.models.v1_status import V1Status
@@ -24,8 +27,14 @@ from lib.broapi import Bro
 os.environ['BRO_HOST'] = 'localhost'
 os.environ['BRO_PORT'] = '0'
 
-from common import BroCliBaseClass, HookException, KubeApi, \
-    KubeBatchBaseClass, get_parsed_args
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from common import ApiProxy, BroCache, BroCliBaseClass, CircuitBreaker, \
+    CircuitOpenException, DeadlineClock, HookException, HookTarget, \
+    HookTimeoutException, KubeApi, KubeBatchBaseClass, RateLimiter, \
+    RetryPolicy, VirtualClock, WallClock, add_timeout_argument, get_clock, \
+    get_parsed_args, hook_target, kube_rate_limiter, rate_limiter, \
+    reset_shared_state, retry_policy, set_clock, watch_timeout
 
 BroService = namedtuple('Service', ['name', 'agent_id'])
 BroBackup = namedtuple('Backup', ['name', 'services'])
@@ -38,14 +47,30 @@ PATCH_load_incluster_config = MagicMock(name='m_load_incluster_config')
 PATCH_load_kube_config = MagicMock(name='m_load_kube_config')
 
 
+# One directory per test process, so parallel workers don't share files.
+# The namespace file is written once and each test gets a fresh subdirectory.
+NAMESPACE = 'enm404'
+SESSION_DIR = mkdtemp(prefix='unit-test-')
+NAMESPACE_FILE = join(SESSION_DIR, 'namespace')
+with open(NAMESPACE_FILE, 'w') as _writer:
+    _writer.write(NAMESPACE)
+atexit.register(shutil.rmtree, SESSION_DIR, True)
+
+
 class BaseTestCase(TestCase):
     def __init__(self, method_name):
         super().__init__(method_name)
-        self.tmpdir = join(gettempdir(), self.__class__.__name__)
+        self.tmpdir = join(SESSION_DIR, self.__class__.__name__)
 
     @staticmethod
     def namespace():
-        return 'enm404'
+        return NAMESPACE
+
+    def virtual_clock(self) -> VirtualClock:
+        """ Run the test on a VirtualClock, put back when it ends """
+        clock = VirtualClock()
+        self.addCleanup(set_clock, set_clock(clock))
+        return clock
 
     @staticmethod
     def reset_mocks(*mocks):
@@ -56,9 +81,7 @@ class BaseTestCase(TestCase):
         if not isdir(self.tmpdir):
             os.makedirs(self.tmpdir)
 
-        os.environ['SA_NAMESPACE'] = join(self.tmpdir, 'namespace')
-        with open(os.environ['SA_NAMESPACE'], 'w') as _w:
-            _w.write(BaseTestCase.namespace())
+        os.environ['SA_NAMESPACE'] = NAMESPACE_FILE
 
         PATCH_load_incluster_config.reset_mock(
             return_value=True, side_effect=True)
@@ -184,9 +207,14 @@ class TestKubeApi(BaseTestCase):
         m_status = V1Status(
             status='Success'
         )
-        p_core.return_value.delete_namespaced_secret.side_effect = [m_status]
+        p_core.return_value.delete_namespaced_secret.side_effect = [
+            m_status, ApiException(status=404), ApiException(status=403)]
         read = klass.delete_secret('secret_name')
         self.assertEqual(m_status.status, read.status)
+        with patch('time.sleep') as p_sleep:
+            self.assertIsNone(klass.delete_secret('secret_name'))
+            p_sleep.assert_not_called()
+        self.assertRaises(ApiException, klass.delete_secret, 'secret_name')
 
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
     @patch('common.load_kube_config', new=PATCH_load_kube_config)
@@ -260,6 +288,38 @@ class TestBroCliBaseClass(BaseTestCase):
         self.assertRaises(HookException, klass.import_backup,
                           'backup', 'sftp@sftp', 'sftp')
 
+    @patch.dict(os.environ, {'IMPORT_STALL_SECONDS': '10'})
+    @patch('common.Bro')
+    def test_import_backup_throughput(self, p_bro_api):
+        clock = self.virtual_clock()
+        progress = {0: 0.1, 5: 0.1, 10: 0.1, 15: 0.5}
+
+        class RunningImport:  # pylint: disable=too-few-public-methods
+            name, id, scope, result = 'IMPORT', '12345', 'DEFAULT', 'SUCCESS'
+            additional_info = None
+
+            @property
+            def progress(self):
+                return progress.get(clock.now(), 1.0)
+
+            @property
+            def state(self):
+                return 'RUNNING' if self.progress < 1 else 'COMPLETE'
+
+        p_bro_api.return_value.import_backup.return_value = RunningImport()
+        with self.assertLogs('common', 'INFO') as logs:
+            summary = BroCliBaseClass().import_backup(
+                'backup', 'sftp@sftp', 'sftp', size_bytes=200 * 1024 ** 2)
+        output = '\n'.join(logs.output)
+        self.assertIn('IMPORT 12345 is RUNNING: 10%, 20/200 MB, ETA unknown',
+                      output)
+        self.assertIn('IMPORT 12345 has not progressed for 10s', output)
+        self.assertIn('IMPORT 12345 is RUNNING: 50%, 100/200 MB, 6.7 MB/s',
+                      output)
+        self.assertEqual(('20', '10.0', '1'), (
+            summary['IMPORT_SECONDS'], summary['IMPORT_MB_PER_SECOND'],
+            summary['IMPORT_STALLS']))
+
     @patch('time.sleep')
     @patch('common.Bro')
     def test_wait_for_action_complete(self, p_bro_api, p_sleep):
@@ -282,6 +342,17 @@ class TestBroCliBaseClass(BaseTestCase):
         finally:
             type(action).state = str
 
+    @patch('common.Bro')
+    def test_wait_for_action_timeout(self, p_bro_api):
+        p_bro_api.return_value = MagicMock(name='m_bro')
+        action = MagicMock(name='m_action', id='12345', state='RUNNING',
+                           progress=0.5)
+        clock = self.virtual_clock()
+        klass = BroCliBaseClass()
+        self.assertRaises(HookTimeoutException, klass.wait_for_action,
+                          action, 12)
+        self.assertEqual([5, 5, 2], clock.sleeps)
+
     @patch('common.Bro')
     def test_wait_for_action_cycle(self, p_bro_api):
         m_bro = MagicMock(name='m_bro')
@@ -357,6 +428,402 @@ class TestKubeBatchBaseClass(BaseTestCase):
         self.assertEqual(
             0, p_batch.return_value.delete_namespaced_job.call_count)
 
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.watch.Watch')
+    @patch('common.CoreV1Api')
+    @patch('common.BatchV1Api')
+    def test_wait_for_job(self, p_batch, p_core, p_watch):
+        running = V1Job(metadata=V1ObjectMeta(name='j1'),
+                        status=V1JobStatus(active=1))
+        complete = V1Job(metadata=V1ObjectMeta(name='j1'),
+                         status=V1JobStatus(conditions=[
+                             V1JobCondition(type='Complete', status='True')]))
+        p_batch.return_value.list_namespaced_job.return_value = V1JobList(
+            metadata=V1ListMeta(resource_version='5'), items=[running])
+        p_watch.return_value.stream.return_value = iter([
+            {'type': 'MODIFIED', 'object': running},
+            {'type': 'MODIFIED', 'object': complete}])
+        p_core.return_value.list_namespaced_pod.return_value = V1PodList(
+            items=[V1Pod(metadata=V1ObjectMeta(name='j1-abc'),
+                         status=V1PodStatus(phase='Succeeded'))])
+        log = MagicMock(name='m_log')
+        log.__iter__.return_value = iter([b'Restore started\n',
+                                          b'Restore finished\n'])
+        p_core.return_value.read_namespaced_pod_log.return_value = log
+
+        klass = KubeBatchBaseClass()
+        with self.assertLogs('common', 'INFO') as logs:
+            self.assertTrue(klass.wait_for_job('j1'))
+        self.assertIn('j1-abc: Restore finished', '\n'.join(logs.output))
+        p_watch.return_value.stream.assert_called_once_with(
+            ANY, self.namespace(), field_selector='metadata.name=j1',
+            resource_version='5', timeout_seconds=60, _request_timeout=70)
+        p_core.return_value.read_namespaced_pod_log.assert_called_once_with(
+            'j1-abc', self.namespace(), follow=True, _preload_content=False,
+            _request_timeout=None)
+        log.release_conn.assert_called_once_with()
+
+        failed = V1Job(metadata=V1ObjectMeta(name='j1'),
+                       status=V1JobStatus(conditions=[
+                           V1JobCondition(type='Failed', status='True')]))
+        p_batch.return_value.list_namespaced_job.return_value = V1JobList(
+            metadata=V1ListMeta(resource_version='6'), items=[failed])
+        self.assertFalse(klass.wait_for_job('j1', follow_logs=False))
+
+        p_batch.return_value.list_namespaced_job.return_value = V1JobList(
+            metadata=V1ListMeta(resource_version='7'), items=[])
+        self.assertRaises(HookException, klass.wait_for_job, 'j1',
+                          follow_logs=False)
+
+
+class TestClock(TestCase):
+    def test_wall_clock(self):
+        self.assertIsInstance(get_clock(), WallClock)
+        with patch('time.sleep') as p_sleep:
+            get_clock().sleep(3)
+        p_sleep.assert_called_once_with(3)
+
+    def test_set_clock(self):
+        clock = VirtualClock(100)
+        previous = set_clock(clock)
+        try:
+            self.assertIs(clock, get_clock())
+            clock.sleep(5)
+            self.assertEqual(105, clock.now())
+            self.assertEqual([5], clock.sleeps)
+        finally:
+            self.assertIs(clock, set_clock(previous))
+
+    def test_deadline_clock(self):
+        clock = VirtualClock()
+        deadline = DeadlineClock(clock, 10, 'something')
+        deadline.sleep(4)
+        self.assertEqual(6, deadline.remaining())
+        deadline.sleep(8)
+        self.assertEqual([4, 6], clock.sleeps)
+        self.assertEqual(0, deadline.remaining())
+        self.assertRaises(HookTimeoutException, deadline.sleep, 1)
+
+    def test_deadline_clock_no_timeout(self):
+        clock = VirtualClock()
+        deadline = DeadlineClock(clock, None, 'something')
+        deadline.sleep(1000)
+        self.assertIsNone(deadline.remaining())
+        self.assertEqual([1000], clock.sleeps)
+
+    def test_watch_timeout(self):
+        clock = VirtualClock()
+        self.assertEqual(60, watch_timeout(DeadlineClock(clock, None, 'x')))
+        deadline = DeadlineClock(clock, 90, 'something')
+        self.assertEqual(60, watch_timeout(deadline))
+        self.assertEqual(10, watch_timeout(deadline, 10))
+        clock.sleep(89.5)
+        self.assertEqual(1, watch_timeout(deadline))
+        clock.sleep(1)
+        self.assertRaises(HookTimeoutException, watch_timeout, deadline)
+
+
+class FlakyApi:
+    """ Fails with the queued errors before answering """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def read_thing(self, name, **kwargs):
+        self.calls.append((name, kwargs))
+        if self.errors:
+            raise self.errors.pop(0)
+        return name
+
+    def create_thing(self, name, **kwargs):
+        return self.read_thing(name, **kwargs)
+
+    def delete_thing(self, name, **kwargs):
+        return self.read_thing(name, **kwargs)
+
+    @property
+    def status(self):
+        return self.read_thing('status')
+
+
+class TestRetryPolicy(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous = set_clock(self.clock)
+
+    def tearDown(self):
+        set_clock(self.previous)
+
+    def test_retries_server_errors(self):
+        api = FlakyApi(ApiException(status=503), RequestsConnectionError())
+        policy = RetryPolicy('kube', base_delay=1)
+        self.assertEqual('x', policy.call(api.read_thing, 'read', 'x'))
+        self.assertEqual(3, len(api.calls))
+        self.assertEqual(2, len(self.clock.sleeps))
+        self.assertTrue(0.5 <= self.clock.sleeps[0] <= 1)
+        self.assertTrue(1 <= self.clock.sleeps[1] <= 2)
+        self.assertEqual(48, policy.budget)
+
+    def test_retry_after(self):
+        error = ApiException(status=429)
+        error.headers = {'Retry-After': '7'}
+        api = FlakyApi(error)
+        policy = RetryPolicy('kube')
+        policy.call(api.create_thing, 'create', 'x', idempotent=False)
+        self.assertEqual([7], self.clock.sleeps)
+
+    def test_not_retried(self):
+        policy = RetryPolicy('kube')
+        api = FlakyApi(ApiException(status=404))
+        self.assertRaises(ApiException, policy.call, api.read_thing, 'r', 'x')
+        api = FlakyApi(ApiException(status=503))
+        self.assertRaises(ApiException, policy.call, api.create_thing, 'c',
+                          'x', idempotent=False)
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_gives_up(self):
+        api = FlakyApi(*[ApiException(status=500)] * 10)
+        policy = RetryPolicy('kube', attempts=3, breaker=CircuitBreaker(
+            'kube', threshold=100))
+        self.assertRaises(ApiException, policy.call, api.read_thing, 'r', 'x')
+        self.assertEqual(3, len(api.calls))
+
+        api = FlakyApi(*[ApiException(status=500)] * 10)
+        policy = RetryPolicy('kube', attempts=10, timeout=5)
+        self.assertRaises(ApiException, policy.call, api.read_thing, 'r', 'x')
+        self.assertTrue(self.clock.now() < 10)
+
+        api = FlakyApi(*[ApiException(status=500)] * 10)
+        policy = RetryPolicy('kube', budget=1)
+        self.assertRaises(ApiException, policy.call, api.read_thing, 'r', 'x')
+        self.assertEqual(2, len(api.calls))
+        self.assertEqual(0, policy.budget)
+
+    def test_retried_delete_gone(self):
+        policy = RetryPolicy('kube')
+        api = FlakyApi(ApiException(status=503), ApiException(status=404))
+        self.assertIsNone(policy.call(api.read_thing, 'delete', 'x',
+                                      delete=True))
+        self.assertEqual(2, len(api.calls))
+        # Not found on the first attempt is still an error
+        api = FlakyApi(ApiException(status=404))
+        self.assertRaises(ApiException, policy.call, api.read_thing,
+                          'delete', 'x', delete=True)
+
+        api = FlakyApi(ApiException(status=502), ApiException(status=404))
+        proxy = ApiProxy(api, RetryPolicy('kube'))
+        self.assertIsNone(proxy.delete_thing('x'))
+        self.assertRaises(ApiException, ApiProxy(
+            FlakyApi(ApiException(status=502), ApiException(status=404)),
+            RetryPolicy('kube')).read_thing, 'x')
+
+    def test_reset_shared_state(self):
+        policy = retry_policy('kube')
+        limiter = rate_limiter('kube')
+        self.assertIs(policy, retry_policy('kube'))
+        reset_shared_state()
+        self.assertIsNot(policy, retry_policy('kube'))
+        self.assertIsNot(limiter, rate_limiter('kube'))
+
+    def test_budget_refills(self):
+        policy = RetryPolicy('kube', budget=2, budget_seconds=100,
+                             breaker=CircuitBreaker('kube', threshold=100))
+        api = FlakyApi(*[ApiException(status=500)] * 10)
+        self.assertRaises(ApiException, policy.call, api.read_thing, 'r', 'x')
+        self.assertEqual(3, len(api.calls))
+        self.assertEqual(0, policy.budget)
+        self.clock.sleep(50)
+        self.assertEqual(1, policy.budget)
+        self.clock.sleep(500)
+        self.assertEqual(2, policy.budget)
+        api = FlakyApi(ApiException(status=500))
+        self.assertEqual('x', policy.call(api.read_thing, 'r', 'x'))
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker('bro', threshold=2, reset_after=30)
+        policy = RetryPolicy('bro', attempts=1, breaker=breaker)
+        api = FlakyApi(*[RequestsConnectionError()] * 3)
+        for _ in range(2):
+            self.assertRaises(RequestsConnectionError, policy.call,
+                              api.read_thing, 'r', 'x')
+        self.assertRaises(CircuitOpenException, policy.call, api.read_thing,
+                          'r', 'x')
+        self.assertEqual(2, len(api.calls))
+
+        self.clock.sleep(30)
+        self.assertRaises(RequestsConnectionError, policy.call,
+                          api.read_thing, 'r', 'x')
+        self.assertRaises(CircuitOpenException, policy.call, api.read_thing,
+                          'r', 'x')
+
+        self.clock.sleep(30)
+        self.assertEqual('x', policy.call(api.read_thing, 'r', 'x'))
+        self.assertEqual(0, breaker.failures)
+        self.assertIsNone(breaker.opened)
+
+    def test_api_proxy(self):
+        api = FlakyApi(ApiException(status=502), ApiException(status=502))
+        proxy = ApiProxy(api, RetryPolicy('kube'), request_timeout=15)
+        self.assertIsInstance(proxy, FlakyApi)
+        self.assertEqual('x', proxy.read_thing('x'))
+        self.assertEqual([('x', {'_request_timeout': 15})] * 3, api.calls)
+        self.assertEqual('status', proxy.status)
+
+        api = FlakyApi(ApiException(status=502))
+        proxy = ApiProxy(api, RetryPolicy('kube'))
+        self.assertRaises(ApiException, proxy.create_thing, 'x')
+        self.assertEqual([('x', {})], api.calls)
+
+
+class TestRateLimiter(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous = set_clock(self.clock)
+
+    def tearDown(self):
+        set_clock(self.previous)
+
+    def test_acquire(self):
+        limiter = RateLimiter('kube', qps=2, burst=3)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual([], self.clock.sleeps)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual([0.5, 0.5], self.clock.sleeps)
+        self.assertEqual(2, limiter.throttled_calls)
+        self.assertEqual(1, limiter.throttled_seconds)
+
+        self.clock.sleep(10)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(3, len(self.clock.sleeps))
+
+    def test_disabled(self):
+        limiter = RateLimiter('kube', qps=0, burst=1)
+        for _ in range(10):
+            limiter.acquire()
+        self.assertEqual([], self.clock.sleeps)
+
+    def test_api_proxy(self):
+        api = FlakyApi(ApiException(status=500))
+        limiter = RateLimiter('kube', qps=1, burst=1)
+        proxy = ApiProxy(api, RetryPolicy('kube', base_delay=0.1),
+                         limiter=limiter)
+        proxy.read_thing('x')
+        proxy.status
+        self.assertEqual(3, len(api.calls))
+        self.assertEqual(2, limiter.throttled_calls)
+
+
+class FakeSchedule:
+    def __init__(self):
+        self.enabled = False
+
+    def update(self, enabled):
+        self.enabled = enabled
+
+
+class TestBroCache(TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.previous = set_clock(self.clock)
+
+    def tearDown(self):
+        set_clock(self.previous)
+
+    def test_ttl(self):
+        cache = BroCache(ttl=10)
+        read = MagicMock(side_effect=['a', 'b', 'c'])
+        self.assertEqual('a', cache.get('status', read))
+        self.clock.sleep(9)
+        self.assertEqual('a', cache.get('status', read))
+        self.clock.sleep(1)
+        self.assertEqual('b', cache.get('status', read))
+        cache.invalidate('status')
+        self.assertEqual('c', cache.get('status', read))
+        self.assertEqual(3, read.call_count)
+
+    def test_disabled(self):
+        cache = BroCache(ttl=0)
+        read = MagicMock(side_effect=['a', 'b'])
+        cache.get('status', read)
+        self.assertEqual('b', cache.get('status', read))
+
+    @patch('common.Bro')
+    def test_schedule_invalidated(self, p_bro_api):
+        m_bro = p_bro_api.return_value
+        m_bro.get_schedule.side_effect = [FakeSchedule(), FakeSchedule()]
+
+        schedule = BroCliBaseClass().get_schedule()
+        self.assertIs(schedule._target, BroCliBaseClass().get_schedule()._target)
+        self.assertEqual(1, m_bro.get_schedule.call_count)
+        schedule.update(True)
+        self.assertTrue(schedule.enabled)
+        schedule.enabled = False
+        self.assertFalse(schedule._target.enabled)
+        self.assertIsNot(schedule._target,
+                         BroCliBaseClass().get_schedule()._target)
+        self.assertEqual(2, m_bro.get_schedule.call_count)
+
+    @patch('common.Bro')
+    def test_wait_bro_ready_once(self, p_bro_api):
+        m_status = PropertyMock(return_value='OK')
+        type(p_bro_api.return_value).status = m_status
+        breaker = retry_policy('bro').breaker
+        try:
+            BroCliBaseClass().wait_bro_ready()
+            reads = m_status.call_count
+            BroCliBaseClass().wait_bro_ready()
+            self.assertEqual(reads, m_status.call_count)
+            breaker.failure()
+            klass = BroCliBaseClass()
+            klass.wait_bro_ready()
+            self.assertGreater(m_status.call_count, reads)
+            self.assertEqual('OK', klass.bro_cache().get('status', None))
+        finally:
+            breaker.success()
+
+
+class TestHookTarget(BaseTestCase):
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.Bro')
+    def test_hook_target(self, p_bro_api):
+        api_client = ApiClient()
+        with hook_target(HookTarget('enm1', 'bro.enm1', 7001, api_client)):
+            kube = KubeApi()
+            brocli = BroCliBaseClass()
+        self.assertEqual('enm1', kube.namespace())
+        self.assertIs(api_client, kube.api_client())
+        PATCH_load_incluster_config.assert_not_called()
+        p_bro_api.assert_called_once_with(host='bro.enm1', port=7001)
+        self.assertIsNot(retry_policy('bro').breaker,
+                         retry_policy('bro enm1').breaker)
+        self.assertIsNot(brocli.bro_api(), BroCliBaseClass().bro_api())
+        self.assertEqual(self.namespace(), KubeApi().namespace())
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    def test_rate_limited_per_namespace(self):
+        api_client = ApiClient()
+        with hook_target(HookTarget('enm1', api_client=api_client)):
+            self.assertIs(rate_limiter('kubernetes enm1'),
+                          kube_rate_limiter())
+            enm1 = KubeBatchBaseClass()
+        with hook_target(HookTarget('enm2', api_client=api_client)):
+            self.assertIs(rate_limiter('kubernetes enm2'),
+                          kube_rate_limiter())
+        self.assertIs(rate_limiter('kubernetes'), kube_rate_limiter())
+        self.assertIsNot(kube_rate_limiter(),
+                         rate_limiter('kubernetes enm1'))
+        self.assertIs(rate_limiter('kubernetes enm1'),
+                      enm1.api_core()._limiter)
+        self.assertIs(rate_limiter('kubernetes enm1'),
+                      enm1.api_batch()._limiter)
+
 
 class TestCommonFunctions(BaseTestCase):
     def test_get_parsed_args(self):
@@ -366,3 +833,13 @@ class TestCommonFunctions(BaseTestCase):
 
         parsed = get_parsed_args(['-t', 'value'], parser)
         self.assertEqual('value', parsed.test)
+
+    def test_add_timeout_argument(self):
+        parser = ArgumentParser()
+        add_timeout_argument(parser)
+        self.assertIsNone(parser.parse_args([]).timeout)
+        self.assertEqual(30, parser.parse_args(['-t', '30']).timeout)
+        with patch.dict(os.environ, {'HOOK_TIMEOUT': '600'}):
+            parser = ArgumentParser()
+            add_timeout_argument(parser)
+        self.assertEqual(600, parser.parse_args([]).timeout)
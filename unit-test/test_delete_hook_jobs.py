@@ -41,4 +41,4 @@ class TestDeletePreInstallHookJob(BaseTestCase):
 
         self.assertRaises(SystemExit, main, [])
         main(['-j', 'j1', '-j', 'j2'])
-        m_hook_cleanup.assert_called_once_with(['j1', 'j2'])
+        m_hook_cleanup.assert_called_once_with(['j1', 'j2'], timeout=None)
@@ -1,21 +1,131 @@
+import os
+import subprocess
+import sys
+import threading
+import time
 from unittest.mock import MagicMock, call, patch
 
-from delete_secrets import DeleteSecrets, main
+from kubernetes.client import V1ObjectMeta, V1Secret, V1SecretList
+from kubernetes.client.exceptions import ApiException
+
+from common import HookException
+from delete_secrets import ABSENT, DELETED, TIMED_OUT, DeleteSecrets, \
+    main
 from test_common import BaseTestCase, PATCH_load_incluster_config, \
     PATCH_load_kube_config
 
+# subprocess polls with time.sleep while it waits with a timeout
+REAL_SLEEP = time.sleep
+
 
 class TestDeleteSecrets(BaseTestCase):
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
     @patch('common.load_kube_config', new=PATCH_load_kube_config)
-    @patch('common.KubeApi.delete_secret')
-    def test_cleanup_secret(self, p_delete_secret):
+    @patch('common.CoreV1Api')
+    def test_cleanup_secret(self, p_core):
+        klass = DeleteSecrets()
+
+        results = klass.cleanup_secrets(["secret1", "secret2"])
+        self.assertEqual({'secret1': DELETED, 'secret2': DELETED}, results)
+        calls = [call("secret1", self.namespace(), grace_period_seconds=0,
+                      _request_timeout=30.0),
+                 call("secret2", self.namespace(), grace_period_seconds=0,
+                      _request_timeout=30.0)]
+        p_core.return_value.delete_namespaced_secret.assert_has_calls(
+            calls, any_order=True)
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    def test_cleanup_secret_absent(self, p_core):
+        klass = DeleteSecrets()
+
+        def delete(name, *_args, **_kwargs):
+            if name == 'gone':
+                raise ApiException(status=404)
+            if name == 'denied':
+                raise ApiException(status=403, reason='Forbidden')
+        p_core.return_value.delete_namespaced_secret.side_effect = delete
+
+        results = klass.cleanup_secrets(['secret1', 'gone'])
+        self.assertEqual({'secret1': DELETED, 'gone': ABSENT}, results)
+
+        with self.assertRaises(HookException) as error:
+            klass.cleanup_secrets(['secret1', 'denied'])
+        self.assertIn("'denied': 'failed: 403 Forbidden'",
+                      str(error.exception))
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    def test_cleanup_secret_label_selector(self, p_core):
         klass = DeleteSecrets()
+        p_core.return_value.list_namespaced_secret.return_value = \
+            V1SecretList(items=[V1Secret(metadata=V1ObjectMeta(name='s1')),
+                                V1Secret(metadata=V1ObjectMeta(name='s2'))])
+
+        results = klass.cleanup_secrets(['s1', 'other'],
+                                        label_selector='app=hooks')
+        self.assertEqual({'s1': DELETED, 's2': DELETED, 'other': DELETED},
+                         results)
+        p_core.return_value.delete_collection_namespaced_secret.\
+            assert_called_once_with(self.namespace(),
+                                    label_selector='app=hooks',
+                                    grace_period_seconds=0,
+                                    _request_timeout=30.0)
+        p_core.return_value.delete_namespaced_secret.assert_called_once_with(
+            'other', self.namespace(), grace_period_seconds=0,
+            _request_timeout=30.0)
 
-        klass.cleanup_secrets(["secret1", "secret2"])
-        calls = [call("secret1"), call("secret2")]
-        p_delete_secret.assert_has_calls(calls)
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    def test_cleanup_secret_timeout(self, p_core):
+        release = threading.Event()
+
+        def delete(name, *_args, **_kwargs):
+            if name == 'stuck':
+                release.wait(5)
+        p_core.return_value.delete_namespaced_secret.side_effect = delete
 
+        try:
+            with self.assertRaises(HookException) as error:
+                DeleteSecrets().cleanup_secrets(['secret1', 'stuck'],
+                                                timeout=0.1)
+            self.assertIn(f"'stuck': '{TIMED_OUT}'", str(error.exception))
+            self.assertNotIn('secret1', str(error.exception))
+            stuck = [thread for thread in threading.enumerate()
+                     if thread.is_alive() and
+                     thread is not threading.current_thread() and
+                     not thread.daemon and thread.name.startswith('Thread')]
+            self.assertEqual([], stuck)
+        finally:
+            release.set()
+
+    @patch('time.sleep', new=REAL_SLEEP)
+    def test_timeout_exits_promptly(self):
+        script = (
+            'import threading\n'
+            'from unittest.mock import patch\n'
+            'from delete_secrets import DeleteSecrets\n'
+            'with patch("common.load_incluster_config"), \\\n'
+            '        patch.object(DeleteSecrets, "delete_if_present",\n'
+            '                     lambda *_a, **_k: threading.Event()'
+            '.wait(60)):\n'
+            '    try:\n'
+            '        DeleteSecrets().cleanup_secrets(["stuck"], '
+            'timeout=0.1)\n'
+            '    except Exception as error:\n'
+            '        print(error)\n')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        started = time.monotonic()
+        result = subprocess.run([sys.executable, '-c', script], env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, timeout=30,
+                                check=False, universal_newlines=True)
+        self.assertLess(time.monotonic() - started, 20, result.stdout)
+        self.assertEqual(0, result.returncode, result.stdout)
+        self.assertIn(TIMED_OUT, result.stdout)
 
     @patch('delete_secrets.DeleteSecrets')
     def test_main(self, p_delete_secret):
@@ -25,6 +135,8 @@ class TestDeleteSecrets(BaseTestCase):
             MagicMock(name='m_cleanup_secret')
 
         self.assertRaises(SystemExit, main, [])
+        self.assertRaises(SystemExit, main, ['-t', '10'])
         main(['-s', 'secret1', '-s', 'secret2'])
-        m_cleanup_secret.assert_called_once_with(['secret1', 'secret2'])
-
+        m_cleanup_secret.assert_called_once_with(
+            ['secret1', 'secret2'], timeout=None, label_selector=None,
+            secret_timeout=30.0)
@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+import time
 from unittest.mock import ANY, MagicMock, call, patch
 
 from test_common import BaseTestCase, PATCH_load_incluster_config, \
@@ -7,7 +11,25 @@ from collections import namedtuple
 
 from delete_svc import DeleteService, main
 
-from kubernetes.client import V1Service, V1ObjectMeta, V1ServiceSpec
+from kubernetes.client import V1ListMeta, V1Service, V1ServiceList, \
+    V1ObjectMeta, V1ServiceSpec
+from kubernetes.client.exceptions import ApiException
+
+
+def services(*names, cluster_ip='10.0.0.1'):
+    return V1ServiceList(
+        metadata=V1ListMeta(resource_version='10'),
+        items=[V1Service(metadata=V1ObjectMeta(name=name),
+                         spec=V1ServiceSpec(cluster_ip=cluster_ip))
+               for name in names])
+
+
+REAL_SLEEP = time.sleep
+
+
+def deleted(name):
+    return {'type': 'DELETED',
+            'object': V1Service(metadata=V1ObjectMeta(name=name))}
 
 class TestDeleteService(BaseTestCase):
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
@@ -18,7 +40,7 @@ class TestDeleteService(BaseTestCase):
 
         myService = V1Service(metadata=V1ObjectMeta(name='service'), spec=V1ServiceSpec(cluster_ip='service_ip'))
         klass.service_cleanup(myService)
-        p_delete_service.assert_called_once_with('service')
+        p_delete_service.assert_called_once_with('service', None)
 
 
     @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
@@ -30,6 +52,99 @@ class TestDeleteService(BaseTestCase):
         p_list_service_details.assert_called_once_with('service')
 
 
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.watch.Watch')
+    def test_batch_cleanup(self, p_watch, p_core):
+        klass = DeleteService()
+        m_core = p_core.return_value
+        m_core.list_namespaced_service.return_value = services(
+            'svc1', 'svc2', 'svc3', 'other')
+        def delete(name, *_args, **_kwargs):
+            if name == 'svc3':
+                raise ApiException(status=404)
+        m_core.delete_namespaced_service.side_effect = delete
+        m_watcher = p_watch.return_value
+        m_watcher.stream.return_value = iter([
+            deleted('other'), deleted('svc2'), deleted('svc1')])
+
+        self.assertEqual(['svc1', 'svc2', 'svc3'], klass.batch_cleanup(
+            ['svc1', 'svc2', 'svc3', 'missing']))
+        self.assertEqual(2, m_core.list_namespaced_service.call_count)
+        m_core.list_namespaced_service.assert_called_with(self.namespace())
+        self.assertEqual(3, m_core.delete_namespaced_service.call_count)
+        m_watcher.stream.assert_called_once_with(
+            m_core.list_namespaced_service, self.namespace(),
+            resource_version='10', timeout_seconds=60, _request_timeout=70)
+        m_watcher.stop.assert_called_once_with()
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.watch.Watch')
+    def test_batch_cleanup_watch_expired(self, p_watch, p_core):
+        klass = DeleteService()
+        m_core = p_core.return_value
+        m_core.list_namespaced_service.side_effect = [
+            services('svc1', 'svc2'), services('svc1', 'svc2'), services()]
+        m_watcher = p_watch.return_value
+        m_watcher.stream.side_effect = [
+            iter([deleted('svc1')]), ApiException(status=410)]
+
+        klass.batch_cleanup(['svc1', 'svc2'])
+        self.assertEqual(3, m_core.list_namespaced_service.call_count)
+        self.assertEqual(2, m_watcher.stream.call_count)
+
+    @patch('time.sleep', new=REAL_SLEEP)
+    def test_batch_cleanup_timeout_exits_promptly(self):
+        script = (
+            'import threading\n'
+            'from unittest.mock import patch\n'
+            'from kubernetes.client import V1ListMeta, V1ObjectMeta, '
+            'V1Service, V1ServiceList, V1ServiceSpec\n'
+            'from delete_svc import DeleteService\n'
+            'listing = V1ServiceList(metadata=V1ListMeta(), items=[V1Service('
+            'metadata=V1ObjectMeta(name="stuck"), '
+            'spec=V1ServiceSpec(cluster_ip="10.0.0.1"))])\n'
+            'with patch("common.load_incluster_config"), \\\n'
+            '        patch("common.CoreV1Api") as p_core:\n'
+            '    p_core.return_value.list_namespaced_service.return_value = '
+            'listing\n'
+            '    p_core.return_value.delete_namespaced_service.side_effect = '
+            'lambda *_a, **_k: threading.Event().wait(60)\n'
+            '    try:\n'
+            '        DeleteService().batch_cleanup(["stuck"], timeout=0.1)\n'
+            '    except Exception as error:\n'
+            '        print(error)\n')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        started = time.monotonic()
+        result = subprocess.run([sys.executable, '-c', script], env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, timeout=30,
+                                check=False, universal_newlines=True)
+        self.assertLess(time.monotonic() - started, 20, result.stdout)
+        self.assertEqual(0, result.returncode, result.stdout)
+        self.assertIn("Timed out after 0.1s deleting services ['stuck']",
+                      result.stdout)
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    def test_batch_cleanup_nothing_to_delete(self, p_core):
+        klass = DeleteService()
+        p_core.return_value.list_namespaced_service.return_value = \
+            services('svc1', cluster_ip=None)
+        self.assertEqual([], klass.batch_cleanup(['svc1', 'svc2']))
+        p_core.return_value.delete_namespaced_service.assert_not_called()
+
+    @patch('delete_svc.DeleteService')
+    def test_main_batch(self, p_delete_svc):
+        main(['-s', 'svc1', '-s', 'svc2', '--batch'])
+        p_delete_svc.return_value.batch_cleanup.assert_called_once_with(
+            ['svc1', 'svc2'], None)
+        p_delete_svc.return_value.service.assert_not_called()
+
     @patch('delete_svc.DeleteService')
     def test_main_service_cleanup_called(self, p_delete_svc):
         self.assertRaises(SystemExit, main, [])
@@ -43,7 +158,7 @@ class TestDeleteService(BaseTestCase):
 
         main(['-s', 'service'])
         m_service.assert_called_once_with('service')
-        m_service_cleanup.assert_called_with(m_service.return_value)
+        m_service_cleanup.assert_called_with(m_service.return_value, None)
     @patch('delete_svc.DeleteService')
     def test_main_service_cleanup_skipped(self, p_delete_svc):
         self.assertRaises(SystemExit, main, [])
@@ -0,0 +1,140 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from argparse import Namespace
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from kubernetes.client import V1Namespace, V1NamespaceList, V1ObjectMeta
+
+from common import HookException, KubeApi, current_target
+from fleet import FAILED, OK, TIMED_OUT, FleetResult, FleetRunner, main, \
+    result_table
+from test_common import BaseTestCase, PATCH_load_incluster_config, \
+    PATCH_load_kube_config
+
+# subprocess polls with time.sleep while it waits with a timeout
+REAL_SLEEP = time.sleep
+
+
+def seen_namespaces(seen):
+    def operation(args, timeout):
+        namespace = KubeApi().namespace()
+        seen.append((namespace, current_target().bro_host, timeout))
+        if namespace == 'enm2':
+            raise HookException('BRO not ready')
+    return operation
+
+
+class TestFleetRunner(BaseTestCase):
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    def test_namespaces(self):
+        runner = FleetRunner()
+        runner.api_core = MagicMock(name='m_api_core')
+        runner.api_core.return_value.list_namespace.return_value = \
+            V1NamespaceList(items=[
+                V1Namespace(metadata=V1ObjectMeta(name='enm2')),
+                V1Namespace(metadata=V1ObjectMeta(name='enm3'))])
+        self.assertEqual(['enm1', 'enm2', 'enm3'], runner.namespaces(
+            ['enm1', 'enm2'], 'app=enm'))
+        runner.api_core.return_value.list_namespace.assert_called_once_with(
+            label_selector='app=enm')
+        self.assertEqual(['enm1'], runner.namespaces(['enm1']))
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    def test_run(self):
+        runner = FleetRunner(bro_host='bro.{namespace}', max_workers=2)
+        seen = []
+        operation = seen_namespaces(seen)
+        results = runner.run(['enm1', 'enm2', 'enm3'], operation,
+                             Namespace())
+        self.assertEqual(
+            [('enm1', OK, ''), ('enm2', FAILED, 'BRO not ready'),
+             ('enm3', OK, '')],
+            [(result.namespace, result.result, result.detail)
+             for result in results])
+        self.assertEqual([('enm1', 'bro.enm1', None),
+                          ('enm2', 'bro.enm2', None),
+                          ('enm3', 'bro.enm3', None)], sorted(seen))
+        self.assertEqual(1, PATCH_load_incluster_config.call_count)
+        self.assertEqual('enm404', runner.namespace())
+        self.assertIsNone(current_target())
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    def test_run_timeout(self):
+        release = threading.Event()
+
+        def operation(_args, _timeout):
+            release.wait(5)
+
+        runner = FleetRunner(max_workers=1)
+        try:
+            results = runner.run(['enm1', 'enm2'], operation, Namespace(),
+                                 timeout=0.1)
+        finally:
+            release.set()
+        self.assertEqual([TIMED_OUT, TIMED_OUT],
+                         [result.result for result in results])
+
+    @patch('time.sleep', new=REAL_SLEEP)
+    def test_run_timeout_exits_promptly(self):
+        script = (
+            'import threading\n'
+            'from argparse import Namespace\n'
+            'from unittest.mock import patch\n'
+            'from fleet import FleetRunner, result_table\n'
+            'with patch("common.load_incluster_config"):\n'
+            '    print(result_table(FleetRunner().run(\n'
+            '        ["enm1"], lambda *_args: threading.Event().wait(60),\n'
+            '        Namespace(), timeout=0.1)))\n')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        started = time.monotonic()
+        result = subprocess.run([sys.executable, '-c', script], env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, timeout=30,
+                                check=False, universal_newlines=True)
+        self.assertLess(time.monotonic() - started, 20, result.stdout)
+        self.assertEqual(0, result.returncode, result.stdout)
+        self.assertIn(f'1 {TIMED_OUT}', result.stdout)
+
+    def test_result_table(self):
+        table = result_table([FleetResult('enm1', OK, 1.25),
+                              FleetResult('enm22', FAILED, 3, 'no\nBRO')])
+        self.assertEqual(
+            'NAMESPACE  RESULT  SECONDS  DETAIL\n'
+            'enm1       OK      1.2\n'
+            'enm22      FAILED  3.0      no BRO\n'
+            '1 FAILED, 1 OK', table)
+
+    @patch.dict(os.environ, {'BRO_PORT': '7002'})
+    @patch('fleet.FleetRunner')
+    def test_main(self, p_runner):
+        runner = p_runner.return_value
+        runner.namespaces.return_value = ['enm1']
+        runner.run.return_value = [FleetResult('enm1', OK)]
+        self.assertRaises(SystemExit, main, [])
+        with patch('sys.stderr', new_callable=StringIO):
+            self.assertRaises(SystemExit, main, ['scheduling', '--enable'])
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            main(['-n', 'enm1', '-w', '4', 'scheduling', '--disable'])
+        p_runner.assert_called_once_with('eric-ctrl-bro.{namespace}', 7002,
+                                         4)
+        runner.namespaces.assert_called_once_with(['enm1'], None)
+        args = runner.run.call_args[0][2]
+        self.assertFalse(args.enabled)
+        self.assertIn('1 OK', stdout.getvalue())
+
+        runner.run.return_value = [FleetResult('enm1', FAILED)]
+        with patch('sys.stdout', new_callable=StringIO):
+            self.assertRaises(SystemExit, main, [
+                '-l', 'app=enm', 'delete-jobs', '-j', 'j1'])
+        self.assertEqual(['j1'], runner.run.call_args[0][2].jobs)
+
+        runner.namespaces.return_value = []
+        self.assertRaises(HookException, main, [
+            '-l', 'app=none', 'reset-restore-state', '-c', 'cm'])
@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from hook_logging import JsonFormatter, RepeatCompactor, TextFormatter, \
+    set_log_context, setup_logging, stop_logging, thread_log_context
+
+
+def record(message, created, level=logging.INFO, *args):
+    log = logging.LogRecord('hook', level, __file__, 1, message, args, None)
+    log.created = created
+    return log
+
+
+def messages(records):
+    return [log.getMessage() for log in records]
+
+
+class TestRepeatCompactor(TestCase):
+    def test_repeats(self):
+        compactor = RepeatCompactor(interval=60)
+        self.assertEqual(['Waiting'],
+                         messages(compactor.process(record('Waiting', 0))))
+        for second in range(10, 60, 10):
+            self.assertEqual([], compactor.process(record('Waiting', second)))
+        self.assertEqual(['Progress: 5%'], messages(compactor.process(
+            record('Progress: %d%%', 30, logging.INFO, 5))))
+        self.assertEqual(['Waiting (5 repeats in the last 60s)'],
+                         messages(compactor.process(record('Waiting', 60))))
+        self.assertEqual([], compactor.process(record('Waiting', 70)))
+        self.assertEqual(['Waiting (1 repeats)'],
+                         messages(compactor.flush()))
+        self.assertEqual([], compactor.flush())
+
+    def test_warnings_not_compacted(self):
+        compactor = RepeatCompactor(interval=60)
+        for second in range(3):
+            self.assertEqual(1, len(compactor.process(
+                record('Retrying', second, logging.WARNING))))
+
+    def test_disabled(self):
+        compactor = RepeatCompactor(interval=0)
+        self.assertEqual(1, len(compactor.process(record('Waiting', 0))))
+        self.assertEqual(1, len(compactor.process(record('Waiting', 1))))
+
+    def test_max_tracked(self):
+        compactor = RepeatCompactor(interval=60, max_tracked=2)
+        compactor.process(record('a', 0))
+        compactor.process(record('a', 1))
+        compactor.process(record('b', 2))
+        self.assertEqual(['a (1 repeats)', 'c'],
+                         messages(compactor.process(record('c', 3))))
+
+
+class TestSetupLogging(TestCase):
+    def setUp(self):
+        stop_logging()
+        self.root_level = logging.getLogger().level
+
+    def tearDown(self):
+        stop_logging()
+        logging.getLogger().setLevel(self.root_level)
+
+    def test_json_format(self):
+        set_log_context(phase='pre-upgrade', namespace='enm404')
+        entry = json.loads(JsonFormatter().format(
+            record('Namespace set to "%s"', 0, logging.DEBUG, 'enm404')))
+        self.assertEqual('Namespace set to "enm404"', entry['message'])
+        self.assertEqual('DEBUG', entry['level'])
+        self.assertEqual('pre-upgrade', entry['phase'])
+        self.assertEqual('enm404', entry['namespace'])
+        self.assertEqual('1970-01-01T00:00:00.000+00:00', entry['timestamp'])
+        self.assertIn('hook', entry)
+
+    @patch.dict(os.environ, {'HOOK_LOG_LEVEL': 'info',
+                             'HOOK_LOG_FORMAT': 'json'})
+    def test_setup_once(self):
+        stream = StringIO()
+        self.assertIsNotNone(setup_logging(stream))
+        self.assertIsNone(setup_logging(stream))
+        logger = logging.getLogger('hook')
+        logger.debug('not written')
+        for _ in range(3):
+            logger.info('Waiting for BRO to be ready')
+        stop_logging()
+        lines = [json.loads(line)['message']
+                 for line in stream.getvalue().splitlines()]
+        self.assertEqual(['Waiting for BRO to be ready',
+                          'Waiting for BRO to be ready (2 repeats)'], lines)
+        self.assertEqual(logging.INFO, logging.getLogger().level)
+
+    @patch.dict(os.environ, {'HOOK_LOG_FORMAT': 'text'})
+    def test_thread_context(self):
+        stream = StringIO()
+        setup_logging(stream)
+        logger = logging.getLogger('hook')
+        for namespace in ('enm1', 'enm2', 'enm1'):
+            with thread_log_context(namespace=namespace):
+                logger.info('Waiting for BRO to be ready')
+        logger.info('Done')
+        stop_logging()
+        lines = [line.split(None, 4)[-1]
+                 for line in stream.getvalue().splitlines()]
+        self.assertEqual(['[enm1] Waiting for BRO to be ready',
+                          '[enm2] Waiting for BRO to be ready', 'Done',
+                          '[enm1] Waiting for BRO to be ready (1 repeats)'],
+                         lines)
+
+    def test_thread_context_json(self):
+        log = record('Waiting', 0)
+        log.fields = {'namespace': 'enm2'}
+        self.assertEqual('enm2', json.loads(
+            JsonFormatter().format(log))['namespace'])
+        self.assertTrue(TextFormatter().format(log).endswith(
+            '[enm2] Waiting'))
@@ -0,0 +1,130 @@
+import os
+import shutil
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from kubernetes.client import V1EnvVar
+
+from common import HookException
+from job_template import JobTemplate
+
+TEMPLATE = '''
+apiVersion: batch/v1
+kind: Job
+metadata:
+  name: placeholder
+  labels:
+    app: restore-executor
+spec:
+  ttlSecondsAfterFinished: 600
+  template:
+    metadata:
+      annotations:
+        sidecar.istio.io/inject: "false"
+    spec:
+      securityContext:
+        runAsNonRoot: true
+      imagePullSecrets:
+        - name: template-secret
+      containers:
+        - name: executor
+          image: registry/hooks:1.2.3
+          imagePullPolicy: IfNotPresent
+          args: ["to", "be", "replaced"]
+          env:
+            - name: BRO_HOST
+              value: old-host
+            - name: TZ
+              value: UTC
+          resources:
+            requests:
+              cpu: 250m
+'''
+
+
+class TestJobTemplate(TestCase):
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def render(self, environ, **kwargs):
+        return JobTemplate(environ).render(
+            'restore-job', ['/bin/sh', '-c', 'run'], {'BRO_HOST': 'bro'},
+            'restore-sa', {'backup_name': 'b1'}, **kwargs)
+
+    def test_render_from_env(self):
+        fallback = MagicMock(name='fallback')
+        job = self.render({'HOOK_IMAGE': 'registry/hooks:1.0',
+                           'HOOK_IMAGE_PULL_POLICY': 'Always',
+                           'HOOK_JOB_TTL': '120'},
+                          pull_secret='pull', fallback_image=fallback)
+        fallback.assert_not_called()
+        self.assertEqual('restore-job', job.metadata.name)
+        self.assertEqual(0, job.spec.backoff_limit)
+        self.assertEqual(120, job.spec.ttl_seconds_after_finished)
+        self.assertEqual(86400, job.spec.active_deadline_seconds)
+        pod = job.spec.template
+        self.assertEqual({'backup_name': 'b1'}, pod.metadata.annotations)
+        self.assertEqual('restore-sa', pod.spec.service_account)
+        self.assertEqual('Never', pod.spec.restart_policy)
+        self.assertEqual('pull', pod.spec.image_pull_secrets[0].name)
+        container = pod.spec.containers[0]
+        self.assertEqual('registry/hooks:1.0', container.image)
+        self.assertEqual('Always', container.image_pull_policy)
+        self.assertEqual(['/bin/sh', '-c', 'run'], container.command)
+        self.assertEqual([V1EnvVar(name='BRO_HOST', value='bro')],
+                         container.env)
+        self.assertEqual({'cpu': '100m', 'memory': '128Mi'},
+                         container.resources.requests)
+
+    def test_render_fallback_image(self):
+        fallback = MagicMock(name='fallback',
+                             return_value=('own-image', 'Never'))
+        job = self.render({}, fallback_image=fallback)
+        container = job.spec.template.spec.containers[0]
+        self.assertEqual('own-image', container.image)
+        self.assertEqual('Never', container.image_pull_policy)
+
+        self.assertRaises(HookException, self.render, {})
+
+    def test_render_from_template(self):
+        path = join(self.tmpdir, 'job.yaml')
+        with open(path, 'w', encoding='utf-8') as _writer:
+            _writer.write(TEMPLATE)
+        fallback = MagicMock(name='fallback')
+
+        job = self.render({'HOOK_JOB_TEMPLATE': path}, pull_secret='pull',
+                          fallback_image=fallback)
+        fallback.assert_not_called()
+        self.assertEqual('restore-job', job.metadata.name)
+        self.assertEqual({'app': 'restore-executor'}, job.metadata.labels)
+        self.assertEqual(600, job.spec.ttl_seconds_after_finished)
+        pod = job.spec.template
+        self.assertEqual({'sidecar.istio.io/inject': 'false',
+                          'backup_name': 'b1'}, pod.metadata.annotations)
+        self.assertTrue(pod.spec.security_context.run_as_non_root)
+        self.assertEqual('template-secret',
+                         pod.spec.image_pull_secrets[0].name)
+        container = pod.spec.containers[0]
+        self.assertEqual('registry/hooks:1.2.3', container.image)
+        self.assertEqual('IfNotPresent', container.image_pull_policy)
+        self.assertIsNone(container.args)
+        self.assertEqual([V1EnvVar(name='TZ', value='UTC'),
+                          V1EnvVar(name='BRO_HOST', value='bro')],
+                         container.env)
+        self.assertEqual({'cpu': '250m'}, container.resources.requests)
+
+    def test_bad_template(self):
+        path = join(self.tmpdir, 'job.yaml')
+        with open(path, 'w', encoding='utf-8') as _writer:
+            _writer.write('kind: Pod\n')
+        self.assertRaises(HookException, self.render,
+                          {'HOOK_JOB_TEMPLATE': path})
+        self.assertRaises(HookException, self.render,
+                          {'HOOK_JOB_TEMPLATE': join(self.tmpdir, 'none')})
+        self.assertRaises(HookException, self.render,
+                          {'HOOK_IMAGE': 'image', 'HOOK_JOB_TTL': 'soon'})
@@ -0,0 +1,109 @@
+import threading
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from kubernetes.client import BatchV1Api, V1ConfigMap, V1Job, V1JobList, \
+    V1ObjectMeta
+
+from common import ApiProxy, BroCliBaseClass, RetryPolicy, \
+    run_on_daemon_threads
+from delete_hook_jobs import main
+from plan import Plan, PlannedResult, planned, planning, skip_wait, \
+    use_plan
+from test_common import BaseTestCase, FakeSchedule, FlakyApi, \
+    PATCH_load_incluster_config, PATCH_load_kube_config
+
+
+class TestPlan(TestCase):
+    def test_report(self):
+        plan = Plan()
+        plan.read('CoreV1Api', 'read_namespaced_config_map')
+        plan.read('CoreV1Api', 'read_namespaced_config_map')
+        result = plan.change(
+            'CoreV1Api', 'patch_namespaced_config_map', ('cm', 'enm404'),
+            {'body': V1ConfigMap(metadata=V1ObjectMeta(name='cm'))})
+        plan.change('Schedule', 'update', (True, 'PREFIX'))
+        plan.wait('BRO action restore to complete', action=True)
+
+        self.assertEqual(('planned-1', 'COMPLETE', 'SUCCESS', 'Success'),
+                         (result.id, result.state, result.result,
+                          result.status))
+        self.assertEqual(5, plan.api_calls())
+        report = plan.report()
+        self.assertIn("CoreV1Api.patch_namespaced_config_map('cm')", report)
+        self.assertIn('Schedule.update()', report)
+        self.assertIn('CoreV1Api.read_namespaced_config_map x2', report)
+        self.assertIn('Estimated API calls: 5, BRO actions: 1', report)
+
+    def test_planned(self):
+        stream = StringIO()
+        self.assertFalse(skip_wait('nothing'))
+        with planned(False) as plan:
+            self.assertIsNone(plan)
+            self.assertIsNone(planning())
+        with self.assertRaises(SystemExit):
+            with planned(True, stream) as plan:
+                self.assertIs(plan, planning())
+                self.assertTrue(skip_wait('job j1 to delete'))
+                raise SystemExit(1)
+        self.assertIsNone(planning())
+        self.assertIn('job j1 to delete', stream.getvalue())
+
+    def test_api_proxy(self):
+        api = FlakyApi()
+        proxy = ApiProxy(api, RetryPolicy('kube'))
+        with planned(True, StringIO()) as plan:
+            self.assertEqual('x', proxy.read_thing('x'))
+            self.assertEqual('status', proxy.status)
+            self.assertIsInstance(proxy.create_thing('y'), PlannedResult)
+        self.assertEqual([('x', {}), ('status', {})], api.calls)
+        self.assertEqual({'FlakyApi.read_thing': 1, 'FlakyApi.status': 1},
+                         plan.reads)
+        self.assertEqual([('FlakyApi.create_thing', 'y')], plan.changes)
+
+    def test_thread_plans(self):
+        seen = []
+        other = threading.Thread(target=lambda: seen.append(planning()))
+        with planned(True, StringIO()) as plan:
+            other.start()
+            other.join()
+            # The plan's own worker threads join it
+            self.assertEqual([plan, plan], [future.result() for future in
+                                            run_on_daemon_threads(
+                                                lambda _: planning(),
+                                                [1, 2], 2, None)])
+            with use_plan(None):
+                self.assertIsNone(planning())
+            self.assertIs(plan, planning())
+        self.assertEqual([None], seen)
+
+    @patch('common.Bro')
+    def test_bro_changes(self, p_bro_api):
+        p_bro_api.return_value.get_schedule.return_value = FakeSchedule()
+        klass = BroCliBaseClass()
+        with planned(True, StringIO()) as plan:
+            schedule = klass.get_schedule()
+            schedule.update(True)
+            klass.wait_for_action(schedule.update(False))
+        self.assertFalse(schedule.enabled)
+        self.assertEqual(2, len(plan.changes))
+        self.assertEqual(1, plan.actions)
+
+
+class TestPlanMain(BaseTestCase):
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch.object(BatchV1Api, 'delete_namespaced_job', autospec=True)
+    @patch.object(BatchV1Api, 'list_namespaced_job', autospec=True)
+    def test_delete_hook_jobs(self, p_list, p_delete):
+        p_list.return_value = V1JobList(
+            items=[V1Job(metadata=V1ObjectMeta(name='j1'))])
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            main(['-j', 'j1', '-j', 'j2', '--plan'])
+        p_delete.assert_not_called()
+        self.assertEqual(2, p_list.call_count)
+        report = stdout.getvalue()
+        self.assertIn("BatchV1Api.delete_namespaced_job('j1')", report)
+        self.assertIn('job j1 to delete', report)
+        self.assertIn('Estimated API calls: 4, BRO actions: 0', report)
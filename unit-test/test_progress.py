@@ -0,0 +1,120 @@
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from progress import MB, ProgressTracker, TransferTracker, \
+    handed_over_summary, published_progress
+
+
+class TestProgressTracker(TestCase):
+    def test_handed_over_summary(self):
+        for value, expected in (
+                (None, {}), ('', {}), ('not json', {}), ('[1]', {}),
+                ('{"IMPORT_STALLS": 2}', {'IMPORT_STALLS': '2'})):
+            env = {} if value is None else {'HOOK_IMPORT_SUMMARY': value}
+            with patch.dict(os.environ, env):
+                if value is None:
+                    os.environ.pop('HOOK_IMPORT_SUMMARY', None)
+                self.assertEqual(expected, handed_over_summary())
+
+    def test_published_progress(self):
+        self.assertIsNone(published_progress(None, 'RESTORE'))
+        self.assertIsNone(published_progress({'RESTORE_STATE': ''},
+                                             'RESTORE'))
+        tracker = ProgressTracker('RESTORE')
+        tracker.record(0, 0.2)
+        tracker.record(10, 0.3)
+        data = tracker.values('Stage: EXECUTION')
+        data['RESTORE_PROGRESS_UPDATED'] = '2024-01-02T03:04:05Z'
+        self.assertEqual('30%, ETA 70s, updated 2024-01-02T03:04:05Z: '
+                         'Stage: EXECUTION',
+                         published_progress(data, 'RESTORE'))
+        self.assertEqual('5%, ETA unknown', published_progress(
+            {'RESTORE_PROGRESS': '5', 'RESTORE_ETA_SECONDS': ''},
+            'RESTORE'))
+
+    def test_eta(self):
+        tracker = ProgressTracker('RESTORE', window=3)
+        self.assertIsNone(tracker.eta())
+        tracker.record(0, 0.1)
+        self.assertIsNone(tracker.eta())
+        tracker.record(10, 0.2)
+        self.assertAlmostEqual(80, tracker.eta())
+        tracker.record(20, 0.2)
+        tracker.record(30, 0.2)
+        self.assertIsNone(tracker.eta())
+        tracker.record(40, 0.6)
+        self.assertAlmostEqual(20, tracker.eta())
+
+    def test_due(self):
+        tracker = ProgressTracker('IMPORT', interval=30, step=0.1)
+        self.assertFalse(tracker.due())
+        tracker.record(0, 0.0)
+        self.assertTrue(tracker.due())
+        values = tracker.values('Stage: EXECUTION\n agent: x')
+        self.assertEqual('0', values['IMPORT_PROGRESS'])
+        self.assertEqual('Stage: EXECUTION agent: x',
+                         values['IMPORT_PROGRESS_INFO'])
+        self.assertEqual('', values['IMPORT_ETA_SECONDS'])
+        self.assertIn('IMPORT_PROGRESS_UPDATED', values)
+
+        tracker.record(10, 0.05)
+        self.assertFalse(tracker.due())
+        tracker.record(20, 0.1)
+        self.assertTrue(tracker.due())
+        tracker.values()
+        tracker.record(49, 0.15)
+        self.assertFalse(tracker.due())
+        tracker.record(50, 0.15)
+        self.assertTrue(tracker.due())
+
+        values = tracker.values(finished=True)
+        self.assertEqual('100', values['IMPORT_PROGRESS'])
+        self.assertEqual('0', values['IMPORT_ETA_SECONDS'])
+
+
+class TestTransferTracker(TestCase):
+    def test_throughput(self):
+        tracker = TransferTracker('IMPORT', size=1000 * MB, interval=30,
+                                  step=0.1, window=3)
+        self.assertEqual('0%, 0/1000 MB, ETA unknown', tracker.describe())
+        tracker.record(0, 0.0)
+        tracker.record(10, 0.1)
+        self.assertAlmostEqual(10 * MB, tracker.throughput())
+        self.assertEqual('10%, 100/1000 MB, 10.0 MB/s, ETA 90s',
+                         tracker.describe())
+        tracker.record(70, 0.5)
+        summary = tracker.summary(100)
+        self.assertEqual('100', summary['IMPORT_SECONDS'])
+        self.assertEqual(str(1000 * MB), summary['IMPORT_BYTES'])
+        self.assertEqual('10.0', summary['IMPORT_MB_PER_SECOND'])
+        self.assertEqual('0', summary['IMPORT_STALLS'])
+        self.assertIn('IMPORT_FINISHED', summary)
+
+    def test_unknown_size(self):
+        tracker = TransferTracker('IMPORT')
+        tracker.record(0, 0.0)
+        tracker.record(10, 0.5)
+        self.assertIsNone(tracker.throughput())
+        self.assertEqual('50%, ETA 10s', tracker.describe())
+        summary = tracker.summary(20)
+        self.assertEqual('', summary['IMPORT_BYTES'])
+        self.assertEqual('', summary['IMPORT_MB_PER_SECOND'])
+
+    def test_stall(self):
+        tracker = TransferTracker('IMPORT', stall_window=60)
+        tracker.record(0, 0.2)
+        tracker.record(59, 0.2)
+        self.assertFalse(tracker.new_stall())
+        tracker.record(60, 0.2)
+        self.assertTrue(tracker.new_stall())
+        self.assertFalse(tracker.new_stall())
+        self.assertIn('stalled 60s', tracker.describe())
+        tracker.record(200, 0.2)
+        self.assertFalse(tracker.new_stall())
+
+        tracker.record(210, 0.3)
+        self.assertEqual(0, tracker.idle())
+        tracker.record(270, 0.3)
+        self.assertTrue(tracker.new_stall())
+        self.assertEqual('2', tracker.summary(300)['IMPORT_STALLS'])
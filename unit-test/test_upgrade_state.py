@@ -1,11 +1,15 @@
+from io import StringIO
 from unittest.mock import patch
 
+from kubernetes.client import CoreV1Api
+from kubernetes.client.exceptions import ApiException
+
 from kubernetes.client.models.v1_config_map import V1ConfigMap
 from kubernetes.client.models.v1_object_meta import V1ObjectMeta
 
 from test_common import BaseTestCase, BroAction, PATCH_load_incluster_config, \
     PATCH_load_kube_config, BroBackup, BroService
-from upgrade_state import UpgradeState
+from upgrade_state import UpgradeState, main
 
 
 class TestUpgradeState(BaseTestCase):
@@ -27,3 +31,23 @@ class TestUpgradeState(BaseTestCase):
         klass = UpgradeState()
         klass.set_upgrade_state(True)
         p_core.return_value.replace_namespaced_config_map.assert_called_once_with('upgrade-state', 'enm404', cfg_map)
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch.object(CoreV1Api, 'create_namespaced_config_map', autospec=True)
+    @patch.object(CoreV1Api, 'read_namespaced_config_map', autospec=True)
+    def test_plan_create(self, p_read, p_create):
+        p_read.side_effect = ApiException(status=404)
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            main(['--partial', '--plan'])
+        report = stdout.getvalue()
+        self.assertIn("CoreV1Api.create_namespaced_config_map("
+                      "'upgrade-state')", report)
+        self.assertNotIn('replace_namespaced_config_map', report)
+        p_create.assert_not_called()
+
+        p_read.side_effect = None
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            main(['--full', '--plan'])
+        self.assertIn("CoreV1Api.replace_namespaced_config_map("
+                      "'upgrade-state')", stdout.getvalue())
@@ -0,0 +1,117 @@
+from unittest.mock import patch
+
+from kubernetes.client import V1ConfigMap, V1ConfigMapList, V1ListMeta, \
+    V1ObjectMeta
+from kubernetes.client.exceptions import ApiException
+
+from common import HookTimeoutException
+from test_common import BaseTestCase, PATCH_load_incluster_config, \
+    PATCH_load_kube_config
+from wait_restore_state import RestoreStateWaiter, main
+
+
+def config_map(state):
+    return V1ConfigMap(metadata=V1ObjectMeta(name='backup-restore'),
+                       data={'RESTORE_STATE': state})
+
+
+def listing(*states, resource_version='10'):
+    return V1ConfigMapList(
+        metadata=V1ListMeta(resource_version=resource_version),
+        items=[config_map(state) for state in states])
+
+
+def event(kind, state):
+    return {'type': kind, 'object': config_map(state)}
+
+
+class TestRestoreStateWaiter(BaseTestCase):
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.watch.Watch')
+    def test_already_set(self, p_watch, p_core):
+        p_core.return_value.list_namespaced_config_map.return_value = \
+            listing('finished')
+        RestoreStateWaiter().wait_for_value('backup-restore',
+                                            'RESTORE_STATE', 'finished')
+        p_core.return_value.list_namespaced_config_map.assert_called_once_with(
+            self.namespace(), field_selector='metadata.name=backup-restore')
+        p_watch.assert_not_called()
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.watch.Watch')
+    def test_watch(self, p_watch, p_core):
+        m_core = p_core.return_value
+        m_core.list_namespaced_config_map.return_value = listing('ongoing')
+        m_watcher = p_watch.return_value
+        m_watcher.resource_version = '12'
+        m_watcher.stream.side_effect = [
+            iter([event('MODIFIED', 'ongoing')]),
+            iter([event('DELETED', 'ongoing'), event('ADDED', ''),
+                  event('MODIFIED', 'finished')])]
+
+        RestoreStateWaiter().wait_for_value('backup-restore',
+                                            'RESTORE_STATE', 'finished')
+        m_core.list_namespaced_config_map.assert_called_once()
+        self.assertEqual(['10', '12'], [
+            stream_call[1]['resource_version']
+            for stream_call in m_watcher.stream.call_args_list])
+        m_watcher.stream.assert_called_with(
+            m_core.list_namespaced_config_map, self.namespace(),
+            field_selector='metadata.name=backup-restore',
+            resource_version='12', timeout_seconds=60, _request_timeout=70)
+        m_watcher.stop.assert_called_once_with()
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.watch.Watch')
+    def test_watch_expired(self, p_watch, p_core):
+        m_core = p_core.return_value
+        m_core.list_namespaced_config_map.side_effect = [
+            listing(), listing('finished', resource_version='20')]
+        p_watch.return_value.stream.side_effect = ApiException(status=410)
+
+        RestoreStateWaiter().wait_for_value('backup-restore',
+                                            'RESTORE_STATE', 'finished')
+        self.assertEqual(2, m_core.list_namespaced_config_map.call_count)
+
+        m_core.list_namespaced_config_map.side_effect = None
+        m_core.list_namespaced_config_map.return_value = listing('')
+        p_watch.return_value.stream.side_effect = ApiException(status=403)
+        self.assertRaises(ApiException, RestoreStateWaiter().wait_for_value,
+                          'backup-restore', 'RESTORE_STATE', 'finished')
+
+    @patch('common.load_incluster_config', new=PATCH_load_incluster_config)
+    @patch('common.load_kube_config', new=PATCH_load_kube_config)
+    @patch('common.CoreV1Api')
+    @patch('common.watch.Watch')
+    def test_timeout(self, p_watch, p_core):
+        clock = self.virtual_clock()
+        p_core.return_value.list_namespaced_config_map.return_value = \
+            listing('ongoing')
+
+        def stream(*_args, **kwargs):
+            clock.sleep(kwargs['timeout_seconds'])
+            return iter([])
+        p_watch.return_value.stream.side_effect = stream
+
+        with self.assertRaises(HookTimeoutException):
+            RestoreStateWaiter().wait_for_value(
+                'backup-restore', 'RESTORE_STATE', 'finished', 90)
+        self.assertEqual([60, 30], [
+            stream_call[1]['timeout_seconds'] for stream_call in
+            p_watch.return_value.stream.call_args_list])
+
+    @patch('wait_restore_state.RestoreStateWaiter')
+    def test_main(self, p_waiter):
+        self.assertRaises(SystemExit, main, [])
+        main(['-c', 'backup-restore', '-t', '600'])
+        p_waiter.return_value.wait_for_value.assert_called_once_with(
+            'backup-restore', 'RESTORE_STATE', 'finished', timeout=600)
+        main(['-c', 'cm', '-k', 'KEY', '-v', 'value'])
+        p_waiter.return_value.wait_for_value.assert_called_with(
+            'cm', 'KEY', 'value', timeout=None)